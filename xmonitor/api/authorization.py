@@ -242,6 +242,8 @@ def _immutable_attr(target, attr, proxy=None):
         raise exception.Forbidden(message % {'attr': attr,
                                              'resource': resource})
 
+    if proxy is None:
+        get_attr.passthrough = (target, attr)
     return property(get_attr, forbidden, forbidden)
 
 
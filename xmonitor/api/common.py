@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import re
 
 from oslo_concurrency import lockutils
@@ -28,6 +29,10 @@ from xmonitor.i18n import _, _LE, _LW
 LOG = logging.getLogger(__name__)
 CONF = cfg.CONF
 
+Validators = collections.namedtuple('Validators',
+                                    ['etag', 'last_modified', 'updated_at',
+                                     'target'])
+
 _CACHED_THREAD_POOL = {}
 
 
@@ -214,3 +219,44 @@ def get_thread_pool(lock_name, size=1024):
         return wsgi.get_asynchronous_eventlet_pool(size=size)
 
     return _get_thread_pool
+
+
+class ValidatorCache(object):
+    """Validators of representations recently served by this worker.
+
+    Entries are kept per resource and per requesting identity, as the
+    representation of a resource depends on who is looking at it. The
+    least recently used entries are evicted once ``size`` is reached.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def _key(context, resource_id):
+        return (resource_id, context.user, context.tenant, context.is_admin,
+                tuple(sorted(context.roles)))
+
+    def get(self, context, resource_id):
+        key = self._key(context, resource_id)
+        validators = self._entries.pop(key, None)
+        if validators is not None:
+            self._entries[key] = validators
+        return validators
+
+    def set(self, context, resource_id, etag, last_modified, updated_at,
+            target=None):
+        """Remember the validators served for a resource.
+
+        :param target: the policy target of the resource as it was served,
+                       for revalidations to be authorized without loading it
+        """
+        if self.size <= 0:
+            return
+        key = self._key(context, resource_id)
+        self._entries.pop(key, None)
+        self._entries[key] = Validators(etag, last_modified, updated_at,
+                                        target)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
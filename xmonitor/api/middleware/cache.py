@@ -49,6 +49,8 @@ PATTERNS = {
     ('v2', 'DELETE'): re.compile(r'^/v2/images/([^\/]+)$')
 }
 
+RE_GZIP = re.compile(r'\bgzip\b')
+
 
 class CacheFilter(wsgi.Middleware):
 
@@ -224,8 +226,17 @@ class CacheFilter(wsgi.Middleware):
         image = request.environ['api.cache.image']
         self._verify_metadata(image_meta)
         response = webob.Response(request=request)
-        response.app_iter = size_checked_iter(response, image_meta,
-                                              image_meta['size'],
+        size = image_meta['size']
+        variant = None
+        if RE_GZIP.search(request.headers.get('Accept-Encoding', '')):
+            variant = self.cache.open_gzip_variant(image_id)
+        if variant is not None:
+            # NOTE: The image.send notification then counts the compressed
+            # bytes, which are the ones sent.
+            size, image_iterator = variant
+            LOG.debug("Serving gzip compressed copy of image '%s'",
+                      image_id)
+        response.app_iter = size_checked_iter(response, image_meta, size,
                                               image_iterator,
                                               notifier.Notifier())
         # NOTE (flwang): Set the content-type, content-md5 and content-length
@@ -241,6 +252,9 @@ class CacheFilter(wsgi.Middleware):
         response.headers['Content-MD5'] = (image.checksum.encode('utf-8')
                                            if six.PY2 else image.checksum)
         response.headers['Content-Length'] = str(image.size)
+        if variant is not None:
+            response.headers['Content-Length'] = str(size)
+            response.headers['Content-Encoding'] = 'gzip'
         return response
 
     def process_response(self, resp):
@@ -15,17 +15,27 @@
 
 """
 Use gzip compression if the client accepts it.
+
+Image data is compressed in worker threads, unless it is compressed
+already. With ``image_cache_gzip_variants``, the compressed data of cached
+images is kept in the image cache for the next downloads.
 """
 
 import re
 
+from oslo_config import cfg
 from oslo_log import log as logging
 
+from xmonitor.common import compression
 from xmonitor.common import wsgi
 from xmonitor.i18n import _LI
+from xmonitor import image_cache
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+CONF.import_opt('image_cache_gzip_variants', 'xmonitor.image_cache')
+
 
 class GzipMiddleware(wsgi.Middleware):
 
@@ -33,6 +43,9 @@ class GzipMiddleware(wsgi.Middleware):
 
     def __init__(self, app):
         LOG.info(_LI("Initialized gzip middleware"))
+        self.cache = None
+        if CONF.image_cache_gzip_variants:
+            self.cache = image_cache.ImageCache()
         super(GzipMiddleware, self).__init__(app)
 
     def process_response(self, response):
@@ -44,22 +57,42 @@ class GzipMiddleware(wsgi.Middleware):
             # app_iter is called. We'll keep it and reset it later
             checksum = response.headers.get("Content-MD5")
 
-            # NOTE(flaper87): We'll use lazy for images so
-            # that they can be compressed without reading
-            # the whole content in memory. Notice that using
-            # lazy will set response's content-length to 0.
+            # NOTE(flaper87): Images are compressed without reading
+            # the whole content in memory. Notice that this will set
+            # response's content-length to 0.
             content_type = response.headers["Content-Type"]
-            lazy = content_type == "application/octet-stream"
-
-            # NOTE(flaper87): Webob takes care of the compression
-            # process, it will replace the body either with a
-            # compressed body or a generator - used for lazy com
-            # pression - depending on the lazy value.
-            #
-            # Webob itself will set the Content-Encoding header.
-            response.encode_content(lazy=lazy)
+            if content_type == "application/octet-stream":
+                self._compress_image(response)
+            else:
+                # NOTE(flaper87): Webob takes care of the compression
+                # process, it will replace the body with a compressed
+                # body and set the Content-Encoding header.
+                response.encode_content()
 
             if checksum:
                 response.headers['Content-MD5'] = checksum
 
         return response
+
+    def _compress_image(self, response):
+        # NOTE: Served from a compressed copy in the image cache
+        if response.content_encoding:
+            return
+
+        length = response.content_length
+        head, app_iter = compression.peek(response.app_iter)
+        if compression.is_compressed(head):
+            response.app_iter = app_iter
+            response.content_length = length
+            return
+
+        app_iter = compression.gzip_iter(app_iter)
+        environ = response.request.environ
+        image_id = environ.get('api.cache.image_id')
+        if (self.cache is not None and image_id and
+                environ.get('api.cache.method') == 'GET' and
+                response.status_int == 200):
+            app_iter = self.cache.get_gzip_variant_iter(image_id, app_iter)
+        response.app_iter = app_iter
+        response.content_length = None
+        response.content_encoding = 'gzip'
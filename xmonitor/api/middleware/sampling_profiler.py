@@ -0,0 +1,320 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Sampling profiler for the requests served by an API worker.
+
+A native thread wakes up every ``profile_sampling_interval`` seconds and
+records the stack of every request being served at that moment, keyed by
+the route the request was matched to. The greenthreads of requests waiting
+for I/O are sampled as well as the one running, so the samples show where
+requests spend their time rather than only the CPU. Sampling starts when
+a worker serves its first request if ``profile_sampling`` is set.
+Otherwise it starts when the worker receives SIGUSR2.
+
+On SIGUSR2 a worker that is already sampling writes the samples collected
+so far to ``profile_sampling_dir``. The file uses the collapsed stack
+format, so it can be fed to flamegraph.pl or speedscope. A worker that
+started sampling on SIGUSR2 then stops. A worker sampling because of
+``profile_sampling`` keeps going with fresh counts.
+
+The SIGUSR2 handler is installed as the pipeline is loaded, so that the
+workers inherit it and an idle worker does not die of the signal. The
+parent of the workers ignores the signal.
+
+The paste filter is ``samplingprofiler``. It goes first in the pipeline of
+xmonitor-api, so that it sees the requests for as long as possible.
+
+Sampling backs off whenever the time spent taking samples exceeds
+``profile_sampling_max_overhead`` of the elapsed time. The overhead
+measured is logged with every dump.
+"""
+
+import collections
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import eventlet.greenthread
+import eventlet.patcher
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from xmonitor.common import wsgi
+from xmonitor.i18n import _, _LI, _LW
+
+sampling_profiler_opts = [
+    cfg.BoolOpt('profile_sampling', default=False,
+                help=_('Sample the stacks of the requests served by each '
+                       'API worker from its first request on. Without it, '
+                       'sampling starts and stops on SIGUSR2. Requires the '
+                       'samplingprofiler filter in the paste pipeline.')),
+    cfg.FloatOpt('profile_sampling_interval', default=0.01, min=0.001,
+                 help=_('The number of seconds between two stack samples.')),
+    cfg.FloatOpt('profile_sampling_max_overhead', default=0.02, min=0.001,
+                 max=1,
+                 help=_('The share of time a worker may spend taking stack '
+                        'samples. Sampling slows down while it takes '
+                        'more.')),
+    cfg.StrOpt('profile_sampling_dir',
+               help=_('The directory the collapsed stack files are written '
+                      'to on SIGUSR2. Defaults to the temporary '
+                      'directory.')),
+]
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.register_opts(sampling_profiler_opts)
+
+# The sampling thread has to be a native thread even in a monkey patched
+# worker, so that it can interrupt greenthreads busy with the CPU
+threading = eventlet.patcher.original('threading')
+_time = eventlet.patcher.original('time')
+
+# Number of samples between two checks of the sampling overhead
+OVERHEAD_WINDOW = 100
+
+# Longest interval sampling backs off to, in seconds
+MAX_INTERVAL = 1.0
+
+# Frames kept from the top of a stack
+MAX_DEPTH = 128
+
+
+def _route(environ):
+    """Name of the route a request was matched to."""
+    route = environ.get('routes.route')
+    if route is None:
+        path = '<unmatched>'
+    elif route.name:
+        path = route.name
+    else:
+        path = environ.get('SCRIPT_NAME', '') + route.routepath
+    return '%s %s' % (environ.get('REQUEST_METHOD'), path)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, code.co_filename,
+                           code.co_firstlineno)
+
+
+class Sampler(object):
+    """Collects the stacks of running requests from a native thread.
+
+    :param interval: seconds between two samples
+    :param max_overhead: share of time sampling may take
+    """
+
+    def __init__(self, interval, max_overhead):
+        self.interval = interval
+        self.min_interval = interval
+        self.max_overhead = max_overhead
+        # Frame of the middleware serving a request -> its environ
+        self.requests = {}
+        # Greenthread serving a request -> the frame of the middleware
+        self.greenlets = {}
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.busy = 0.0
+        self.started = None
+        self._stopped = None
+
+    @property
+    def running(self):
+        return self._stopped is not None
+
+    @property
+    def overhead(self):
+        elapsed = _time.time() - self.started
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+    def start(self):
+        self.reset()
+        self._stopped = threading.Event()
+        thread = threading.Thread(target=self._run, args=(self._stopped,),
+                                  name='sampling-profiler')
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._stopped = None
+
+    def reset(self):
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.busy = 0.0
+        self.started = _time.time()
+
+    def sample(self):
+        """Record the stack of every request being served right now."""
+        frames = list(sys._current_frames().values())
+        # NOTE: The frame of the greenthread running is the one of its
+        # thread, the others have theirs saved until they switch back in.
+        frames.extend(serving.gr_frame for serving in list(self.greenlets)
+                      if serving.gr_frame is not None)
+        for frame in frames:
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                environ = self.requests.get(frame)
+                if environ is not None:
+                    stack.append(_route(environ))
+                    stack.reverse()
+                    self.stacks[';'.join(stack)] += 1
+                    break
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+        self.samples += 1
+
+    def _adjust_interval(self, window_busy, window_elapsed):
+        overhead = window_busy / window_elapsed
+        # NOTE: Nothing is logged from the sampling thread, logging takes
+        # green locks in a monkey patched worker.
+        if overhead > self.max_overhead:
+            self.interval = min(self.interval * 2, MAX_INTERVAL)
+        elif (overhead < self.max_overhead / 4 and
+                self.interval > self.min_interval):
+            self.interval = max(self.interval / 2, self.min_interval)
+
+    def _run(self, stopped):
+        window_start = _time.time()
+        window_busy = 0.0
+        count = 0
+        while not stopped.wait(self.interval):
+            start = _time.time()
+            self.sample()
+            took = _time.time() - start
+            self.busy += took
+            window_busy += took
+            count += 1
+            if count == OVERHEAD_WINDOW:
+                now = _time.time()
+                self._adjust_interval(window_busy, now - window_start)
+                window_start = now
+                window_busy = 0.0
+                count = 0
+
+    def dump(self, path):
+        """Write the samples to path in the collapsed stack format."""
+        # Copied at once, the sampling thread keeps adding to it
+        stacks = dict(self.stacks)
+        with open(path, 'w') as dump:
+            for stack, count in sorted(stacks.items()):
+                dump.write('%s %d\n' % (stack, count))
+
+        routes = collections.Counter()
+        for stack, count in stacks.items():
+            routes[stack.split(';', 1)[0]] += count
+        LOG.info(_LI("Wrote %(samples)d stack samples taken over %(elapsed)ds "
+                     "to %(path)s, sampling took %(overhead).2f%% of the "
+                     "time and is now done every %(interval).3fs. Samples "
+                     "per route: %(routes)s"),
+                 {'samples': self.samples,
+                  'elapsed': _time.time() - self.started,
+                  'path': path, 'overhead': self.overhead * 100,
+                  'interval': self.interval,
+                  'routes': ', '.join('%s: %d' % route
+                                      for route in routes.most_common())})
+
+
+class SamplingProfilerMiddleware(wsgi.Middleware):
+    """Marks the requests whose stacks the Sampler records."""
+
+    def __init__(self, app):
+        super(SamplingProfilerMiddleware, self).__init__(app)
+        self.sampler = Sampler(CONF.profile_sampling_interval,
+                               CONF.profile_sampling_max_overhead)
+        self.pid = None
+        # NOTE: The pipeline is loaded by the parent, before the workers
+        # are forked. They inherit the signal handler.
+        self.parent_pid = os.getpid()
+        try:
+            signal.signal(signal.SIGUSR2, self.toggle)
+        except ValueError:
+            # Only the main thread may install signal handlers
+            LOG.warn(_LW("Unable to handle SIGUSR2 in this server, "
+                         "only profile_sampling starts stack sampling"))
+
+    def _setup(self):
+        # The sampling thread does not survive the fork of a worker
+        self.pid = os.getpid()
+        if self.sampler.running:
+            self.sampler.stop()
+        if CONF.profile_sampling:
+            self.sampler.start()
+
+    def toggle(self, *args):
+        """Start sampling, or dump the samples taken so far."""
+        if os.getpid() == self.parent_pid and wsgi.get_num_workers():
+            # NOTE: The parent serves no requests
+            return
+        if self.pid != os.getpid():
+            self._setup()
+        if not self.sampler.running:
+            LOG.info(_LI("Sampling request stacks every %.3fs"),
+                     self.sampler.interval)
+            self.sampler.start()
+            return
+
+        path = os.path.join(CONF.profile_sampling_dir or
+                            tempfile.gettempdir(),
+                            'xmonitor-%d-%s.collapsed' %
+                            (os.getpid(), time.strftime('%Y%m%d%H%M%S')))
+        try:
+            self.sampler.dump(path)
+        except EnvironmentError as e:
+            LOG.warn(_LW("Unable to write stack samples to %(path)s: "
+                         "%(error)s"), {'path': path, 'error': e})
+        if CONF.profile_sampling:
+            self.sampler.reset()
+        else:
+            self.sampler.stop()
+
+    def _mark(self, environ):
+        frame = sys._getframe(1)
+        self.sampler.requests[frame] = environ
+        self.sampler.greenlets[eventlet.greenthread.getcurrent()] = frame
+        return frame
+
+    def _unmark(self, frame):
+        self.sampler.greenlets.pop(eventlet.greenthread.getcurrent(), None)
+        del self.sampler.requests[frame]
+
+    def _iterate(self, app_iter, environ):
+        frame = self._mark(environ)
+        try:
+            for chunk in app_iter:
+                yield chunk
+        finally:
+            self._unmark(frame)
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def __call__(self, environ, start_response):
+        if self.pid != os.getpid():
+            self._setup()
+        if not self.sampler.running:
+            return self.application(environ, start_response)
+
+        frame = self._mark(environ)
+        try:
+            app_iter = self.application(environ, start_response)
+        finally:
+            self._unmark(frame)
+        return self._iterate(app_iter, environ)
@@ -412,6 +412,30 @@ class ImageTarget(object):
 
         return key
 
+    @classmethod
+    def snapshot(cls, image):
+        """Copy what an ImageTarget exposes of an image into a plain dict.
+
+        The attributes are those every proxy of an image passes on, looked
+        up as the target looks them up. A policy can then be enforced on
+        the image as it was, later on and without loading it again.
+        """
+        target = cls(image)
+        snapshot = dict(image.extra_properties)
+        for name in _IMAGE_ATTRIBUTES:
+            snapshot[name] = target[name]
+        snapshot['id'] = target['id']
+        return snapshot
+
+
+# The attributes of an image, other than its extra properties. Locations
+# are left out: reading them is subject to a policy of their own, and no
+# rule matches a list.
+_IMAGE_ATTRIBUTES = tuple(sorted(
+    name for name, value in vars(xmonitor.domain.proxy.Image).items()
+    if isinstance(value, property) and
+    name not in ('extra_properties', 'locations')))
+
 
 # Metadef Namespace classes
 class MetadefNamespaceProxy(xmonitor.domain.proxy.MetadefNamespace):
@@ -12,15 +12,23 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import base64
+import binascii
+import os
+
 import glance_store
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import encodeutils
 from oslo_utils import excutils
+import six
 import webob.exc
 
+from xmonitor.api import authorization
+from xmonitor.api import common as api_common
 import xmonitor.api.policy
 from xmonitor.common import exception
+from xmonitor.common import multipart
 from xmonitor.common import trust_auth
 from xmonitor.common import utils
 from xmonitor.common import wsgi
@@ -39,13 +47,13 @@ class ImageDataController(object):
     def __init__(self, db_api=None, store_api=None,
                  policy_enforcer=None, notifier=None,
                  gateway=None):
+        self.policy = policy_enforcer or xmonitor.api.policy.Enforcer()
         if gateway is None:
             db_api = db_api or xmonitor.db.get_api()
             store_api = store_api or glance_store
-            policy = policy_enforcer or xmonitor.api.policy.Enforcer()
             notifier = notifier or xmonitor.notifier.Notifier()
             gateway = xmonitor.gateway.Gateway(db_api, store_api,
-                                               notifier, policy)
+                                               notifier, self.policy)
         self.gateway = gateway
 
     def _restore(self, image_repo, image):
@@ -75,6 +83,7 @@ class ImageDataController(object):
             if image_repo and image:
                 image.status = 'killed'
                 image_repo.save(image)
+                multipart.delete_uploads(image.image_id)
         except Exception as e:
             msg = (_LE("Unable to delete image %(image_id)s: %(e)s") %
                    {'image_id': image.image_id,
@@ -248,6 +257,107 @@ class ImageDataController(object):
                                   "internal error"))
                 self._restore(image_repo, image)
 
+    def _get_upload(self, req, image_id, upload_id=None, queued=True):
+        """The multipart upload of an image the user may upload data to.
+
+        :param upload_id: the id of the upload, a new upload is created
+                          when it is None
+        :param queued: whether the image must still be waiting for its data
+        """
+        if not CONF.multipart_upload_dir:
+            msg = _("Multipart uploads are not enabled.")
+            raise webob.exc.HTTPNotImplemented(explanation=msg)
+
+        image_repo = self.gateway.get_repo(req.context)
+        try:
+            image = image_repo.get(image_id)
+            # NOTE: The parts are only handed to the image once they are
+            # all there, it is checked upfront that it would take them.
+            self.policy.enforce(req.context, 'upload_image',
+                                xmonitor.api.policy.ImageTarget(image))
+            if not authorization.is_image_mutable(req.context, image):
+                raise exception.Forbidden(
+                    _("Not allowed to upload image data for image %s") %
+                    image_id)
+            if upload_id is None:
+                upload = multipart.MultipartUpload.create(image_id)
+            else:
+                upload = multipart.MultipartUpload.get(image_id, upload_id)
+        except exception.NotFound as e:
+            raise webob.exc.HTTPNotFound(explanation=e.msg)
+        except exception.Forbidden as e:
+            LOG.debug("User not permitted to upload image data for image "
+                      "'%s'", image_id)
+            raise webob.exc.HTTPForbidden(explanation=e.msg)
+
+        if queued and image.status != 'queued':
+            msg = (_("Image %(image_id)s is %(status)s, only queued images "
+                     "take image data.") %
+                   {'image_id': image_id, 'status': image.status})
+            raise webob.exc.HTTPConflict(explanation=msg, request=req)
+        return upload
+
+    @utils.mutating
+    def create_upload(self, req, image_id):
+        multipart.expire_uploads()
+        upload = self._get_upload(req, image_id)
+        return {'image_id': image_id, 'upload_id': upload.upload_id,
+                'parts': []}
+
+    def show_upload(self, req, image_id, upload_id):
+        upload = self._get_upload(req, image_id, upload_id, queued=False)
+        return {'image_id': image_id, 'upload_id': upload_id,
+                'parts': upload.parts()}
+
+    @utils.mutating
+    def upload_part(self, req, image_id, upload_id, part_number, data,
+                    checksum=None):
+        try:
+            part_number = int(part_number)
+        except ValueError:
+            msg = _("Part number %s is not an integer") % part_number
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+
+        upload = self._get_upload(req, image_id, upload_id)
+        # NOTE: The parts are not accounted for in the storage usage of the
+        # user until the upload is completed, they are kept within what is
+        # left of the quota meanwhile.
+        remaining = api_common.get_remaining_quota(
+            req.context, self.gateway.db_api, image_id=image_id)
+        try:
+            return upload.add_part(part_number, data, checksum, remaining)
+        except exception.Invalid as e:
+            raise webob.exc.HTTPBadRequest(explanation=e.msg)
+        except exception.ImageSizeLimitExceeded as e:
+            msg = _("The incoming image part is "
+                    "too large: %s") % encodeutils.exception_to_unicode(e)
+            raise webob.exc.HTTPRequestEntityTooLarge(explanation=msg,
+                                                      request=req)
+        except (IOError, OSError) as e:
+            # NOTE: The upload was removed meanwhile
+            if not os.path.isdir(upload.path):
+                raise webob.exc.HTTPNotFound(
+                    explanation=encodeutils.exception_to_unicode(e))
+            raise
+
+    @utils.mutating
+    def complete_upload(self, req, image_id, upload_id, parts):
+        upload = self._get_upload(req, image_id, upload_id)
+        try:
+            size, data = upload.read(parts)
+        except exception.Invalid as e:
+            raise webob.exc.HTTPBadRequest(explanation=e.msg)
+
+        # NOTE: The parts are kept until the image data is saved, so that
+        # completing the upload can be tried again should that fail.
+        self.upload(req, image_id, data, size)
+        upload.delete()
+
+    @utils.mutating
+    def delete_upload(self, req, image_id, upload_id):
+        upload = self._get_upload(req, image_id, upload_id, queued=False)
+        upload.delete()
+
     def download(self, req, image_id):
         image_repo = self.gateway.get_repo(req.context)
         try:
@@ -276,6 +386,39 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
         image_size = request.content_length or None
         return {'size': image_size, 'data': request.body_file}
 
+    def upload_part(self, request):
+        try:
+            request.get_content_type(('application/octet-stream',))
+        except exception.InvalidContentType as e:
+            raise webob.exc.HTTPUnsupportedMediaType(explanation=e.msg)
+
+        checksum = None
+        content_md5 = request.headers.get('Content-MD5')
+        if content_md5:
+            try:
+                checksum = binascii.hexlify(
+                    base64.b64decode(content_md5)).decode('ascii')
+            except (TypeError, ValueError):
+                msg = _("Content-MD5 is not a base64 encoded MD5 digest")
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        return {'data': request.body_file, 'checksum': checksum}
+
+    def complete_upload(self, request):
+        body = self.default(request).get('body')
+        parts = body.get('parts') if isinstance(body, dict) else None
+        if not isinstance(parts, list) or not all(
+                isinstance(part, dict) for part in parts):
+            msg = _("Expected a list of parts, each with a part_number and "
+                    "optionally a checksum")
+            raise webob.exc.HTTPBadRequest(explanation=msg)
+        for part in parts:
+            checksum = part.get('checksum')
+            if checksum is not None and not isinstance(checksum,
+                                                       six.string_types):
+                msg = _("Checksums of parts must be strings")
+                raise webob.exc.HTTPBadRequest(explanation=msg)
+        return {'parts': parts}
+
 
 class ResponseSerializer(wsgi.JSONResponseSerializer):
 
@@ -322,6 +465,16 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
     def upload(self, response, result):
         response.status_int = 204
 
+    def create_upload(self, response, result):
+        response.status_int = 201
+        self.default(response, result)
+
+    def complete_upload(self, response, result):
+        response.status_int = 204
+
+    def delete_upload(self, response, result):
+        response.status_int = 204
+
 
 def create_resource():
     """Image data resource factory method"""
@@ -24,9 +24,11 @@ import six
 import six.moves.urllib.parse as urlparse
 import webob.exc
 
+from xmonitor.api import common as api_common
 from xmonitor.api import policy
 from xmonitor.common import exception
 from xmonitor.common import location_strategy
+from xmonitor.common import multipart
 from xmonitor.common import timeutils
 from xmonitor.common import utils
 from xmonitor.common import wsgi
@@ -47,13 +49,14 @@ CONF.import_opt('show_multiple_locations', 'xmonitor.common.config')
 
 class ImagesController(object):
     def __init__(self, db_api=None, policy_enforcer=None, notifier=None,
-                 store_api=None):
+                 store_api=None, validator_cache=None):
         self.db_api = db_api or xmonitor.db.get_api()
         self.policy = policy_enforcer or policy.Enforcer()
         self.notifier = notifier or xmonitor.notifier.Notifier()
         self.store_api = store_api or glance_store
         self.gateway = xmonitor.gateway.Gateway(self.db_api, self.store_api,
                                                 self.notifier, self.policy)
+        self.validator_cache = validator_cache
 
     @utils.mutating
     def create(self, req, image, extra_properties, tags):
@@ -123,7 +126,33 @@ class ImagesController(object):
         result['images'] = images
         return result
 
+    def _check_not_modified(self, req, image_id):
+        """Answer the revalidation of an unchanged image straight away.
+
+        When the entity tag sent by the client is the one this worker last
+        served to the same identity, and the image has not been updated
+        since, 304 is returned without going through the domain proxies and
+        the serializer. The get_image policy is enforced on the image as it
+        was served, which is how it still is. Any error is left to the
+        regular path to report.
+        """
+        if self.validator_cache is None or not req.if_none_match:
+            return
+        validators = self.validator_cache.get(req.context, image_id)
+        if validators is None or validators.etag not in req.if_none_match:
+            return
+        try:
+            updated_at = self.db_api.image_get_updated_at(req.context,
+                                                          image_id)
+            if updated_at != validators.updated_at:
+                return
+            self.policy.enforce(req.context, 'get_image', validators.target)
+        except (exception.NotFound, exception.Forbidden):
+            return
+        raise wsgi.not_modified(validators.etag, validators.last_modified)
+
     def show(self, req, image_id):
+        self._check_not_modified(req, image_id)
         image_repo = self.gateway.get_repo(req.context)
         try:
             return image_repo.get(image_id)
@@ -234,6 +263,7 @@ class ImagesController(object):
             image = image_repo.get(image_id)
             image.delete()
             image_repo.remove(image)
+            multipart.delete_uploads(image_id)
         except (glance_store.Forbidden, exception.Forbidden) as e:
             LOG.debug("User not permitted to delete image '%s'", image_id)
             raise webob.exc.HTTPForbidden(explanation=e.msg)
@@ -723,9 +753,10 @@ class RequestDeserializer(wsgi.JSONRequestDeserializer):
 
 
 class ResponseSerializer(wsgi.JSONResponseSerializer):
-    def __init__(self, schema=None):
+    def __init__(self, schema=None, validator_cache=None):
         super(ResponseSerializer, self).__init__()
         self.schema = schema or get_schema()
+        self.validator_cache = validator_cache
 
     def _get_image_href(self, image, subcollection=''):
         base_href = '/v2/images/%s' % image.image_id
@@ -799,6 +830,19 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         body = json.dumps(image_view, ensure_ascii=False)
         response.unicode_body = six.text_type(body)
         response.content_type = 'application/json'
+        response.last_modified = image.updated_at
+        self._remember_validators(response, image)
+
+    def _remember_validators(self, response, image):
+        request = response.request
+        if (self.validator_cache is None or request is None or
+                request.method != 'GET'):
+            return
+        response.etag = wsgi.body_etag(response.body)
+        self.validator_cache.set(request.context, image.image_id,
+                                 response.etag, response.last_modified,
+                                 image.updated_at,
+                                 policy.ImageTarget.snapshot(image))
 
     def update(self, response, image):
         image_view = self._format_image(image)
@@ -811,7 +855,6 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         params.pop('marker', None)
         query = urlparse.urlencode(params)
         body = {
-            'images': [self._format_image(i) for i in result['images']],
             'first': '/v2/images',
             'schema': '/v2/schemas/images',
         }
@@ -821,6 +864,11 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
             params['marker'] = result['next_marker']
             next_query = urlparse.urlencode(params)
             body['next'] = '/v2/images?%s' % next_query
+        if CONF.stream_list_responses:
+            self.stream_collection(response, 'images', result['images'],
+                                   self._format_image, body)
+            return
+        body['images'] = [self._format_image(i) for i in result['images']]
         response.unicode_body = six.text_type(json.dumps(body,
                                                          ensure_ascii=False))
         response.content_type = 'application/json'
@@ -1010,7 +1058,11 @@ def load_custom_properties():
 def create_resource(custom_properties=None):
     """Images resource factory method"""
     schema = get_schema(custom_properties)
+    validator_cache = None
+    if CONF.image_validator_cache_size:
+        validator_cache = api_common.ValidatorCache(
+            CONF.image_validator_cache_size)
     deserializer = RequestDeserializer(schema)
-    serializer = ResponseSerializer(schema)
-    controller = ImagesController()
+    serializer = ResponseSerializer(schema, validator_cache=validator_cache)
+    controller = ImagesController(validator_cache=validator_cache)
     return wsgi.Resource(controller, deserializer, serializer)
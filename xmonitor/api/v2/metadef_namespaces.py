@@ -30,6 +30,7 @@ from xmonitor.api.v2.model.metadef_property_type import PropertyType
 from xmonitor.api.v2.model.metadef_resource_type import ResourceTypeAssociation
 from xmonitor.api.v2.model.metadef_tag import MetadefTag
 from xmonitor.common import exception
+from xmonitor.common import metadef_cache
 from xmonitor.common import utils
 from xmonitor.common import wsgi
 from xmonitor.common import wsme_utils
@@ -824,4 +825,5 @@ def create_resource():
     deserializer = RequestDeserializer(schema)
     serializer = ResponseSerializer(schema)
     controller = NamespaceController()
-    return wsgi.Resource(controller, deserializer, serializer)
+    return metadef_cache.CachingResource(controller, deserializer,
+                                         serializer)
@@ -26,6 +26,7 @@ from xmonitor.api.v2 import metadef_namespaces as namespaces
 from xmonitor.api.v2.model.metadef_object import MetadefObject
 from xmonitor.api.v2.model.metadef_object import MetadefObjects
 from xmonitor.common import exception
+from xmonitor.common import metadef_cache
 from xmonitor.common import wsgi
 from xmonitor.common import wsme_utils
 import xmonitor.db
@@ -365,4 +366,5 @@ def create_resource():
     deserializer = RequestDeserializer(schema)
     serializer = ResponseSerializer(schema)
     controller = MetadefObjectsController()
-    return wsgi.Resource(controller, deserializer, serializer)
+    return metadef_cache.CachingResource(controller, deserializer,
+                                         serializer)
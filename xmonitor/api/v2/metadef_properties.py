@@ -26,6 +26,7 @@ from xmonitor.api.v2.model.metadef_namespace import Namespace
 from xmonitor.api.v2.model.metadef_property_type import PropertyType
 from xmonitor.api.v2.model.metadef_property_type import PropertyTypes
 from xmonitor.common import exception
+from xmonitor.common import metadef_cache
 from xmonitor.common import wsgi
 import xmonitor.db
 import xmonitor.gateway
@@ -312,4 +313,5 @@ def create_resource():
     deserializer = RequestDeserializer(schema)
     serializer = ResponseSerializer(schema)
     controller = NamespacePropertiesController()
-    return wsgi.Resource(controller, deserializer, serializer)
+    return metadef_cache.CachingResource(controller, deserializer,
+                                         serializer)
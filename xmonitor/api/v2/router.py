@@ -459,6 +459,43 @@ class API(wsgi.Router):
                        controller=reject_method_resource,
                        action='reject',
                        allowed_methods='GET, PUT')
+        mapper.connect('/images/{image_id}/file/uploads',
+                       controller=image_data_resource,
+                       action='create_upload',
+                       conditions={'method': ['POST']},
+                       body_reject=True)
+        mapper.connect('/images/{image_id}/file/uploads',
+                       controller=reject_method_resource,
+                       action='reject',
+                       allowed_methods='POST')
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}',
+                       controller=image_data_resource,
+                       action='show_upload',
+                       conditions={'method': ['GET']},
+                       body_reject=True)
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}',
+                       controller=image_data_resource,
+                       action='complete_upload',
+                       conditions={'method': ['POST']})
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}',
+                       controller=image_data_resource,
+                       action='delete_upload',
+                       conditions={'method': ['DELETE']},
+                       body_reject=True)
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}',
+                       controller=reject_method_resource,
+                       action='reject',
+                       allowed_methods='GET, POST, DELETE')
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}/parts/'
+                       '{part_number}',
+                       controller=image_data_resource,
+                       action='upload_part',
+                       conditions={'method': ['PUT']})
+        mapper.connect('/images/{image_id}/file/uploads/{upload_id}/parts/'
+                       '{part_number}',
+                       controller=reject_method_resource,
+                       action='reject',
+                       allowed_methods='PUT')
 
         image_tags_resource = image_tags.create_resource()
         mapper.connect('/images/{image_id}/tags/{tag_value}',
@@ -15,6 +15,7 @@
 # under the License.
 
 import copy
+import functools
 
 import debtcollector
 import glance_store
@@ -304,8 +305,6 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
         params.pop('marker', None)
         query = urlparse.urlencode(params)
         body = {
-            'tasks': [self._format_task_stub(self.partial_task_schema, task)
-                      for task in result['tasks']],
             'first': '/v2/tasks',
             'schema': '/v2/schemas/tasks',
         }
@@ -315,6 +314,15 @@ class ResponseSerializer(wsgi.JSONResponseSerializer):
             params['marker'] = result['next_marker']
             next_query = urlparse.urlencode(params)
             body['next'] = '/v2/tasks?%s' % next_query
+        if CONF.stream_list_responses:
+            formatter = functools.partial(self._format_task_stub,
+                                          self.partial_task_schema)
+            self.stream_collection(response, 'tasks', result['tasks'],
+                                   formatter, body)
+            return
+        body['tasks'] = [self._format_task_stub(self.partial_task_schema,
+                                                task)
+                         for task in result['tasks']]
         response.unicode_body = six.text_type(json.dumps(body,
                                                          ensure_ascii=False))
         response.content_type = 'application/json'
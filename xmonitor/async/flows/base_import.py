@@ -13,13 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
+import itertools
 import logging
 import os
 
 import glance_store as store_api
 from glance_store import backend
-from oslo_concurrency import processutils as putils
 from oslo_config import cfg
 from oslo_utils import encodeutils
 from oslo_utils import excutils
@@ -30,16 +29,44 @@ from taskflow import retry
 from taskflow import task
 from taskflow.types import failure
 
+from xmonitor.async.flows import ovf_process
 from xmonitor.common import exception
+from xmonitor.common import format_inspector
 from xmonitor.common.scripts.image_import import main as image_import
 from xmonitor.common.scripts import utils as script_utils
-from xmonitor.i18n import _, _LE, _LI
+from xmonitor.common import utils
+from xmonitor.i18n import _, _LE, _LI, _LW
 
 
 LOG = logging.getLogger(__name__)
 
 
 CONF = cfg.CONF
+CONF.import_opt('conversion_format', 'xmonitor.async.flows.convert',
+                group='taskflow_executor')
+
+# The most bytes the work dir held at once, as seen by this process
+_work_dir_peak = 0
+
+
+def _report_work_dir_usage(task_id):
+    """Log how many bytes the work dir holds and held at most so far."""
+    global _work_dir_peak
+    work_dir = CONF.task.work_dir
+    if work_dir is None:
+        return
+
+    usage = 0
+    for name in os.listdir(work_dir):
+        try:
+            usage += os.path.getsize(os.path.join(work_dir, name))
+        except OSError:
+            # NOTE: Removed meanwhile by another task
+            continue
+    _work_dir_peak = max(_work_dir_peak, usage)
+    LOG.info(_LI("%(task_id)s: The work dir holds %(usage)d bytes, "
+                 "%(peak)d bytes at most so far"),
+             {'task_id': task_id, 'usage': usage, 'peak': _work_dir_peak})
 
 
 class _CreateImage(task.Task):
@@ -83,11 +110,12 @@ class _ImportToFS(task.Task):
 
     default_provides = 'file_path'
 
-    def __init__(self, task_id, task_type, task_repo, uri):
+    def __init__(self, task_id, task_type, task_repo, uri, image_repo=None):
         self.task_id = task_id
         self.task_type = task_type
         self.task_repo = task_repo
         self.uri = uri
+        self.image_repo = image_repo
         super(_ImportToFS, self).__init__(
             name='%s-ImportToFS-%s' % (task_type, task_id))
 
@@ -147,23 +175,16 @@ class _ImportToFS(task.Task):
         # refer to the comment in the `_ImportToStore.execute` method.
         data = script_utils.get_image_data_iter(self.uri)
 
-        path = self.store.add(image_id, data, 0, context=None)[0]
+        # NOTE: Only the disk image of an OVA package is written to the
+        # work dir, it is extracted as the package is downloaded.
+        if (self.image_repo is not None and
+                self.image_repo.get(image_id).container_format == 'ova'):
+            data = ovf_process.extract_disk(self.image_repo, image_id, data)
 
-        try:
-            # NOTE(flaper87): Consider moving this code to a common
-            # place that other tasks can consume as well.
-            stdout, stderr = putils.trycmd('qemu-img', 'info',
-                                           '--output=json', path,
-                                           log_errors=putils.LOG_ALL_ERRORS)
-        except OSError as exc:
-            with excutils.save_and_reraise_exception():
-                exc_message = encodeutils.exception_to_unicode(exc)
-                msg = (_LE('Failed to execute security checks on the image '
-                           '%(task_id)s: %(exc)s') %
-                       {'task_id': self.task_id, 'exc': exc_message})
-                LOG.error(msg)
+        path = self.store.add(image_id, data, 0, context=None)[0]
+        _report_work_dir_usage(self.task_id)
 
-        metadata = json.loads(stdout)
+        metadata = format_inspector.inspect_file(path)
 
         backing_file = metadata.get('backing-filename')
         if backing_file is not None:
@@ -198,6 +219,7 @@ class _DeleteFromFS(task.Task):
 
         :param file_path: path to the file being deleted
         """
+        _report_work_dir_usage(self.task_id)
         store_api.delete_from_backend(file_path)
 
 
@@ -314,6 +336,116 @@ class _ImportToStore(task.Task):
         self.image_repo.save(image)
 
 
+class _StreamToStore(task.Task):
+    """Streams the image data from its source into the store in one pass.
+
+    Takes the place of `_ImportToFS`, the introspection and `_ImportToStore`
+    when nothing has to be done to the whole image before it is stored. The
+    disk image of an OVA package is extracted on the way.
+    """
+
+    def __init__(self, task_id, task_type, image_repo, uri):
+        self.task_id = task_id
+        self.task_type = task_type
+        self.image_repo = image_repo
+        self.uri = uri
+        super(_StreamToStore, self).__init__(
+            name='%s-StreamToStore-%s' % (task_type, task_id))
+
+    def _read_head(self, chunks):
+        head = []
+        size = 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= format_inspector.HEAD_SIZE:
+                break
+        return b''.join(head)
+
+    def _inspect(self, head):
+        metadata = format_inspector.inspect_head(head)
+        backing_file = metadata.get('backing-filename')
+        if backing_file is not None:
+            msg = _("File %(path)s has invalid backing file "
+                    "%(bfile)s, aborting.") % {'path': self.uri,
+                                               'bfile': backing_file}
+            raise RuntimeError(msg)
+        return metadata
+
+    def _set_format(self, image, metadata):
+        image.disk_format = metadata['format']
+        image.virtual_size = metadata.get('virtual-size', 0)
+
+    def _read_tail(self, image, data):
+        """Yield the data of a raw looking image, then set its format.
+
+        A fixed vhd image looks raw from its head, its footer is in its
+        last sector. The format is set once the store has read all of the
+        data, before it makes the image active.
+        """
+        tail = b''
+        size = 0
+        for chunk in data:
+            if len(chunk) >= format_inspector.SECTOR_SIZE:
+                tail = chunk[-format_inspector.SECTOR_SIZE:]
+            else:
+                tail = (tail + chunk)[-format_inspector.SECTOR_SIZE:]
+            size += len(chunk)
+            yield chunk
+
+        metadata = format_inspector.inspect_tail(tail, size)
+        if metadata is None:
+            metadata = {'format': 'raw', 'virtual-size': size}
+        self._set_format(image, metadata)
+
+    def execute(self, image_id):
+        """Inspect the start of the image and stream it to the store
+
+        :param image_id: Glance Image ID
+        """
+        data_iter = script_utils.get_image_data_iter(self.uri)
+        try:
+            data = data_iter
+            image = self.image_repo.get(image_id)
+            if image.container_format == 'ova':
+                data = ovf_process.extract_disk(self.image_repo, image_id,
+                                                data_iter)
+                # NOTE: Saved meanwhile with the properties of the package
+                image = self.image_repo.get(image_id)
+
+            chunks = iter(utils.chunkreadable(data))
+            head = self._read_head(chunks)
+            # NOTE: Nothing reaches the store before the image passed
+            # the checks.
+            metadata = self._inspect(head)
+            data = itertools.chain([head], chunks)
+
+            if metadata['format'] == 'raw':
+                # NOTE: The disk format can only be set on a queued image,
+                # the image stays queued until its last sector is read.
+                data = self._read_tail(image, data)
+            else:
+                self._set_format(image, metadata)
+                image.status = 'saving'
+                self.image_repo.save(image)
+
+            # NOTE: The store computes the checksum as it writes the data
+            image.set_data(data)
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                LOG.warn(_LW("Task %(task_id)s failed with exception "
+                             "%(error)s") %
+                         {"error": encodeutils.exception_to_unicode(e),
+                          "task_id": self.task_id})
+        finally:
+            if hasattr(data_iter, 'close'):
+                data_iter.close()
+
+        self.image_repo.save(image)
+        LOG.debug("%(task_id)s: Streamed %(size)d bytes to the store",
+                  {'task_id': self.task_id, 'size': image.size})
+
+
 class _SaveImage(task.Task):
 
     def __init__(self, task_id, task_type, image_repo):
@@ -347,16 +479,21 @@ class _CompleteTask(task.Task):
         super(_CompleteTask, self).__init__(
             name='%s-CompleteTask-%s' % (task_type, task_id))
 
-    def execute(self, image_id):
+    def execute(self, image_id, conversion=None):
         """Finishing the task flow
 
         :param image_id: Glance Image ID
+        :param conversion: the figures of the conversion of the image, if
+                           it was converted
         """
         task = script_utils.get_task(self.task_repo, self.task_id)
         if task is None:
             return
+        result = {'image_id': image_id}
+        if conversion is not None:
+            result['conversion'] = conversion
         try:
-            task.succeed({'image_id': image_id})
+            task.succeed(result)
         except Exception as e:
             # Note: The message string contains Error in it to indicate
             # in the task.message that it's a error message for the user.
@@ -396,6 +533,18 @@ def _get_import_flows(**kwargs):
         yield ext.obj
 
 
+def _stream_import(task_repo, task_id):
+    """Whether the image of an import task can be streamed to the store."""
+    if not CONF.task.stream_import:
+        return False
+
+    # NOTE: Converting needs the whole image on disk
+    if CONF.taskflow_executor.conversion_format is not None:
+        return False
+
+    return script_utils.get_task(task_repo, task_id) is not None
+
+
 def get_flow(**kwargs):
     """Return task flow
 
@@ -418,6 +567,14 @@ def get_flow(**kwargs):
 
     import_to_store = _ImportToStore(task_id, task_type, image_repo, uri)
 
+    if _stream_import(task_repo, task_id):
+        flow.add(
+            _StreamToStore(task_id, task_type, image_repo, uri),
+            _SaveImage(task_id, task_type, image_repo),
+            _CompleteTask(task_id, task_type, task_repo)
+        )
+        return flow
+
     try:
         # NOTE(flaper87): ImportToLocal and DeleteFromLocal shouldn't be here.
         # Ideally, we should have the different import flows doing this for us
@@ -432,7 +589,8 @@ def get_flow(**kwargs):
         limbo = lf.Flow(task_type).add(_ImportToFS(task_id,
                                                    task_type,
                                                    task_repo,
-                                                   uri))
+                                                   uri,
+                                                   image_repo))
 
         for subflow in _get_import_flows(**kwargs):
             limbo.add(subflow)
@@ -15,13 +15,15 @@
 
 import logging
 import os
+import time
 
 from oslo_concurrency import processutils as putils
 from oslo_config import cfg
 from taskflow.patterns import linear_flow as lf
 from taskflow import task
 
-from xmonitor.i18n import _, _LW
+from xmonitor.common import format_inspector
+from xmonitor.i18n import _, _LI, _LW
 
 LOG = logging.getLogger(__name__)
 
@@ -31,6 +33,19 @@ convert_task_opts = [
                help=_("The format to which images will be automatically "
                       "converted. When using the RBD backend, this should be "
                       "set to 'raw'")),
+    cfg.IntOpt('conversion_coroutines', min=1, max=16,
+               help=_("The number of coroutines qemu-img uses to convert "
+                      "an image. By default, the CPUs of the host are "
+                      "shared among the tasks an API worker runs at once, "
+                      "see max_concurrent_tasks.")),
+    cfg.BoolOpt('conversion_out_of_order', default=True,
+                help=_("Whether qemu-img may write the converted image out "
+                       "of order, which lets its coroutines work in "
+                       "parallel.")),
+    cfg.IntOpt('conversion_sparse_size', default=4096, min=0,
+               help=_("The size in bytes of the runs of zeroes qemu-img "
+                      "leaves unallocated in the converted image, to keep "
+                      "it sparse. 0 allocates all of the image.")),
 ]
 
 CONF = cfg.CONF
@@ -39,10 +54,27 @@ CONF = cfg.CONF
 # for now. It seems a waste to have a whole section dedicated to a
 # single task with a single option.
 CONF.register_opts(convert_task_opts, group='taskflow_executor')
+CONF.import_opt('max_concurrent_tasks', 'xmonitor.async.scheduler',
+                group='taskflow_executor')
+
+# Formats known to the format inspector, as named by qemu-img
+_QEMU_FORMATS = {'vhd': 'vpc', 'iso': 'raw'}
+
+
+def _coroutines():
+    coroutines = CONF.taskflow_executor.conversion_coroutines
+    if coroutines is None:
+        # NOTE: Every task running at once in the worker gets its share
+        # of the CPUs.
+        coroutines = (putils.get_worker_count() //
+                      CONF.taskflow_executor.max_concurrent_tasks)
+    return max(1, min(16, coroutines))
 
 
 class _Convert(task.Task):
 
+    default_provides = 'conversion'
+
     conversion_missing_warned = False
 
     def __init__(self, task_id, task_type, image_repo):
@@ -69,30 +101,56 @@ class _Convert(task.Task):
                 _Convert.conversion_missing_warned = True
             return
 
-        # TODO(flaper87): Check whether the image is in the desired
-        # format already. Probably using `qemu-img` just like the
-        # `Introspection` task.
-        dest_path = os.path.join(CONF.task.work_dir, "%s.converted" % image_id)
-        stdout, stderr = putils.trycmd('qemu-img', 'convert', '-O',
-                                       conversion_format, file_path, dest_path,
+        src_path = file_path.split("file://")[-1]
+        source_format = format_inspector.inspect_file(src_path)['format']
+        if source_format == conversion_format:
+            LOG.debug("%(task_id)s: Image already in %(format)s format, "
+                      "not converted", {'task_id': self.task_id,
+                                        'format': conversion_format})
+            return None
+
+        # NOTE: The source format is given rather than probed by qemu-img,
+        # which could take a raw image for another format.
+        args = ['qemu-img', 'convert',
+                '-f', _QEMU_FORMATS.get(source_format, source_format),
+                '-O', conversion_format,
+                '-m', str(_coroutines()),
+                '-S', str(CONF.taskflow_executor.conversion_sparse_size)]
+        if CONF.taskflow_executor.conversion_out_of_order:
+            args.append('-W')
+
+        dest_path = self._get_dest_path(image_id)
+        size = os.path.getsize(src_path)
+        start = time.time()
+        stdout, stderr = putils.trycmd(*(args + [src_path, dest_path]),
                                        log_errors=putils.LOG_ALL_ERRORS)
 
         if stderr:
             raise RuntimeError(stderr)
 
-        os.rename(dest_path, file_path.split("file://")[-1])
-        return file_path
+        seconds = time.time() - start
+        os.rename(dest_path, src_path)
 
-    def revert(self, image_id, result=None, **kwargs):
-        # NOTE(flaper87): If result is None, it probably
-        # means this task failed. Otherwise, we would have
-        # a result from its execution.
-        if result is None:
-            return
+        conversion = {'source_format': source_format,
+                      'format': conversion_format,
+                      'size': size,
+                      'seconds': round(seconds, 3),
+                      'bytes_per_second': int(size / max(seconds, 0.001))}
+        LOG.info(_LI("%(task_id)s: Converted %(size)d bytes from "
+                     "%(source_format)s to %(format)s in %(seconds).1fs, "
+                     "%(bytes_per_second)d bytes per second"),
+                 dict(conversion, task_id=self.task_id))
+        return conversion
 
-        fs_path = result.split("file://")[-1]
-        if os.path.exists(fs_path):
-            os.remove(fs_path)
+    def _get_dest_path(self, image_id):
+        return os.path.join(CONF.task.work_dir, "%s.converted" % image_id)
+
+    def revert(self, image_id, result=None, **kwargs):
+        # NOTE: A failed conversion may have left some output behind,
+        # the image it was converting is removed by `_ImportToFS`.
+        dest_path = self._get_dest_path(image_id)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
 
 
 def get_flow(**kwargs):
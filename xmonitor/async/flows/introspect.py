@@ -13,16 +13,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
 import logging
 
-from oslo_concurrency import processutils as putils
-from oslo_utils import encodeutils
-from oslo_utils import excutils
 from taskflow.patterns import linear_flow as lf
 
 from xmonitor.async import utils
-from xmonitor.i18n import _LE
+from xmonitor.common import format_inspector
 
 
 LOG = logging.getLogger(__name__)
@@ -45,28 +41,7 @@ class _Introspect(utils.OptionalTask):
         :param file_path: Path to the file being introspected
         """
 
-        try:
-            stdout, stderr = putils.trycmd('qemu-img', 'info',
-                                           '--output=json', file_path,
-                                           log_errors=putils.LOG_ALL_ERRORS)
-        except OSError as exc:
-            # NOTE(flaper87): errno == 2 means the executable file
-            # was not found. For now, log an error and move forward
-            # until we have a better way to enable/disable optional
-            # tasks.
-            if exc.errno != 2:
-                with excutils.save_and_reraise_exception():
-                    exc_message = encodeutils.exception_to_unicode(exc)
-                    msg = (_LE('Failed to execute introspection '
-                               '%(task_id)s: %(exc)s') %
-                           {'task_id': self.task_id, 'exc': exc_message})
-                    LOG.error(msg)
-            return
-
-        if stderr:
-            raise RuntimeError(stderr)
-
-        metadata = json.loads(stdout)
+        metadata = format_inspector.inspect_file(file_path)
         new_image = self.image_repo.get(image_id)
         new_image.virtual_size = metadata.get('virtual-size', 0)
         new_image.disk_format = metadata.get('format')
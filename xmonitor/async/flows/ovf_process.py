@@ -30,6 +30,7 @@ from six.moves import urllib
 from taskflow.patterns import linear_flow as lf
 from taskflow import task
 
+from xmonitor.common import utils
 from xmonitor import i18n
 
 
@@ -89,34 +90,50 @@ class _OVF_Process(task.Task):
         image = self.image_repo.get(image_id)
         # Expect 'ova' as image container format for OVF_Process task
         if image.container_format == 'ova':
-            # FIXME(dramakri): This is an admin-only feature for security
-            # reasons. Ideally this should be achieved by making the import
-            # task API admin only. This is one of the items that the upcoming
-            # import refactoring work plans to do. Until then, we will check
-            # the context as a short-cut.
-            if image.context and image.context.is_admin:
-                extractor = OVAImageExtractor()
-                data_iter = self._get_ova_iter_objects(file_path)
-                disk, properties = extractor.extract(data_iter)
-                image.extra_properties.update(properties)
-                image.container_format = 'bare'
-                self.image_repo.save(image)
-                dest_path = self._get_extracted_file_path(image_id)
-                with open(dest_path, 'wb') as f:
-                    shutil.copyfileobj(disk, f, 4096)
-
-                # Overwrite the input ova file since it is no longer needed
-                os.rename(dest_path, file_path.split("file://")[-1])
+            data_iter = self._get_ova_iter_objects(file_path)
+            disk = extract_disk(self.image_repo, image_id, data_iter)
+            dest_path = self._get_extracted_file_path(image_id)
+            with open(dest_path, 'wb') as f:
+                shutil.copyfileobj(disk, f, 4096)
 
-            else:
-                raise RuntimeError(_('OVA extract is limited to admin'))
+            # Overwrite the input ova file since it is no longer needed
+            os.rename(dest_path, file_path.split("file://")[-1])
 
         return file_path
 
     def revert(self, image_id, result, **kwargs):
         fs_path = self._get_extracted_file_path(image_id)
         if os.path.exists(fs_path):
-            os.path.remove(fs_path)
+            os.remove(fs_path)
+
+
+def extract_disk(image_repo, image_id, ova):
+    """Extracts the disk image of an OVA package being imported.
+
+    Saves the properties parsed from the OVF file to the image, which is
+    then a bare one.
+
+    :param image_repo: Image repository used
+    :param image_id: Id of the image the OVA package is imported to
+    :param ova: a file object or an iterator over the OVA package
+    :returns: a file object reading the disk image out of the package
+    :raises: RuntimeError if the image was not created by an admin
+    """
+    image = image_repo.get(image_id)
+    # FIXME(dramakri): This is an admin-only feature for security
+    # reasons. Ideally this should be achieved by making the import
+    # task API admin only. This is one of the items that the upcoming
+    # import refactoring work plans to do. Until then, we will check
+    # the context as a short-cut.
+    if not (image.context and image.context.is_admin):
+        raise RuntimeError(_('OVA extract is limited to admin'))
+
+    extractor = OVAImageExtractor()
+    disk, properties = extractor.extract(ova)
+    image.extra_properties.update(properties)
+    image.container_format = 'bare'
+    image_repo.save(image)
+    return disk
 
 
 class OVAImageExtractor(object):
@@ -134,28 +151,39 @@ class OVAImageExtractor(object):
         """Extracts disk image and OVF file from OVA package
 
         Extracts a single disk image and OVF from OVA tar archive and calls
-        OVF parser method.
-
-        :param ova: a file object containing the OVA file
-        :returns: a tuple of extracted disk file object and dictionary of
-            properties parsed from the OVF file
-        :raises: RuntimeError for malformed OVA and OVF files
+        OVF parser method. The archive is read once from start to end, so
+        it does not have to be staged in a file: the OVF file comes first
+        in an OVA package and the disk image is returned as soon as the
+        archive reaches it.
+
+        :param ova: a file object or an iterator over the OVA package
+        :returns: a tuple of a file object reading the disk image out of
+            the archive and dictionary of properties parsed from the OVF
+            file
+        :raises: RuntimeError for malformed OVA and OVF files, KeyError if
+            the disk image is not in the archive
         """
-        with tarfile.open(fileobj=ova) as tar_file:
-            filenames = tar_file.getnames()
-            ovf_filename = next((filename for filename in filenames
-                                 if filename.endswith('.ovf')), None)
-            if ovf_filename:
-                ovf = tar_file.extractfile(ovf_filename)
+        tar_file = tarfile.open(fileobj=utils.CooperativeReader(ova),
+                                mode='r|*')
+        disk_name, properties = None, None
+        for member in tar_file:
+            if properties is None:
+                if not member.name.endswith('.ovf'):
+                    raise RuntimeError(_('Could not find OVF file in OVA '
+                                         'archive file.'))
+                ovf = tar_file.extractfile(member)
                 disk_name, properties = self._parse_OVF(ovf)
                 ovf.close()
-            else:
-                raise RuntimeError(_('Could not find OVF file in OVA archive '
-                                     'file.'))
-
-            disk = tar_file.extractfile(disk_name)
-
-            return (disk, properties)
+            elif member.name == disk_name:
+                # NOTE: Read from the archive, it is only valid until the
+                # next member is looked for.
+                return (tar_file.extractfile(member), properties)
+
+        if properties is None:
+            raise RuntimeError(_('Could not find OVF file in OVA archive '
+                                 'file.'))
+        raise KeyError(_('Could not find disk image %s in OVA archive '
+                         'file.') % disk_name)
 
     def _parse_OVF(self, ovf):
         """Parses the OVF file
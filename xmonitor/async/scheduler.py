@@ -0,0 +1,189 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded execution of the tasks run by an API worker.
+
+At most ``max_concurrent_tasks`` tasks run at once in a worker. The tasks
+beyond that wait for their turn, up to ``max_queued_tasks`` of them, and
+the ones after those are failed right away. Waiting tasks are started by
+priority, tasks created by admins first. Within a priority the owners of
+the tasks take turns, so that one tenant creating many tasks does not hold
+back the tasks of the others.
+
+The scheduler also times each stage of the tasks it ran, for the stage
+timings to be logged along with the queue depth when a task ends. Both
+are reported by the ``tasks`` backend of the healthcheck filter as well.
+"""
+
+import collections
+import os
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_middleware.healthcheck import pluginbase
+
+from xmonitor.common import exception
+from xmonitor.i18n import _, _LI
+
+LOG = logging.getLogger(__name__)
+
+task_scheduler_opts = [
+    cfg.IntOpt('max_concurrent_tasks', default=4, min=1,
+               help=_('The number of tasks each API worker runs at once. '
+                      'Further tasks wait for one of those to end.')),
+    cfg.IntOpt('max_queued_tasks', default=64, min=0,
+               help=_('The number of tasks that may wait to be run in each '
+                      'API worker. Tasks created while that many are '
+                      'waiting fail right away.')),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(task_scheduler_opts, group='taskflow_executor')
+
+HIGH_PRIORITY = 0
+NORMAL_PRIORITY = 1
+
+_scheduler = None
+
+
+class TaskQueueFull(exception.TaskException):
+    message = _("Too many tasks are waiting to be run, try again later.")
+
+
+class _Waiter(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.since = time.time()
+
+
+class TaskScheduler(object):
+    """Lets a bounded number of tasks run at once, by priority and owner."""
+
+    def __init__(self, size, queue_size):
+        self.size = size
+        self.queue_size = queue_size
+        self.running = 0
+        self.queued = 0
+        # priority -> owner -> waiters, owners in the order of their turns
+        self._queues = collections.defaultdict(collections.OrderedDict)
+        self._lock = threading.Lock()
+        # stage -> [count, total seconds, max seconds]
+        self.stages = collections.defaultdict(lambda: [0, 0.0, 0.0])
+
+    def _next(self):
+        for priority in sorted(self._queues):
+            owners = self._queues[priority]
+            if not owners:
+                continue
+            owner, waiters = owners.popitem(last=False)
+            waiter = waiters.popleft()
+            if waiters:
+                # Back of the line for the owner's next task
+                owners[owner] = waiters
+            return waiter
+        return None
+
+    def acquire(self, owner, priority=NORMAL_PRIORITY):
+        """Wait for the turn of a task to run.
+
+        :returns: the seconds spent waiting
+        :raises: TaskQueueFull if too many tasks are waiting already
+        """
+        with self._lock:
+            if self.running < self.size and not self.queued:
+                self.running += 1
+                return 0.0
+            if self.queued >= self.queue_size:
+                raise TaskQueueFull()
+            waiter = _Waiter()
+            owners = self._queues[priority]
+            owners.setdefault(owner, collections.deque()).append(waiter)
+            self.queued += 1
+
+        waiter.event.wait()
+        return time.time() - waiter.since
+
+    def release(self):
+        """End a task, starting the next one waiting if any."""
+        with self._lock:
+            waiter = self._next()
+            if waiter is None:
+                self.running -= 1
+                return
+            # NOTE: The slot goes straight to the next task, so that no
+            # task arriving meanwhile can take it.
+            self.queued -= 1
+        waiter.event.set()
+
+    def record(self, stage, seconds):
+        """Account for a stage of a task that took that many seconds."""
+        timing = self.stages[stage]
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] = max(timing[2], seconds)
+
+    def stats(self):
+        """The queue depth and the timings of the stages run so far."""
+        return {'running': self.running, 'queued': self.queued,
+                'stages': dict((stage, {'count': count,
+                                        'average': total / count,
+                                        'max': longest})
+                               for stage, (count, total, longest)
+                               in self.stages.items())}
+
+    def report(self, task_id, waited):
+        """Log how a task went along with the queue depth."""
+        stats = self.stats()
+        LOG.info(_LI("Task %(task_id)s ended after waiting %(waited).1fs to "
+                     "run, %(running)d tasks running and %(queued)d "
+                     "waiting. Stage timings: %(stages)s"),
+                 {'task_id': task_id, 'waited': waited,
+                  'running': stats['running'], 'queued': stats['queued'],
+                  'stages': ', '.join(
+                      '%s %d runs, %.1fs on average, %.1fs at most' %
+                      (stage, timing['count'], timing['average'],
+                       timing['max'])
+                      for stage, timing in sorted(stats['stages'].items()))})
+
+
+def get_scheduler():
+    """The scheduler of the tasks of this process."""
+    global _scheduler
+    # NOTE: Tasks are run by the workers, which fork off a parent that
+    # may have run tasks already.
+    if _scheduler is None or _scheduler[0] != os.getpid():
+        options = CONF.taskflow_executor
+        _scheduler = (os.getpid(),
+                      TaskScheduler(options.max_concurrent_tasks,
+                                    options.max_queued_tasks))
+    return _scheduler[1]
+
+
+class TaskSchedulerHealthcheck(pluginbase.HealthcheckBaseExtension):
+    """Healthcheck backend reporting the tasks of a worker.
+
+    Enabled by adding ``tasks`` to the backends of the healthcheck filter.
+    With ``detailed`` set, the number of tasks running and waiting in the
+    worker that served the check, and the timings of the stages it ran,
+    are in the details.
+    """
+
+    def healthcheck(self, server_port):
+        return pluginbase.HealthcheckResult(
+            available=True, reason=_("OK"), details=get_scheduler().stats())
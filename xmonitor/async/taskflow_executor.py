@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+import time
+
 import futurist
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -21,12 +24,15 @@ from oslo_utils import excutils
 from six.moves import urllib
 from stevedore import driver
 from taskflow import engines
+from taskflow.listeners import base
 from taskflow.listeners import logging as llistener
+from taskflow import states
 
 import xmonitor.async
+from xmonitor.async import scheduler
 from xmonitor.common import exception
 from xmonitor.common.scripts import utils as script_utils
-from xmonitor.i18n import _, _LE
+from xmonitor.i18n import _, _LE, _LW
 
 LOG = logging.getLogger(__name__)
 
@@ -42,8 +48,9 @@ taskflow_executor_opts = [
     cfg.IntOpt('max_workers',
                default=10,
                help=_("The number of parallel activities executed at the "
-                      "same time by the engine. The value can be greater "
-                      "than one when the engine mode is 'parallel'."),
+                      "same time by the engine, for all the tasks an API "
+                      "worker runs. The value can be greater than one when "
+                      "the engine mode is 'parallel'."),
                deprecated_opts=[_deprecated_opt])
 ]
 
@@ -51,6 +58,30 @@ taskflow_executor_opts = [
 CONF = cfg.CONF
 CONF.register_opts(taskflow_executor_opts, group='taskflow_executor')
 
+# pid -> the executor shared by the engines of the tasks of that process
+_executors = {}
+
+
+class _StageTimer(base.Listener):
+    """Records how long each task of a flow took with the scheduler."""
+
+    def __init__(self, engine, task_scheduler):
+        super(_StageTimer, self).__init__(engine)
+        self.scheduler = task_scheduler
+        self.started = {}
+
+    def _task_receiver(self, state, details):
+        name = details['task_name']
+        if state == states.RUNNING:
+            self.started[name] = time.time()
+        elif state in (states.SUCCESS, states.FAILURE) and (
+                name in self.started):
+            # NOTE: Tasks are named <task type>-<stage>-<task id>
+            parts = name.split('-')
+            stage = parts[1] if len(parts) > 2 else name
+            self.scheduler.record(stage,
+                                  time.time() - self.started.pop(name))
+
 
 class TaskExecutor(xmonitor.async.TaskExecutor):
 
@@ -66,15 +97,22 @@ class TaskExecutor(xmonitor.async.TaskExecutor):
     def _fetch_an_executor():
         if CONF.taskflow_executor.engine_mode != 'parallel':
             return None
-        else:
+
+        # NOTE: One executor for all the tasks of a worker, it bounds the
+        # activities they run at once.
+        pid = os.getpid()
+        if pid not in _executors:
+            _executors.clear()
             max_workers = CONF.taskflow_executor.max_workers
             try:
-                return futurist.GreenThreadPoolExecutor(
+                _executors[pid] = futurist.GreenThreadPoolExecutor(
                     max_workers=max_workers)
             except RuntimeError:
                 # NOTE(harlowja): I guess eventlet isn't being made
                 # useable, well just use native threads then (or try to).
-                return futurist.ThreadPoolExecutor(max_workers=max_workers)
+                _executors[pid] = futurist.ThreadPoolExecutor(
+                    max_workers=max_workers)
+        return _executors[pid]
 
     def _get_flow(self, task):
         try:
@@ -103,8 +141,11 @@ class TaskExecutor(xmonitor.async.TaskExecutor):
             raise NotImplementedError()
 
     def begin_processing(self, task_id):
+        # NOTE: The task is left pending here, _run sets it processing once
+        # the scheduler lets it run.
+        task = self.task_repo.get(task_id)
         try:
-            super(TaskExecutor, self).begin_processing(task_id)
+            self._run(task_id, task.type)
         except exception.ImportTaskError as exc:
             LOG.error(_LE('Failed to execute task %(task_id)s: %(exc)s') %
                       {'task_id': task_id, 'exc': exc.msg})
@@ -126,14 +167,30 @@ class TaskExecutor(xmonitor.async.TaskExecutor):
             return
 
         flow = self._get_flow(task)
-        executor = self._fetch_an_executor()
+
+        task_scheduler = scheduler.get_scheduler()
+        priority = (scheduler.HIGH_PRIORITY if self.context.is_admin
+                    else scheduler.NORMAL_PRIORITY)
         try:
+            waited = task_scheduler.acquire(task.owner, priority)
+        except scheduler.TaskQueueFull as exc:
+            LOG.warn(_LW('Not running task %(task_id)s: %(exc)s') %
+                     {'task_id': task_id, 'exc': exc.msg})
+            task.fail(exc.msg)
+            self.task_repo.save(task)
+            return
+
+        try:
+            task.begin_processing()
+            self.task_repo.save(task)
+            executor = self._fetch_an_executor()
             engine = engines.load(
                 flow,
                 engine=CONF.taskflow_executor.engine_mode, executor=executor,
                 max_workers=CONF.taskflow_executor.max_workers)
             with llistener.DynamicLoggingListener(engine, log=LOG):
-                engine.run()
+                with _StageTimer(engine, task_scheduler):
+                    engine.run()
         except Exception as exc:
             with excutils.save_and_reraise_exception():
                 LOG.error(_LE('Failed to execute task %(task_id)s: %(exc)s') %
@@ -144,5 +201,5 @@ class TaskExecutor(xmonitor.async.TaskExecutor):
                 task.fail(_('Task failed due to Internal Error'))
                 self.task_repo.save(task)
         finally:
-            if executor is not None:
-                executor.shutdown()
+            task_scheduler.release()
+            task_scheduler.report(task_id, waited)
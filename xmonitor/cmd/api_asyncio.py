@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Glance API Server running on asyncio
+
+Serves the same paste pipeline as xmonitor-api, with the application
+running on native threads instead of greenthreads. Nothing is monkey
+patched. Requires Python 3.
+"""
+
+import os
+import sys
+
+# If ../xmonitor/__init__.py exists, add ../ to Python search path, so that
+# it will override what happens to be installed in /usr/(local/)lib/python...
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'xmonitor', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import oslo_messaging
+from oslo_utils import encodeutils
+import osprofiler.notifier
+import osprofiler.web
+
+from xmonitor.common import asyncio_wsgi
+from xmonitor.common import config
+from xmonitor import notifier
+
+CONF = cfg.CONF
+CONF.import_group("profiler", "xmonitor.common.wsgi")
+logging.register_options(CONF)
+
+
+def main():
+    config.parse_args()
+    config.set_config_defaults()
+    logging.setup(CONF, 'xmonitor')
+    notifier.set_defaults()
+    if cfg.CONF.profiler.enabled:
+        _notifier = osprofiler.notifier.create("Messaging",
+                                               oslo_messaging, {},
+                                               notifier.get_transport(),
+                                               "xmonitor", "api",
+                                               cfg.CONF.bind_host)
+        osprofiler.notifier.set(_notifier)
+        osprofiler.web.enable(cfg.CONF.profiler.hmac_keys)
+    else:
+        osprofiler.web.disable()
+
+    server = asyncio_wsgi.Server(initialize_glance_store=True)
+    try:
+        server.start(config.load_paste_app('xmonitor-api'),
+                     default_port=9696)
+    except RuntimeError as e:
+        sys.stderr.write("ERROR: %s\n" % encodeutils.exception_to_unicode(e))
+        sys.exit(1)
+    server.wait()
+
+
+if __name__ == '__main__':
+    main()
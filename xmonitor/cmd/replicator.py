@@ -18,21 +18,29 @@
 
 from __future__ import print_function
 
+import collections
+import datetime
+import functools
+import gzip
 import os
 import sys
+import threading
+import time
+import zlib
 
+import futurist
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
 from oslo_utils import uuidutils
-import six
 from six.moves import http_client
 import six.moves.urllib.parse as urlparse
 from webob import exc
 
 from xmonitor.common import config
 from xmonitor.common import exception
+from xmonitor.common import timeutils
 from xmonitor.common import utils
 from xmonitor.i18n import _, _LE, _LI, _LW
 
@@ -70,6 +78,31 @@ cli_opts = [
                default='',
                help=("Pass in your authentication token if you have "
                      "one. This is the token used for the slave.")),
+    cfg.IntOpt('workers',
+               short='w',
+               dest='image_workers',
+               default=4,
+               min=1,
+               help="Number of images to replicate in parallel."),
+    cfg.StrOpt('journal',
+               short='j',
+               help=("File recording the images a livecopy has finished "
+                     "with. An interrupted livecopy given the same file "
+                     "resumes where it stopped. The file is removed once "
+                     "every image has been replicated.")),
+    cfg.IntOpt('retries',
+               short='r',
+               default=3,
+               min=0,
+               help=("Number of times the replication of an image is "
+                     "retried after a connection or server error, waiting "
+                     "twice as long before each retry.")),
+    cfg.StrOpt('sync_state',
+               short='s',
+               help=("File keeping the time up to which the slave is in "
+                     "sync with the master. When given, livecopy only "
+                     "replicates the images changed since the previous "
+                     "successful livecopy, including deleted ones.")),
     cfg.StrOpt('command',
                positional=True,
                help="Command to be given to replicator"),
@@ -109,6 +142,26 @@ IMAGE_ALREADY_PRESENT_MESSAGE = _('The image %s is already present on '
                                   'do not have permissions to see all '
                                   'the images on the slave server.')
 
+# Name of the manifest holding the image metadata of a dump
+MANIFEST_NAME = 'manifest.gz'
+
+# Size of the buffers used when reading and writing image data files
+IO_BUFFER_SIZE = 1024 * 1024
+
+# Seconds to wait before the first retry of a failed image replication
+RETRY_DELAY = 1
+
+# Seconds by which consecutive incremental livecopies overlap, so that
+# changes made within the same second as the last one seen are not missed
+SYNC_OVERLAP = 1
+
+# Statuses of the images that are or are about to be deleted
+DELETED_STATUSES = ('deleted', 'pending_delete')
+
+# Errors after which replicating an image is worth another try
+RETRIABLE_ERRORS = (IOError, http_client.HTTPException,
+                    exc.HTTPInternalServerError)
+
 
 class ImageService(object):
     def __init__(self, conn, auth_token):
@@ -181,12 +234,20 @@ class ImageService(object):
             response.read()
         return response
 
-    def get_images(self):
+    def get_images(self, changes_since=None):
         """Return a detailed list of images.
 
+        changes_since: only list the images changed since this ISO 8601
+                       time, oldest change first. The list then includes
+                       deleted images.
+
         Yields a series of images as dicts containing metadata.
         """
         params = {'is_public': None}
+        if changes_since:
+            params.update({'changes-since': changes_since,
+                           'sort_key': 'updated_at',
+                           'sort_dir': 'asc'})
 
         while True:
             url = '/v1/images/detail'
@@ -213,6 +274,14 @@ class ImageService(object):
         url = '/v1/images/%s' % image_uuid
         return self._http_request('GET', url, {}, '')
 
+    def delete_image(self, image_uuid):
+        """Delete an image.
+
+        image_uuid: the id of an image
+        """
+        url = '/v1/images/%s' % image_uuid
+        self._http_request('DELETE', url, {}, '', ignore_result_body=True)
+
     @staticmethod
     def _header_list_to_dict(headers):
         """Expand a list of headers into a dictionary.
@@ -313,6 +382,157 @@ def get_image_service():
     return ImageService
 
 
+class Manifest(object):
+    """Compressed, append-only record of the images in a dump.
+
+    Holds the metadata of one image per line. An image is appended once
+    it has been dumped completely, so the images listed are the ones an
+    interrupted dump does not have to fetch again. A tail left truncated
+    by an interruption is dropped when the manifest is next opened.
+    """
+
+    def __init__(self, path):
+        """Initialize the Manifest.
+
+        path: the manifest file
+        """
+        self.path = path
+        self.images = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        if os.path.exists(path):
+            self._read()
+
+    def _read(self):
+        for line in self._lines():
+            image = jsonutils.loads(line)
+            self.images[image['id']] = image
+        # NOTE: Rewriting leaves the file ending on a complete gzip member,
+        # which the entries added next have to follow.
+        self._rewrite()
+
+    def _lines(self):
+        """Yield the complete lines of the manifest.
+
+        The file is decompressed by hand rather than through gzip, which
+        raises on a truncated member before returning the lines it holds.
+        """
+        buf = b''
+        error = None
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            with open(self.path, 'rb') as manifest_file:
+                chunk = manifest_file.read(IO_BUFFER_SIZE)
+                while chunk:
+                    buf += decompressor.decompress(chunk)
+                    lines = buf.split(b'\n')
+                    buf = lines.pop()
+                    for line in lines:
+                        yield line
+                    if decompressor.unused_data:
+                        # Every time the manifest was opened for appending
+                        # a new member was started
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(
+                            16 + zlib.MAX_WBITS)
+                    else:
+                        chunk = manifest_file.read(IO_BUFFER_SIZE)
+        except zlib.error as e:
+            error = encodeutils.exception_to_unicode(e)
+        if buf and error is None:
+            error = _('incomplete entry')
+        if error is not None:
+            LOG.warn(_LW('Dropping the truncated end of %(path)s: '
+                         '%(error)s'),
+                     {'path': self.path, 'error': error})
+
+    def _rewrite(self):
+        new_path = self.path + '.new'
+        with gzip.open(new_path, 'wb') as manifest_file:
+            for image in self.images.values():
+                manifest_file.write(self._encode(image))
+        os.rename(new_path, self.path)
+
+    @staticmethod
+    def _encode(image):
+        return encodeutils.safe_encode(jsonutils.dumps(image) + '\n')
+
+    def __contains__(self, image_uuid):
+        return image_uuid in self.images
+
+    def __iter__(self):
+        return iter(list(self.images.values()))
+
+    def add(self, image):
+        """Append the metadata of a dumped image."""
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, 'ab')
+            self._file.write(self._encode(image))
+            # NOTE: Flushing ends the entry on a byte boundary, so that it
+            # can be read back even if the dump is interrupted later on.
+            self._file.flush()
+            self.images[image['id']] = image
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _wait_to_retry(options, clients, attempt, image_uuid, error):
+    """Prepare for another try at an image that failed to replicate.
+
+    Returns: False once the retries are exhausted
+    """
+    clients.reset()
+    if attempt >= options.retries:
+        return False
+    delay = RETRY_DELAY * 2 ** attempt
+    LOG.warn(_LW('Replicating image %(id)s failed, retrying in '
+                 '%(delay)d seconds: %(error)s'),
+             {'id': image_uuid, 'delay': delay,
+              'error': encodeutils.exception_to_unicode(error)})
+    time.sleep(delay)
+    return True
+
+
+def _with_retries(options, clients, image_uuid, func, *args):
+    """Call func, retrying on connection and server errors."""
+    attempt = 0
+    while True:
+        try:
+            return func(*args)
+        except RETRIABLE_ERRORS as e:
+            if not _wait_to_retry(options, clients, attempt, image_uuid, e):
+                raise
+            attempt += 1
+
+
+def _run_parallel(options, func, images):
+    """Call func for every image in a pool of options.image_workers threads.
+
+    Returns: a tuple of (the ids of the images func returned True for,
+             the number of images func failed for)
+    """
+    done = []
+    failed = 0
+    workers = options.image_workers
+    with futurist.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(func, image) for image in images]
+        for image, future in zip(images, futures):
+            try:
+                if future.result():
+                    done.append(image['id'])
+            except Exception as e:
+                failed += 1
+                LOG.error(_LE('Unable to replicate image %(id)s: %(error)s'),
+                          {'id': image['id'],
+                           'error': encodeutils.exception_to_unicode(e)})
+    return done, failed
+
+
 def replication_size(options, args):
     """%(prog)s size <server:port>
 
@@ -344,6 +564,29 @@ def replication_size(options, args):
            'img_count': count})
 
 
+def _dump_image(options, clients, manifest, path, image):
+    """Dump a single image, data first, then its metadata."""
+    if image['status'] == 'active' and not options.metaonly:
+        # Now fetch the image. The metadata returned in headers here is the
+        # same as that which we got from the detailed images request
+        # earlier, so we can ignore it here. Note that we also only dump
+        # active images.
+        LOG.debug('Image %s is active', image['id'])
+        master_client = clients.get()[0]
+        image_response = master_client.get_image(image['id'])
+        data_path = os.path.join(path, image['id'] + '.img')
+        with open(data_path + '.part', 'wb', IO_BUFFER_SIZE) as f:
+            while True:
+                chunk = image_response.read(options.chunksize)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.rename(data_path + '.part', data_path)
+
+    manifest.add(image)
+    return True
+
+
 def replication_dump(options, args):
     """%(prog)s dump <server:port> <path>
 
@@ -358,39 +601,31 @@ def replication_dump(options, args):
         raise TypeError(_("Too few arguments."))
 
     path = args.pop()
-    server, port = utils.parse_valid_host_port(args.pop())
+    server = utils.parse_valid_host_port(args.pop())
 
-    imageservice = get_image_service()
-    client = imageservice(http_client.HTTPConnection(server, port),
-                          options.mastertoken)
-    for image in client.get_images():
+    clients = _Clients(options, master=server)
+    manifest = Manifest(os.path.join(path, MANIFEST_NAME))
+    images = []
+    for image in clients.get()[0].get_images():
         LOG.debug('Considering: %s', image['id'])
-
-        data_path = os.path.join(path, image['id'])
-        if not os.path.exists(data_path):
+        if image['id'] not in manifest:
             LOG.info(_LI('Storing: %s'), image['id'])
+            images.append(image)
+    clients.reset()
 
-            # Dump xmonitor information
-            if six.PY3:
-                f = open(data_path, 'w', encoding='utf-8')
-            else:
-                f = open(data_path, 'w')
-            with f:
-                f.write(jsonutils.dumps(image))
-
-            if image['status'] == 'active' and not options.metaonly:
-                # Now fetch the image. The metadata returned in headers here
-                # is the same as that which we got from the detailed images
-                # request earlier, so we can ignore it here. Note that we also
-                # only dump active images.
-                LOG.debug('Image %s is active', image['id'])
-                image_response = client.get_image(image['id'])
-                with open(data_path + '.img', 'wb') as f:
-                    while True:
-                        chunk = image_response.read(options.chunksize)
-                        if not chunk:
-                            break
-                        f.write(chunk)
+    try:
+        dumped, failed = _run_parallel(
+            options, lambda image: _with_retries(options, clients,
+                                                 image['id'], _dump_image,
+                                                 options, clients, manifest,
+                                                 path, image), images)
+    finally:
+        manifest.close()
+
+    if failed:
+        LOG.error(_LE('%d images could not be dumped, run the dump again '
+                      'to retry them.'), failed)
+    return dumped
 
 
 def _dict_diff(a, b):
@@ -408,7 +643,7 @@ def _dict_diff(a, b):
         return True
 
     for key in a:
-        if str(a[key]) != str(b[key]):
+        if a[key] != b[key]:
             LOG.debug('metadata diff -- value differs for key '
                       '%(key)s: master "%(master_value)s" vs '
                       'slave "%(slave_value)s"',
@@ -420,6 +655,99 @@ def _dict_diff(a, b):
     return False
 
 
+def _normalize_meta(meta):
+    """Image metadata in the form HEAD response headers give it.
+
+    Image listings keep the JSON types of the values. HEAD responses carry
+    strings only, leave out unset values and lower case property names.
+    Metadata from both has to be brought to the same form to be compared.
+    """
+    normalized = {}
+    for key, value in meta.items():
+        if key == 'properties':
+            value = dict((name.lower(), '%s' % prop)
+                         for name, prop in (value or {}).items()
+                         if prop is not None)
+            if not value:
+                continue
+        elif value is None:
+            continue
+        else:
+            value = '%s' % value
+        normalized[key] = value
+    return normalized
+
+
+def _read_dump(path):
+    """Read the image metadata of a dump.
+
+    Dumps written before the manifest was introduced keep the metadata of
+    every image in a file of its own, named after the image.
+
+    Returns: the image metadata by image id
+    """
+    images = collections.OrderedDict()
+    for ent in sorted(os.listdir(path)):
+        if uuidutils.is_uuid_like(ent):
+            with open(os.path.join(path, ent)) as meta_file:
+                images[ent] = jsonutils.loads(meta_file.read())
+
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        manifest = Manifest(manifest_path)
+        images.update((image['id'], image) for image in manifest)
+    return images
+
+
+def _load_image(options, clients, journal, path, slave_images, meta):
+    """Load a single image into the slave.
+
+    Returns: True if the slave has been updated
+    """
+    image_uuid = meta['id']
+    LOG.info(_LI('Considering: %s'), image_uuid)
+    slave_client = clients.get()[1]
+    updated = False
+
+    if image_uuid in slave_images:
+        # NOTE(mikal): Perhaps we just need to update the metadata?
+        # Note that we don't attempt to change an image file once it
+        # has been uploaded.
+        LOG.debug('Image %s already present', image_uuid)
+        headers = dict(slave_images[image_uuid])
+        for key in options.dontreplicate.split(' '):
+            if key in headers:
+                LOG.debug('Stripping %(header)s from slave '
+                          'metadata', {'header': key})
+                del headers[key]
+
+        if _dict_diff(_normalize_meta(meta), _normalize_meta(headers)):
+            LOG.info(_LI('Image %s metadata has changed'), image_uuid)
+            headers, body = slave_client.add_image_meta(meta)
+            _check_upload_response_headers(headers, body)
+            updated = True
+
+    else:
+        data_path = os.path.join(path, image_uuid + '.img')
+        if not os.path.exists(data_path):
+            LOG.debug('%s dump is missing image data, skipping',
+                      image_uuid)
+            return False
+
+        # Upload the image itself
+        with open(data_path, 'rb', IO_BUFFER_SIZE) as img_file:
+            try:
+                headers, body = slave_client.add_image(meta, img_file)
+                _check_upload_response_headers(headers, body)
+                updated = True
+            except exc.HTTPConflict:
+                LOG.error(_LE(IMAGE_ALREADY_PRESENT_MESSAGE)
+                          % image_uuid)  # noqa
+
+    journal.record(image_uuid)
+    return updated
+
+
 def replication_load(options, args):
     """%(prog)s load <server:port> <path>
 
@@ -434,65 +762,255 @@ def replication_load(options, args):
         raise TypeError(_("Too few arguments."))
 
     path = args.pop()
-    server, port = utils.parse_valid_host_port(args.pop())
+    server = utils.parse_valid_host_port(args.pop())
 
-    imageservice = get_image_service()
-    client = imageservice(http_client.HTTPConnection(server, port),
-                          options.slavetoken)
+    clients = _Clients(options, slave=server)
+    slave_images = dict((image['id'], image)
+                        for image in clients.get()[1].get_images())
+    clients.reset()
 
-    updated = []
+    journal = Journal(options.journal)
+    images = []
+    for image_uuid, meta in _read_dump(path).items():
+        if image_uuid in journal:
+            LOG.debug('Image %s already loaded', image_uuid)
+            continue
 
-    for ent in os.listdir(path):
-        if uuidutils.is_uuid_like(ent):
-            image_uuid = ent
-            LOG.info(_LI('Considering: %s'), image_uuid)
+        # Remove keys which don't make sense for replication
+        for key in options.dontreplicate.split(' '):
+            if key in meta:
+                LOG.debug('Stripping %(header)s from saved '
+                          'metadata', {'header': key})
+                del meta[key]
+        images.append(meta)
+
+    updated, failed = _run_parallel(
+        options, lambda meta: _with_retries(options, clients, meta['id'],
+                                            _load_image, options, clients,
+                                            journal, path, slave_images,
+                                            meta), images)
+
+    journal.close(complete=not failed)
+    if failed:
+        LOG.error(_LE('%d images could not be loaded, run the load again '
+                      'to retry them.'), failed)
+    return updated
 
-            meta_file_name = os.path.join(path, image_uuid)
-            with open(meta_file_name) as meta_file:
-                meta = jsonutils.loads(meta_file.read())
 
-            # Remove keys which don't make sense for replication
-            for key in options.dontreplicate.split(' '):
-                if key in meta:
-                    LOG.debug('Stripping %(header)s from saved '
-                              'metadata', {'header': key})
-                    del meta[key]
-
-            if _image_present(client, image_uuid):
-                # NOTE(mikal): Perhaps we just need to update the metadata?
-                # Note that we don't attempt to change an image file once it
-                # has been uploaded.
-                LOG.debug('Image %s already present', image_uuid)
-                headers = client.get_image_meta(image_uuid)
-                for key in options.dontreplicate.split(' '):
-                    if key in headers:
-                        LOG.debug('Stripping %(header)s from slave '
-                                  'metadata', {'header': key})
-                        del headers[key]
-
-                if _dict_diff(meta, headers):
-                    LOG.info(_LI('Image %s metadata has changed'), image_uuid)
-                    headers, body = client.add_image_meta(meta)
-                    _check_upload_response_headers(headers, body)
-                    updated.append(meta['id'])
+class Journal(object):
+    """Record of the images a livecopy has finished with.
 
-            else:
-                if not os.path.exists(os.path.join(path, image_uuid + '.img')):
-                    LOG.debug('%s dump is missing image data, skipping',
-                              image_uuid)
+    Every image is appended to the journal file as soon as it is done,
+    so that a livecopy interrupted for whatever reason does not have to
+    start over.
+    """
+
+    def __init__(self, path):
+        """Initialize the Journal.
+
+        path: the journal file, or None to keep the record in memory only
+        """
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            if os.path.exists(path):
+                with open(path) as journal_file:
+                    self.done = set(line.strip() for line in journal_file
+                                    if line.strip())
+            self._file = open(path, 'a')
+
+    def __contains__(self, image_uuid):
+        return image_uuid in self.done
+
+    def record(self, image_uuid):
+        """Record an image as replicated."""
+        with self._lock:
+            self.done.add(image_uuid)
+            if self._file:
+                self._file.write('%s\n' % image_uuid)
+                self._file.flush()
+
+    def close(self, complete):
+        """Close the journal, removing it once it is no longer needed.
+
+        complete: True if every image has been replicated
+        """
+        if self._file:
+            self._file.close()
+            self._file = None
+            if complete:
+                os.unlink(self.path)
+
+
+class SyncState(object):
+    """Time up to which the slave is known to be in sync with the master."""
+
+    def __init__(self, path):
+        """Initialize the SyncState.
+
+        path: the file the state is kept in
+        """
+        self.path = path
+        self.changes_since = None
+        if os.path.exists(path):
+            with open(path) as state_file:
+                state = jsonutils.loads(state_file.read())
+            self.changes_since = state.get('changes_since')
+
+    def save(self, changes_since):
+        """Record that the slave is in sync up to the given time."""
+        # NOTE: Write a new file and move it in place, so that the state
+        # is never left half written.
+        new_path = self.path + '.new'
+        with open(new_path, 'w') as state_file:
+            state_file.write(jsonutils.dumps(
+                {'changes_since': changes_since}))
+        os.rename(new_path, self.path)
+        self.changes_since = changes_since
+
+
+class _Clients(threading.local):
+    """Master and slave clients, with their own connections per thread."""
+
+    def __init__(self, options, master=None, slave=None):
+        self.options = options
+        self.master = master
+        self.slave = slave
+        self.conns = None
+        self.clients = None
+
+    def get(self):
+        """Return a tuple of (master client, slave client).
+
+        The client of a server that was not given is None.
+        """
+        if self.clients is None:
+            imageservice = get_image_service()
+            self.conns = []
+            self.clients = []
+            for server, token in ((self.master, 'mastertoken'),
+                                  (self.slave, 'slavetoken')):
+                if server is None:
+                    self.clients.append(None)
                     continue
+                conn = http_client.HTTPConnection(*server)
+                self.conns.append(conn)
+                self.clients.append(
+                    imageservice(conn, getattr(self.options, token)))
+            self.clients = tuple(self.clients)
+        return self.clients
 
-                # Upload the image itself
-                with open(os.path.join(path, image_uuid + '.img')) as img_file:
-                    try:
-                        headers, body = client.add_image(meta, img_file)
-                        _check_upload_response_headers(headers, body)
-                        updated.append(meta['id'])
-                    except exc.HTTPConflict:
-                        LOG.error(_LE(IMAGE_ALREADY_PRESENT_MESSAGE)
-                                  % image_uuid)  # noqa
+    def reset(self):
+        """Drop the connections, which may be unusable after an error."""
+        for conn in self.conns or []:
+            conn.close()
+        self.conns = None
+        self.clients = None
 
-    return updated
+
+def _livecopy_image(options, master_client, slave_client, image,
+                    slave_image):
+    """Replicate a single image.
+
+    image: the master image metadata
+    slave_image: the slave image metadata, None if the slave lacks it
+
+    Returns: True if the slave has been updated
+    """
+    if image['status'] in DELETED_STATUSES:
+        if (slave_image is None or
+                slave_image['status'] in DELETED_STATUSES):
+            return False
+        LOG.info(_LI('Image %s has been deleted, deleting it from the '
+                     'slave'), image['id'])
+        slave_client.delete_image(image['id'])
+        return True
+
+    if slave_image is not None:
+        # NOTE(mikal): Perhaps we just need to update the metadata?
+        # Note that we don't attempt to change an image file once it
+        # has been uploaded.
+        if slave_image['status'] != 'active':
+            return False
+
+        slave_image = dict(slave_image)
+        for key in options.dontreplicate.split(' '):
+            if key in slave_image:
+                LOG.debug('Stripping %(header)s from slave metadata',
+                          {'header': key})
+                del slave_image[key]
+
+        # NOTE: After a retry the slave image comes from HEAD headers
+        if _dict_diff(_normalize_meta(image), _normalize_meta(slave_image)):
+            LOG.info(_LI('Image %s metadata has changed'), image['id'])
+            headers, body = slave_client.add_image_meta(image)
+            _check_upload_response_headers(headers, body)
+            return True
+        return False
+
+    if image['status'] != 'active':
+        return False
+
+    LOG.info(_LI('Image %s is being synced'), image['id'])
+    if options.metaonly:
+        return False
+
+    image_response = master_client.get_image(image['id'])
+    try:
+        headers, body = slave_client.add_image(image, image_response)
+        _check_upload_response_headers(headers, body)
+        return True
+    except exc.HTTPConflict:
+        LOG.error(_LE(IMAGE_ALREADY_PRESENT_MESSAGE) % image['id'])  # noqa
+        return False
+
+
+def _get_slave_image(slave_client, image_uuid):
+    """Return the slave image metadata, None if the slave lacks the image."""
+    headers = slave_client.get_image_meta(image_uuid)
+    return headers if 'status' in headers else None
+
+
+def _replicate_image(options, clients, journal, slave_images, image):
+    """Replicate a single image, retrying on connection and server errors.
+
+    slave_images: the slave images by id, None to look the image up on
+                  the slave instead
+
+    Returns: True if the slave has been updated
+    """
+    looked_up = slave_images is not None
+    slave_image = slave_images.get(image['id']) if looked_up else None
+    attempt = 0
+    while True:
+        master_client, slave_client = clients.get()
+        try:
+            if not looked_up:
+                slave_image = _get_slave_image(slave_client, image['id'])
+                looked_up = True
+            updated = _livecopy_image(options, master_client, slave_client,
+                                      image, slave_image)
+            journal.record(image['id'])
+            return updated
+        except RETRIABLE_ERRORS as e:
+            if not _wait_to_retry(options, clients, attempt, image['id'], e):
+                raise
+            attempt += 1
+
+        if looked_up and slave_image is None:
+            # The upload may have got far enough to create the image
+            master_client, slave_client = clients.get()
+            headers = slave_client.get_image_meta(image['id'])
+            if 'status' in headers:
+                if headers['status'] != 'active':
+                    msg = (_('Image %(id)s was left %(status)s on the slave '
+                             'and has to be deleted there before it can be '
+                             'replicated again.') %
+                           {'id': image['id'], 'status': headers['status']})
+                    raise exception.UploadException(msg)
+                slave_image = headers
 
 
 def replication_livecopy(options, args):
@@ -508,60 +1026,58 @@ def replication_livecopy(options, args):
     if len(args) < 2:
         raise TypeError(_("Too few arguments."))
 
-    imageservice = get_image_service()
-
-    slave_server, slave_port = utils.parse_valid_host_port(args.pop())
-    slave_conn = http_client.HTTPConnection(slave_server, slave_port)
-    slave_client = imageservice(slave_conn, options.slavetoken)
-
-    master_server, master_port = utils.parse_valid_host_port(args.pop())
-    master_conn = http_client.HTTPConnection(master_server, master_port)
-    master_client = imageservice(master_conn, options.mastertoken)
-
-    updated = []
-
-    for image in master_client.get_images():
+    slave = utils.parse_valid_host_port(args.pop())
+    master = utils.parse_valid_host_port(args.pop())
+    clients = _Clients(options, master, slave)
+    master_client, slave_client = clients.get()
+
+    state = SyncState(options.sync_state) if options.sync_state else None
+    if state is not None and state.changes_since:
+        LOG.info(_LI('Replicating the images changed since %s'),
+                 state.changes_since)
+        master_images = master_client.get_images(
+            changes_since=state.changes_since)
+        # Only the few images that changed are looked up on the slave
+        slave_images = None
+    else:
+        master_images = master_client.get_images()
+        # Compare against one listing of the slave rather than asking it
+        # about every image on its own.
+        slave_images = dict((image['id'], image)
+                            for image in slave_client.get_images())
+
+    journal = Journal(options.journal)
+    jobs = []
+    last_change = None
+    for image in master_images:
         LOG.debug('Considering %(id)s', {'id': image['id']})
+        if image.get('updated_at'):
+            updated_at = timeutils.normalize_time(
+                timeutils.parse_isotime(image['updated_at']))
+            last_change = max(last_change or updated_at, updated_at)
+        if image['id'] in journal:
+            LOG.debug('Image %s already replicated', image['id'])
+            continue
+
         for key in options.dontreplicate.split(' '):
             if key in image:
                 LOG.debug('Stripping %(header)s from master metadata',
                           {'header': key})
                 del image[key]
-
-        if _image_present(slave_client, image['id']):
-            # NOTE(mikal): Perhaps we just need to update the metadata?
-            # Note that we don't attempt to change an image file once it
-            # has been uploaded.
-            headers = slave_client.get_image_meta(image['id'])
-            if headers['status'] == 'active':
-                for key in options.dontreplicate.split(' '):
-                    if key in image:
-                        LOG.debug('Stripping %(header)s from master '
-                                  'metadata', {'header': key})
-                        del image[key]
-                    if key in headers:
-                        LOG.debug('Stripping %(header)s from slave '
-                                  'metadata', {'header': key})
-                        del headers[key]
-
-                if _dict_diff(image, headers):
-                    LOG.info(_LI('Image %s metadata has changed'), image['id'])
-                    headers, body = slave_client.add_image_meta(image)
-                    _check_upload_response_headers(headers, body)
-                    updated.append(image['id'])
-
-        elif image['status'] == 'active':
-            LOG.info(_LI('Image %s is being synced'), image['id'])
-            if not options.metaonly:
-                image_response = master_client.get_image(image['id'])
-                try:
-                    headers, body = slave_client.add_image(image,
-                                                           image_response)
-                    _check_upload_response_headers(headers, body)
-                    updated.append(image['id'])
-                except exc.HTTPConflict:
-                    LOG.error(_LE(IMAGE_ALREADY_PRESENT_MESSAGE) % image['id'])  # noqa
-
+        jobs.append(image)
+    clients.reset()
+
+    updated, failed = _run_parallel(
+        options, functools.partial(_replicate_image, options, clients,
+                                   journal, slave_images), jobs)
+
+    journal.close(complete=not failed)
+    if failed:
+        LOG.error(_LE('%d images could not be replicated, run the livecopy '
+                      'again to retry them.'), failed)
+    elif state is not None and last_change is not None:
+        state.save(timeutils.isotime(
+            last_change - datetime.timedelta(seconds=SYNC_OVERLAP)))
     return updated
 
 
@@ -589,10 +1105,12 @@ def replication_compare(options, args):
     master_client = imageservice(master_conn, options.mastertoken)
 
     differences = {}
+    slave_images = dict((image['id'], image)
+                        for image in slave_client.get_images())
 
     for image in master_client.get_images():
-        if _image_present(slave_client, image['id']):
-            headers = slave_client.get_image_meta(image['id'])
+        if image['id'] in slave_images:
+            headers = dict(slave_images[image['id']])
             for key in options.dontreplicate.split(' '):
                 if key in image:
                     LOG.debug('Stripping %(header)s from master metadata',
@@ -642,18 +1160,6 @@ def _check_upload_response_headers(headers, body):
             raise exception.UploadException(body)
 
 
-def _image_present(client, image_uuid):
-    """Check if an image is present in xmonitor.
-
-    client: the ImageService
-    image_uuid: the image uuid to check
-
-    Returns: True if the image is present
-    """
-    headers = client.get_image_meta(image_uuid)
-    return 'status' in headers
-
-
 def print_help(options, args):
     """Print help specific to a command.
 
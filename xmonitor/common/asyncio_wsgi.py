@@ -0,0 +1,928 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+WSGI server running on an asyncio event loop.
+
+An alternative to the eventlet based :class:`xmonitor.common.wsgi.Server`,
+available on Python 3. The event loop of a worker only parses requests and
+moves bytes. The application, with all of its blocking database and store
+calls, runs on a pool of native threads, so that nothing needs to be
+monkey patched. Responses are written without joining their chunks and
+files handed to ``wsgi.file_wrapper`` are sent with ``loop.sendfile`` where
+the event loop supports it.
+
+The prefork worker management, socket setup and configuration reloading
+are those of :class:`xmonitor.common.wsgi.Server`.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import email.utils
+import os
+import signal
+import socket
+import ssl
+import sys
+import threading
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+import six
+from six.moves.urllib import parse as urlparse
+
+from xmonitor.common import utils
+from xmonitor.common import wsgi
+from xmonitor.i18n import _, _LE, _LI
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+
+# Bytes of a request body, or of pipelined requests, buffered per
+# connection before reading from the client pauses
+READ_BUFFER_SIZE = 1024 * 1024
+
+# Maximum number of header lines of a request
+MAX_HEADERS = 100
+
+# Seconds between two checks whether a connection was dropped while an
+# application thread waits for its output to be written
+SEND_CHECK_INTERVAL = 1
+
+ACCESS_LOG_FORMAT = ('%(client_ip)s - - [%(date_time)s] "%(request_line)s" '
+                     '%(status_code)s %(body_length)s %(wall_seconds).6f')
+
+
+class ConnectionClosed(Exception):
+    """The client went away while a response was being sent."""
+
+
+class FileWrapper(object):
+    """``wsgi.file_wrapper`` whose files are sent with sendfile."""
+
+    def __init__(self, filelike, block_size=65536):
+        self.filelike = filelike
+        self.block_size = block_size
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.block_size)
+            if not data:
+                break
+            yield data
+
+
+class RequestBody(object):
+    """``wsgi.input`` fed by the event loop and read by the application.
+
+    :param pause: called from the event loop when too much of the body is
+                  buffered
+    :param resume: called from the reading thread once the buffer drained
+    :param expect_continue: called from the reading thread before the
+                            body is first read
+    """
+
+    def __init__(self, pause, resume, expect_continue=None):
+        self._pause = pause
+        self._resume = resume
+        self._expect_continue = expect_continue
+        self._chunks = collections.deque()
+        self._buffered = 0
+        self._paused = False
+        self._eof = False
+        self._cond = threading.Condition()
+
+    def feed(self, data):
+        with self._cond:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            pause = not self._paused and self._buffered > READ_BUFFER_SIZE
+            if pause:
+                self._paused = True
+            self._cond.notify()
+        if pause:
+            self._pause()
+
+    def feed_eof(self):
+        with self._cond:
+            self._eof = True
+            self._cond.notify()
+
+    def _start(self):
+        # Called by the reading thread without self._cond held, as the
+        # event loop may be waiting for it to feed the body
+        if self._expect_continue is not None:
+            expect_continue, self._expect_continue = (
+                self._expect_continue, None)
+            expect_continue()
+
+    def _next_chunk(self):
+        # Called with self._cond held
+        while not self._chunks and not self._eof:
+            self._cond.wait()
+        if not self._chunks:
+            return None
+        return self._chunks.popleft()
+
+    def _consumed(self, chunks):
+        # Called with self._cond held
+        self._buffered -= sum(len(chunk) for chunk in chunks)
+        if self._paused and self._buffered <= READ_BUFFER_SIZE // 2:
+            self._paused = False
+            self._resume()
+        if len(chunks) == 1:
+            return chunks[0]
+        return b''.join(chunks)
+
+    def read(self, size=-1):
+        chunks = []
+        self._start()
+        with self._cond:
+            while size:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                if 0 < size < len(chunk):
+                    self._chunks.appendleft(chunk[size:])
+                    chunk = chunk[:size]
+                chunks.append(chunk)
+                if size > 0:
+                    size -= len(chunk)
+            return self._consumed(chunks)
+
+    def readline(self, size=-1):
+        chunks = []
+        length = 0
+        self._start()
+        with self._cond:
+            while size < 0 or length < size:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                end = chunk.find(b'\n') + 1 or len(chunk)
+                if size >= 0:
+                    end = min(end, size - length)
+                if end < len(chunk):
+                    self._chunks.appendleft(chunk[end:])
+                    chunk = chunk[:end]
+                chunks.append(chunk)
+                length += len(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+            return self._consumed(chunks)
+
+    def readlines(self, hint=-1):
+        lines = []
+        length = 0
+        for line in self:
+            lines.append(line)
+            length += len(line)
+            if 0 < hint <= length:
+                break
+        return lines
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+
+class Response(object):
+    """Thread side of a request: runs the application and sends its output.
+
+    :param protocol: the HttpProtocol of the connection
+    :param environ: the WSGI environment of the request
+    :param keep_alive: whether the connection may serve further requests
+    """
+
+    def __init__(self, protocol, environ, keep_alive):
+        self.protocol = protocol
+        self.environ = environ
+        self.keep_alive = keep_alive
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.send_body = True
+        self.chunked = False
+        self.content_length = None
+        self.length_hint = None
+        self.bytes_sent = 0
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self.headers_sent:
+                    six.reraise(*exc_info)
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError("Headers already set")
+        self.status = status
+        self.headers = headers
+        return self.write
+
+    def _send_headers(self):
+        if self.status is None:
+            raise AssertionError("write() before start_response()")
+        self.headers_sent = True
+        status_code = int(self.status.split(' ', 1)[0])
+        self.send_body = (self.environ['REQUEST_METHOD'] != 'HEAD' and
+                          status_code >= 200 and
+                          status_code not in (204, 304))
+
+        headers = list(self.headers)
+        names = {}
+        for name, value in headers:
+            names[name.lower()] = value
+        if 'content-length' in names:
+            self.content_length = int(names['content-length'])
+        elif self.length_hint is not None:
+            self.content_length = self.length_hint
+            headers.append(('Content-Length', str(self.length_hint)))
+        elif not self.send_body:
+            pass
+        elif self.environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+            self.chunked = True
+            headers.append(('Transfer-Encoding', 'chunked'))
+        else:
+            self.keep_alive = False
+
+        if 'date' not in names:
+            headers.append(('Date', email.utils.formatdate(usegmt=True)))
+        if not self.keep_alive:
+            headers.append(('Connection', 'close'))
+        elif self.environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            headers.append(('Connection', 'keep-alive'))
+
+        lines = ['HTTP/1.1 %s\r\n' % self.status]
+        lines.extend('%s: %s\r\n' % header for header in headers)
+        lines.append('\r\n')
+        self.protocol.send([''.join(lines).encode('latin-1')])
+
+    def write(self, data):
+        if not self.headers_sent:
+            self._send_headers()
+        if not data or not self.send_body:
+            return
+        if self.chunked:
+            self.protocol.send([('%x\r\n' % len(data)).encode('ascii'),
+                                data, b'\r\n'])
+        else:
+            self.protocol.send([data])
+        self.bytes_sent += len(data)
+
+    @staticmethod
+    def _file_range(app_iter):
+        """Return the offset and length left of a wrapped file, if known."""
+        try:
+            offset = app_iter.filelike.tell()
+            size = os.fstat(app_iter.filelike.fileno()).st_size
+        except (AttributeError, EnvironmentError, ValueError):
+            return None, None
+        return offset, size - offset
+
+    def _sendfile(self, app_iter, offset):
+        """Send a file with sendfile, if the event loop can.
+
+        :returns: False if the file has to be read and written instead
+        """
+        loop = self.protocol.loop
+        if (not hasattr(loop, 'sendfile') or
+                self.environ['REQUEST_METHOD'] == 'HEAD'):
+            return False
+
+        self._send_headers()
+        if not self.send_body:
+            return True
+        future = asyncio.run_coroutine_threadsafe(
+            loop.sendfile(self.protocol.transport, app_iter.filelike,
+                          offset, min(self.content_length,
+                                      self.length_hint)), loop)
+        try:
+            self.bytes_sent += future.result()
+        except (EnvironmentError, RuntimeError) as e:
+            raise ConnectionClosed(e)
+        return True
+
+    def send(self, app_iter):
+        if isinstance(app_iter, FileWrapper) and not self.headers_sent:
+            offset, self.length_hint = self._file_range(app_iter)
+            if offset is not None and self._sendfile(app_iter, offset):
+                return
+        if isinstance(app_iter, (list, tuple)):
+            self.length_hint = sum(len(data) for data in app_iter)
+        for data in app_iter:
+            self.write(data)
+        if not self.headers_sent:
+            self.length_hint = 0
+            self._send_headers()
+        if self.chunked:
+            self.protocol.send([b'0\r\n\r\n'])
+
+    def send_error(self):
+        self.status = '500 Internal Server Error'
+        self.headers = [('Content-Type', 'text/plain')]
+        self.keep_alive = False
+        body = b'Internal Server Error'
+        self.length_hint = len(body)
+        self.write(body)
+
+    def __call__(self):
+        """Run the application.
+
+        :returns: whether the connection may serve further requests
+        """
+        started = time.time()
+        app_iter = None
+        try:
+            try:
+                app_iter = self.protocol.service.application(
+                    self.environ, self.start_response)
+                self.send(app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+        except ConnectionClosed:
+            return False
+        except Exception:
+            LOG.exception(_LE("Unhandled error serving %s"),
+                          self.environ['REQUEST_LINE'])
+            if self.headers_sent:
+                return False
+            try:
+                self.send_error()
+            except ConnectionClosed:
+                return False
+
+        self.protocol.service.logger.info(ACCESS_LOG_FORMAT % {
+            'client_ip': self.environ['REMOTE_ADDR'],
+            'date_time': time.strftime('%d/%b/%Y %H:%M:%S'),
+            'request_line': self.environ['REQUEST_LINE'],
+            'status_code': self.status.split(' ', 1)[0],
+            'body_length': self.bytes_sent,
+            'wall_seconds': time.time() - started})
+        if (self.content_length is not None and self.send_body and
+                self.bytes_sent != self.content_length):
+            return False
+        return self.keep_alive
+
+
+class HttpProtocol(asyncio.Protocol):
+    """HTTP/1.1 connection handing requests to the application threads."""
+
+    def __init__(self, service):
+        self.service = service
+        self.loop = service.loop
+        self.transport = None
+        self.closed = False
+        self.peer = None
+        self._buffer = b''
+        self._active = False
+        self._body = None
+        self._chunked = False
+        self._state = None
+        self._remaining = 0
+        self._reading_paused = False
+        self._writing_paused = False
+        self._drain_waiters = []
+        self._idle_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername') or ('', 0)
+        self.service.connections.add(self)
+        self._start_idle_timer()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._cancel_idle_timer()
+        if self._body is not None:
+            self._body.feed_eof()
+        self._wake_writers(ConnectionClosed(exc))
+        self.service.connection_closed(self)
+
+    def data_received(self, data):
+        self._buffer = self._buffer + data if self._buffer else data
+        self._process()
+
+    @property
+    def idle(self):
+        return not self._active
+
+    def close(self):
+        if not self.closed:
+            self.transport.close()
+
+    def abort(self):
+        """Drop the connection once the event loop stopped.
+
+        Application threads still serving it fail instead of waiting for
+        the event loop forever.
+        """
+        self.closed = True
+        if self._body is not None:
+            self._body.feed_eof()
+        self._wake_writers(ConnectionClosed())
+        self.transport.abort()
+
+    def _start_idle_timer(self):
+        if self.service.timeout:
+            self._idle_timer = self.loop.call_later(self.service.timeout,
+                                                    self.close)
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _pause_reading(self):
+        if not self._reading_paused and not self.closed:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def _resume_reading(self):
+        if self._reading_paused and not self.closed:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+    def pause_writing(self):
+        self._writing_paused = True
+
+    def resume_writing(self):
+        self._writing_paused = False
+        self._wake_writers()
+
+    def _wake_writers(self, exc=None):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+    def _write(self, parts, waiter):
+        if self.closed:
+            waiter.set_exception(ConnectionClosed())
+            return
+        self.transport.writelines(parts)
+        if self._writing_paused:
+            self._drain_waiters.append(waiter)
+        else:
+            waiter.set_result(None)
+
+    def send(self, parts):
+        """Write to the client from an application thread.
+
+        Blocks while the transport has more buffered than it wants to.
+        """
+        if self.closed:
+            raise ConnectionClosed()
+        waiter = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(self._write, parts, waiter)
+        while True:
+            try:
+                return waiter.result(SEND_CHECK_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                # The event loop may have stopped for good
+                if self.closed:
+                    raise ConnectionClosed()
+
+    def _reject(self, status):
+        self.transport.write(('HTTP/1.1 %s\r\nContent-Length: 0\r\n'
+                              'Connection: close\r\n\r\n' %
+                              status).encode('latin-1'))
+        self.transport.close()
+        self._buffer = b''
+
+    def _process(self):
+        while not self.closed:
+            if self._body is not None:
+                if not self._feed_body():
+                    return
+            elif self._active:
+                # Pipelined requests wait for the current one
+                if len(self._buffer) > READ_BUFFER_SIZE:
+                    self._pause_reading()
+                return
+            elif not self._start_request():
+                return
+
+    def _parse_head(self):
+        """Split the request head off the buffer.
+
+        :returns: the request line and the list of headers, None if the
+                  head is incomplete, or the status to reject it with
+        """
+        max_line = CONF.max_header_line
+        self._buffer = self._buffer.lstrip(b'\r\n')
+        end = self._buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self._buffer) > max_line * MAX_HEADERS:
+                return '431 Request Header Fields Too Large'
+            return None
+
+        lines = self._buffer[:end].decode('latin-1').split('\r\n')
+        self._buffer = self._buffer[end + 4:]
+        if len(lines) > MAX_HEADERS + 1 or max(map(len, lines)) > max_line:
+            return '431 Request Header Fields Too Large'
+        headers = []
+        for line in lines[1:]:
+            if line[:1] in (' ', '\t') and headers:
+                # Obsolete line folding
+                name, value = headers.pop()
+                headers.append((name, value + ' ' + line.strip()))
+                continue
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                return '400 Bad Request'
+            headers.append((name, value.strip()))
+        return lines[0], headers
+
+    def _build_environ(self, request_line, headers):
+        method, target, version = request_line.split(' ')
+        path, _sep, query = target.partition('?')
+        environ = dict(self.service.base_environ)
+        environ.update({
+            'REQUEST_METHOD': method,
+            'REQUEST_LINE': request_line,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urlparse.unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': self.peer[0],
+            'REMOTE_PORT': str(self.peer[1]),
+        })
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            if key in environ and key.startswith('HTTP_'):
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+        return environ
+
+    def _start_request(self):
+        head = self._parse_head()
+        if head is None:
+            return False
+        if not isinstance(head, tuple):
+            self._reject(head)
+            return False
+        request_line, headers = head
+        if len(request_line.split(' ')) != 3:
+            self._reject('400 Bad Request')
+            return False
+        environ = self._build_environ(request_line, headers)
+        version = environ['SERVER_PROTOCOL']
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            self._reject('505 HTTP Version Not Supported')
+            return False
+
+        self._cancel_idle_timer()
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        keep_alive = (self.service.keepalive and
+                      not self.service.stopping and
+                      'close' not in connection and
+                      (version == 'HTTP/1.1' or 'keep-alive' in connection))
+
+        expect_continue = None
+        if (version == 'HTTP/1.1' and
+                environ.get('HTTP_EXPECT', '').lower() == '100-continue'):
+            expect_continue = self._send_continue
+        body = RequestBody(
+            self._pause_reading,
+            lambda: self.loop.call_soon_threadsafe(self._resume_reading),
+            expect_continue)
+        environ['wsgi.input'] = body
+
+        self._chunked = 'chunked' in environ.get('HTTP_TRANSFER_ENCODING',
+                                                 '').lower()
+        if self._chunked:
+            self._state = 'size'
+            self._body = body
+        else:
+            try:
+                self._remaining = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                self._remaining = -1
+            if self._remaining < 0:
+                self._reject('400 Bad Request')
+                return False
+            self._state = 'data'
+            if self._remaining:
+                self._body = body
+            else:
+                body.feed_eof()
+
+        self._active = True
+        future = self.loop.run_in_executor(
+            self.service.executor, Response(self, environ, keep_alive))
+        future.add_done_callback(self._request_done)
+        return True
+
+    def _send_continue(self):
+        self.send([b'HTTP/1.1 100 Continue\r\n\r\n'])
+
+    def _feed_body(self):
+        """Hand request body bytes from the buffer to the application.
+
+        :returns: True once the whole body has been handed over
+        """
+        while True:
+            if self._state == 'data':
+                if not self._buffer:
+                    return False
+                if self._remaining < len(self._buffer):
+                    data = self._buffer[:self._remaining]
+                    self._buffer = self._buffer[self._remaining:]
+                else:
+                    data, self._buffer = self._buffer, b''
+                self._remaining -= len(data)
+                self._body.feed(data)
+                if self._remaining:
+                    return False
+                if not self._chunked:
+                    break
+                self._state = 'crlf'
+            elif self._state == 'crlf':
+                if len(self._buffer) < 2:
+                    return False
+                if self._buffer[:2] != b'\r\n':
+                    return self._bad_body()
+                self._buffer = self._buffer[2:]
+                self._state = 'size'
+            else:
+                end = self._buffer.find(b'\r\n')
+                if end < 0:
+                    if len(self._buffer) > CONF.max_header_line:
+                        return self._bad_body()
+                    return False
+                line = self._buffer[:end]
+                self._buffer = self._buffer[end + 2:]
+                if self._state == 'trailer':
+                    if not line:
+                        break
+                    continue
+                try:
+                    self._remaining = int(line.split(b';', 1)[0], 16)
+                except ValueError:
+                    return self._bad_body()
+                self._state = 'data' if self._remaining else 'trailer'
+
+        self._body.feed_eof()
+        self._body = None
+        return True
+
+    def _bad_body(self):
+        LOG.debug("Malformed chunked request body from %s", self.peer[0])
+        self._body.feed_eof()
+        self._body = None
+        self.transport.close()
+        return False
+
+    def _request_done(self, future):
+        self._active = False
+        keep_alive = not future.exception() and future.result()
+        if (not keep_alive or self.closed or self._body is not None or
+                self.service.stopping):
+            self.close()
+            self.service.connection_closed(self)
+            return
+        self._start_idle_timer()
+        self._resume_reading()
+        self._process()
+
+
+class Service(object):
+    """State shared by the connections of a worker process."""
+
+    def __init__(self, loop, executor, application, logger, url_scheme,
+                 server_name, server_port):
+        self.loop = loop
+        self.executor = executor
+        self.application = application
+        self.logger = logger
+        self.keepalive = CONF.http_keepalive
+        self.timeout = CONF.client_socket_timeout or None
+        self.stopping = False
+        self.server = None
+        self.connections = set()
+        self.base_environ = {
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': url_scheme,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': wsgi.get_num_workers() > 0,
+            'wsgi.run_once': False,
+            'wsgi.file_wrapper': FileWrapper,
+        }
+
+    def stop(self):
+        """Stop accepting connections and finish the running requests."""
+        LOG.info(_LI('Worker %d stopping, finishing running requests'),
+                 os.getpid())
+        self.stopping = True
+        if self.server is not None:
+            self.server.close()
+        for connection in list(self.connections):
+            if connection.idle:
+                connection.close()
+        self._stop_if_done()
+
+    def abort(self):
+        """Drop all connections once the event loop stopped."""
+        for connection in list(self.connections):
+            connection.abort()
+        self.connections.clear()
+
+    def connection_closed(self, connection):
+        self.connections.discard(connection)
+        self._stop_if_done()
+
+    def _stop_if_done(self):
+        if self.stopping and not any(not connection.idle
+                                     for connection in self.connections):
+            self.loop.stop()
+
+
+class AdmissionQueue(wsgi.AdmissionQueue):
+    """AdmissionQueue for requests served by native threads."""
+
+    @staticmethod
+    def _semaphore(size):
+        return threading.Semaphore(size)
+
+    def _wait(self):
+        return self.semaphore.acquire(timeout=self.timeout)
+
+
+class Server(wsgi.Server):
+    """WSGI server running the application on an asyncio event loop.
+
+    :param threads: the number of threads running the application in each
+                    worker, asyncio_executor_threads by default
+    """
+
+    admission_queue_class = AdmissionQueue
+
+    def __init__(self, threads=None, initialize_glance_store=False):
+        super(Server, self).__init__(
+            threads=threads, initialize_glance_store=initialize_glance_store)
+
+    @staticmethod
+    def _check_supported():
+        """Refuse the features that need an eventlet hub to run.
+
+        Image tasks, the parallel taskflow engine and copying image data
+        from another location through the v1 API hand work to greenthreads,
+        which nothing runs in a worker of this server.
+        """
+        CONF.import_opt('engine_mode', 'xmonitor.async.taskflow_executor',
+                        group='taskflow_executor')
+        unsupported = []
+        if CONF.task.work_dir:
+            unsupported.append(_("image tasks, unset [task] work_dir"))
+        if CONF.taskflow_executor.engine_mode == 'parallel':
+            unsupported.append(_("the parallel taskflow engine, set "
+                                 "[taskflow_executor] engine_mode to "
+                                 "serial"))
+        if CONF.enable_v1_api:
+            unsupported.append(_("the v1 API, set enable_v1_api to False"))
+        if unsupported:
+            raise RuntimeError(_("The asyncio API server does not support "
+                                 "%s") % '; '.join(unsupported))
+
+    def start(self, application, default_port):
+        self._check_supported()
+        super(Server, self).start(application, default_port)
+
+    def start_wsgi(self):
+        if wsgi.get_num_workers() == 0:
+            # The event loop runs in wait()
+            return
+        super(Server, self).start_wsgi()
+
+    def wait(self):
+        """Wait until all servers have completed running."""
+        if self.children:
+            super(Server, self).wait()
+            return
+        LOG.info(_LI("Starting single process server"))
+        try:
+            self.run_server()
+        except KeyboardInterrupt:
+            pass
+
+    def _report_admission(self, application):
+        loop = asyncio.get_event_loop()
+
+        def report():
+            application.data.report()
+            application.metadata.report()
+            loop.call_later(wsgi.ADMISSION_REPORT_INTERVAL, report)
+
+        loop.call_later(wsgi.ADMISSION_REPORT_INTERVAL, report)
+
+    def _child_terminating(self):
+        # NOTE: Only reached before the event loop of the worker handles
+        # SIGTERM itself. There is no hub to hand the flush to.
+        self._terminate_child()
+
+    @staticmethod
+    def _ssl_context():
+        if not CONF.cert_file or not CONF.key_file:
+            return None
+        utils.validate_key_cert(CONF.key_file, CONF.cert_file)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(CONF.cert_file, CONF.key_file)
+        if CONF.ca_file:
+            context.load_verify_locations(CONF.ca_file)
+            context.verify_mode = ssl.CERT_REQUIRED
+        return context
+
+    def _listening_socket(self):
+        # The socket is set up by the eventlet based parent class. The
+        # event loop gets a plain duplicate of it, any TLS is done by the
+        # event loop itself.
+        sock = socket.fromfd(self.sock.fileno(), self.sock.family,
+                             socket.SOCK_STREAM)
+        self.sock.close()
+        self.sock = None
+        sock.setblocking(False)
+        return sock
+
+    def _terminate(self, loop, service):
+        """Stop serving and exit once the queued notifications are sent.
+
+        As in an eventlet worker, requests still running then are cut short.
+        """
+        loop.remove_signal_handler(signal.SIGTERM)
+        service.stop()
+        loop.run_in_executor(None, self._flush_and_exit)
+
+    @staticmethod
+    def _flush_and_exit():
+        # NOTE: Imported here as the notifier imports the wsgi module
+        from xmonitor import notifier
+        notifier.flush_queue()
+        LOG.info(_LI('Child %d exiting on SIGTERM'), os.getpid())
+        # NOTE: Removing the handler of the event loop restored the default
+        # action of SIGTERM
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def run_server(self):
+        """Run a WSGI server."""
+        if CONF.pydev_worker_debug_host:
+            utils.setup_remote_pydev_debug(CONF.pydev_worker_debug_host,
+                                           CONF.pydev_worker_debug_port)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.threads = self.threads or CONF.asyncio_executor_threads
+        # NOTE: Requests waiting for admission hold a thread, as on the
+        # eventlet server they hold a greenthread
+        executor = concurrent.futures.ThreadPoolExecutor(
+            self.threads + wsgi.admission_queue_capacity())
+        ssl_context = self._ssl_context()
+        sock = self._listening_socket()
+        server_name, server_port = sock.getsockname()[:2]
+        service = Service(loop, executor,
+                          self._admission_control(self.application),
+                          self._logger, 'https' if ssl_context else 'http',
+                          server_name, server_port)
+        try:
+            service.server = loop.run_until_complete(loop.create_server(
+                lambda: HttpProtocol(service), sock=sock, ssl=ssl_context,
+                backlog=CONF.backlog))
+            loop.add_signal_handler(signal.SIGHUP, service.stop)
+            loop.add_signal_handler(signal.SIGTERM, self._terminate,
+                                    loop, service)
+            loop.run_forever()
+        finally:
+            if service.server is not None:
+                service.server.close()
+            service.abort()
+            executor.shutdown(wait=False)
+            loop.close()
@@ -0,0 +1,215 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Gzip compression of image data in worker threads.
+
+The data is cut into blocks that are deflated independently, the way pigz
+does, so that several of them are compressed at once in native threads
+while the next ones are read. zlib lets go of the GIL while deflating.
+Each block ends on a sync flush, which makes the blocks add up to a single
+deflate stream, and the gzip header and trailer are written around them.
+As blocks do not share a dictionary, the data compresses slightly less
+than in a single stream.
+
+Data that is compressed already is left alone, which is told from its
+first bytes: the signatures of compressed files and of ISO images, qcow2
+images holding compressed clusters, and data that does not shrink when
+deflated.
+"""
+
+import collections
+import struct
+import zlib
+
+import eventlet
+from eventlet import tpool
+from oslo_config import cfg
+
+from xmonitor.common import format_inspector
+from xmonitor.i18n import _
+
+compression_opts = [
+    cfg.IntOpt('gzip_workers', default=4, min=0, max=64,
+               help=_('Number of blocks of an image download the gzip '
+                      'middleware compresses at once, in native threads. '
+                      'Set to 0 to compress the blocks one after the other '
+                      'in the request, which then takes no more than one '
+                      'core per download.')),
+    cfg.IntOpt('gzip_block_size', default=1024 * 1024, min=64 * 1024,
+               help=_('Size in bytes of the blocks image downloads are '
+                      'cut into to be compressed independently.')),
+    cfg.IntOpt('gzip_level', default=6, min=1, max=9,
+               help=_('The zlib compression level of image downloads.')),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(compression_opts)
+
+# Bytes from the start of the data looked at to tell whether it is
+# compressed already
+HEAD_SIZE = 1024 * 1024
+
+# Data deflated to more than this share of its size is not compressed
+INCOMPRESSIBLE = 0.95
+
+_COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b',  # gzip
+    b'BZh',  # bzip2
+    b'\xfd7zXZ\x00',  # xz
+    b'PK\x03\x04',  # zip
+    b'\x28\xb5\x2f\xfd',  # zstd
+)
+
+# Raw deflate, as in the gzip format
+_WBITS = -zlib.MAX_WBITS
+
+# Fixed header of gzip members: no name, no time, unknown OS
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+_QCOW2_COMPRESSED = 1 << 62
+_QCOW2_OFFSET_MASK = 0x00fffffffffffe00
+
+
+def _qcow2_compressed(head):
+    """Whether the L2 tables found in the head map compressed clusters."""
+    if len(head) < 48:
+        return False
+    cluster_bits, = struct.unpack_from('>I', head, 20)
+    l1_size, l1_offset = struct.unpack_from('>IQ', head, 36)
+    if not 9 <= cluster_bits <= 21:
+        return False
+    cluster_size = 1 << cluster_bits
+    l1_size = min(l1_size, max(0, len(head) - l1_offset) // 8)
+    if not l1_size:
+        return False
+    for l1_entry in struct.unpack_from('>%dQ' % l1_size, head, l1_offset):
+        l2_offset = l1_entry & _QCOW2_OFFSET_MASK
+        if not l2_offset or l2_offset + cluster_size > len(head):
+            continue
+        l2_table = struct.unpack_from('>%dQ' % (cluster_size // 8), head,
+                                      l2_offset)
+        if any(entry & _QCOW2_COMPRESSED for entry in l2_table):
+            return True
+    return False
+
+
+def is_compressed(head):
+    """Whether data starting with these bytes is compressed already.
+
+    :param head: the first ``HEAD_SIZE`` bytes of the data, or all of it
+    """
+    if head.startswith(_COMPRESSED_SIGNATURES):
+        return True
+    iso = format_inspector.ISO_VOLUME_DESCRIPTOR + 1
+    if head[iso:iso + len(format_inspector.ISO_SIGNATURE)] == (
+            format_inspector.ISO_SIGNATURE):
+        return True
+    if head.startswith(format_inspector.QCOW2_MAGIC):
+        return _qcow2_compressed(head)
+    # NOTE: The fastest level is enough to tell
+    return len(_deflate(head, 1)) > INCOMPRESSIBLE * len(head)
+
+
+def peek(chunks, size=HEAD_SIZE):
+    """Read the first bytes of an iterator, without losing them.
+
+    :returns: a tuple of at most ``size`` first bytes and an iterator over
+              all of the data, closing ``chunks`` when it is closed
+    """
+    head = []
+    length = 0
+    rest = iter(chunks)
+    for chunk in rest:
+        head.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            break
+    return b''.join(head)[:size], _chain(head, rest, chunks)
+
+
+def _chain(head, rest, chunks):
+    try:
+        for chunk in head:
+            yield chunk
+        for chunk in rest:
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _blocks(chunks, block_size):
+    pending = []
+    length = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length < block_size:
+            continue
+        data = b''.join(pending)
+        offset = 0
+        while length - offset >= block_size:
+            yield data[offset:offset + block_size]
+            offset += block_size
+        pending = [data[offset:]]
+        length -= offset
+    if length:
+        yield b''.join(pending)
+
+
+def _deflate(block, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_iter(chunks, level=None, workers=None, block_size=None):
+    """Compress data into a gzip stream, ``workers`` blocks at once.
+
+    :param chunks: an iterator over the data, closed along with the result
+    :param level: the zlib compression level, gzip_level by default
+    :param workers: the blocks compressed at once, gzip_workers by default
+    :param block_size: the size of the blocks, gzip_block_size by default
+    """
+    level = CONF.gzip_level if level is None else level
+    workers = CONF.gzip_workers if workers is None else workers
+    block_size = CONF.gzip_block_size if block_size is None else block_size
+
+    pool = eventlet.GreenPool(max(workers, 1))
+    pending = collections.deque()
+    crc = 0
+    size = 0
+    try:
+        yield _GZIP_HEADER
+        for block in _blocks(chunks, block_size):
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+            if not workers:
+                yield _deflate(block, level)
+                continue
+            pending.append(pool.spawn(tpool.execute, _deflate, block,
+                                      level))
+            if len(pending) >= workers:
+                yield pending.popleft().wait()
+        while pending:
+            yield pending.popleft().wait()
+        # An empty final block ends the deflate stream
+        yield zlib.compressobj(level, zlib.DEFLATED, _WBITS).flush()
+        yield struct.pack('<II', crc & 0xffffffff, size & 0xffffffff)
+    finally:
+        for deflating in pending:
+            deflating.kill()
+        if hasattr(chunks, 'close'):
+            chunks.close()
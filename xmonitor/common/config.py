@@ -85,6 +85,18 @@ task_opts = [
                       'these are just estimations and you should do them '
                       'based on the worst case scenario and be prepared to '
                       'act in case they were wrong.')),
+    cfg.BoolOpt('stream_import', default=False,
+                help=_('Whether import tasks stream the image data straight '
+                       'into the destination store. The format and the '
+                       'backing file of the image are checked on its first '
+                       'few megabytes, kept in memory, instead of on a copy '
+                       'of the whole image in the work dir, and the disk '
+                       'image of an OVA package is extracted on the way. '
+                       'Images that look raw from their first megabytes stay '
+                       'queued until all of their data is stored, for fixed '
+                       'VHD images to be told apart by their last sector. '
+                       'The work dir is still used when the image has to be '
+                       'converted.')),
 ]
 common_opts = [
     cfg.BoolOpt('allow_additional_image_properties', default=True,
@@ -168,6 +180,62 @@ common_opts = [
                       'digest-algorithms" to get the available algorithms '
                       'supported by the version of OpenSSL on the platform.'
                       ' Examples are "sha1", "sha256", "sha512", etc.')),
+    cfg.IntOpt('image_validator_cache_size', default=1024, min=0,
+               help=_('Number of image representations for which each API '
+                      'worker remembers the entity tag it served. A '
+                      'conditional GET of such an image is answered with '
+                      '304 Not Modified after a lightweight freshness check '
+                      'in the database, without loading the image through '
+                      'the domain model. Set to 0 to disable.')),
+    cfg.BoolOpt('compose_image_proxies', default=False,
+                help=_('Hand out images as a single flattened proxy instead '
+                       'of the nested chain of location, quota, policy, '
+                       'notifier, property protection and authorization '
+                       'proxies. Attribute access then goes straight to the '
+                       'layer implementing it, which makes reading the '
+                       'attributes of an image about twice as fast. Every '
+                       'proxy of the chain is still built for each image.')),
+    cfg.IntOpt('metadef_cache_size', default=0, min=0,
+               help=_('Number of serialized metadata definition namespace, '
+                      'object and property documents each API worker keeps '
+                      'in memory. Any change to the metadata definitions '
+                      'made through this worker drops them all. Set to 0 '
+                      'to disable.')),
+    cfg.BoolOpt('metadef_cache_shared_generation', default=False,
+                help=_('Keep a generation counter of the metadata '
+                       'definitions in the database, so that a change made '
+                       'through one API worker also invalidates the cached '
+                       'documents of all other workers. Every cached read '
+                       'then costs one query of that counter. Enable this '
+                       'whenever more than one API worker or server uses '
+                       'metadef_cache_size.')),
+    cfg.StrOpt('multipart_upload_dir',
+               help=_('Directory in which the parts of multipart image data '
+                      'uploads are kept until the upload is completed. It '
+                      'must be shared by all API workers and servers taking '
+                      'the parts of an upload. Multipart uploads are '
+                      'disabled when this is not set.')),
+    cfg.IntOpt('multipart_upload_max_parts', default=10000, min=1,
+               help=_('The number of parts a multipart image data upload '
+                      'may have, numbered from 1.')),
+    cfg.IntOpt('multipart_upload_expiry', default=24 * 60 * 60, min=0,
+               help=_('Seconds after which a multipart image data upload '
+                      'no part was uploaded to is deleted, along with its '
+                      'parts. Expired uploads are looked for whenever an '
+                      'upload is created. Set to 0 to keep uploads until '
+                      'they are completed or aborted.')),
+    cfg.IntOpt('signature_certificate_cache_size', default=128, min=0,
+               help=_('Number of image signing certificates, along with '
+                      'their public keys, each API worker keeps after '
+                      'fetching them from the key manager. A certificate '
+                      'is kept per requesting user and project. Set to 0 '
+                      'to fetch the certificate for every signed image.')),
+    cfg.IntOpt('signature_certificate_cache_ttl', default=300, min=0,
+               help=_('Seconds for which a cached image signing '
+                      'certificate is used before it is fetched from the '
+                      'key manager again, so that a certificate deleted '
+                      'or replaced there is noticed. A certificate is '
+                      'never used past the end of its validity.')),
 ]
 
 CONF = cfg.CONF
@@ -368,6 +368,11 @@ class InvalidImageStatusTransition(Invalid):
                 " %(new_status)s is not allowed")
 
 
+class InvalidImageFormat(Invalid):
+    message = _("Image data is not a valid %(disk_format)s image: "
+                "%(reason)s")
+
+
 class MetadefDuplicateNamespace(Duplicate):
     message = _("The metadata definition namespace=%(namespace_name)s"
                 " already exists.")
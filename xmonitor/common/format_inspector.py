@@ -0,0 +1,351 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process inspection of disk image headers.
+
+Finds the format, the virtual size and the backing file of an image from
+its headers, without spawning ``qemu-img info``. The result uses the keys
+of the JSON output of ``qemu-img info`` so that it can stand in for it, but
+formats are named after the disk formats of Glance: ``vhd`` rather than
+``vpc`` and ``iso`` rather than ``raw``.
+
+Images are inspected either from a file or from the first ``HEAD_SIZE``
+bytes of their data. Only the file lets the size of raw images and fixed
+vhd images, whose footer is at their very end, be known. Fixed vhd images
+are told apart from raw images by their last sector otherwise.
+"""
+
+import os
+import re
+import struct
+import uuid
+
+from xmonitor.common import exception
+from xmonitor.i18n import _
+
+# Bytes from the start of an image that hold the headers of any of the
+# formats known here, in practice
+HEAD_SIZE = 4 * 1024 * 1024
+
+SECTOR_SIZE = 512
+
+# Longest backing file name qemu accepts in a qcow2 image
+MAX_BACKING_FILE = 1023
+
+QCOW2_MAGIC = b'QFI\xfb'
+QED_MAGIC = b'QED\0'
+VMDK_MAGIC = b'KDMV'
+VMDK_DESCRIPTOR = b'# Disk DescriptorFile'
+VHD_COOKIE = b'conectix'
+VHDX_SIGNATURE = b'vhdxfile'
+VDI_SIGNATURE = 0xbeda107f
+ISO_SIGNATURE = b'CD001'
+
+QCOW_VERSION = 1
+QED_BACKING_FILE = 0x01
+VHD_DIFFERENCING = 4
+VHDX_REGION_TABLE = 192 * 1024
+VHDX_METADATA_REGION = uuid.UUID('8b7ca206-4790-4b9a-b8fe-575f050f886e')
+VHDX_VIRTUAL_DISK_SIZE = uuid.UUID('2fa54224-cd1b-4876-b211-5dbed83bf4b8')
+VHDX_PARENT_LOCATOR = uuid.UUID('a8d35f2d-b30b-454d-abf7-d3d84834ab0c')
+VDI_NORMAL, VDI_FIXED = 1, 2
+ISO_VOLUME_DESCRIPTOR = 0x8000
+
+_VMDK_PARENT = re.compile(br'^parentFileNameHint\s*=\s*"(.*)"', re.M)
+_VMDK_EXTENT = re.compile(br'^(?:RW|RDONLY|NOACCESS)\s+(\d+)\s', re.M)
+
+
+class _Head(object):
+    """The first bytes of an image."""
+
+    size = None
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, offset, length):
+        return self.data[offset:offset + length]
+
+
+class _Tail(object):
+    """The last bytes of an image of a known size."""
+
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+        self.offset = size - len(data)
+
+    def read(self, offset, length):
+        if offset < self.offset:
+            return b''
+        offset -= self.offset
+        return self.data[offset:offset + length]
+
+
+class _File(object):
+    """An image file, read only where needed."""
+
+    def __init__(self, image_file):
+        self.image_file = image_file
+        self.size = os.fstat(image_file.fileno()).st_size
+
+    def read(self, offset, length):
+        self.image_file.seek(offset)
+        return self.image_file.read(length)
+
+
+def _read(source, disk_format, offset, length):
+    data = source.read(offset, length)
+    if len(data) != length:
+        raise exception.InvalidImageFormat(
+            disk_format=disk_format,
+            reason=_('%(length)d bytes at offset %(offset)d are '
+                     'missing') % {'length': length, 'offset': offset})
+    return data
+
+
+def _unpack(source, disk_format, fmt, offset):
+    return struct.unpack(fmt, _read(source, disk_format, offset,
+                                    struct.calcsize(fmt)))
+
+
+def _qcow2(source):
+    if source.read(0, 4) != QCOW2_MAGIC:
+        return None
+    # NOTE: The virtual size is at the same offset in the header of qcow
+    # version 1 images, where it follows their mtime rather than their
+    # cluster bits, and they have a backing file just the same.
+    (version, backing_offset, backing_size,
+     cluster_bits, virtual_size) = _unpack(source, 'qcow2', '>IQIIQ', 4)
+    disk_format = 'qcow' if version == QCOW_VERSION else 'qcow2'
+    info = {'format': disk_format, 'virtual-size': virtual_size}
+    if backing_offset:
+        info['backing-filename'] = _backing_file(
+            source, disk_format, backing_offset, backing_size)
+    return info
+
+
+def _backing_file(source, disk_format, offset, size):
+    if size > MAX_BACKING_FILE:
+        raise exception.InvalidImageFormat(
+            disk_format=disk_format, reason=_('Backing file name too long'))
+    return _read(source, disk_format, offset, size).decode('utf-8',
+                                                           'replace')
+
+
+def _qed(source):
+    if source.read(0, 4) != QED_MAGIC:
+        return None
+    features, = _unpack(source, 'qed', '<Q', 16)
+    (virtual_size, backing_offset,
+     backing_size) = _unpack(source, 'qed', '<QII', 48)
+    info = {'format': 'qed', 'virtual-size': virtual_size}
+    if features & QED_BACKING_FILE:
+        info['backing-filename'] = _backing_file(
+            source, 'qed', backing_offset, backing_size)
+    return info
+
+
+def _vmdk_descriptor(descriptor, info):
+    descriptor = descriptor.rstrip(b'\0')
+    parent = _VMDK_PARENT.search(descriptor)
+    if parent:
+        info['backing-filename'] = parent.group(1).decode('utf-8',
+                                                          'replace')
+    return info
+
+
+def _vmdk(source):
+    magic = source.read(0, len(VMDK_DESCRIPTOR))
+    if magic.startswith(VMDK_MAGIC):
+        (version, flags, capacity, grain_size,
+         descriptor_offset, descriptor_size) = _unpack(source, 'vmdk',
+                                                       '<IIQQQQ', 4)
+        info = {'format': 'vmdk', 'virtual-size': capacity * SECTOR_SIZE}
+        if not descriptor_offset:
+            return info
+        if descriptor_size * SECTOR_SIZE > HEAD_SIZE:
+            raise exception.InvalidImageFormat(
+                disk_format='vmdk', reason=_('Descriptor too large'))
+        descriptor = _read(source, 'vmdk', descriptor_offset * SECTOR_SIZE,
+                           descriptor_size * SECTOR_SIZE)
+        return _vmdk_descriptor(descriptor, info)
+
+    if magic == VMDK_DESCRIPTOR:
+        # NOTE: A descriptor on its own, its data is in the extent files
+        # it refers to
+        descriptor = source.read(0, HEAD_SIZE)
+        sectors = sum(int(extent)
+                      for extent in _VMDK_EXTENT.findall(descriptor))
+        info = {'format': 'vmdk', 'virtual-size': sectors * SECTOR_SIZE}
+        return _vmdk_descriptor(descriptor, info)
+    return None
+
+
+def _vhd(source):
+    # NOTE: Dynamic and differencing disks start with a copy of the
+    # footer, fixed disks only have it at their end.
+    footer = 0
+    if source.read(0, len(VHD_COOKIE)) != VHD_COOKIE:
+        if source.size is None or source.size < SECTOR_SIZE:
+            return None
+        footer = source.size - SECTOR_SIZE
+        if source.read(footer, len(VHD_COOKIE)) != VHD_COOKIE:
+            return None
+
+    data_offset, = _unpack(source, 'vhd', '>Q', footer + 16)
+    virtual_size, = _unpack(source, 'vhd', '>Q', footer + 48)
+    disk_type, = _unpack(source, 'vhd', '>I', footer + 60)
+    info = {'format': 'vhd', 'virtual-size': virtual_size}
+    if disk_type == VHD_DIFFERENCING:
+        parent = _read(source, 'vhd', data_offset + 64, 512)
+        info['backing-filename'] = parent.decode('utf-16-be',
+                                                 'replace').rstrip('\0')
+    return info
+
+
+def _vhdx_metadata(source):
+    table = VHDX_REGION_TABLE
+    if _read(source, 'vhdx', table, 4) != b'regi':
+        raise exception.InvalidImageFormat(
+            disk_format='vhdx', reason=_('Region table not found'))
+    count, = _unpack(source, 'vhdx', '<I', table + 8)
+    for index in range(min(count, 2047)):
+        entry = table + 16 + index * 32
+        if _read(source, 'vhdx', entry, 16) == VHDX_METADATA_REGION.bytes_le:
+            return _unpack(source, 'vhdx', '<Q', entry + 16)[0]
+    raise exception.InvalidImageFormat(
+        disk_format='vhdx', reason=_('Metadata region not found'))
+
+
+def _vhdx_parent(source, locator):
+    count, = _unpack(source, 'vhdx', '<H', locator + 18)
+    paths = {}
+    for index in range(count):
+        (key_offset, value_offset,
+         key_length, value_length) = _unpack(source, 'vhdx', '<IIHH',
+                                             locator + 20 + index * 12)
+        key = _read(source, 'vhdx', locator + key_offset, key_length)
+        value = _read(source, 'vhdx', locator + value_offset, value_length)
+        paths[key.decode('utf-16-le', 'replace')] = value.decode(
+            'utf-16-le', 'replace')
+    for key in ('relative_path', 'absolute_win32_path', 'volume_path'):
+        if key in paths:
+            return paths[key]
+    return paths.get('parent_linkage', '')
+
+
+def _vhdx(source):
+    if source.read(0, len(VHDX_SIGNATURE)) != VHDX_SIGNATURE:
+        return None
+    metadata = _vhdx_metadata(source)
+    if _read(source, 'vhdx', metadata, 8) != b'metadata':
+        raise exception.InvalidImageFormat(
+            disk_format='vhdx', reason=_('Metadata table not found'))
+
+    info = {'format': 'vhdx'}
+    count, = _unpack(source, 'vhdx', '<H', metadata + 10)
+    for index in range(min(count, 2047)):
+        entry = metadata + 32 + index * 32
+        item = _read(source, 'vhdx', entry, 16)
+        offset, = _unpack(source, 'vhdx', '<I', entry + 16)
+        if item == VHDX_VIRTUAL_DISK_SIZE.bytes_le:
+            info['virtual-size'] = _unpack(source, 'vhdx', '<Q',
+                                           metadata + offset)[0]
+        elif item == VHDX_PARENT_LOCATOR.bytes_le:
+            info['backing-filename'] = _vhdx_parent(source,
+                                                    metadata + offset)
+    if 'virtual-size' not in info:
+        raise exception.InvalidImageFormat(
+            disk_format='vhdx', reason=_('Virtual disk size not found'))
+    return info
+
+
+def _vdi(source):
+    signature = source.read(0x40, 4)
+    if len(signature) != 4 or struct.unpack('<I', signature)[0] != (
+            VDI_SIGNATURE):
+        return None
+    image_type, = _unpack(source, 'vdi', '<I', 0x4c)
+    if image_type not in (VDI_NORMAL, VDI_FIXED):
+        # NOTE: Differencing images, which qemu does not support either
+        raise exception.InvalidImageFormat(
+            disk_format='vdi',
+            reason=_('Unsupported image type %d') % image_type)
+    virtual_size, = _unpack(source, 'vdi', '<Q', 0x170)
+    return {'format': 'vdi', 'virtual-size': virtual_size}
+
+
+def _iso(source):
+    descriptor = ISO_VOLUME_DESCRIPTOR
+    if source.read(descriptor + 1, len(ISO_SIGNATURE)) != ISO_SIGNATURE:
+        return None
+    blocks, = _unpack(source, 'iso', '<I', descriptor + 80)
+    block_size, = _unpack(source, 'iso', '<H', descriptor + 128)
+    return {'format': 'iso', 'virtual-size': blocks * block_size}
+
+
+# Tried in this order, an image none of them recognizes is raw
+_INSPECTORS = (_qcow2, _qed, _vhdx, _vhd, _vmdk, _vdi, _iso)
+
+
+def _inspect(source):
+    for inspector in _INSPECTORS:
+        info = inspector(source)
+        if info is not None:
+            return info
+    info = {'format': 'raw'}
+    if source.size is not None:
+        info['virtual-size'] = source.size
+    return info
+
+
+def inspect_head(head):
+    """Inspect an image from the first bytes of its data.
+
+    :param head: the first ``HEAD_SIZE`` bytes of the image, or all of it
+                 if it is smaller
+    :returns: a dict with the ``format``, the ``virtual-size`` and the
+              ``backing-filename``, if any, of the image. The virtual size
+              of a raw image is unknown.
+    :raises: InvalidImageFormat if the headers are truncated or invalid
+    """
+    return _inspect(_Head(head))
+
+
+def inspect_tail(tail, size):
+    """Inspect an image that looks raw from the last bytes of its data.
+
+    :param tail: the last ``SECTOR_SIZE`` bytes of the image, or all of it
+                 if it is smaller
+    :param size: the size of the image
+    :returns: the dict returned by `inspect_head` for a fixed vhd image,
+              or None if the image has no vhd footer
+    :raises: InvalidImageFormat if the footer is truncated or invalid
+    """
+    return _vhd(_Tail(tail, size))
+
+
+def inspect_file(path):
+    """Inspect an image file.
+
+    :param path: path of the image, with or without a file:// scheme
+    :returns: a dict with the ``format``, the ``virtual-size`` and the
+              ``backing-filename``, if any, of the image
+    :raises: InvalidImageFormat if the headers are truncated or invalid
+    """
+    with open(path.split("file://")[-1], 'rb') as image_file:
+        return _inspect(_File(image_file))
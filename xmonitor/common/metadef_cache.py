@@ -0,0 +1,168 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process cache of serialized metadata definition documents.
+
+Metadata definitions hardly ever change, while rendering a single
+namespace takes a query for the namespace and for each of its objects,
+properties, tags and resource type associations. Documents are cached
+whole, per request path and per requesting identity, and stamped with
+the generation of the metadata definitions they were read at. Every
+change made through the notifier proxies bumps the generation, which
+makes all cached documents stale. With ``metadef_cache_shared_generation``
+the generation is also kept in the database so that changes made through
+other workers are seen as well.
+"""
+
+import collections
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import encodeutils
+import webob
+import webob.dec
+
+from xmonitor.common import wsgi
+import xmonitor.db
+from xmonitor.i18n import _LW
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+
+Document = collections.namedtuple('Document',
+                                  ['version', 'body', 'content_type',
+                                   'charset'])
+
+
+class MetadefCache(object):
+    """Bounded cache of serialized metadata definition documents."""
+
+    def __init__(self, size, db_api=None):
+        self.size = size
+        self.generation = 0
+        self._db_api = db_api
+        self._entries = collections.OrderedDict()
+
+    @property
+    def db_api(self):
+        if self._db_api is None:
+            self._db_api = xmonitor.db.get_api()
+        return self._db_api
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    @staticmethod
+    def _key(context, path):
+        return (path, context.user, context.tenant, context.is_admin,
+                tuple(sorted(context.roles)))
+
+    def version(self, context):
+        """Return the current version of the metadata definitions.
+
+        It has to be taken before reading the definitions, so that a
+        document read concurrently with a change is never stored as
+        being current.
+        """
+        if CONF.metadef_cache_shared_generation:
+            return (self.generation,
+                    self.db_api.metadef_generation_get(context))
+        return (self.generation, None)
+
+    def get(self, context, path, version):
+        key = self._key(context, path)
+        document = self._entries.pop(key, None)
+        if document is None or document.version != version:
+            return None
+        self._entries[key] = document
+        return document
+
+    def set(self, context, path, version, body, content_type, charset):
+        if not self.enabled or version[0] != self.generation:
+            return
+        key = self._key(context, path)
+        self._entries.pop(key, None)
+        self._entries[key] = Document(version, body, content_type, charset)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, context):
+        """Make every document cached so far stale."""
+        self.generation += 1
+        self._entries.clear()
+        if CONF.metadef_cache_shared_generation:
+            self.db_api.metadef_generation_increment(context)
+
+
+_CACHE = None
+
+
+def get_cache():
+    """Return the metadata definition cache of this process."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = MetadefCache(CONF.metadef_cache_size)
+    return _CACHE
+
+
+def invalidate(context):
+    get_cache().invalidate(context)
+
+
+class CachingResource(wsgi.Resource):
+    """Resource answering GET requests from the metadef cache.
+
+    Only complete JSON documents are cached. Everything else, including
+    errors, goes through the controller on every request.
+    """
+
+    def __init__(self, controller, deserializer=None, serializer=None,
+                 cache=None):
+        super(CachingResource, self).__init__(controller, deserializer,
+                                              serializer)
+        self.cache = cache or get_cache()
+
+    @webob.dec.wsgify(RequestClass=wsgi.Request)
+    def __call__(self, request):
+        call = super(CachingResource, self).__call__
+        if request.method != 'GET' or not self.cache.enabled:
+            return call(request)
+
+        try:
+            version = self.cache.version(request.context)
+        except Exception as e:
+            LOG.warn(_LW("Unable to read the generation of the metadata "
+                         "definitions, bypassing the cache: %s"),
+                     encodeutils.exception_to_unicode(e))
+            return call(request)
+
+        document = self.cache.get(request.context, request.path_qs, version)
+        if document is not None:
+            response = webob.Response(request=request, body=document.body,
+                                      content_type=document.content_type,
+                                      charset=document.charset)
+            return self._apply_validators(request, response)
+
+        response = call(request)
+        if (response.status_int == 200 and
+                response.content_type == 'application/json' and
+                isinstance(response.app_iter, list)):
+            self.cache.set(request.context, request.path_qs, version,
+                           response.body, response.content_type,
+                           response.charset)
+        return response
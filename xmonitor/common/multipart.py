@@ -0,0 +1,307 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Spool of the parts of multipart image data uploads.
+
+The parts of an upload are written to ``multipart_upload_dir`` as they
+arrive, in any order and possibly at once, each to a file named after its
+number and checksum. Completing the upload reads the parts back, in order,
+as the data of the image. Until then a part can be uploaded again, so that
+an interrupted upload is resumed by uploading only the parts it misses.
+
+All the uploads of an image together take no more than ``image_size_cap``
+bytes. They are deleted along with the image, and once no part was
+uploaded to them for ``multipart_upload_expiry`` seconds.
+"""
+
+import hashlib
+import os
+import shutil
+import time
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import uuidutils
+import six
+
+from xmonitor.common import exception
+from xmonitor.common import utils
+from xmonitor.i18n import _, _LI
+
+LOG = logging.getLogger(__name__)
+
+CONF = cfg.CONF
+CONF.import_opt('multipart_upload_dir', 'xmonitor.common.config')
+CONF.import_opt('multipart_upload_max_parts', 'xmonitor.common.config')
+CONF.import_opt('multipart_upload_expiry', 'xmonitor.common.config')
+CONF.import_opt('image_size_cap', 'xmonitor.common.config')
+
+CHUNK_SIZE = 65536
+# NOTE: Parts uploaded at once all check that the uploads of the image fit
+# in the cap every that many bytes, and once they are written
+USAGE_CHECK_SIZE = 16 * CHUNK_SIZE
+
+
+class MultipartUpload(object):
+    """The parts of the data of an image uploaded so far."""
+
+    def __init__(self, image_id, upload_id):
+        self.image_id = image_id
+        self.upload_id = upload_id
+        self.path = os.path.join(CONF.multipart_upload_dir, image_id,
+                                 upload_id)
+
+    @classmethod
+    def create(cls, image_id):
+        upload = cls(image_id, str(uuid.uuid4()))
+        utils.safe_mkdirs(upload.path)
+        return upload
+
+    @classmethod
+    def get(cls, image_id, upload_id):
+        """The upload of an image with that id.
+
+        :raises: NotFound if there is no such upload
+        """
+        if uuidutils.is_uuid_like(upload_id):
+            upload = cls(image_id, upload_id)
+            if os.path.isdir(upload.path):
+                return upload
+        msg = (_("No multipart upload %(upload_id)s of image %(image_id)s") %
+               {'upload_id': upload_id, 'image_id': image_id})
+        raise exception.NotFound(msg)
+
+    def _files(self):
+        """Map the numbers of the parts uploaded to their file names."""
+        files = {}
+        for name in os.listdir(self.path):
+            # NOTE: Parts being uploaded are hidden
+            if not name.startswith('.'):
+                files[int(name.split('-', 1)[0])] = name
+        return files
+
+    def _part(self, name):
+        number, checksum = name.split('-', 1)
+        return {'part_number': int(number),
+                'checksum': checksum,
+                'size': os.path.getsize(os.path.join(self.path, name))}
+
+    def parts(self):
+        """The parts uploaded so far, by part number."""
+        return [self._part(name)
+                for number, name in sorted(self._files().items())]
+
+    def _image_usage(self, part_number, uploading=None):
+        """Bytes taken by the uploads of the image, but for this part.
+
+        :param uploading: the file name the part is being written to
+        """
+        excluded = (self._files().get(part_number), uploading)
+        usage = 0
+        for path, dirs, names in os.walk(os.path.dirname(self.path)):
+            for name in names:
+                if path == self.path and name in excluded:
+                    continue
+                # NOTE: Parts being uploaded count for what they have so
+                # far, and may be gone already
+                try:
+                    usage += os.path.getsize(os.path.join(path, name))
+                except OSError:
+                    pass
+        return usage
+
+    def _check_usage(self, part, part_number, tmp_name, written, limit):
+        """Check that the uploads of the image, with this part, fit.
+
+        :raises: ImageSizeLimitExceeded if they do not
+        """
+        # NOTE: Flushed for the parts uploaded at once to see its size
+        part.flush()
+        if written + self._image_usage(part_number, tmp_name) > limit:
+            raise exception.ImageSizeLimitExceeded()
+
+    def add_part(self, part_number, data, checksum=None, max_size=None):
+        """Write a part, in place of any part uploaded with that number.
+
+        :param part_number: the number of the part, from 1
+        :param data: the data of the part, a file object or an iterator
+        :param checksum: the MD5 checksum of the part, checked if given
+        :param max_size: the bytes all the uploads of the image may take,
+                         when fewer than ``image_size_cap``
+        :returns: a dict with the number, checksum and size of the part
+        :raises: Invalid for a bad part number or checksum,
+                 ImageSizeLimitExceeded for a part that is too large
+        """
+        max_parts = CONF.multipart_upload_max_parts
+        if not 1 <= part_number <= max_parts:
+            raise exception.Invalid(
+                _("Part numbers go from 1 to %d") % max_parts)
+
+        limit = CONF.image_size_cap
+        if max_size is not None:
+            limit = min(limit, max_size)
+
+        md5 = hashlib.md5()
+        # NOTE: The data is read into the same buffer over and over
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        tmp_name = '.%s' % uuid.uuid4()
+        tmp_path = os.path.join(self.path, tmp_name)
+        try:
+            with open(tmp_path, 'wb') as part:
+                reader = utils.LimitingReader(
+                    utils.CooperativeReader(data),
+                    limit - self._image_usage(part_number))
+                written = 0
+                checked = 0
+                size = reader.readinto(buf)
+                while size:
+                    md5.update(view[:size])
+                    part.write(view[:size])
+                    written += size
+                    if written - checked >= USAGE_CHECK_SIZE:
+                        self._check_usage(part, part_number, tmp_name,
+                                          written, limit)
+                        checked = written
+                    size = reader.readinto(buf)
+                # NOTE: Checked again once written, as parts uploaded at
+                # once may have taken up the room meanwhile
+                self._check_usage(part, part_number, tmp_name, written,
+                                  limit)
+
+            if checksum is not None and checksum != md5.hexdigest():
+                msg = (_("Checksum of part %(part)d is %(checksum)s, not "
+                         "%(expected)s") %
+                       {'part': part_number, 'checksum': md5.hexdigest(),
+                        'expected': checksum})
+                raise exception.Invalid(msg)
+
+            name = '%d-%s' % (part_number, md5.hexdigest())
+            os.rename(tmp_path, os.path.join(self.path, name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        prefix = '%d-' % part_number
+        for other in os.listdir(self.path):
+            if other.startswith(prefix) and other != name:
+                os.remove(os.path.join(self.path, other))
+        return self._part(name)
+
+    def _read(self, paths):
+        for path in paths:
+            with open(path, 'rb') as part:
+                for chunk in utils.chunkiter(part, CHUNK_SIZE):
+                    yield chunk
+
+    def read(self, parts):
+        """Read the data of the parts an upload is completed with.
+
+        :param parts: dicts with the ``part_number`` and, optionally, the
+                      ``checksum`` of the parts, by increasing part number
+        :returns: a tuple of the size of the data and an iterator over it
+        :raises: Invalid if a part is missing or has another checksum
+        """
+        if not parts:
+            raise exception.Invalid(_("No parts to complete the upload with"))
+
+        files = self._files()
+        paths = []
+        size = 0
+        previous = 0
+        for part in parts:
+            number = part.get('part_number')
+            if (not isinstance(number, six.integer_types) or
+                    number <= previous):
+                raise exception.Invalid(
+                    _("Parts must be listed by increasing part number"))
+            previous = number
+
+            if number not in files:
+                raise exception.Invalid(
+                    _("Part %d has not been uploaded") % number)
+            uploaded = self._part(files[number])
+            if part.get('checksum', uploaded['checksum']) != (
+                    uploaded['checksum']):
+                msg = (_("Checksum of part %(part)d is %(checksum)s") %
+                       {'part': number, 'checksum': uploaded['checksum']})
+                raise exception.Invalid(msg)
+
+            paths.append(os.path.join(self.path, files[number]))
+            size += uploaded['size']
+        return size, self._read(paths)
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            # NOTE: Fails while other uploads of the image are ongoing
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+
+def delete_uploads(image_id):
+    """Delete the uploads of an image, along with their parts."""
+    if CONF.multipart_upload_dir:
+        shutil.rmtree(os.path.join(CONF.multipart_upload_dir, image_id),
+                      ignore_errors=True)
+
+
+def _last_modified(path):
+    last_modified = os.path.getmtime(path)
+    for name in os.listdir(path):
+        last_modified = max(last_modified,
+                            os.path.getmtime(os.path.join(path, name)))
+    return last_modified
+
+
+def expire_uploads():
+    """Delete the uploads no part was uploaded to for a while.
+
+    :returns: the number of uploads deleted
+    """
+    if not CONF.multipart_upload_dir or not CONF.multipart_upload_expiry:
+        return 0
+    try:
+        image_ids = os.listdir(CONF.multipart_upload_dir)
+    except OSError:
+        return 0
+
+    older_than = time.time() - CONF.multipart_upload_expiry
+    expired = 0
+    for image_id in image_ids:
+        image_path = os.path.join(CONF.multipart_upload_dir, image_id)
+        try:
+            upload_ids = os.listdir(image_path)
+        except OSError:
+            continue
+        for upload_id in upload_ids:
+            upload = MultipartUpload(image_id, upload_id)
+            try:
+                if _last_modified(upload.path) >= older_than:
+                    continue
+            except OSError:
+                # NOTE: Deleted meanwhile
+                continue
+            LOG.info(_LI("Deleting multipart upload %(upload_id)s of image "
+                         "%(image_id)s, no part was uploaded to it for "
+                         "%(expiry)d seconds"),
+                     {'upload_id': upload_id, 'image_id': image_id,
+                      'expiry': CONF.multipart_upload_expiry})
+            upload.delete()
+            expired += 1
+    return expired
@@ -16,7 +16,9 @@
 """Support signature verification."""
 
 import binascii
+import collections
 import datetime
+import threading
 
 from castellan import key_manager
 from cryptography import exceptions as crypto_exception
@@ -27,6 +29,7 @@ from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import hashes
 from cryptography import x509
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import base64
 from oslo_utils import encodeutils
@@ -36,6 +39,10 @@ from xmonitor.i18n import _, _LE
 
 LOG = logging.getLogger(__name__)
 
+CONF = cfg.CONF
+CONF.import_opt('signature_certificate_cache_size', 'xmonitor.common.config')
+CONF.import_opt('signature_certificate_cache_ttl', 'xmonitor.common.config')
+
 
 # Note: This is the signature hash method, which is independent from the
 # image data checksum hash method (which is handled elsewhere).
@@ -291,6 +298,9 @@ def get_hash_method(hash_method_name):
 def get_public_key(context, signature_certificate_uuid, signature_key_type):
     """Create the public key object from a retrieved certificate.
 
+    The certificate is only retrieved when it is not in the certificate
+    cache already.
+
     :param context: the user context for authentication
     :param signature_certificate_uuid: the uuid to use to retrieve the
                                        certificate
@@ -299,11 +309,15 @@ def get_public_key(context, signature_certificate_uuid, signature_key_type):
     :raises xmonitor.common.exception.SignatureVerificationError: if public
             key format is invalid
     """
-    certificate = get_certificate(context, signature_certificate_uuid)
+    cache = get_certificate_cache()
+    cached = cache.get(context, signature_certificate_uuid)
+    if cached is None:
+        certificate = get_certificate(context, signature_certificate_uuid)
+        cached = cache.set(context, signature_certificate_uuid, certificate)
 
     # Note that this public key could either be
     # RSAPublicKey, DSAPublicKey, or EllipticCurvePublicKey
-    public_key = certificate.public_key()
+    public_key = cached.public_key
 
     # Confirm the type is of the type expected based on the signature key type
     if not isinstance(public_key, signature_key_type.public_key_type):
@@ -385,3 +399,133 @@ def verify_certificate(certificate):
             _('Certificate is not valid after: %s UTC')
             % certificate.not_valid_after
         )
+
+
+CachedCertificate = collections.namedtuple('CachedCertificate',
+                                           ['certificate', 'public_key',
+                                            'expires_at'])
+
+
+class CertificateCache(object):
+    """Certificates recently fetched from the key manager by this worker.
+
+    Whether a certificate can be fetched depends on who asks for it, so
+    entries are kept per certificate and per requesting user and project.
+    An entry is used for ``ttl`` seconds at most, and never past the end of
+    the validity of its certificate. The least recently used entries are
+    evicted once ``size`` is reached.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def _key(context, signature_certificate_uuid):
+        return (signature_certificate_uuid,
+                getattr(context, 'user', None),
+                getattr(context, 'tenant', None))
+
+    def get(self, context, signature_certificate_uuid):
+        key = self._key(context, signature_certificate_uuid)
+        cached = self._entries.pop(key, None)
+        if cached is None:
+            return None
+        now = datetime.datetime.utcnow()
+        if (now >= cached.expires_at or
+                now < cached.certificate.not_valid_before):
+            return None
+        self._entries[key] = cached
+        return cached
+
+    def set(self, context, signature_certificate_uuid, certificate):
+        """Keep a certificate verified by get_certificate.
+
+        :returns: the CachedCertificate, also when the cache is disabled
+        """
+        expires_at = min(datetime.datetime.utcnow() +
+                         datetime.timedelta(seconds=self.ttl),
+                         certificate.not_valid_after)
+        cached = CachedCertificate(certificate, certificate.public_key(),
+                                   expires_at)
+        if self.size <= 0 or self.ttl <= 0:
+            return cached
+        key = self._key(context, signature_certificate_uuid)
+        self._entries.pop(key, None)
+        self._entries[key] = cached
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return cached
+
+
+_CACHE = None
+
+
+def get_certificate_cache():
+    """Return the certificate cache of this process."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = CertificateCache(CONF.signature_certificate_cache_size,
+                                  CONF.signature_certificate_cache_ttl)
+    return _CACHE
+
+
+class PendingVerifier(object):
+    """A verifier created while the image data starts to be stored.
+
+    Fetching the certificate from the key manager takes a round trip to
+    it, which is overlapped with the first chunks of the upload. Those
+    chunks are kept, up to ``max_pending`` bytes of them, and fed to the
+    verifier once it exists. Past that, storing the data waits for it.
+    Errors creating the verifier are raised from update() or verify().
+
+    The verifier is created by a thread, which is a greenthread in the
+    monkey patched eventlet API server and a native one in the asyncio API
+    server.
+    """
+
+    def __init__(self, context, image_properties, max_pending=16 * 1024 ** 2):
+        self.max_pending = max_pending
+        self._verifier = None
+        self._error = None
+        self._pending = []
+        self._pending_size = 0
+        self._created = None
+        self._creation = threading.Thread(target=self._create,
+                                          args=(context, image_properties))
+        self._creation.daemon = True
+        self._creation.start()
+
+    def _create(self, context, image_properties):
+        try:
+            self._created = get_verifier(context, image_properties)
+        except Exception as e:
+            # NOTE: Kept for update() or verify() to raise, as nobody may
+            # ever wait for a verifier of an upload that failed already.
+            self._error = e
+
+    def _wait(self):
+        if self._verifier is None:
+            self._creation.join()
+            if self._error is not None:
+                raise self._error
+            verifier = self._created
+            for data in self._pending:
+                verifier.update(data)
+            self._pending = []
+            self._verifier = verifier
+        return self._verifier
+
+    def update(self, data):
+        if (self._verifier is None and self._creation.is_alive() and
+                self._pending_size + len(data) <= self.max_pending):
+            # NOTE: Buffers the data is read into may be reused
+            self._pending.append(data if isinstance(data, bytes)
+                                 else bytes(data))
+            self._pending_size += len(data)
+            return
+        self._wait().update(data)
+
+    def verify(self):
+        return self._wait().verify()
@@ -123,6 +123,27 @@ def cooperative_read(fd):
     return readfn
 
 
+def cooperative_readinto(fd):
+    """
+    Wrap a file descriptor's readinto with a partial function which
+    schedules after each read. This can prevent eventlet thread starvation.
+
+    :param fd: a file descriptor to wrap
+    """
+    def readintofn(buf):
+        result = fd.readinto(buf)
+        sleep(0)
+        return result
+    return readintofn
+
+
+def _readinto_from_read(read, buf):
+    """Fill a buffer through the read method of a reader lacking readinto."""
+    data = read(len(buf))
+    buf[:len(data)] = data
+    return len(data)
+
+
 MAX_COOP_READER_BUFFER_SIZE = 134217728  # 128M seems like a sane buffer limit
 
 
@@ -135,6 +156,11 @@ class CooperativeReader(object):
     one image being uploaded/downloaded this prevents eventlet thread
     starvation, ie allows all threads to be scheduled periodically rather than
     having the same thread be continuously active.
+
+    The chunks of an underlying iterator are not copied when they can be
+    avoided: a read of a whole chunk returns the chunk itself, the parts of
+    chunks are taken through a memoryview and copied once, into the result
+    or into the buffer given to readinto.
     """
     def __init__(self, fd):
         """
@@ -147,11 +173,73 @@ class CooperativeReader(object):
         # is more straightforward
         if hasattr(fd, 'read'):
             self.read = cooperative_read(fd)
+            if hasattr(fd, 'readinto'):
+                self.readinto = cooperative_readinto(fd)
+            else:
+                self.readinto = functools.partial(_readinto_from_read,
+                                                  self.read)
         else:
             self.iterator = None
             self.buffer = b''
+            self.view = b''
             self.position = 0
 
+    def _next_chunk(self):
+        """Make the next chunk of the underlying iterator the buffer.
+
+        :returns: False once the iterator is exhausted
+        """
+        if self.iterator is None:
+            self.iterator = self.__iter__()
+        self.position = 0
+        try:
+            self.buffer = next(self.iterator)
+        except StopIteration:
+            self.buffer = self.view = b''
+            return False
+
+        # NOTE: Slicing a memoryview does not copy the chunk. The slices
+        # can only be joined into bytes on Python 3, though.
+        if six.PY3 and isinstance(self.buffer, (bytes, bytearray)):
+            self.view = memoryview(self.buffer)
+        else:
+            self.view = self.buffer
+        return True
+
+    def _pieces(self, length):
+        """Take up to length bytes off the chunks of the iterator.
+
+        Whole chunks are taken as they are, parts of chunks as slices of
+        their view.
+        """
+        pieces = []
+        size = 0
+        while size < length:
+            if self.position >= len(self.buffer):
+                if not self._next_chunk():
+                    break
+                continue
+
+            to_read = min(len(self.buffer) - self.position, length - size)
+            if to_read == len(self.buffer):
+                pieces.append(self.buffer)
+            else:
+                pieces.append(self.view[self.position:
+                                        self.position + to_read])
+            size += to_read
+            self.position += to_read
+
+            # This check is here to prevent potential OOM issues if
+            # this code is called with unreasonably high values of read
+            # size. Currently it is only called from the HTTP clients
+            # of Glance backend stores, which use httplib for data
+            # streaming, which has readsize hardcoded to 8K, so this
+            # check should never fire. Regardless it still worths to
+            # make the check, as the code may be reused somewhere else.
+            if size >= MAX_COOP_READER_BUFFER_SIZE:
+                raise exception.LimitExceeded()
+        return pieces
+
     def read(self, length=None):
         """Return the requested amount of bytes, fetching the next chunk of
         the underlying iterator when needed.
@@ -160,55 +248,38 @@ class CooperativeReader(object):
         fd already supports read().
         """
         if length is None:
-            if len(self.buffer) - self.position > 0:
-                # if no length specified but some data exists in buffer,
-                # return that data and clear the buffer
-                result = self.buffer[self.position:]
-                self.buffer = b''
-                self.position = 0
-                return str(result)
-            else:
-                # otherwise read the next chunk from the underlying iterator
-                # and return it as a whole. Reset the buffer, as subsequent
-                # calls may specify the length
-                try:
-                    if self.iterator is None:
-                        self.iterator = self.__iter__()
-                    return next(self.iterator)
-                except StopIteration:
-                    return ''
-                finally:
-                    self.buffer = b''
-                    self.position = 0
-        else:
-            result = bytearray()
-            while len(result) < length:
-                if self.position < len(self.buffer):
-                    to_read = length - len(result)
-                    chunk = self.buffer[self.position:self.position + to_read]
-                    result.extend(chunk)
-
-                    # This check is here to prevent potential OOM issues if
-                    # this code is called with unreasonably high values of read
-                    # size. Currently it is only called from the HTTP clients
-                    # of Glance backend stores, which use httplib for data
-                    # streaming, which has readsize hardcoded to 8K, so this
-                    # check should never fire. Regardless it still worths to
-                    # make the check, as the code may be reused somewhere else.
-                    if len(result) >= MAX_COOP_READER_BUFFER_SIZE:
-                        raise exception.LimitExceeded()
-                    self.position += len(chunk)
-                else:
-                    try:
-                        if self.iterator is None:
-                            self.iterator = self.__iter__()
-                        self.buffer = next(self.iterator)
-                        self.position = 0
-                    except StopIteration:
-                        self.buffer = b''
-                        self.position = 0
-                        return bytes(result)
-            return bytes(result)
+            # NOTE: Without a length, the rest of the current chunk or else
+            # the next chunk as a whole is returned
+            if self.position >= len(self.buffer) and not self._next_chunk():
+                return b''
+            result = self.buffer[self.position:] if self.position else (
+                self.buffer)
+            self.buffer = self.view = b''
+            self.position = 0
+            return result
+
+        pieces = self._pieces(length)
+        if not pieces:
+            return b''
+        if len(pieces) == 1:
+            piece = pieces[0]
+            return piece.tobytes() if isinstance(piece, memoryview) else (
+                piece)
+        return b''.join(pieces)
+
+    def readinto(self, buf):
+        """Read up to len(buf) bytes into buf, the way io readers do.
+
+        This is replaced in __init__ if the underlying fd supports read().
+
+        :returns: the number of bytes read, 0 once all have been read
+        """
+        target = memoryview(buf)
+        size = 0
+        for piece in self._pieces(len(target)):
+            target[size:size + len(piece)] = piece
+            size += len(piece)
+        return size
 
     def __iter__(self):
         return cooperative_iter(self.fd.__iter__())
@@ -243,6 +314,16 @@ class LimitingReader(object):
             raise exception.ImageSizeLimitExceeded()
         return result
 
+    def readinto(self, buf):
+        if hasattr(self.data, 'readinto'):
+            result = self.data.readinto(buf)
+        else:
+            result = _readinto_from_read(self.data.read, buf)
+        self.bytes_read += result
+        if self.bytes_read > self.limit:
+            raise exception.ImageSizeLimitExceeded()
+        return result
+
 
 def image_meta_to_http_headers(image_meta):
     """
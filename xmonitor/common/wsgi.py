@@ -23,7 +23,9 @@ from __future__ import print_function
 
 import errno
 import functools
+import hashlib
 import os
+import re
 import signal
 import sys
 import time
@@ -32,11 +34,13 @@ import eventlet
 from eventlet.green import socket
 from eventlet.green import ssl
 import eventlet.greenio
+import eventlet.semaphore
 import eventlet.wsgi
 import glance_store
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_middleware.healthcheck import pluginbase
 from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
 from oslo_utils import strutils
@@ -71,6 +75,14 @@ socket_opts = [
                help=_('The value for the socket option TCP_KEEPIDLE.  This is '
                       'the time in seconds that the connection must be idle '
                       'before TCP starts sending keepalive probes.')),
+    cfg.BoolOpt('reuse_port', default=False,
+                help=_('Give every worker process a listening socket of its '
+                       'own, bound with SO_REUSEPORT, so that the kernel '
+                       'balances new connections across the workers. By '
+                       'default all workers accept connections from one '
+                       'shared socket, whichever worker wakes up first '
+                       'winning. Requires Linux 3.9 or later and has no '
+                       'effect when workers is 0.')),
     cfg.StrOpt('ca_file', help=_('CA certificate file to use to verify '
                                  'connecting clients.')),
     cfg.StrOpt('cert_file', help=_('Certificate file to use when starting API '
@@ -98,6 +110,32 @@ eventlet_opts = [
                        'read successfully by the client, you simply have to '
                        'set this option to False when you create a wsgi '
                        'server.')),
+    cfg.IntOpt('max_data_transfers_per_worker', default=0, min=0,
+               help=_('The maximum number of image uploads and downloads '
+                      'a worker process serves at the same time. Further '
+                      'transfers are queued, see admission_queue_size, '
+                      'and wait as long as it takes for one to finish. '
+                      'Requests for metadata are admitted separately. 0 '
+                      'means no limit.')),
+    cfg.IntOpt('max_metadata_requests_per_worker', default=0, min=0,
+               help=_('The maximum number of requests other than image '
+                      'uploads and downloads a worker process serves at '
+                      'the same time. Further requests are queued, see '
+                      'admission_queue_size. 0 means no limit.')),
+    cfg.IntOpt('admission_queue_size', default=128, min=0,
+               help=_('The number of data transfers, and separately of '
+                      'metadata requests, that may wait for a worker to '
+                      'serve them once max_data_transfers_per_worker or '
+                      'max_metadata_requests_per_worker is reached. '
+                      'Requests beyond that are answered with 503 and a '
+                      'Retry-After header. Waiting requests get threads '
+                      'of their own, beyond those serving requests.')),
+    cfg.IntOpt('admission_queue_timeout', default=30, min=0,
+               help=_('The number of seconds a queued metadata request '
+                      'waits to be served before it is answered with 503 '
+                      'and a Retry-After header. 0 means waiting as long '
+                      'as it takes. Queued data transfers always wait as '
+                      'long as it takes.')),
     cfg.IntOpt('client_socket_timeout', default=900,
                help=_('Timeout for client connections\' socket operations. '
                       'If an incoming connection is idle for this number of '
@@ -111,6 +149,24 @@ wsgi_opts = [
                       'original request, even if it was removed by an SSL '
                       'terminating proxy. Typical value is '
                       '"HTTP_X_FORWARDED_PROTO".')),
+    cfg.BoolOpt('stream_list_responses', default=False,
+                help=_('Serialize image and task list responses '
+                       'incrementally. Each item is formatted and encoded '
+                       'while the body is being sent instead of building '
+                       'the whole document in memory first, which keeps '
+                       'memory usage flat and lowers the time to first byte '
+                       'for large pages. As the status line is sent before '
+                       'the items are formatted, a failure part way through '
+                       'a page aborts the connection instead of returning '
+                       'an error response.')),
+]
+
+asyncio_opts = [
+    cfg.IntOpt('asyncio_executor_threads', default=64, min=1,
+               help=_('The number of threads that run the application in '
+                      'a worker process of the asyncio API server, '
+                      'xmonitor-api-asyncio. Requests beyond that wait for '
+                      'a thread to become free.')),
 ]
 
 
@@ -121,10 +177,25 @@ CONF.register_opts(bind_opts)
 CONF.register_opts(socket_opts)
 CONF.register_opts(eventlet_opts)
 CONF.register_opts(wsgi_opts)
+CONF.register_opts(asyncio_opts)
 profiler_opts.set_defaults(CONF)
 
 ASYNC_EVENTLET_THREAD_POOL_LIST = []
 
+# Seconds between two reports of the admission queue statistics
+ADMISSION_REPORT_INTERVAL = 60
+
+# The AdmissionControl of the requests served by this process, if any
+_admission = None
+
+
+def admission_queue_capacity():
+    """The number of requests that may wait for admission in a worker."""
+    queues = sum(1 for limit in (CONF.max_data_transfers_per_worker,
+                                 CONF.max_metadata_requests_per_worker)
+                 if limit)
+    return queues * CONF.admission_queue_size
+
 
 def get_num_workers():
     """Return the configured number of workers."""
@@ -163,13 +234,24 @@ def ssl_wrap_socket(sock):
     return ssl.wrap_socket(sock, **ssl_kwargs)
 
 
-def get_socket(default_port):
+def _listen_reuse_port(bind_addr, family):
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(bind_addr)
+    sock.listen(CONF.backlog)
+    return sock
+
+
+def get_socket(default_port, reuse_port=False):
     """
     Bind socket to bind ip:port in conf
 
     note: Mostly comes from Swift with a few small changes...
 
     :param default_port: port to bind to if none is specified in conf
+    :param reuse_port: bind with SO_REUSEPORT, so that other processes can
+                       listen on the same address
 
     :returns: a socket object as returned from socket.listen or
                ssl.wrap_socket if conf specifies cert_file
@@ -198,9 +280,12 @@ def get_socket(default_port):
 
     while not sock and time.time() < retry_until:
         try:
-            sock = eventlet.listen(bind_addr,
-                                   backlog=CONF.backlog,
-                                   family=address_family)
+            if reuse_port:
+                sock = _listen_reuse_port(bind_addr, address_family)
+            else:
+                sock = eventlet.listen(bind_addr,
+                                       backlog=CONF.backlog,
+                                       family=address_family)
         except socket.error as err:
             if err.args[0] != errno.EADDRINUSE:
                 raise
@@ -252,16 +337,213 @@ def get_asynchronous_eventlet_pool(size=1000):
     return pool
 
 
+# Downloads of image data, as opposed to reads of metadata
+DATA_DOWNLOAD_PATH = re.compile(r'^/v2/images/[^/]+/file$|'
+                                r'^/v1/images/(?!detail$)[^/]+$')
+
+
+def is_data_transfer(environ):
+    """Whether a request moves image data rather than metadata."""
+    method = environ['REQUEST_METHOD']
+    if method == 'GET':
+        return bool(DATA_DOWNLOAD_PATH.match(environ.get('PATH_INFO', '')))
+    if method in ('PUT', 'POST'):
+        has_body = (environ.get('CONTENT_LENGTH') not in (None, '', '0') or
+                    'chunked' in environ.get('HTTP_TRANSFER_ENCODING', ''))
+        return (has_body and
+                environ.get('CONTENT_TYPE') == 'application/octet-stream')
+    return False
+
+
+class _ReleasingIterator(object):
+    """Response body calling release once the server is done with it."""
+
+    def __init__(self, app_iter, release):
+        self.app_iter = app_iter
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            release, self.release = self.release, None
+            if release is not None:
+                release()
+
+
+class AdmissionQueue(object):
+    """Bound on the requests of one kind a worker serves at once.
+
+    Requests beyond the bound wait in a queue of bounded length, for a
+    bounded time. Requests that find the queue full or wait for too long
+    are shed.
+    """
+
+    def __init__(self, name, size, queue_size, timeout):
+        self.name = name
+        self.semaphore = self._semaphore(size) if size else None
+        self.queue_size = queue_size
+        self.timeout = timeout or None
+        self.running = 0
+        self.waiting = 0
+        self._reset()
+
+    def _reset(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.max_waiting = self.waiting
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        """Wait for a slot.
+
+        :returns: False if the request has to be shed
+        """
+        if self.semaphore is not None and not self.semaphore.acquire(False):
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            started = time.time()
+            try:
+                acquired = self._wait()
+            finally:
+                self.waiting -= 1
+            waited = time.time() - started
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+            if not acquired:
+                self.rejected += 1
+                return False
+
+        self.running += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.running -= 1
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    @staticmethod
+    def _semaphore(size):
+        return eventlet.semaphore.Semaphore(size)
+
+    def _wait(self):
+        """Wait for the semaphore for up to timeout seconds."""
+        # NOTE: Semaphore.acquire only takes a timeout in eventlet 0.19.0
+        # and later
+        with eventlet.Timeout(self.timeout, False):
+            return self.semaphore.acquire()
+        return False
+
+    def stats(self):
+        """The queue statistics since the previous report."""
+        return {'running': self.running, 'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted, 'rejected': self.rejected,
+                'wait_time': self.wait_time, 'max_wait': self.max_wait}
+
+    def report(self):
+        """Log the queue statistics since the previous report."""
+        if self.admitted or self.rejected or self.running or self.waiting:
+            LOG.info(_LI("%(name)s requests: %(running)d running, "
+                         "%(waiting)d queued (at most %(max_waiting)d), "
+                         "%(admitted)d admitted, %(rejected)d shed, "
+                         "waited %(wait_time).1fs in total and "
+                         "%(max_wait).1fs at most"),
+                     dict(self.stats(), name=self.name))
+        self._reset()
+
+
+class AdmissionControl(object):
+    """WSGI application admitting requests through per kind queues.
+
+    Image data transfers last as long as it takes to move whole images,
+    so they are admitted separately from requests for metadata. A burst
+    of transfers then cannot keep metadata requests from being served.
+    """
+
+    def __init__(self, application, data, metadata):
+        """
+        :param application: the application to admit requests to
+        :param data: the AdmissionQueue for image data transfers
+        :param metadata: the AdmissionQueue for all other requests
+        """
+        self.application = application
+        self.data = data
+        self.metadata = metadata
+
+    def __call__(self, environ, start_response):
+        queue = self.data if is_data_transfer(environ) else self.metadata
+        if not queue.acquire():
+            LOG.debug("Shedding %s request", queue.name)
+            retry_after = str(max(1, int(queue.timeout or 1)))
+            response = webob.exc.HTTPServiceUnavailable(
+                explanation=_("The server is busy, try again later."),
+                headers=[('Retry-After', retry_after)])
+            return response(environ, start_response)
+
+        try:
+            app_iter = self.application(environ, start_response)
+        except Exception:
+            queue.release()
+            raise
+        return _ReleasingIterator(app_iter, queue.release)
+
+    def stats(self):
+        """The statistics of both queues since their previous report."""
+        return {'data': self.data.stats(),
+                'metadata': self.metadata.stats()}
+
+    def report(self, interval):
+        """Log the queue statistics every interval seconds."""
+        while True:
+            eventlet.sleep(interval)
+            self.data.report()
+            self.metadata.report()
+
+
+class AdmissionHealthcheck(pluginbase.HealthcheckBaseExtension):
+    """Healthcheck backend reporting the admission queues of a worker.
+
+    Enabled by adding ``admission`` to the backends of the healthcheck
+    filter. With ``detailed`` set, the statistics of the data and metadata
+    queues of the worker that served the check, since their previous
+    report, are in the details.
+    """
+
+    def healthcheck(self, server_port):
+        if _admission is None:
+            return pluginbase.HealthcheckResult(
+                available=True, reason=_("No admission limits"))
+        return pluginbase.HealthcheckResult(
+            available=True, reason=_("OK"), details=_admission.stats())
+
+
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications.
 
     This class requires initialize_glance_store set to True if
     xmonitor store needs to be initialized.
     """
+
+    admission_queue_class = AdmissionQueue
+
     def __init__(self, threads=1000, initialize_glance_store=False):
         os.umask(0o27)  # ensure files are created with the correct privileges
         self._logger = logging.getLogger("eventlet.wsgi.server")
         self.threads = threads
+        self.sock = None
+        self._sock = None
+        self.reuse_port = False
         self.children = set()
         self.stale_children = set()
         self.running = True
@@ -306,6 +588,10 @@ class Server(object):
         :param application: The application to be run in the WSGI server
         :param default_port: Port to bind to if none is specified in conf
         """
+        # NOTE: Imported here as the notifier imports this module
+        from xmonitor import notifier
+        # NOTE: The workers flush the notification queue when stopped
+        notifier.enable_queue()
         self.application = application
         self.default_port = default_port
         self.configure()
@@ -315,6 +601,9 @@ class Server(object):
         workers = get_num_workers()
         if workers == 0:
             # Useful for profiling, test, debug etc.
+            # NOTE: The single process serves requests, so it sends the
+            # notifications they queued before exiting as a worker does
+            signal.signal(signal.SIGTERM, self._child_term)
             self.pool = self.create_pool()
             self.pool.spawn_n(self._single_run, self.application, self.sock)
             return
@@ -327,7 +616,10 @@ class Server(object):
                 self.run_child()
 
     def create_pool(self):
-        return get_asynchronous_eventlet_pool(size=self.threads)
+        # NOTE: Requests waiting for admission hold a greenthread, they get
+        # some of their own for the pool to keep serving the admitted ones
+        return get_asynchronous_eventlet_pool(
+            size=self.threads + admission_queue_capacity())
 
     def _remove_children(self, pid):
         if pid in self.children:
@@ -369,8 +661,9 @@ class Server(object):
             except exception.SIGHUPInterrupt:
                 self.reload()
                 continue
-        eventlet.greenio.shutdown_safe(self.sock)
-        self.sock.close()
+        if self.sock is not None:
+            eventlet.greenio.shutdown_safe(self.sock)
+            self.sock.close()
         LOG.debug('Exited')
 
     def configure(self, old_conf=None, has_changed=None):
@@ -382,7 +675,19 @@ class Server(object):
         """
         eventlet.wsgi.MAX_HEADER_LINE = CONF.max_header_line
         self.client_socket_timeout = CONF.client_socket_timeout or None
-        self.configure_socket(old_conf, has_changed)
+        self.reuse_port = CONF.reuse_port and get_num_workers() > 0
+        if self.reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise RuntimeError(_("reuse_port is not supported on this "
+                                     "platform"))
+            # NOTE: Every worker binds a socket of its own. A socket left
+            # listening here would take its share of the connections
+            # without anybody accepting them.
+            if self.sock is not None:
+                self.sock.close()
+            self.sock = self._sock = None
+        else:
+            self.configure_socket(old_conf, has_changed)
         if self.initialize_glance_store:
             initialize_glance_store()
 
@@ -430,16 +735,19 @@ class Server(object):
             """Shuts down child processes, existing requests are handled."""
             signal.signal(signal.SIGHUP, signal.SIG_IGN)
             eventlet.wsgi.is_accepting = False
-            self.sock.close()
+            if self.sock is not None:
+                self.sock.close()
 
         pid = os.fork()
         if pid == 0:
             signal.signal(signal.SIGHUP, child_hup)
-            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, self._child_term)
             # ignore the interrupt signal to avoid a race whereby
             # a child worker receives the signal before the parent
             # and is respawned unnecessarily as a result
             signal.signal(signal.SIGINT, signal.SIG_IGN)
+            if self.reuse_port:
+                self.configure_socket()
             # The child has no need to stash the unwrapped
             # socket, and the reference prevents a clean
             # exit on sighup
@@ -453,6 +761,29 @@ class Server(object):
             LOG.info(_LI('Started child %s'), pid)
             self.children.add(pid)
 
+    def _child_term(self, *args):
+        """Shuts down a worker once notifications are sent."""
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        eventlet.wsgi.is_accepting = False
+        if self.sock is not None:
+            self.sock.close()
+        self._child_terminating()
+
+    def _child_terminating(self):
+        # NOTE: The handler may run in the hub, which must go on for the
+        # notifications to be sent.
+        eventlet.spawn_n(self._terminate_child)
+
+    @staticmethod
+    def _terminate_child():
+        # NOTE: Imported here as the notifier imports this module
+        from xmonitor import notifier
+        notifier.flush_queue()
+        LOG.info(_LI('Child %d exiting on SIGTERM'), os.getpid())
+        # NOTE: Requests still running are cut short, as they were before
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
     def run_server(self):
         """Run a WSGI server."""
         if cfg.CONF.pydev_worker_debug_host:
@@ -461,9 +792,10 @@ class Server(object):
 
         eventlet.wsgi.HttpProtocol.default_request_version = "HTTP/1.0"
         self.pool = self.create_pool()
+        application = self._admission_control(self.application)
         try:
             eventlet.wsgi.server(self.sock,
-                                 self.application,
+                                 application,
                                  log=self._logger,
                                  custom_pool=self.pool,
                                  debug=False,
@@ -478,9 +810,37 @@ class Server(object):
             for pool in ASYNC_EVENTLET_THREAD_POOL_LIST:
                 pool.waitall()
 
+    def _admission_control(self, application):
+        global _admission
+        data_limit = CONF.max_data_transfers_per_worker
+        metadata_limit = CONF.max_metadata_requests_per_worker
+        if not data_limit and not metadata_limit:
+            return application
+
+        if data_limit >= self.threads:
+            LOG.warn(_LW("Data transfers may take up all %d threads of a "
+                         "worker, lower max_data_transfers_per_worker"),
+                     self.threads)
+        # NOTE: Transfers last as long as whole images take to move, the
+        # ones queued behind them are not shed for waiting.
+        queue_class = self.admission_queue_class
+        application = AdmissionControl(
+            application,
+            queue_class('Data', data_limit, CONF.admission_queue_size, 0),
+            queue_class('Metadata', metadata_limit,
+                        CONF.admission_queue_size,
+                        CONF.admission_queue_timeout))
+        self._report_admission(application)
+        _admission = application
+        return application
+
+    def _report_admission(self, application):
+        eventlet.spawn_n(application.report, ADMISSION_REPORT_INTERVAL)
+
     def _single_run(self, application, sock):
         """Start a WSGI server in a new green thread."""
         LOG.info(_LI("Starting single process server"))
+        application = self._admission_control(application)
         eventlet.wsgi.server(sock, application, custom_pool=self.pool,
                              log=self._logger,
                              debug=False,
@@ -506,7 +866,7 @@ class Server(object):
         :param has changed: callable to determine if a parameter has changed
         """
         # Do we need a fresh socket?
-        new_sock = (old_conf is None or (
+        new_sock = (old_conf is None or self._sock is None or (
                     has_changed('bind_host') or
                     has_changed('bind_port')))
         # Will we be using https?
@@ -521,10 +881,10 @@ class Server(object):
         unwrap_sock = use_ssl is False and old_use_ssl is True
 
         if new_sock:
-            self._sock = None
-            if old_conf is not None:
+            if old_conf is not None and self.sock is not None:
                 self.sock.close()
-            _sock = get_socket(self.default_port)
+            self._sock = None
+            _sock = get_socket(self.default_port, reuse_port=self.reuse_port)
             _sock.setsockopt(socket.SOL_SOCKET,
                              socket.SO_REUSEADDR, 1)
             # sockets can hang around forever without keepalive
@@ -823,6 +1183,10 @@ class JSONRequestDeserializer(object):
 
 class JSONResponseSerializer(object):
 
+    # NOTE: Formatted items are coalesced into chunks of about this size
+    # before being handed to the server, to avoid a write per item.
+    stream_chunk_size = 64 * 1024
+
     def _sanitizer(self, obj):
         """Sanitizer method that will be passed to jsonutils.dumps."""
         if hasattr(obj, "to_dict"):
@@ -840,6 +1204,67 @@ class JSONResponseSerializer(object):
         body = encodeutils.to_utf8(body)
         response.body = body
 
+    def _iter_collection(self, collection, items, formatter, links):
+        head = jsonutils.dumps(links, ensure_ascii=False)[:-1]
+        if links:
+            head += ', '
+        pieces = [encodeutils.to_utf8('%s"%s": [' % (head, collection))]
+        buffered = len(pieces[0])
+        separator = b''
+        for item in items:
+            view = jsonutils.dumps(formatter(item), ensure_ascii=False)
+            piece = separator + encodeutils.to_utf8(view)
+            pieces.append(piece)
+            buffered += len(piece)
+            separator = b', '
+            if buffered >= self.stream_chunk_size:
+                yield b''.join(pieces)
+                pieces = []
+                buffered = 0
+        pieces.append(b']}')
+        yield b''.join(pieces)
+
+    def stream_collection(self, response, collection, items, formatter,
+                          links):
+        """Serialize a collection body lazily into the response.
+
+        The body is a JSON object holding the ``links`` members and the
+        ``collection`` array. Items are passed through ``formatter`` one at
+        a time while the response is being iterated, so the full document
+        never exists in memory at once.
+        """
+        response.content_type = 'application/json'
+        response.app_iter = self._iter_collection(collection, items,
+                                                  formatter, links)
+        response.content_length = None
+
+
+def body_etag(body):
+    """Return a strong entity tag for a response body."""
+    return hashlib.sha256(body).hexdigest()
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """Check whether a conditional GET matches the current representation.
+
+    If-None-Match takes precedence over If-Modified-Since as required by
+    RFC 7232; the latter is only evaluated when no entity tag was sent.
+    """
+    if request.if_none_match:
+        return etag in request.if_none_match
+    if last_modified is not None and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def not_modified(etag, last_modified=None):
+    """Build a 304 response carrying the representation validators."""
+    response = webob.exc.HTTPNotModified()
+    response.etag = etag
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
 
 def translate_exception(req, e):
     """Translates all translatable elements of the given exception."""
@@ -925,6 +1350,7 @@ class Resource(object):
         try:
             response = webob.Response(request=request)
             self.dispatch(self.serializer, action, response, action_result)
+            response = self._apply_validators(request, response)
             # encode all headers in response to utf-8 to prevent unicode errors
             for name, value in list(response.headers.items()):
                 if six.PY2 and isinstance(value, six.text_type):
@@ -938,6 +1364,23 @@ class Resource(object):
         except Exception:
             return action_result
 
+    def _apply_validators(self, request, response):
+        """Answer conditional GETs for representations with an entity tag.
+
+        Serializers only tag representations the controller can tell are
+        unchanged without building them again, as a 304 would save little
+        otherwise. That is the image shown from the validator cache. Image
+        data, tagged with its checksum, is passed through untouched.
+        """
+        if (request.method != 'GET' or response.status_int != 200 or
+                response.etag is None or
+                response.content_type != 'application/json' or
+                not isinstance(response.app_iter, list)):
+            return response
+        if is_not_modified(request, response.etag, response.last_modified):
+            return not_modified(response.etag, response.last_modified)
+        return response
+
     def dispatch(self, obj, action, *args, **kwargs):
         """Find action-specific method on self and call it."""
         try:
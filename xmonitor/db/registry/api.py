@@ -83,6 +83,11 @@ def image_get(client, image_id, force_show_deleted=False):
                             force_show_deleted=force_show_deleted)
 
 
+@_get_client
+def image_get_updated_at(client, image_id):
+    return client.image_get_updated_at(image_id=image_id)
+
+
 def is_image_visible(context, image, status=None):
     """Return True if the image is visible in this context."""
     # Is admin == image visible
@@ -236,10 +241,34 @@ def image_tag_get_all(client, image_id, session=None):
 
 
 @_get_client
-def image_location_delete(client, image_id, location_id, status, session=None):
+def image_location_delete(client, image_id, location_id, status,
+                          delete_time=None, session=None):
     """Delete an image location."""
     client.image_location_delete(image_id=image_id, location_id=location_id,
-                                 status=status)
+                                 status=status, delete_time=delete_time)
+
+
+@_get_client
+def image_location_delete_many(client, location_ids, status,
+                               delete_time=None, session=None):
+    return client.image_location_delete_many(location_ids=location_ids,
+                                             status=status,
+                                             delete_time=delete_time)
+
+
+@_get_client
+def image_status_update_many(client, image_ids, from_status, to_status,
+                             session=None):
+    return client.image_status_update_many(image_ids=image_ids,
+                                           from_status=from_status,
+                                           to_status=to_status)
+
+
+@_get_client
+def image_location_get_pending_delete(client, deleted_before, marker=None,
+                                      limit=None, session=None):
+    return client.image_location_get_pending_delete(
+        deleted_before=deleted_before, marker=marker, limit=limit)
 
 
 @_get_client
@@ -565,6 +594,16 @@ def metadef_tag_count(client, namespace_name, session=None):
     return client.metadef_tag_count(namespace_name=namespace_name)
 
 
+@_get_client
+def metadef_generation_get(client, session=None):
+    return client.metadef_generation_get()
+
+
+@_get_client
+def metadef_generation_increment(client, session=None):
+    return client.metadef_generation_increment()
+
+
 @_get_client
 def artifact_create(client, values,
                     type_name, type_version=None, session=None):
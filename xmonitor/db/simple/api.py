@@ -32,6 +32,7 @@ LOG = logging.getLogger(__name__)
 DATA = {
     'images': {},
     'members': {},
+    'metadef_generation': 0,
     'metadef_namespace_resource_types': [],
     'metadef_namespaces': [],
     'metadef_objects': [],
@@ -74,6 +75,7 @@ def reset():
     DATA = {
         'images': {},
         'members': [],
+        'metadef_generation': 0,
         'metadef_namespace_resource_types': [],
         'metadef_namespaces': [],
         'metadef_objects': [],
@@ -426,6 +428,12 @@ def image_get(context, image_id, session=None, force_show_deleted=False):
                                 force_show_deleted=force_show_deleted)
 
 
+@log_call
+def image_get_updated_at(context, image_id, session=None):
+    image = _image_get(context, image_id)
+    return image['updated_at']
+
+
 @log_call
 def image_get_all(context, filters=None, marker=None, limit=None,
                   sort_key=None, sort_dir=None,
@@ -619,6 +627,70 @@ def image_location_delete(context, image_id, location_id, status,
         raise exception.NotFound(msg)
 
 
+@log_call
+def image_location_delete_many(context, location_ids, status,
+                               delete_time=None):
+    if status not in ('deleted', 'pending_delete'):
+        msg = _("The status of deleted image location can only be set to "
+                "'pending_delete' or 'deleted'.")
+        raise exception.Invalid(msg)
+
+    delete_time = delete_time or timeutils.utcnow()
+    count = 0
+    for loc in DATA['locations']:
+        if loc['id'] in location_ids:
+            loc.update({"deleted": True,
+                        "status": status,
+                        "updated_at": delete_time,
+                        "deleted_at": delete_time})
+            count += 1
+    return count
+
+
+@log_call
+def image_status_update_many(context, image_ids, from_status, to_status):
+    remaining = set(loc['image_id'] for loc in DATA['locations']
+                    if loc['status'] == from_status)
+    count = 0
+    for image_id in image_ids:
+        image = DATA['images'].get(image_id)
+        if (image is None or image['status'] != from_status or
+                image_id in remaining):
+            continue
+        image['status'] = to_status
+        image['updated_at'] = timeutils.utcnow()
+        count += 1
+    return count
+
+
+@log_call
+def image_location_get_pending_delete(context, deleted_before, marker=None,
+                                      limit=None):
+    locations = sorted([loc for loc in DATA['locations']
+                        if loc['status'] == 'pending_delete' and
+                        loc['deleted_at'] <= deleted_before],
+                       key=lambda loc: (loc['deleted_at'], loc['id']))
+
+    if marker is not None:
+        for loc in DATA['locations']:
+            if loc['id'] == marker:
+                start = (loc['deleted_at'], loc['id'])
+                break
+        else:
+            msg = _("No location found with ID %s") % marker
+            raise exception.NotFound(msg)
+        locations = [loc for loc in locations
+                     if (loc['deleted_at'], loc['id']) > start]
+
+    if limit is not None:
+        locations = locations[:limit]
+
+    return [{'id': loc['id'],
+             'image_id': loc['image_id'],
+             'url': loc['url'],
+             'deleted_at': loc['deleted_at']} for loc in locations]
+
+
 def _image_locations_set(context, image_id, locations):
     # NOTE(zhiyan): 1. Remove records from DB for deleted locations
     used_loc_ids = [loc['id'] for loc in locations if loc.get('id')]
@@ -1966,6 +2038,19 @@ def _artifact_format(artifact_id, **values):
     return artifact
 
 
+@log_call
+def metadef_generation_get(context):
+    """Get the generation counter of the metadata definitions"""
+    return DATA['metadef_generation']
+
+
+@log_call
+def metadef_generation_increment(context):
+    """Bump the generation counter of the metadata definitions"""
+    DATA['metadef_generation'] += 1
+    return DATA['metadef_generation']
+
+
 @log_call
 def artifact_create(context, values, type_name, type_version):
     global DATA
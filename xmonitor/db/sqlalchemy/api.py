@@ -44,6 +44,7 @@ from xmonitor.common import exception
 from xmonitor.common import timeutils
 from xmonitor.common import utils
 from xmonitor.db.sqlalchemy import glare
+from xmonitor.db.sqlalchemy.metadef_api import generation as metadef_gen_api
 from xmonitor.db.sqlalchemy.metadef_api import (resource_type
                                               as metadef_resource_type_api)
 from xmonitor.db.sqlalchemy.metadef_api import (resource_type_association
@@ -205,6 +206,35 @@ def image_get(context, image_id, session=None, force_show_deleted=False):
     return image
 
 
+def image_get_updated_at(context, image_id, session=None):
+    """
+    Return the last modification time of an image.
+
+    The image is checked for visibility like in image_get but neither its
+    properties nor its locations are loaded, which makes this a cheap probe
+    for clients revalidating a cached representation.
+    """
+    _check_image_id(image_id)
+    session = session or get_session()
+    query = session.query(models.Image).filter_by(id=image_id)
+    if not context.can_see_deleted:
+        query = query.filter_by(deleted=False)
+
+    try:
+        image = query.one()
+    except sa_orm.exc.NoResultFound:
+        msg = "No image found with ID %s" % image_id
+        LOG.debug(msg)
+        raise exception.ImageNotFound(msg)
+
+    if not is_image_visible(context, image):
+        msg = "Forbidding request, image %s not visible" % image_id
+        LOG.debug(msg)
+        raise exception.Forbidden(msg)
+
+    return image['updated_at']
+
+
 def _check_image_id(image_id):
     """
     check if the given image id is valid before executing operations. For
@@ -922,6 +952,85 @@ def image_location_delete(context, image_id, location_id, status,
         raise exception.NotFound(msg)
 
 
+def image_location_delete_many(context, location_ids, status,
+                               delete_time=None, session=None):
+    """Mark several image locations deleted in a single statement."""
+    if status not in ('deleted', 'pending_delete'):
+        msg = _("The status of deleted image location can only be set to "
+                "'pending_delete' or 'deleted'")
+        raise exception.Invalid(msg)
+
+    session = session or get_session()
+    delete_time = delete_time or timeutils.utcnow()
+    with session.begin():
+        query = session.query(models.ImageLocation).filter(
+            models.ImageLocation.id.in_(location_ids))
+        return query.update({"deleted": True,
+                             "status": status,
+                             "updated_at": delete_time,
+                             "deleted_at": delete_time},
+                            synchronize_session=False)
+
+
+def image_status_update_many(context, image_ids, from_status, to_status,
+                             session=None):
+    """Move several images from one status to another at once.
+
+    Images no longer in ``from_status``, or which still have a location
+    in ``from_status``, are left as they are.
+
+    :returns: the number of images moved
+    """
+    session = session or get_session()
+    remaining = session.query(models.ImageLocation.image_id).filter(
+        models.ImageLocation.image_id.in_(image_ids)).filter_by(
+        status=from_status)
+    with session.begin():
+        query = session.query(models.Image).filter(
+            models.Image.id.in_(image_ids)).filter_by(
+            status=from_status).filter(~models.Image.id.in_(remaining))
+        return query.update({"status": to_status,
+                             "updated_at": timeutils.utcnow()},
+                            synchronize_session=False)
+
+
+def image_location_get_pending_delete(context, deleted_before, marker=None,
+                                      limit=None, session=None):
+    """Get image locations waiting to be scrubbed, in order of deletion.
+
+    :param deleted_before: only return locations deleted at or before
+                           this time
+    :param marker: id of the last location of the previous page
+    :param limit: maximum number of locations to return
+    """
+    session = session or get_session()
+    query = session.query(models.ImageLocation).filter_by(
+        status='pending_delete').filter(
+        models.ImageLocation.deleted_at <= deleted_before)
+
+    if marker is not None:
+        marker_ref = session.query(models.ImageLocation).filter_by(
+            id=marker).first()
+        if marker_ref is None:
+            msg = _("No location found with ID %s") % marker
+            raise exception.NotFound(msg)
+        query = query.filter(sa_sql.or_(
+            models.ImageLocation.deleted_at > marker_ref.deleted_at,
+            sa_sql.and_(
+                models.ImageLocation.deleted_at == marker_ref.deleted_at,
+                models.ImageLocation.id > marker_ref.id)))
+
+    query = query.order_by(models.ImageLocation.deleted_at,
+                           models.ImageLocation.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [{'id': loc_ref.id,
+             'image_id': loc_ref.image_id,
+             'url': loc_ref.value,
+             'deleted_at': loc_ref.deleted_at} for loc_ref in query.all()]
+
+
 def _image_locations_set(context, image_id, locations, session=None):
     # NOTE(zhiyan): 1. Remove records from DB for deleted locations
     session = session or get_session()
@@ -1842,6 +1951,18 @@ def metadef_tag_count(context, namespace_name, session=None):
     return metadef_tag_api.count(context, namespace_name, session)
 
 
+def metadef_generation_get(context, session=None):
+    """Get the generation counter of the metadata definitions."""
+    session = session or get_session()
+    return metadef_gen_api.get(context, session)
+
+
+def metadef_generation_increment(context, session=None):
+    """Bump the generation counter of the metadata definitions."""
+    session = session or get_session()
+    return metadef_gen_api.increment(context, session)
+
+
 def artifact_create(context, values, type_name,
                     type_version=None, session=None):
     session = session or get_session()
@@ -72,6 +72,10 @@ def get_metadef_tags_table(meta):
     return sqlalchemy.Table('metadef_tags', meta, autoload=True)
 
 
+def get_metadef_generation_table(meta):
+    return sqlalchemy.Table('metadef_generation', meta, autoload=True)
+
+
 def _get_resource_type_id(meta, name):
     rt_table = get_metadef_resource_types_table(meta)
     resource_type = (
@@ -344,6 +348,18 @@ def _populate_metadata(meta, metadata_path=None, merge=False,
     LOG.info(_LI("Metadata loading finished"))
 
 
+def _bump_generation(meta):
+    """Make API workers drop the metadata definitions they cached."""
+    generation_table = get_metadef_generation_table(meta)
+    result = (generation_table.update().
+              where(generation_table.c.id == 1).
+              values(generation=generation_table.c.generation + 1).execute())
+    if not result.rowcount:
+        _insert_data_to_db(generation_table,
+                           {'id': 1, 'generation': 1,
+                            'created_at': timeutils.utcnow()})
+
+
 def _insert_data_to_db(table, values, log_exception=True):
     try:
         table.insert(values=values).execute()
@@ -469,6 +485,7 @@ def db_load_metadefs(engine, metadata_path=None, merge=False,
         return
 
     _populate_metadata(meta, metadata_path, merge, prefer_new, overwrite)
+    _bump_generation(meta)
 
 
 def db_unload_metadefs(engine):
@@ -476,6 +493,7 @@ def db_unload_metadefs(engine):
     meta.bind = engine
 
     _clear_metadata(meta)
+    _bump_generation(meta)
 
 
 def db_export_metadefs(engine, metadata_path=None):
@@ -0,0 +1,43 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_db import exception as db_exc
+
+from xmonitor.db.sqlalchemy import models_metadef as models
+
+# The generation counter is a single row table.
+GENERATION_ID = 1
+
+
+def get(context, session):
+    """Get the current generation of the metadata definitions."""
+    query = (session.query(models.MetadefGeneration.generation).filter_by(
+        id=GENERATION_ID))
+    return query.scalar() or 0
+
+
+def increment(context, session):
+    """Bump the generation of the metadata definitions and return it."""
+    with session.begin():
+        updated = (session.query(models.MetadefGeneration).filter_by(
+            id=GENERATION_ID).update(
+                {'generation': models.MetadefGeneration.generation + 1},
+                synchronize_session=False))
+    if not updated:
+        generation = models.MetadefGeneration()
+        generation.update({'id': GENERATION_ID, 'generation': 1})
+        try:
+            generation.save(session=session)
+        except db_exc.DBDuplicateEntry:
+            # Created concurrently by another worker, count on that row.
+            return increment(context, session)
+    return get(context, session)
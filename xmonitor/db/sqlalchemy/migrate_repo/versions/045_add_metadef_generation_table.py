@@ -0,0 +1,39 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy.schema import Column, MetaData, Table  # noqa
+
+from xmonitor.db.sqlalchemy.migrate_repo.schema import (
+    BigInteger, DateTime, Integer, create_tables)  # noqa
+
+
+def define_metadef_generation_table(meta):
+    metadef_generation = Table('metadef_generation',
+                               meta,
+                               Column('id', Integer(), primary_key=True,
+                                      nullable=False),
+                               Column('generation', BigInteger(),
+                                      nullable=False),
+                               Column('created_at', DateTime(),
+                                      nullable=False),
+                               Column('updated_at', DateTime()),
+                               mysql_engine='InnoDB',
+                               mysql_charset='utf8',
+                               extend_existing=False)
+    return metadef_generation
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    tables = [define_metadef_generation_table(meta)]
+    create_tables(tables)
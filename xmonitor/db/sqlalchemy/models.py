@@ -174,7 +174,9 @@ class ImageLocation(BASE, GlanceBase):
     """Represents an image location in the datastore."""
     __tablename__ = 'image_locations'
     __table_args__ = (Index('ix_image_locations_image_id', 'image_id'),
-                      Index('ix_image_locations_deleted', 'deleted'),)
+                      Index('ix_image_locations_deleted', 'deleted'),
+                      Index('ix_image_locations_status_deleted_at',
+                            'status', 'deleted_at'),)
 
     id = Column(Integer, primary_key=True, nullable=False)
     image_id = Column(String(36), ForeignKey('images.id'), nullable=False)
@@ -17,6 +17,7 @@ SQLAlchemy models for xmonitor metadata schema
 """
 
 from oslo_db.sqlalchemy import models
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import DateTime
@@ -162,11 +163,20 @@ class MetadefTag(BASE_DICT, GlanceMetadefBase):
     name = Column(String(80), nullable=False)
 
 
+class MetadefGeneration(BASE_DICT, GlanceMetadefBase):
+    """Counter bumped on every change to the metadata definitions."""
+    __tablename__ = 'metadef_generation'
+
+    id = Column(Integer, primary_key=True, nullable=False)
+    generation = Column(BigInteger, nullable=False, default=0)
+
+
 def register_models(engine):
     """Create database tables for all models with the given engine."""
     models = (MetadefNamespace, MetadefObject, MetadefProperty,
               MetadefTag,
-              MetadefResourceType, MetadefNamespaceResourceType)
+              MetadefResourceType, MetadefNamespaceResourceType,
+              MetadefGeneration)
     for model in models:
         model.metadata.create_all(engine)
 
@@ -175,6 +185,6 @@ def unregister_models(engine):
     """Drop database tables for all models with the given engine."""
     models = (MetadefObject, MetadefProperty, MetadefNamespaceResourceType,
               MetadefTag,
-              MetadefNamespace, MetadefResourceType)
+              MetadefNamespace, MetadefResourceType, MetadefGeneration)
     for model in models:
         model.metadata.drop_all(engine)
@@ -25,9 +25,130 @@ def _proxy(target, attr):
     def del_attr(self):
         return delattr(getattr(self, target), attr)
 
+    # NOTE: Mark the accessors as plain pass-throughs so that compose() can
+    # skip this layer when flattening a proxy chain.
+    get_attr.passthrough = set_attr.passthrough = (target, attr)
     return property(get_attr, set_attr, del_attr)
 
 
+def _lookup_descriptor(cls, name):
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return vars(klass)[name]
+    return None
+
+
+def _resolve_layer(layer_types, name, accessor):
+    """Find the layer which really serves an attribute access.
+
+    Walks the chain from the outermost layer inwards and skips every layer
+    whose descriptor for ``name`` only forwards the access to its ``base``.
+
+    :returns: a tuple of the layer index and the attribute name to use on it
+    """
+    for index, layer_type in enumerate(layer_types[:-1]):
+        descriptor = _lookup_descriptor(layer_type, name)
+        link = getattr(getattr(descriptor, accessor, None),
+                       'passthrough', None)
+        if link is None or link[0] != 'base':
+            return index, name
+        name = link[1]
+    return len(layer_types) - 1, name
+
+
+def _composed_property(name, getter, setter):
+    get_index, get_name = getter
+    set_index, set_name = setter
+
+    def get_attr(self):
+        return getattr(self._layers[get_index], get_name)
+
+    def set_attr(self, value):
+        setattr(self._layers[set_index], set_name, value)
+
+    def del_attr(self):
+        delattr(self._layers[0], name)
+
+    return property(get_attr, set_attr, del_attr)
+
+
+class ComposedProxy(object):
+    """Flat view over a chain of nested domain proxies.
+
+    Attribute reads and writes are routed straight to the layer which
+    implements them instead of going through every intermediate pass-through
+    property. Anything else, such as the domain methods, is looked up on the
+    outermost layer so the behaviour of the chain is unchanged.
+    """
+
+    __slots__ = ('_layers',)
+    _attributes = frozenset()
+
+    def __init__(self, layers):
+        object.__setattr__(self, '_layers', layers)
+
+    def __getattr__(self, name):
+        return getattr(self._layers[0], name)
+
+    def __setattr__(self, name, value):
+        if name in self._attributes:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._layers[0], name, value)
+
+
+_composed_classes = {}
+
+
+def _build_composed_class(layer_types):
+    attributes = set()
+    for klass in layer_types[0].__mro__:
+        attributes.update(name for name, value in vars(klass).items()
+                          if isinstance(value, property))
+
+    namespace = {'__slots__': (), '_attributes': frozenset(attributes)}
+    for name in attributes:
+        namespace[name] = _composed_property(
+            name,
+            _resolve_layer(layer_types, name, 'fget'),
+            _resolve_layer(layer_types, name, 'fset'))
+    class_name = 'Composed%s' % layer_types[0].__name__
+    return type(class_name, (ComposedProxy,), namespace)
+
+
+def get_composed_class(layer_types):
+    """Return the flattened proxy class for a chain of layer types.
+
+    Classes are generated once per distinct chain configuration and cached
+    for the lifetime of the process.
+    """
+    composed_class = _composed_classes.get(layer_types)
+    if composed_class is None:
+        composed_class = _build_composed_class(layer_types)
+        _composed_classes[layer_types] = composed_class
+    return composed_class
+
+
+def compose(obj):
+    """Wrap the outermost layer of a proxy chain in a ComposedProxy."""
+    if obj is None or isinstance(obj, ComposedProxy):
+        return obj
+    layers = [obj]
+    while getattr(layers[-1], 'base', None) is not None:
+        layers.append(layers[-1].base)
+    if len(layers) == 1:
+        return obj
+    layer_types = tuple(type(layer) for layer in layers)
+    return get_composed_class(layer_types)(tuple(layers))
+
+
+def decompose(obj):
+    """Return the outermost layer of the chain behind a ComposedProxy."""
+    if isinstance(obj, ComposedProxy):
+        return obj._layers[0]
+    return obj
+
+
 class Helper(object):
     def __init__(self, proxy_class=None, proxy_kwargs=None):
         self.proxy_class = proxy_class
@@ -105,6 +226,28 @@ class Repo(object):
         return self.helper.proxy(result)
 
 
+class ComposedRepo(object):
+    def __init__(self, base):
+        self.base = base
+
+    def get(self, item_id):
+        return compose(self.base.get(item_id))
+
+    def list(self, *args, **kwargs):
+        items = self.base.list(*args, **kwargs)
+        return [compose(item) for item in items]
+
+    def add(self, item):
+        return compose(self.base.add(decompose(item)))
+
+    def save(self, item, from_state=None):
+        result = self.base.save(decompose(item), from_state=from_state)
+        return compose(result)
+
+    def remove(self, item):
+        return compose(self.base.remove(decompose(item)))
+
+
 class MemberRepo(object):
     def __init__(self, image, base,
                  member_proxy_class=None, member_proxy_kwargs=None):
@@ -145,6 +288,14 @@ class ImageFactory(object):
         return self.helper.proxy(self.base.new_image(**kwargs))
 
 
+class ComposedImageFactory(object):
+    def __init__(self, base):
+        self.base = base
+
+    def new_image(self, **kwargs):
+        return compose(self.base.new_image(**kwargs))
+
+
 class ImageMembershipFactory(object):
     def __init__(self, base, proxy_class=None, proxy_kwargs=None):
         self.helper = Helper(proxy_class, proxy_kwargs)
@@ -14,6 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 import glance_store
+from oslo_config import cfg
 
 from xmonitor.api import authorization
 from xmonitor.api import policy
@@ -22,10 +23,13 @@ from xmonitor.common import property_utils
 from xmonitor.common import store_utils
 import xmonitor.db
 import xmonitor.domain
+import xmonitor.domain.proxy
 import xmonitor.location
 import xmonitor.notifier
 import xmonitor.quota
 
+CONF = cfg.CONF
+
 
 class Gateway(object):
     def __init__(self, db_api=None, store_api=None, notifier=None,
@@ -55,6 +59,9 @@ class Gateway(object):
         else:
             authorized_image_factory = authorization.ImageFactoryProxy(
                 notifier_image_factory, context)
+        if CONF.compose_image_proxies:
+            return xmonitor.domain.proxy.ComposedImageFactory(
+                authorized_image_factory)
         return authorized_image_factory
 
     def get_image_member_factory(self, context):
@@ -87,6 +94,8 @@ class Gateway(object):
             authorized_image_repo = authorization.ImageRepoProxy(
                 notifier_image_repo, context)
 
+        if CONF.compose_image_proxies:
+            return xmonitor.domain.proxy.ComposedRepo(authorized_image_repo)
         return authorized_image_repo
 
     def get_member_repo(self, image, context):
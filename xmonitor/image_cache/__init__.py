@@ -18,6 +18,9 @@ LRU Cache for Image Data
 """
 
 import hashlib
+import os
+import time
+import uuid
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -160,6 +163,33 @@ Possible values:
 Related options:
     * ``image_cache_sqlite_db``
 
+""")),
+
+    cfg.BoolOpt('image_cache_gzip_variants', default=False,
+                help=_("""
+Keep a gzip compressed copy of cached images that are downloaded gzipped.
+
+When a client accepting gzip downloads an image that is in the image cache,
+the gzip middleware compresses it on the fly. With this option, the
+compressed data is also written to the ``gzip`` subdirectory of the image
+cache, and later gzip downloads of the image are served from that copy
+without compressing the image again. Only downloads through the v2 API are
+served from it.
+
+The compressed copies are deleted along with their cached images. They are
+not accounted for in the size of the cache, which they may take up to as
+much room again as the images.
+
+Services which consume this:
+    * xmonitor-api
+
+Possible values:
+    * True
+    * False
+
+Related options:
+    * ``image_cache_dir``
+
 """)),
 ]
 
@@ -258,7 +288,10 @@ class ImageCache(object):
         Removes all cached image files and any attributes about the images
         and returns the number of cached image files that were deleted.
         """
-        return self.driver.delete_all_cached_images()
+        deleted = self.driver.delete_all_cached_images()
+        for name in self._get_gzip_variant_names():
+            self._delete_gzip_variant(name)
+        return deleted
 
     def delete_cached_image(self, image_id):
         """
@@ -267,6 +300,7 @@ class ImageCache(object):
         :param image_id: Image ID
         """
         self.driver.delete_cached_image(image_id)
+        self._delete_gzip_variant(image_id)
 
     def delete_all_queued_images(self):
         """
@@ -308,6 +342,7 @@ class ImageCache(object):
             LOG.debug("Pruning '%(image_id)s' to free %(size)d bytes",
                       {'image_id': image_id, 'size': size})
             self.driver.delete_cached_image(image_id)
+            self._delete_gzip_variant(image_id)
             total_bytes_pruned = total_bytes_pruned + size
             total_files_pruned = total_files_pruned + 1
             current_size = current_size - size
@@ -327,6 +362,18 @@ class ImageCache(object):
         """
         self.driver.clean(stall_time)
 
+        # NOTE: Compressed copies being written are hidden
+        if stall_time is None:
+            stall_time = CONF.image_cache_stall_time
+        older_than = time.time() - stall_time
+        for name in self._get_gzip_variant_names(hidden=True):
+            path = os.path.join(self.gzip_dir, name)
+            if name.startswith('.'):
+                if os.path.getmtime(path) < older_than:
+                    os.remove(path)
+            elif not self.driver.is_cached(name):
+                self._delete_gzip_variant(name)
+
     def queue_image(self, image_id):
         """
         This adds a image to be cache to the queue.
@@ -452,3 +499,102 @@ class ImageCache(object):
         into the queue.
         """
         return self.driver.get_queued_images()
+
+    @property
+    def gzip_dir(self):
+        return os.path.join(self.driver.base_dir, 'gzip')
+
+    def _get_gzip_variant_names(self, hidden=False):
+        try:
+            names = os.listdir(self.gzip_dir)
+        except OSError:
+            return []
+        return [name for name in names
+                if hidden or not name.startswith('.')]
+
+    def _delete_gzip_variant(self, image_id):
+        path = os.path.join(self.gzip_dir, str(image_id))
+        if os.path.exists(path):
+            LOG.debug("Deleting gzip compressed copy of image '%s'", image_id)
+            os.remove(path)
+
+    def open_gzip_variant(self, image_id):
+        """
+        Open the gzip compressed copy of a cached image, if there is one.
+
+        :param image_id: Image ID
+
+        :returns: a tuple of the size of the compressed copy and an
+                  iterator over it, or None
+        """
+        if (not CONF.image_cache_gzip_variants or
+                not self.driver.is_cached(image_id)):
+            return None
+        path = os.path.join(self.gzip_dir, str(image_id))
+        try:
+            variant = open(path, 'rb')
+        except IOError:
+            return None
+        return os.fstat(variant.fileno()).st_size, self._read(variant)
+
+    @staticmethod
+    def _read(variant):
+        with variant:
+            for chunk in utils.chunkiter(variant):
+                yield chunk
+
+    def get_gzip_variant_iter(self, image_id, gzip_iter):
+        """
+        Returns an iterator that keeps a gzip compressed copy of a cached
+        image while the compressed data is read through it.
+
+        :param image_id: Image ID
+        :param gzip_iter: Iterator over the compressed image data
+        """
+        if (not CONF.image_cache_gzip_variants or
+                not self.driver.is_cached(image_id) or
+                os.path.exists(os.path.join(self.gzip_dir, str(image_id)))):
+            return gzip_iter
+
+        LOG.debug("Tee'ing gzip compressed image '%s' into cache", image_id)
+
+        return self.gzip_variant_tee_iter(image_id, gzip_iter)
+
+    def gzip_variant_tee_iter(self, image_id, gzip_iter):
+        path = os.path.join(self.gzip_dir, str(image_id))
+        tmp_path = os.path.join(self.gzip_dir,
+                                '.%s.%s' % (image_id, uuid.uuid4()))
+        variant = None
+        try:
+            try:
+                utils.safe_mkdirs(self.gzip_dir)
+                variant = open(tmp_path, 'wb')
+            except (IOError, OSError) as e:
+                self._warn_gzip_variant(image_id, e)
+            for chunk in gzip_iter:
+                if variant is not None:
+                    try:
+                        variant.write(chunk)
+                    except IOError as e:
+                        self._warn_gzip_variant(image_id, e)
+                        variant.close()
+                        variant = None
+                yield chunk
+            if variant is not None:
+                variant.close()
+                os.rename(tmp_path, path)
+        finally:
+            if variant is not None:
+                variant.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if hasattr(gzip_iter, 'close'):
+                gzip_iter.close()
+
+    @staticmethod
+    def _warn_gzip_variant(image_id, error):
+        # NOTE: The download goes on without the compressed copy
+        LOG.warn(_LW("Failed to keep a gzip compressed copy of image "
+                     "'%(image_id)s': %(error)s"),
+                 {'image_id': image_id,
+                  'error': encodeutils.exception_to_unicode(error)})
@@ -411,8 +411,8 @@ class ImageProxy(xmonitor.domain.proxy.Image):
         if (signature_utils.should_create_verifier(
                 self.image.extra_properties)):
             # NOTE(bpoulos): if creating verifier fails, exception will be
-            # raised
-            verifier = signature_utils.get_verifier(
+            # raised, as soon as the data is handed to it
+            verifier = signature_utils.PendingVerifier(
                 self.context, self.image.extra_properties)
         else:
             verifier = None
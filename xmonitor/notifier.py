@@ -15,6 +15,10 @@
 #    under the License.
 
 import abc
+import collections
+import os
+import threading
+import time
 
 import glance_store
 from oslo_config import cfg
@@ -26,9 +30,10 @@ import six
 import webob
 
 from xmonitor.common import exception
+from xmonitor.common import metadef_cache
 from xmonitor.common import timeutils
 from xmonitor.domain import proxy as domain_proxy
-from xmonitor.i18n import _, _LE
+from xmonitor.i18n import _, _LE, _LI, _LW
 
 
 notifier_opts = [
@@ -43,6 +48,22 @@ notifier_opts = [
                      '"image.create" notification will not be sent after '
                      'image is created and none of the notifications for '
                      'metadefinition namespaces will be sent.'),
+    cfg.IntOpt('notification_queue_size', default=1024, min=0,
+               help='Number of notifications each API worker keeps waiting '
+                    'to be sent by a background sender, so that requests '
+                    'do not wait for the messaging bus. When the queue is '
+                    'full, image.send notifications are merged with a '
+                    'waiting one of the same download or dropped, and '
+                    'other notifications are sent right away by the '
+                    'request. Set to 0 to send every notification from '
+                    'the request.'),
+    cfg.IntOpt('notification_batch_size', default=64, min=1,
+               help='Number of waiting notifications the background sender '
+                    'takes off the queue at once.'),
+    cfg.IntOpt('notification_flush_timeout', default=10, min=0,
+               help='Seconds an API worker stopped with SIGTERM waits for '
+                    'the notifications still queued to be sent before it '
+                    'exits. It stops accepting requests meanwhile.'),
 ]
 
 CONF = cfg.CONF
@@ -65,6 +86,205 @@ def get_transport():
     return oslo_messaging.get_notification_transport(CONF, aliases=_ALIASES)
 
 
+# Notifications merged or dropped when the queue is full
+_LOW_VALUE_EVENTS = ('image.send',)
+
+# Seconds between two logs of the notification queue statistics
+QUEUE_REPORT_INTERVAL = 60
+
+_queue = None
+_queue_enabled = False
+
+_Notification = collections.namedtuple('_Notification',
+                                       ['notifier', 'priority', 'event_type',
+                                        'payload'])
+
+
+class NotificationQueue(object):
+    """Notifications waiting to be sent off the request path.
+
+    A sender thread is started when notifications are queued and ends once
+    it has sent them all, taking up to ``batch_size`` of them off the queue
+    at a time. The sender logs the queue statistics every
+    ``QUEUE_REPORT_INTERVAL`` seconds while it runs. A worker shutting down
+    calls :func:`flush_queue` to send the notifications still queued.
+    """
+
+    def __init__(self, size, batch_size):
+        self.size = size
+        self.batch_size = batch_size
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self._notifications = collections.deque()
+        self._lock = threading.Lock()
+        self._drained = threading.Event()
+        self._drained.set()
+        self._sender = None
+        self._under_pressure = False
+        # [total seconds, max seconds] spent sending
+        self._latency = [0.0, 0.0]
+        self._reported_at = time.time()
+        self._reported_sent = 0
+
+    def put(self, notifier, priority, event_type, payload):
+        notification = _Notification(notifier, priority, event_type, payload)
+        with self._lock:
+            if len(self._notifications) < self.size:
+                self._notifications.append(notification)
+                self._start()
+                return
+            self._warn_pressure()
+            if event_type in _LOW_VALUE_EVENTS:
+                self._merge_or_drop(notification)
+                return
+            self.overflowed += 1
+        # NOTE: Rather than losing a notification that matters, the request
+        # waits for the messaging bus as it did without the queue.
+        self._send(notification)
+
+    def _warn_pressure(self):
+        if not self._under_pressure:
+            self._under_pressure = True
+            LOG.warn(_LW("The queue of %d notifications is full, image.send "
+                         "notifications are merged or dropped until it "
+                         "drains."), self.size)
+
+    def _merge_or_drop(self, notification):
+        payload = notification.payload
+        download = (payload.get('image_id'),
+                    payload.get('receiver_tenant_id'),
+                    payload.get('receiver_user_id'))
+        for queued in reversed(self._notifications):
+            if (queued.notifier is notification.notifier and
+                    queued.priority == notification.priority and
+                    queued.event_type == notification.event_type and
+                    (queued.payload.get('image_id'),
+                     queued.payload.get('receiver_tenant_id'),
+                     queued.payload.get('receiver_user_id')) == download):
+                queued.payload['bytes_sent'] += payload.get('bytes_sent', 0)
+                self.merged += 1
+                return
+        self.dropped += 1
+
+    def _start(self):
+        if self._sender is None:
+            self._drained.clear()
+            self._sender = threading.Thread(target=self._run)
+            self._sender.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                batch = [self._notifications.popleft()
+                         for i in range(min(self.batch_size,
+                                            len(self._notifications)))]
+                if not batch:
+                    self._sender = None
+                    self._under_pressure = False
+                    self._drained.set()
+                    return
+            for notification in batch:
+                self._send(notification)
+            if time.time() - self._reported_at >= QUEUE_REPORT_INTERVAL:
+                self.report()
+
+    def _send(self, notification):
+        start = time.time()
+        try:
+            notify = getattr(notification.notifier, notification.priority)
+            notify({}, notification.event_type, notification.payload)
+        except Exception as e:
+            LOG.error(_LE("Failed to send %(event_type)s notification: "
+                          "%(error)s"),
+                      {'event_type': notification.event_type,
+                       'error': encodeutils.exception_to_unicode(e)})
+        took = time.time() - start
+        self.sent += 1
+        self._latency[0] += took
+        self._latency[1] = max(self._latency[1], took)
+
+    def flush(self, timeout=None):
+        """Wait for the notifications queued so far to be sent.
+
+        :returns: True once the queue is empty, False on timeout
+        """
+        return self._drained.wait(timeout)
+
+    def stats(self):
+        """The queue depth and what happened to the notifications so far."""
+        return {'queued': len(self._notifications),
+                'sent': self.sent,
+                'merged': self.merged,
+                'dropped': self.dropped,
+                'overflowed': self.overflowed,
+                'latency': {'average': (self._latency[0] / self.sent
+                                        if self.sent else 0.0),
+                            'max': self._latency[1]}}
+
+    def report(self):
+        """Log the queue statistics, if notifications were sent since the
+        previous report.
+        """
+        self._reported_at = time.time()
+        stats = self.stats()
+        if stats['sent'] == self._reported_sent and not stats['queued']:
+            return
+        self._reported_sent = stats['sent']
+        LOG.info(_LI("Notifications: %(queued)d queued, %(sent)d sent, "
+                     "%(merged)d merged, %(dropped)d dropped and "
+                     "%(overflowed)d sent by requests as the queue was "
+                     "full, sent in %(average).3fs on average and "
+                     "%(max).3fs at most"),
+                 dict(stats, **stats['latency']))
+
+
+def enable_queue():
+    """Queue the notifications of this process.
+
+    Called by the API servers, which flush the queue when stopped. Other
+    processes send each notification from the code that emits it.
+    """
+    global _queue_enabled
+    _queue_enabled = True
+
+
+def get_queue():
+    """The notification queue of this process, None if disabled."""
+    global _queue
+    if not _queue_enabled or not CONF.notification_queue_size:
+        return None
+    # NOTE: Notifications are sent by the workers, which fork off a parent
+    # that may have queued some already.
+    if _queue is None or _queue[0] != os.getpid():
+        _queue = (os.getpid(),
+                  NotificationQueue(CONF.notification_queue_size,
+                                    CONF.notification_batch_size))
+    return _queue[1]
+
+
+def flush_queue(timeout=None):
+    """Send the notifications queued by this process, before it exits.
+
+    :param timeout: seconds to wait at most, notification_flush_timeout by
+                    default
+    :returns: False if notifications were left unsent
+    """
+    if _queue is None or _queue[0] != os.getpid():
+        return True
+    queue = _queue[1]
+    if timeout is None:
+        timeout = CONF.notification_flush_timeout
+    flushed = queue.flush(timeout)
+    if not flushed:
+        LOG.warn(_LW("%(queued)d notifications were not sent within "
+                     "%(timeout)d seconds of shutting down"),
+                 {'queued': queue.stats()['queued'], 'timeout': timeout})
+    queue.report()
+    return flushed
+
+
 class Notifier(object):
     """Uses a notification strategy to send out messages about events."""
 
@@ -74,14 +294,21 @@ class Notifier(object):
         self._notifier = oslo_messaging.Notifier(self._transport,
                                                  publisher_id=publisher_id)
 
+    def _notify(self, priority, event_type, payload):
+        queue = get_queue()
+        if queue is None:
+            getattr(self._notifier, priority)({}, event_type, payload)
+        else:
+            queue.put(self._notifier, priority, event_type, payload)
+
     def warn(self, event_type, payload):
-        self._notifier.warn({}, event_type, payload)
+        self._notify('warn', event_type, payload)
 
     def info(self, event_type, payload):
-        self._notifier.info({}, event_type, payload)
+        self._notify('info', event_type, payload)
 
     def error(self, event_type, payload):
-        self._notifier.error({}, event_type, payload)
+        self._notify('error', event_type, payload)
 
 
 def _get_notification_group(notification):
@@ -328,6 +555,15 @@ class NotificationRepoProxy(NotificationBase):
         pass
 
 
+class MetadefNotificationRepoProxy(NotificationRepoProxy):
+    def send_notification(self, notification_id, obj, extra_payload=None):
+        # Every change to the metadata definitions is notified, which makes
+        # this the place to drop the documents rendered before it.
+        metadef_cache.invalidate(self.context)
+        super(MetadefNotificationRepoProxy, self).send_notification(
+            notification_id, obj, extra_payload=extra_payload)
+
+
 @six.add_metaclass(abc.ABCMeta)
 class NotificationFactoryProxy(object):
     def __init__(self, factory, context, notifier):
@@ -609,7 +845,7 @@ class MetadefNamespaceFactoryProxy(NotificationFactoryProxy,
         return MetadefNamespaceProxy
 
 
-class MetadefNamespaceRepoProxy(NotificationRepoProxy,
+class MetadefNamespaceRepoProxy(MetadefNotificationRepoProxy,
                                 domain_proxy.MetadefNamespaceRepo):
     def get_super_class(self):
         return domain_proxy.MetadefNamespaceRepo
@@ -681,7 +917,7 @@ class MetadefObjectFactoryProxy(NotificationFactoryProxy,
         return MetadefObjectProxy
 
 
-class MetadefObjectRepoProxy(NotificationRepoProxy,
+class MetadefObjectRepoProxy(MetadefNotificationRepoProxy,
                              domain_proxy.MetadefObjectRepo):
     def get_super_class(self):
         return domain_proxy.MetadefObjectRepo
@@ -735,7 +971,7 @@ class MetadefPropertyFactoryProxy(NotificationFactoryProxy,
         return MetadefPropertyProxy
 
 
-class MetadefPropertyRepoProxy(NotificationRepoProxy,
+class MetadefPropertyRepoProxy(MetadefNotificationRepoProxy,
                                domain_proxy.MetadefPropertyRepo):
     def get_super_class(self):
         return domain_proxy.MetadefPropertyRepo
@@ -790,7 +1026,7 @@ class MetadefResourceTypeFactoryProxy(NotificationFactoryProxy,
         return MetadefResourceTypeProxy
 
 
-class MetadefResourceTypeRepoProxy(NotificationRepoProxy,
+class MetadefResourceTypeRepoProxy(MetadefNotificationRepoProxy,
                                    domain_proxy.MetadefResourceTypeRepo):
     def get_super_class(self):
         return domain_proxy.MetadefResourceTypeRepo
@@ -836,7 +1072,8 @@ class MetadefTagFactoryProxy(NotificationFactoryProxy,
         return MetadefTagProxy
 
 
-class MetadefTagRepoProxy(NotificationRepoProxy, domain_proxy.MetadefTagRepo):
+class MetadefTagRepoProxy(MetadefNotificationRepoProxy,
+                          domain_proxy.MetadefTagRepo):
     def get_super_class(self):
         return domain_proxy.MetadefTagRepo
 
@@ -27,8 +27,11 @@ import itertools
 from osprofiler import opts as profiler
 
 import xmonitor.api.middleware.context
+import xmonitor.api.middleware.sampling_profiler
 import xmonitor.api.versions
+import xmonitor.async.scheduler
 import xmonitor.async.taskflow_executor
+import xmonitor.common.compression
 import xmonitor.common.config
 import xmonitor.common.location_strategy
 import xmonitor.common.location_strategy.store_type
@@ -47,11 +50,14 @@ import xmonitor.scrubber
 _api_opts = [
     (None, list(itertools.chain(
         xmonitor.api.middleware.context.context_opts,
+        xmonitor.api.middleware.sampling_profiler.sampling_profiler_opts,
         xmonitor.api.versions.versions_opts,
+        xmonitor.common.compression.compression_opts,
         xmonitor.common.config.common_opts,
         xmonitor.common.location_strategy.location_strategy_opts,
         xmonitor.common.property_utils.property_opts,
         xmonitor.common.rpc.rpc_opts,
+        xmonitor.common.wsgi.asyncio_opts,
         xmonitor.common.wsgi.bind_opts,
         xmonitor.common.wsgi.eventlet_opts,
         xmonitor.common.wsgi.socket_opts,
@@ -66,8 +72,9 @@ _api_opts = [
         xmonitor.scrubber.scrubber_opts))),
     ('image_format', xmonitor.common.config.image_format_opts),
     ('task', xmonitor.common.config.task_opts),
-    ('taskflow_executor',
-     xmonitor.async.taskflow_executor.taskflow_executor_opts),
+    ('taskflow_executor', list(itertools.chain(
+        xmonitor.async.scheduler.task_scheduler_opts,
+        xmonitor.async.taskflow_executor.taskflow_executor_opts))),
     ('store_type_location_strategy',
      xmonitor.common.location_strategy.store_type.store_type_opts),
     profiler.list_opts()[0],
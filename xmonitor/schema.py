@@ -33,9 +33,26 @@ class Schema(object):
         self.required = required
         self.definitions = definitions
 
+    def __setattr__(self, name, value):
+        # NOTE: Replacing any part of the schema definition invalidates the
+        # compiled validator, it is rebuilt on the next validation.
+        if not name.startswith('_'):
+            self.__dict__['_validator'] = None
+        super(Schema, self).__setattr__(name, value)
+
+    def _get_validator(self):
+        validator = getattr(self, '_validator', None)
+        if validator is None:
+            raw = self.raw()
+            validator_cls = jsonschema.validators.validator_for(raw)
+            validator_cls.check_schema(raw)
+            validator = validator_cls(raw)
+            self._validator = validator
+        return validator
+
     def validate(self, obj):
         try:
-            jsonschema.validate(obj, self.raw())
+            self._get_validator().validate(obj)
         except jsonschema.ValidationError as e:
             reason = encodeutils.exception_to_unicode(e)
             raise exception.InvalidObject(schema=self.name, reason=reason)
@@ -81,6 +98,7 @@ class Schema(object):
             raise exception.SchemaLoadError(reason=reason % {'props': props})
 
         self.properties.update(properties)
+        self._validator = None
 
     def raw(self):
         raw = {
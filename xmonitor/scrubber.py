@@ -13,7 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import calendar
+import collections
+import datetime
+import itertools
+import operator
 import time
 
 import eventlet
@@ -22,9 +25,11 @@ from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import encodeutils
 import six
+import six.moves.urllib.parse as urlparse
 
 from xmonitor.common import crypt
 from xmonitor.common import exception
+from xmonitor.common import timeutils
 from xmonitor import context
 import xmonitor.db as db_api
 from xmonitor.i18n import _, _LE, _LI, _LW
@@ -36,12 +41,41 @@ scrubber_opts = [
     cfg.IntOpt('scrub_time', default=0,
                help=_('The amount of time in seconds to delay before '
                       'performing a delete.')),
-    cfg.IntOpt('scrub_pool_size', default=1,
+    cfg.IntOpt('scrub_pool_size', default=1, deprecated_for_removal=True,
+               deprecated_reason=_('Locations are deleted by a pool of '
+                                   'their own per storage backend, see '
+                                   'scrub_backend_concurrency.'),
                help=_('The size of thread pool to be used for '
                       'scrubbing images. The default is one, which '
                       'signifies serial scrubbing. Any value above '
                       'one indicates the max number of images that '
                       'may be scrubbed in parallel.')),
+    cfg.IntOpt('scrub_backend_concurrency', default=10, min=1,
+               help=_('The maximum number of image locations that are '
+                      'deleted at the same time from any one storage '
+                      'backend. A backend is identified by the scheme and '
+                      'host of the location URI.')),
+    cfg.FloatOpt('scrub_backend_ops_per_second', default=0, min=0,
+                 help=_('The maximum rate, in deletes per second, at which '
+                        'image locations are deleted from any one storage '
+                        'backend. The default of zero means no limit.')),
+    cfg.IntOpt('scrub_flush_interval', default=5, min=0,
+               help=_('The interval in seconds at which the scrubber '
+                      'records the locations and images it has finished '
+                      'deleting in the database. They are recorded in '
+                      'batches, at the latest when a run ends.')),
+    cfg.IntOpt('scrub_flush_size', default=500, min=1,
+               help=_('The number of finished location deletions after '
+                      'which the scrubber records them in the database '
+                      'without waiting for scrub_flush_interval.')),
+    cfg.IntOpt('scrub_queue_page_size', default=1000, min=1,
+               help=_('The number of image locations due for scrubbing '
+                      'that are fetched from the database at a time.')),
+    cfg.IntOpt('scrub_images_in_flight', default=1000, min=1,
+               help=_('The maximum number of images the scrubber has '
+                      'handed to the storage backends and not finished '
+                      'deleting. Once reached, it waits for the oldest '
+                      'of them before reading more from the queue.')),
     cfg.BoolOpt('delayed_delete', default=False,
                 help=_('Turn on/off delayed delete.')),
     cfg.StrOpt('admin_role', default='admin',
@@ -80,12 +114,18 @@ CONF = cfg.CONF
 CONF.register_opts(scrubber_opts)
 CONF.import_opt('metadata_encryption_key', 'xmonitor.common.config')
 
+# Seconds between two progress reports of a running scrubber.
+REPORT_INTERVAL = 60
+
 
 class ScrubDBQueue(object):
     """Database-based image scrub queue class."""
     def __init__(self):
         self.scrub_time = CONF.scrub_time
         self.metadata_encryption_key = CONF.metadata_encryption_key
+        self.page_size = CONF.scrub_queue_page_size
+        # NOTE: High-water mark of the queue, the last location handed out.
+        self.marker = None
         registry.configure_registry_client()
         registry.configure_registry_admin_creds()
         admin_user = CONF.admin_user
@@ -124,29 +164,59 @@ class ScrubDBQueue(object):
         else:
             return False
 
-    def _get_images_page(self, marker):
-        filters = {'deleted': True,
-                   'is_public': 'none',
-                   'status': 'pending_delete'}
-
-        if marker:
-            return self.registry.get_images_detailed(filters=filters,
-                                                     marker=marker)
-        else:
-            return self.registry.get_images_detailed(filters=filters)
+    def _get_locations_page(self, deleted_before, marker):
+        return db_api.get_api().image_location_get_pending_delete(
+            self.admin_context, deleted_before, marker=marker,
+            limit=self.page_size)
 
-    def _get_all_images(self):
-        """Generator to fetch all appropriate images, paging as needed."""
+    def _get_due_locations(self):
+        """Generator of the locations due for scrubbing, paging as needed.
 
-        marker = None
+        Locations are read in the order they were deleted in, starting
+        after the high-water mark left by the previous call.
+        """
+        deleted_before = (timeutils.utcnow() -
+                          datetime.timedelta(seconds=self.scrub_time))
         while True:
-            images = self._get_images_page(marker)
-            if len(images) == 0:
+            try:
+                locations = self._get_locations_page(deleted_before,
+                                                     self.marker)
+            except exception.NotFound:
+                # NOTE: The location the high-water mark points at has been
+                # purged from the database, start over from the beginning.
+                LOG.debug("Scrub queue marker %s is gone, rescanning.",
+                          self.marker)
+                self.marker = None
+                continue
+
+            full_page = len(locations) == self.page_size
+            if full_page:
+                # NOTE: Keep the trailing locations of the last image for
+                # the next page, so that the image is scrubbed in one go.
+                last_image_id = locations[-1]['image_id']
+                cut = len(locations)
+                while cut and locations[cut - 1]['image_id'] == last_image_id:
+                    cut -= 1
+                if cut:
+                    locations = locations[:cut]
+
+            for loc in locations:
+                yield loc
+            if locations:
+                self.marker = locations[-1]['id']
+            if not full_page:
                 break
-            marker = images[-1]['id']
 
-            for image in images:
-                yield image
+    def iter_locations(self):
+        """Generator of image id and location tuples from scrub queue.
+
+        Only locations which became due since the previous call are
+        returned, unless the queue was rewound in between.
+        """
+        for loc in self._get_due_locations():
+            # NOTE: The url is kept encrypted in the database when a
+            # metadata encryption key is configured.
+            yield (loc['image_id'], loc['id'], loc['url'])
 
     def get_all_locations(self):
         """Returns a list of image id and location tuple from scrub queue.
@@ -155,34 +225,11 @@ class ScrubDBQueue(object):
             scrub queue
 
         """
-        ret = []
-
-        for image in self._get_all_images():
-            deleted_at = image.get('deleted_at')
-            if not deleted_at:
-                continue
-
-            # NOTE: Strip off microseconds which may occur after the last '.,'
-            # Example: 2012-07-07T19:14:34.974216
-            date_str = deleted_at.rsplit('.', 1)[0].rsplit(',', 1)[0]
-            delete_time = calendar.timegm(time.strptime(date_str,
-                                                        "%Y-%m-%dT%H:%M:%S"))
-
-            if delete_time + self.scrub_time > time.time():
-                continue
+        return list(self.iter_locations())
 
-            for loc in image['location_data']:
-                if loc['status'] != 'pending_delete':
-                    continue
-
-                if self.metadata_encryption_key:
-                    uri = crypt.urlsafe_encrypt(self.metadata_encryption_key,
-                                                loc['url'], 64)
-                else:
-                    uri = loc['url']
-
-                ret.append((image['id'], loc['id'], uri))
-        return ret
+    def rewind(self):
+        """Return all locations still pending deletion again."""
+        self.marker = None
 
     def has_image(self, image_id):
         """Returns whether the queue contains an image or not.
@@ -235,6 +282,140 @@ class Daemon(object):
         LOG.debug("Next run scheduled in %s seconds", self.wakeup_time)
 
 
+class Backend(object):
+    """Deletion queue, budget and statistics of one storage backend.
+
+    Deletes are queued without waiting and run by greenthreads of the
+    backend's own, so a slow backend only holds up its own locations.
+    """
+
+    def __init__(self, name, concurrency, ops_per_second):
+        self.name = name
+        self.pool = eventlet.greenpool.GreenPool(concurrency)
+        self.jobs = collections.deque()
+        self.interval = 1.0 / ops_per_second if ops_per_second else 0
+        self.next_slot = 0
+        self.running = 0
+        self.deleted = 0
+        self.failed = 0
+
+    @property
+    def waiting(self):
+        return len(self.jobs)
+
+    def submit(self, func, *args):
+        """Queue a call to func for one of the backend's greenthreads."""
+        self.jobs.append((func, args))
+        if self.pool.free():
+            self.pool.spawn_n(self._work)
+
+    def wait(self):
+        """Wait for the queued calls to finish."""
+        self.pool.waitall()
+
+    def _work(self):
+        while self.jobs:
+            func, args = self.jobs.popleft()
+            if self.interval:
+                now = time.time()
+                delay = self.next_slot - now
+                self.next_slot = max(now, self.next_slot) + self.interval
+                if delay > 0:
+                    eventlet.sleep(delay)
+            self.running += 1
+            try:
+                func(*args)
+            finally:
+                self.running -= 1
+
+    def report(self, elapsed):
+        rate = self.deleted / elapsed if elapsed > 0 else 0
+        LOG.info(_LI("Scrubbing %(backend)s: %(deleted)d locations deleted, "
+                     "%(failed)d failed, %(rate).2f deletes/s, "
+                     "%(running)d running, %(waiting)d waiting"),
+                 {'backend': self.name, 'deleted': self.deleted,
+                  'failed': self.failed, 'rate': rate,
+                  'running': self.running, 'waiting': self.waiting})
+
+
+class ImageScrub(object):
+    """Locations of one image on their way out of the backends."""
+
+    def __init__(self, image_id, count):
+        self.image_id = image_id
+        self.remaining = count
+        self.success = True
+        self.done = eventlet.event.Event()
+        if not count:
+            self.done.send(True)
+
+    def location_done(self, success):
+        """Count a location as handled.
+
+        :returns: True once the last location of the image is handled
+        """
+        self.success = self.success and success
+        self.remaining -= 1
+        if self.remaining:
+            return False
+        self.done.send(self.success)
+        return True
+
+    def wait(self):
+        """Wait for all the locations, return whether all were deleted."""
+        return self.done.wait()
+
+
+class Deletions(object):
+    """Deletions finished in the backends but not yet in the database.
+
+    They are recorded in batches. A crash before a batch is flushed only
+    means that its locations get deleted from their backend once more,
+    which is harmless as a missing location counts as deleted.
+    """
+
+    def __init__(self, context, flush_size):
+        self.context = context
+        self.flush_size = flush_size
+        self.locations = []
+        self.images = []
+
+    def add_location(self, loc_id):
+        self.locations.append(loc_id)
+        if len(self.locations) >= self.flush_size:
+            self.flush()
+
+    def add_image(self, image_id):
+        self.images.append(image_id)
+
+    def flush(self):
+        locations, self.locations = self.locations, []
+        images, self.images = self.images, []
+        db = db_api.get_api()
+        done = False
+        try:
+            if locations:
+                db.image_location_delete_many(self.context, locations,
+                                              'deleted')
+            if images:
+                # NOTE: Images with locations that are still pending deletion
+                # stay as they are and are transitioned by a later flush.
+                db.image_status_update_many(self.context, images,
+                                            'pending_delete', 'deleted')
+            done = True
+        except Exception as e:
+            LOG.error(_LE("Unable to record %(locs)d scrubbed locations and "
+                          "%(imgs)d scrubbed images, will retry. "
+                          "Reason: %(exc)s"),
+                      {'locs': len(locations), 'imgs': len(images),
+                       'exc': encodeutils.exception_to_unicode(e)})
+        finally:
+            if not done:
+                self.locations.extend(locations)
+                self.images.extend(images)
+        return done
+
+
 class Scrubber(object):
     def __init__(self, store_api):
         LOG.info(_LI("Initializing scrubber with configuration: %s"),
@@ -268,52 +449,128 @@ class Scrubber(object):
                                                         auth_token=auth_token)
 
         self.db_queue = get_scrub_queue()
-        self.pool = eventlet.greenpool.GreenPool(CONF.scrub_pool_size)
+        self.backends = {}
+        self.deletions = Deletions(self.admin_context, CONF.scrub_flush_size)
 
     def _get_delete_jobs(self):
+        """Generator of the delete jobs of each image due for scrubbing."""
         try:
-            records = self.db_queue.get_all_locations()
+            records = self.db_queue.iter_locations()
+            for image_id, jobs in itertools.groupby(
+                    records, key=operator.itemgetter(0)):
+                yield image_id, list(jobs)
         except Exception as err:
             LOG.error(_LE("Can not get scrub jobs from queue: %s") %
                       encodeutils.exception_to_unicode(err))
-            return {}
-
-        delete_jobs = {}
-        for image_id, loc_id, loc_uri in records:
-            if image_id not in delete_jobs:
-                delete_jobs[image_id] = []
-            delete_jobs[image_id].append((image_id, loc_id, loc_uri))
-        return delete_jobs
 
     def run(self, event=None):
-        delete_jobs = self._get_delete_jobs()
+        started = time.time()
+        # NOTE: Locations handed out by a previous run that are still
+        # pending deletion, such as failed ones, are scrubbed again
+        self.db_queue.rewind()
+        reporter = eventlet.spawn(self._report_progress, started)
+        flusher = eventlet.spawn(self._flush_periodically)
+        try:
+            scrubs = collections.deque()
+            for image_id, delete_jobs in self._get_delete_jobs():
+                if len(scrubs) >= CONF.scrub_images_in_flight:
+                    scrubs.popleft().wait()
+                scrubs.append(self._dispatch_image(image_id, delete_jobs))
+                # Let the backends start on the locations handed to them
+                eventlet.sleep(0)
+            for scrub in scrubs:
+                scrub.wait()
+        finally:
+            reporter.kill()
+            flusher.kill()
+        self.deletions.flush()
+        self._report_backends(time.time() - started, reset=True)
+
+    def _flush_periodically(self):
+        while CONF.scrub_flush_interval:
+            eventlet.sleep(CONF.scrub_flush_interval)
+            self.deletions.flush()
+
+    def _report_progress(self, started):
+        while True:
+            eventlet.sleep(REPORT_INTERVAL)
+            self._report_backends(time.time() - started)
 
-        if delete_jobs:
-            list(self.pool.starmap(self._scrub_image, delete_jobs.items()))
+    def _get_backend(self, uri):
+        if CONF.metadata_encryption_key:
+            uri = crypt.urlsafe_decrypt(CONF.metadata_encryption_key, uri)
+        # NOTE: Only the scheme and host identify a backend, the URI may
+        # carry credentials which must not end up in the logs.
+        pieces = urlparse.urlparse(uri)
+        name = '%s://%s' % (pieces.scheme, pieces.hostname or '')
+        if name not in self.backends:
+            self.backends[name] = Backend(name,
+                                          CONF.scrub_backend_concurrency,
+                                          CONF.scrub_backend_ops_per_second)
+        return self.backends[name]
+
+    def _report_backends(self, elapsed, reset=False):
+        for name in sorted(self.backends):
+            backend = self.backends[name]
+            if backend.deleted or backend.failed or backend.waiting:
+                backend.report(elapsed)
+            if reset:
+                backend.deleted = backend.failed = 0
 
     def _scrub_image(self, image_id, delete_jobs):
-        if len(delete_jobs) == 0:
-            return
+        """Delete the locations of an image, return whether all went."""
+        return self._dispatch_image(image_id, delete_jobs).wait()
+
+    def _dispatch_image(self, image_id, delete_jobs):
+        """Queue the locations of an image to the backends they live in.
+
+        :returns: the ImageScrub to wait for
+        """
+        scrub = ImageScrub(image_id, len(delete_jobs))
+        if not delete_jobs:
+            return scrub
 
         LOG.info(_LI("Scrubbing image %(id)s from %(count)d locations."),
                  {'id': image_id, 'count': len(delete_jobs)})
 
-        success = True
+        # NOTE: The locations of an image are deleted in parallel, the
+        # budget of each backend keeps a single one from being overrun.
         for img_id, loc_id, uri in delete_jobs:
             try:
-                self._delete_image_location_from_backend(img_id, loc_id, uri)
-            except Exception:
-                success = False
+                backend = self._get_backend(uri)
+            except Exception as e:
+                LOG.error(_LE("Unable to scrub image %(id)s from a location. "
+                              "Reason: %(exc)s ") %
+                          {'id': image_id,
+                           'exc': encodeutils.exception_to_unicode(e)})
+                self._location_done(scrub, False)
+                continue
+            backend.submit(self._delete_location, backend, scrub, img_id,
+                           loc_id, uri)
+        return scrub
 
-        if success:
-            image = self.registry.get_image(image_id)
-            if image['status'] == 'pending_delete':
-                self.registry.update_image(image_id, {'status': 'deleted'})
-            LOG.info(_LI("Image %s has been scrubbed successfully"), image_id)
+    def _delete_location(self, backend, scrub, image_id, loc_id, uri):
+        try:
+            self._delete_image_location_from_backend(image_id, loc_id, uri)
+        except Exception:
+            backend.failed += 1
+            success = False
+        else:
+            backend.deleted += 1
+            success = True
+        self._location_done(scrub, success)
+
+    def _location_done(self, scrub, success):
+        if not scrub.location_done(success):
+            return
+        if scrub.success:
+            self.deletions.add_image(scrub.image_id)
+            LOG.info(_LI("Image %s has been scrubbed successfully"),
+                     scrub.image_id)
         else:
             LOG.warn(_LW("One or more image locations couldn't be scrubbed "
                          "from backend. Leaving image '%s' in 'pending_delete'"
-                         " status") % image_id)
+                         " status") % scrub.image_id)
 
     def _delete_image_location_from_backend(self, image_id, loc_id, uri):
         if CONF.metadata_encryption_key:
@@ -328,10 +585,7 @@ class Scrubber(object):
                              "db."), image_id)
 
             if loc_id != '-':
-                db_api.get_api().image_location_delete(self.admin_context,
-                                                       image_id,
-                                                       int(loc_id),
-                                                       'deleted')
+                self.deletions.add_location(int(loc_id))
             LOG.info(_LI("Image %s is scrubbed from a location."), image_id)
         except Exception as e:
             LOG.error(_LE("Unable to scrub image %(id)s from a location. "
@@ -0,0 +1,159 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Throughput of the eventlet and the asyncio WSGI servers side by side.
+
+Runs each server with a stand-in application in a separate process, with
+the same number of workers, and reports the rate of metadata requests,
+whose application code takes a little CPU time and a blocking call, and
+the throughput of image downloads, each measured with several clients at
+once.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_asyncio_server \
+        [workers] [clients] [seconds]
+"""
+
+import hashlib
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from six.moves import http_client
+from six.moves import range
+
+CHUNK = b'x' * 65536
+
+MODULE = 'xmonitor.tests.benchmarks.bench_asyncio_server'
+
+SERVERS = ('eventlet', 'asyncio')
+
+
+def application(environ, start_response):
+    """Stand-in for the API, serving image data and metadata."""
+    if environ['PATH_INFO'].endswith('/file'):
+        start_response('200 OK', [('Content-Type',
+                                   'application/octet-stream')])
+        return (CHUNK for _ in range(1024))
+    # Stands in for a database query and rendering the result
+    time.sleep(0.002)
+    body = hashlib.sha256(CHUNK * 4).hexdigest().encode('ascii')
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def serve(server_type, port, workers):
+    if server_type == 'eventlet':
+        import eventlet
+        eventlet.patcher.monkey_patch()
+
+    from oslo_config import cfg
+
+    from xmonitor.common import wsgi
+
+    cfg.CONF([], project='xmonitor')
+    cfg.CONF.set_override('bind_host', '127.0.0.1')
+    cfg.CONF.set_override('workers', workers)
+    if server_type == 'eventlet':
+        server = wsgi.Server()
+    else:
+        from xmonitor.common import asyncio_wsgi
+        server = asyncio_wsgi.Server()
+    server.start(application, port)
+    server.wait()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _client(port, path, stop, counts):
+    conn = http_client.HTTPConnection('127.0.0.1', port)
+    requests = received = 0
+    try:
+        while not stop.is_set():
+            conn.request('GET', path)
+            response = conn.getresponse()
+            while True:
+                data = response.read(65536)
+                if not data:
+                    break
+                received += len(data)
+            requests += 1
+    except Exception:
+        pass
+    finally:
+        conn.close()
+        counts.append((requests, received))
+
+
+def _measure(port, path, clients, seconds):
+    stop = threading.Event()
+    counts = []
+    threads = [threading.Thread(target=_client,
+                                args=(port, path, stop, counts))
+               for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return (sum(count[0] for count in counts) / float(seconds),
+            sum(count[1] for count in counts) / float(seconds))
+
+
+def run(server_type, workers, clients, seconds):
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, '-m', MODULE, 'serve',
+                               server_type, str(port), str(workers)])
+    try:
+        time.sleep(2)
+        metadata_rate = _measure(port, '/v2/images', clients, seconds)[0]
+        download_rate = _measure(port, '/v2/images/fake/file', clients,
+                                 seconds)[1]
+    finally:
+        server.terminate()
+        server.wait()
+    return metadata_rate, download_rate
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+        return
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    print('%d workers, %d concurrent clients' % (workers, clients))
+    for server_type in SERVERS:
+        metadata_rate, download_rate = run(server_type, workers, clients,
+                                           seconds)
+        print('%-10s metadata %8.1f req/s, downloads %8.1f MiB/s' %
+              (server_type, metadata_rate, download_rate / (1024 * 1024)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Database load of clients polling GET /v2/images/{image_id}.
+
+Polls an image through the v2 images resource, once unconditionally and
+once revalidating with If-None-Match, and reports the database calls and
+the time spent per poll.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_conditional_get [polls]
+"""
+
+import collections
+import sys
+import time
+import uuid
+
+from six.moves import range
+
+import xmonitor.api.common
+import xmonitor.api.v2.images
+from xmonitor.common import wsgi
+from xmonitor.tests.unit import utils as unit_test_utils
+
+
+class CountingDB(object):
+    def __init__(self, db_api):
+        self.db_api = db_api
+        self.calls = collections.Counter()
+
+    def __getattr__(self, name):
+        func = getattr(self.db_api, name)
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+
+def _get_request(image_id, etag=None):
+    request = unit_test_utils.get_fake_request('/v2/images/%s' % image_id,
+                                               method='GET')
+    request.environ['wsgiorg.routing_args'] = [
+        None, {'action': 'show', 'image_id': image_id}]
+    if etag:
+        request.headers['If-None-Match'] = '"%s"' % etag
+    return request
+
+
+def _poll(resource, db, image_id, polls, conditional):
+    etag = resource(_get_request(image_id)).etag if conditional else None
+    db.calls.clear()
+    start = time.time()
+    for _ in range(polls):
+        response = resource(_get_request(image_id, etag))
+    elapsed = (time.time() - start) / polls
+    calls = sum(db.calls.values()) / float(polls)
+    return response.status_int, calls, elapsed
+
+
+def main():
+    polls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    image_id = str(uuid.uuid4())
+    db = CountingDB(unit_test_utils.FakeDB(initialize=False))
+    db.image_create(None, {'id': image_id, 'status': 'active',
+                           'owner': unit_test_utils.TENANT1,
+                           'properties': dict(('prop-%d' % n, 'value')
+                                              for n in range(20))})
+
+    cache = xmonitor.api.common.ValidatorCache(1024)
+    controller = xmonitor.api.v2.images.ImagesController(
+        db_api=db, policy_enforcer=unit_test_utils.FakePolicyEnforcer(),
+        notifier=unit_test_utils.FakeNotifier(),
+        store_api=unit_test_utils.FakeStoreAPI(), validator_cache=cache)
+    serializer = xmonitor.api.v2.images.ResponseSerializer(
+        validator_cache=cache)
+    resource = wsgi.Resource(controller,
+                             xmonitor.api.v2.images.RequestDeserializer(),
+                             serializer)
+
+    for conditional in (False, True):
+        status, calls, elapsed = _poll(resource, db, image_id, polls,
+                                       conditional)
+        print('%-12s status %d  %.1f db calls/poll  %8.1f us/poll' % (
+            'conditional' if conditional else 'plain', status, calls,
+            elapsed * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-image overhead of the nested and the composed domain proxy chain.
+
+Reports the time to list and show images, reading all their attributes,
+and the time to read the attributes of images already fetched.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_domain_proxy [num_images]
+"""
+
+import sys
+import time
+import uuid
+
+from oslo_config import cfg
+from six.moves import range
+
+import xmonitor.context
+import xmonitor.gateway
+from xmonitor.tests.unit import utils as unit_test_utils
+
+CONF = cfg.CONF
+
+ATTRIBUTES = ('image_id', 'name', 'status', 'created_at', 'updated_at',
+              'visibility', 'min_disk', 'min_ram', 'protected', 'checksum',
+              'owner', 'disk_format', 'container_format', 'size',
+              'virtual_size', 'extra_properties', 'tags', 'locations')
+
+
+def _create_images(db_api, count):
+    properties = dict(('prop-%d' % n, 'value') for n in range(20))
+    for i in range(count):
+        image_id = str(uuid.uuid4())
+        db_api.image_create(None, {
+            'id': image_id, 'owner': unit_test_utils.TENANT1,
+            'status': 'active', 'name': 'image-%d' % i})
+        db_api.image_update(None, image_id, {'properties': properties})
+
+
+def _read_all(image):
+    return [getattr(image, attr) for attr in ATTRIBUTES]
+
+
+def _run(gateway, context, composed, rounds):
+    CONF.set_override('compose_image_proxies', composed)
+    repo = gateway.get_repo(context)
+    images = repo.list()
+
+    start = time.time()
+    for _ in range(rounds):
+        for image in repo.list():
+            _read_all(image)
+    list_time = (time.time() - start) / (rounds * len(images))
+
+    start = time.time()
+    for _ in range(rounds):
+        for image in images:
+            _read_all(repo.get(image.image_id))
+    show_time = (time.time() - start) / (rounds * len(images))
+
+    start = time.time()
+    for _ in range(rounds * 10):
+        for image in images:
+            _read_all(image)
+    read_time = (time.time() - start) / (rounds * 10 * len(images))
+    return list_time, show_time, read_time
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rounds = 5
+    CONF([], project='xmonitor')
+    db_api = unit_test_utils.FakeDB(initialize=False)
+    _create_images(db_api, count)
+    gateway = xmonitor.gateway.Gateway(
+        db_api=db_api,
+        store_api=unit_test_utils.FakeStoreAPI(),
+        notifier=unit_test_utils.FakeNotifier(),
+        policy_enforcer=unit_test_utils.FakePolicyEnforcer())
+    context = xmonitor.context.RequestContext(
+        tenant=unit_test_utils.TENANT1, user=unit_test_utils.USER1)
+
+    for composed in (False, True):
+        list_time, show_time, read_time = _run(gateway, context, composed,
+                                               rounds)
+        print('%-8s list: %8.1f us/image  show: %8.1f us/image  '
+              'read: %6.1f us/image' % (
+                  'composed' if composed else 'nested',
+                  list_time * 1e6, show_time * 1e6, read_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
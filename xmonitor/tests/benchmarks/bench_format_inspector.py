@@ -0,0 +1,105 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Time to inspect an image in process and with ``qemu-img info``.
+
+Creates an empty image of each format qemu-img can write and inspects it
+repeatedly with the format inspector and by running ``qemu-img info``,
+the way the import tasks used to. The average time of an inspection is
+reported for both, along with the formats and virtual sizes found. When
+qemu-img is not installed, only a qcow2 header written here is inspected.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_format_inspector [iterations]
+"""
+
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from oslo_concurrency import processutils as putils
+
+from xmonitor.common import format_inspector
+
+# Named after the qemu-img drivers
+FORMATS = ('qcow2', 'vmdk', 'vpc', 'vhdx', 'vdi', 'raw')
+
+VIRTUAL_SIZE = 10 * 1024 * 1024 * 1024
+
+
+def _qemu_img_info(path):
+    stdout, stderr = putils.trycmd('qemu-img', 'info', '--output=json',
+                                   path, log_errors=putils.LOG_ALL_ERRORS)
+    if stderr:
+        raise RuntimeError(stderr)
+    return json.loads(stdout)
+
+
+def _create(work_dir):
+    images = []
+    for driver in FORMATS:
+        path = os.path.join(work_dir, 'image.%s' % driver)
+        try:
+            putils.execute('qemu-img', 'create', '-f', driver, path,
+                           str(VIRTUAL_SIZE))
+        except (OSError, putils.ProcessExecutionError):
+            continue
+        images.append((driver, path))
+
+    if not images:
+        path = os.path.join(work_dir, 'image.qcow2')
+        with open(path, 'wb') as image:
+            image.write(b'QFI\xfb' + struct.pack('>IQIIQ', 2, 0, 0, 16,
+                                                  VIRTUAL_SIZE))
+        images.append(('qcow2', path))
+    return images
+
+
+def _time(inspect, path, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        info = inspect(path)
+    return (time.time() - start) / iterations, info
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    work_dir = tempfile.mkdtemp()
+    try:
+        for driver, path in _create(work_dir):
+            took, info = _time(format_inspector.inspect_file, path,
+                               iterations)
+            print('%-6s inspector  %8.3f ms  %-5s %d' %
+                  (driver, took * 1000, info['format'],
+                   info['virtual-size']))
+            try:
+                took, info = _time(_qemu_img_info, path,
+                                   max(1, iterations // 10))
+            except OSError:
+                continue
+            print('%-6s qemu-img   %8.3f ms  %-5s %d' %
+                  (driver, took * 1000, info['format'],
+                   info['virtual-size']))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
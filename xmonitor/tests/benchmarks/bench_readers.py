@@ -0,0 +1,97 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Throughput and allocations of the readers on the image upload path.
+
+Image data is read through ``LimitingReader(CooperativeReader(data))``
+into the store 64 KiB at a time, the way glance_store reads it. The data
+comes from an iterator whose chunks are 64 KiB, 8 KiB as httplib hands
+them out, or 16 MiB as the import tasks fetch them. The data is also read
+into a single reused buffer with ``readinto``.
+
+For each case, the throughput is reported along with the buffers the
+readers allocated per GiB of data, and the bytes they copied into them:
+a read returning a chunk of the iterator as it is allocates nothing.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_readers [GiB]
+"""
+
+import itertools
+import sys
+import time
+
+from xmonitor.common import utils
+
+GiB = 1024 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+CHUNK_SIZES = (('64 KiB chunks', 64 * 1024),
+               ('8 KiB chunks', 8 * 1024),
+               ('16 MiB chunks', 16 * 1024 * 1024))
+
+
+def _chunks(chunk_size, total):
+    # NOTE: A few chunks handed out over and over, so that the reads
+    # returning them can be told from the ones allocating
+    pool = [chr(ord('a') + index).encode('ascii') * chunk_size
+            for index in range(4)]
+    return pool, itertools.islice(itertools.cycle(pool),
+                                  total // chunk_size)
+
+
+def _read(chunk_size, total):
+    pool, chunks = _chunks(chunk_size, total)
+    pool = set(id(chunk) for chunk in pool)
+    reader = utils.LimitingReader(utils.CooperativeReader(chunks), total)
+    allocations = copied = 0
+    start = time.time()
+    data = reader.read(READ_SIZE)
+    while data:
+        if id(data) not in pool:
+            allocations += 1
+            copied += len(data)
+        data = reader.read(READ_SIZE)
+    return time.time() - start, allocations, copied
+
+
+def _readinto(chunk_size, total):
+    pool, chunks = _chunks(chunk_size, total)
+    reader = utils.LimitingReader(utils.CooperativeReader(chunks), total)
+    buf = bytearray(READ_SIZE)
+    copied = 0
+    start = time.time()
+    size = reader.readinto(buf)
+    while size:
+        copied += size
+        size = reader.readinto(buf)
+    return time.time() - start, 0, copied
+
+
+def main():
+    gib = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    total = int(gib * GiB) // (16 * 1024 * 1024) * (16 * 1024 * 1024)
+    for name, chunk_size in CHUNK_SIZES:
+        for method, read in (('read', _read), ('readinto', _readinto)):
+            took, allocations, copied = read(chunk_size, total)
+            print('%-14s %-9s %8.1f MiB/s  %8d allocations/GiB  '
+                  '%6.2f GiB copied/GiB' %
+                  (name, method, total / took / 1024 / 1024,
+                   allocations * GiB // total, float(copied) / total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Throughput of xmonitor-replicator dump and load.
+
+Dumps the images of a local stand-in for the v1 API into a temporary
+directory and loads them into an empty stand-in, with one worker and
+with several, and reports the time taken. The stand-ins answer every
+request after a fixed latency, as remote servers would.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_replicator \
+        [images] [image size] [latency ms] [workers]
+"""
+
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from oslo_serialization import jsonutils
+from six.moves import BaseHTTPServer
+from six.moves import range
+from six.moves import socketserver
+import six.moves.urllib.parse as urlparse
+
+from xmonitor.cmd import replicator
+
+
+class Options(object):
+    chunksize = 65536
+    dontreplicate = 'created_at date deleted_at location updated_at'
+    metaonly = False
+    mastertoken = ''
+    slavetoken = ''
+    retries = 0
+    journal = None
+
+    def __init__(self, workers):
+        self.image_workers = workers
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body=b'', content_type='application/json'):
+        time.sleep(self.server.latency)
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path == '/v1/images/detail':
+            marker = urlparse.parse_qs(url.query).get('marker', [None])[0]
+            images = self.server.images
+            if marker:
+                ids = [image['id'] for image in images]
+                images = images[ids.index(marker) + 1:]
+            body = jsonutils.dumps({'images': images[:1000]})
+            self._reply(200, body.encode('utf-8'))
+        else:
+            self._reply(200, self.server.data, 'application/octet-stream')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._reply(201, b'{"image": {"status": "active"}}')
+
+    def do_PUT(self):
+        self._reply(200, b'{"image": {"status": "active"}}')
+
+
+class StandInServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, images, size, latency):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           StandInHandler)
+        self.images = [{'id': str(uuid.uuid4()), 'status': 'active',
+                        'size': size, 'name': 'image-%d' % i,
+                        'properties': {}}
+                       for i in range(images)]
+        self.data = b'x' * size
+        self.latency = latency
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def _time(command, options, server, path):
+    address = '%s:%d' % server.server_address
+    start = time.time()
+    command(options, [address, path])
+    return time.time() - start
+
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024 * 1024
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.02
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    master = _serve(StandInServer(images, size, latency))
+    slave = _serve(StandInServer(0, size, latency))
+
+    print('%d images of %d bytes, %d ms latency' %
+          (images, size, latency * 1000))
+    try:
+        for count in (1, workers):
+            path = tempfile.mkdtemp()
+            try:
+                dump = _time(replicator.replication_dump, Options(count),
+                             master, path)
+                load = _time(replicator.replication_load, Options(count),
+                             slave, path)
+            finally:
+                shutil.rmtree(path)
+            print('%2d workers: dump %7.2f s, load %7.2f s' %
+                  (count, dump, load))
+    finally:
+        master.shutdown()
+        slave.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Overhead of the sampling profiler middleware.
+
+Serves requests whose stand-in application is CPU bound, with a deep
+stack, through the middleware in one thread. It is run once without
+sampling and then with sampling at several intervals. For each run the
+rate of requests and the share of time spent sampling, as measured by
+the sampler itself, are reported.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_sampling_profiler [seconds]
+"""
+
+import os
+import sys
+import time
+
+from oslo_config import cfg
+
+from xmonitor.api.middleware import sampling_profiler
+
+INTERVALS = (None, 0.05, 0.01, 0.005, 0.001)
+
+
+def _work(depth):
+    if depth:
+        return _work(depth - 1)
+    return sum(i * i for i in range(2000))
+
+
+def application(environ, start_response):
+    _work(30)
+    return [b'{}']
+
+
+def run(interval, seconds):
+    cfg.CONF.set_override('profile_sampling', interval is not None)
+    if interval is not None:
+        cfg.CONF.set_override('profile_sampling_interval', interval)
+    middleware = sampling_profiler.SamplingProfilerMiddleware(application)
+    # The signal handler is of no use here
+    middleware.pid = os.getpid()
+    if interval is not None:
+        middleware.sampler.start()
+
+    environ = {'REQUEST_METHOD': 'GET'}
+    requests = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for _ in middleware(environ, None):
+            pass
+        requests += 1
+
+    overhead = None
+    if interval is not None:
+        overhead = middleware.sampler.overhead
+        middleware.sampler.stop()
+    return requests / float(seconds), overhead
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    cfg.CONF([], project='xmonitor')
+
+    baseline = None
+    for interval in INTERVALS:
+        rate, overhead = run(interval, seconds)
+        if interval is None:
+            baseline = rate
+            print('no sampling     %8.1f req/s' % rate)
+            continue
+        print('every %5.3fs    %8.1f req/s, %5.1f%% slower, sampling took '
+              '%.2f%% of the time' %
+              (interval, rate, (1 - rate / baseline) * 100, overhead * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Validations per second on the image schema.
+
+Compares validating against a freshly built schema and validator on every
+call with the cached validator of xmonitor.schema.Schema. Custom properties
+are read from schema-image.json when it can be found.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_schema_validation [seconds]
+"""
+
+import sys
+import time
+
+import jsonschema
+
+import xmonitor.api.v2.images
+
+IMAGE = {
+    'name': 'cirros',
+    'visibility': 'public',
+    'container_format': 'bare',
+    'disk_format': 'qcow2',
+    'min_ram': 512,
+    'min_disk': 1,
+    'protected': False,
+    'tags': ['one', 'two'],
+    'os_distro': 'cirros',
+    'hw_disk_bus': 'virtio',
+}
+
+
+def _rate(func, duration):
+    count = 0
+    end = time.time() + duration
+    while time.time() < end:
+        func()
+        count += 1
+    return count / duration
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    custom_properties = xmonitor.api.v2.images.load_custom_properties()
+    schema = xmonitor.api.v2.images.get_schema(custom_properties)
+
+    def uncached():
+        jsonschema.validate(IMAGE, schema.raw())
+
+    def cached():
+        schema.validate(IMAGE)
+
+    for name, func in (('uncached', uncached), ('cached', cached)):
+        print('%-8s %10.0f validations/s' % (name, _rate(func, duration)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cost of verifying the signature of image data.
+
+Signs some image data with an RSA-PSS and an ECC key for each supported
+hash method, and reports the throughput of verifying it 64 KiB at a time,
+the way the store hands the data to the verifier.
+
+Then creates verifiers against a key manager answering after a delay, and
+reports the time spent before the first chunk of data can be stored:
+fetching the certificate for each verifier, with the certificate cached,
+and with the certificate fetched while the data is stored.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_signature_verification [MiB]
+"""
+
+import base64
+import datetime
+import sys
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import hashes
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+import eventlet
+import mock
+from six.moves import range
+
+from xmonitor.common import signature_utils
+
+CHUNK_SIZE = 64 * 1024
+
+# Round trip to the key manager
+KEY_MANAGER_DELAY = 0.05
+VERIFIERS = 20
+
+
+def _keys():
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048,
+                                       backend=default_backend())
+    ecc_key = ec.generate_private_key(ec.SECP521R1(), default_backend())
+    return (
+        ('RSA-PSS', rsa_key,
+         lambda hash_method: (padding.PSS(mgf=padding.MGF1(hash_method),
+                                          salt_length=padding.PSS.MAX_LENGTH),
+                              hash_method)),
+        ('ECC_SECP521R1', ecc_key,
+         lambda hash_method: (ec.ECDSA(hash_method),)))
+
+
+def _sign(private_key, signer_args, chunks):
+    signer = private_key.signer(*signer_args)
+    for chunk in chunks:
+        signer.update(chunk)
+    return base64.b64encode(signer.finalize())
+
+
+def _certificate(private_key):
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'xmonitor')])
+    now = datetime.datetime.utcnow()
+    return (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(private_key.public_key())
+            .serial_number(1)
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(private_key, hashes.SHA256(), default_backend()))
+
+
+def _properties(key_type, hash_name, signature):
+    return {signature_utils.CERT_UUID: 'fea14bc2-d75f-4ba5-bccc-b5c924ad0693',
+            signature_utils.HASH_METHOD: hash_name,
+            signature_utils.KEY_TYPE: key_type,
+            signature_utils.SIGNATURE: signature}
+
+
+def _throughput(mib):
+    chunks = [b'x' * CHUNK_SIZE] * (mib * 1024 * 1024 // CHUNK_SIZE)
+    for key_type, private_key, signer_args in _keys():
+        certificate = _certificate(private_key)
+        for hash_name, hash_method in sorted(
+                signature_utils.HASH_METHODS.items()):
+            properties = _properties(
+                key_type, hash_name,
+                _sign(private_key, signer_args(hash_method), chunks))
+            with mock.patch.object(signature_utils, 'get_certificate',
+                                   return_value=certificate), \
+                    mock.patch.object(signature_utils, '_CACHE',
+                                      signature_utils.CertificateCache(
+                                          0, 300)):
+                start = time.time()
+                verifier = signature_utils.get_verifier(None, properties)
+                for chunk in chunks:
+                    verifier.update(chunk)
+                verifier.verify()
+                took = time.time() - start
+            print('%-14s %-8s %8.1f MiB/s' % (key_type, hash_name,
+                                                 mib / took))
+
+
+def _store(verifier, chunks):
+    """Time until the first chunk is stored, and until all of them are."""
+    start = time.time()
+    first = None
+    for chunk in chunks:
+        verifier.update(chunk)
+        if first is None:
+            first = time.time() - start
+        # NOTE: Writing the chunk to the store
+        eventlet.sleep(0.001)
+    verifier.verify()
+    return first, time.time() - start
+
+
+def _creation():
+    key_type, private_key, signer_args = _keys()[0]
+    certificate = _certificate(private_key)
+    chunks = [b'x' * CHUNK_SIZE] * 64
+    properties = _properties(
+        key_type, 'SHA-256',
+        _sign(private_key, signer_args(hashes.SHA256()), chunks))
+
+    def get_certificate(context, signature_certificate_uuid):
+        eventlet.sleep(KEY_MANAGER_DELAY)
+        return certificate
+
+    cases = (('uncached', 0, lambda: signature_utils.get_verifier(
+              None, properties)),
+             ('cached', 128, lambda: signature_utils.get_verifier(
+              None, properties)),
+             ('pending', 0, lambda: signature_utils.PendingVerifier(
+              None, properties)))
+    for name, cache_size, create in cases:
+        first = total = 0.0
+        with mock.patch.object(signature_utils, 'get_certificate',
+                               get_certificate), \
+                mock.patch.object(signature_utils, '_CACHE',
+                                  signature_utils.CertificateCache(
+                                      cache_size, 300)):
+            for i in range(VERIFIERS):
+                start = time.time()
+                verifier = create()
+                to_first, to_end = _store(verifier, chunks)
+                first += time.time() - start - to_end + to_first
+                total += time.time() - start
+        print('%-9s %7.1f ms to the first chunk  %7.1f ms per upload' %
+              (name, first / VERIFIERS * 1000, total / VERIFIERS * 1000))
+
+
+def main():
+    mib = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    _throughput(mib)
+    _creation()
+
+
+if __name__ == '__main__':
+    main()
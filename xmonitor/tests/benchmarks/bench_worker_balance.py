@@ -0,0 +1,174 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Latency of metadata requests during heavy image downloads.
+
+Runs the WSGI server with a stand-in application in a separate process,
+keeps it busy with image downloads and reports the latency of metadata
+requests made meanwhile. This is repeated with all workers sharing one
+socket, with reuse_port, with reuse_port and a limit on the data
+transfers per worker, and with a short admission queue that sheds the
+transfers beyond it.
+
+Run with::
+
+    python -m xmonitor.tests.benchmarks.bench_worker_balance \
+        [workers] [downloads] [seconds]
+"""
+
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from six.moves import http_client
+from six.moves import range
+
+CHUNK = b'x' * 65536
+
+MODULE = 'xmonitor.tests.benchmarks.bench_worker_balance'
+
+MODES = (
+    ('shared socket', []),
+    ('reuse_port', ['reuse_port']),
+    ('reuse_port, 2 transfers', ['reuse_port', 'max_data_transfers']),
+    ('2 transfers, queue of 4', ['reuse_port', 'max_data_transfers',
+                                 'admission_queue']),
+)
+
+
+def application(environ, start_response):
+    """Stand-in for the API, serving image data and metadata."""
+    if environ['PATH_INFO'].endswith('/file'):
+        start_response('200 OK', [('Content-Type',
+                                   'application/octet-stream')])
+        return (CHUNK for _ in range(16 * 1024))
+    body = b'{"images": []}'
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def serve(port, workers, options):
+    import eventlet
+    eventlet.patcher.monkey_patch()
+
+    from oslo_config import cfg
+
+    from xmonitor.common import wsgi
+
+    cfg.CONF([], project='xmonitor')
+    cfg.CONF.set_override('bind_host', '127.0.0.1')
+    cfg.CONF.set_override('workers', workers)
+    cfg.CONF.set_override('reuse_port', 'reuse_port' in options)
+    if 'max_data_transfers' in options:
+        cfg.CONF.set_override('max_data_transfers_per_worker', 2)
+    if 'admission_queue' in options:
+        cfg.CONF.set_override('admission_queue_size', 4)
+        cfg.CONF.set_override('admission_queue_timeout', 1)
+    server = wsgi.Server()
+    server.start(application, port)
+    server.wait()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _download(port, stop):
+    while not stop.is_set():
+        conn = http_client.HTTPConnection('127.0.0.1', port)
+        try:
+            conn.request('GET', '/v2/images/fake/file')
+            response = conn.getresponse()
+            while response.read(65536) and not stop.is_set():
+                pass
+        except Exception:
+            time.sleep(0.1)
+        finally:
+            conn.close()
+
+
+def _poll(port, stop, latencies):
+    while not stop.is_set():
+        start = time.time()
+        conn = http_client.HTTPConnection('127.0.0.1', port)
+        try:
+            conn.request('GET', '/v2/images')
+            conn.getresponse().read()
+            latencies.append(time.time() - start)
+        except Exception:
+            time.sleep(0.1)
+        finally:
+            conn.close()
+        time.sleep(0.01)
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run(workers, downloads, seconds, options):
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, '-m', MODULE, 'serve',
+                               str(port), str(workers)] + options)
+    try:
+        time.sleep(2)
+        stop = threading.Event()
+        latencies = []
+        threads = [threading.Thread(target=_download, args=(port, stop))
+                   for _ in range(downloads)]
+        threads.append(threading.Thread(target=_poll,
+                                        args=(port, stop, latencies)))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return latencies
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve(int(sys.argv[2]), int(sys.argv[3]), sys.argv[4:])
+        return
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    downloads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    print('%d workers, %d concurrent downloads' % (workers, downloads))
+    for name, options in MODES:
+        latencies = run(workers, downloads, seconds, options)
+        if not latencies:
+            print('%-24s no metadata request completed' % name)
+            continue
+        print('%-24s %5d requests, p50 %7.1f ms, p99 %7.1f ms' %
+              (name, len(latencies), _percentile(latencies, 50) * 1000,
+               _percentile(latencies, 99) * 1000))
+
+
+if __name__ == '__main__':
+    main()
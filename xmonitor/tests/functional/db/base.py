@@ -286,6 +286,78 @@ class DriverTests(object):
         image['locations'][1].pop('id')
         self.assertEqual(locations, image['locations'])
 
+    def test_image_location_get_pending_delete(self):
+        locations = [{'url': url, 'metadata': {}, 'status': 'active'}
+                     for url in ('a', 'b', 'c')]
+        image = self.db_api.image_update(self.adm_context, UUID3,
+                                         {'locations': locations})
+        loc_ids = [loc['id'] for loc in image['locations']]
+        now = timeutils.utcnow()
+        for offset, loc_id in zip((30, 20, 10), loc_ids):
+            self.db_api.image_location_delete(
+                self.adm_context, UUID3, loc_id, 'pending_delete',
+                delete_time=now - datetime.timedelta(seconds=offset))
+
+        due = self.db_api.image_location_get_pending_delete(
+            self.adm_context, now - datetime.timedelta(seconds=15))
+        self.assertEqual(loc_ids[:2], [loc['id'] for loc in due])
+        self.assertEqual([UUID3, UUID3], [loc['image_id'] for loc in due])
+        self.assertEqual(['a', 'b'], [loc['url'] for loc in due])
+
+        due = self.db_api.image_location_get_pending_delete(
+            self.adm_context, now, marker=loc_ids[0], limit=1)
+        self.assertEqual([loc_ids[1]], [loc['id'] for loc in due])
+
+    def test_image_location_delete_many(self):
+        locations = [{'url': url, 'metadata': {}, 'status': 'pending_delete'}
+                     for url in ('a', 'b', 'c')]
+        image = self.db_api.image_update(self.adm_context, UUID3,
+                                         {'locations': locations})
+        loc_ids = [loc['id'] for loc in image['locations']]
+
+        count = self.db_api.image_location_delete_many(
+            self.adm_context, loc_ids[:2], 'deleted')
+        self.assertEqual(2, count)
+        image = self.db_api.image_get(self.adm_context, UUID3)
+        statuses = dict((loc['id'], loc['status'])
+                        for loc in image['locations'])
+        self.assertEqual({loc_ids[2]: 'pending_delete'}, statuses)
+
+        self.assertRaises(exception.Invalid,
+                          self.db_api.image_location_delete_many,
+                          self.adm_context, loc_ids, 'active')
+
+    def test_image_status_update_many(self):
+        locations = [{'url': url, 'metadata': {}, 'status': 'active'}
+                     for url in ('a', 'b')]
+        image = self.db_api.image_update(self.adm_context, UUID3,
+                                         {'locations': locations,
+                                          'status': 'pending_delete'})
+        loc_ids = [loc['id'] for loc in image['locations']]
+        self.db_api.image_location_delete(self.adm_context, UUID3,
+                                          loc_ids[0], 'deleted')
+        self.db_api.image_location_delete(self.adm_context, UUID3,
+                                          loc_ids[1], 'pending_delete')
+        self.db_api.image_update(self.adm_context, UUID2,
+                                 {'status': 'pending_delete'})
+
+        # UUID3 still has a location waiting to be scrubbed, UUID1 is not
+        # pending deletion at all.
+        count = self.db_api.image_status_update_many(
+            self.adm_context, [UUID1, UUID2, UUID3],
+            'pending_delete', 'deleted')
+        self.assertEqual(1, count)
+        self.assertEqual('deleted', self.db_api.image_get(
+            self.adm_context, UUID2, force_show_deleted=True)['status'])
+        self.assertEqual('pending_delete', self.db_api.image_get(
+            self.adm_context, UUID3, force_show_deleted=True)['status'])
+
+        self.db_api.image_location_delete_many(self.adm_context,
+                                               loc_ids[1:], 'deleted')
+        count = self.db_api.image_status_update_many(
+            self.adm_context, [UUID3], 'pending_delete', 'deleted')
+        self.assertEqual(1, count)
+
     def test_image_update_with_location_data(self):
         location_data = [{'url': 'a', 'metadata': {'key': 'value'},
                           'status': 'active'},
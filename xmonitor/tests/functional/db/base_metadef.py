@@ -697,11 +697,26 @@ class MetadefTagTests(object):
                           created_tag['name'])
 
 
+class MetadefGenerationTests(object):
+
+    def test_generation_increment(self):
+        generation = self.db_api.metadef_generation_get(self.context)
+        self.assertEqual(generation + 1,
+                         self.db_api.metadef_generation_increment(
+                             self.context))
+        self.assertEqual(generation + 2,
+                         self.db_api.metadef_generation_increment(
+                             self.context))
+        self.assertEqual(generation + 2,
+                         self.db_api.metadef_generation_get(self.context))
+
+
 class MetadefDriverTests(MetadefNamespaceTests,
                          MetadefResourceTypeTests,
                          MetadefResourceTypeAssociationTests,
                          MetadefPropertyTests,
                          MetadefObjectTests,
-                         MetadefTagTests):
+                         MetadefTagTests,
+                         MetadefGenerationTests):
     # collection class
     pass
@@ -0,0 +1,186 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import greenlet
+import mock
+
+from xmonitor.api.middleware import sampling_profiler
+from xmonitor.tests import utils as test_utils
+
+
+class TestSamplingProfilerMiddleware(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestSamplingProfilerMiddleware, self).setUp()
+        # Only the samples taken by the application count
+        self.config(profile_sampling_dir=self.test_dir,
+                    profile_sampling_interval=3600, workers=0)
+        patcher = mock.patch.object(sampling_profiler.signal, 'signal')
+        self.signal = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.middleware = sampling_profiler.SamplingProfilerMiddleware(
+            self._application)
+        self.addCleanup(self._stop)
+
+    def _stop(self):
+        if self.middleware.sampler.running:
+            self.middleware.sampler.stop()
+
+    def _application(self, environ, start_response):
+        # Sample while the request is running
+        self.middleware.sampler.sample()
+        return self._body()
+
+    def _body(self):
+        self.middleware.sampler.sample()
+        yield b'data'
+
+    def _waiting_application(self, environ, start_response):
+        # Wait for I/O, the way a greenthread switches to the hub
+        greenlet.getcurrent().parent.switch()
+        return iter([b'data'])
+
+    def _environ(self):
+        route = mock.Mock(routepath='/images/{image_id}/file')
+        route.name = None
+        return {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '/v2',
+                'routes.route': route}
+
+    def test_not_sampling(self):
+        app_iter = self.middleware(self._environ(), None)
+        self.assertEqual([b'data'], list(app_iter))
+        self.assertEqual({}, self.middleware.sampler.stacks)
+
+    def test_sampling(self):
+        self.config(profile_sampling=True)
+        self.assertEqual([b'data'], list(self.middleware(self._environ(),
+                                                          None)))
+        self.assertTrue(self.middleware.sampler.running)
+        self.assertEqual({}, self.middleware.sampler.requests)
+
+        stacks = self.middleware.sampler.stacks
+        self.assertEqual(2, len(stacks))
+        for stack in stacks:
+            frames = stack.split(';')
+            self.assertEqual('GET /v2/images/{image_id}/file', frames[0])
+            self.assertIn('sample', frames[-1])
+        self.assertTrue(any('_application' in stack for stack in stacks))
+        self.assertTrue(any('_body' in stack for stack in stacks))
+
+    def test_sampling_waiting_requests(self):
+        self.config(profile_sampling=True)
+        self.middleware.application = self._waiting_application
+        waiting = greenlet.greenlet(
+            lambda: list(self.middleware(self._environ(), None)))
+        waiting.switch()
+        self.middleware.sampler.sample()
+        waiting.switch()
+        self.assertTrue(waiting.dead)
+        self.assertEqual({}, self.middleware.sampler.greenlets)
+
+        stacks = self.middleware.sampler.stacks
+        self.assertEqual(1, len(stacks))
+        frames = list(stacks)[0].split(';')
+        self.assertEqual('GET /v2/images/{image_id}/file', frames[0])
+        self.assertIn('_waiting_application', frames[-1])
+
+    def test_route_name(self):
+        environ = self._environ()
+        environ['routes.route'].name = 'image_download'
+        self.assertEqual('GET image_download',
+                         sampling_profiler._route(environ))
+        del environ['routes.route']
+        self.assertEqual('GET <unmatched>',
+                         sampling_profiler._route(environ))
+
+    def test_toggle(self):
+        self.signal.assert_called_once_with(
+            sampling_profiler.signal.SIGUSR2, self.middleware.toggle)
+        list(self.middleware(self._environ(), None))
+        self.assertEqual(1, self.signal.call_count)
+
+        self.middleware.toggle()
+        self.assertTrue(self.middleware.sampler.running)
+        list(self.middleware(self._environ(), None))
+
+        self.middleware.toggle()
+        self.assertFalse(self.middleware.sampler.running)
+        dumps = os.listdir(self.test_dir)
+        self.assertEqual(1, len([name for name in dumps
+                                 if name.endswith('.collapsed')]))
+        path = os.path.join(self.test_dir, [
+            name for name in dumps if name.endswith('.collapsed')][0])
+        with open(path) as dump:
+            lines = dump.read().splitlines()
+        self.assertEqual(2, len(lines))
+        for line in lines:
+            self.assertTrue(line.startswith('GET /v2/images/{image_id}/file'))
+            self.assertTrue(line.endswith(' 1'))
+
+    def test_toggle_idle_worker(self):
+        self.middleware.toggle()
+        self.assertEqual(os.getpid(), self.middleware.pid)
+        self.assertTrue(self.middleware.sampler.running)
+
+    def test_toggle_parent(self):
+        self.config(workers=2)
+        self.middleware.toggle()
+        self.assertIsNone(self.middleware.pid)
+        self.assertFalse(self.middleware.sampler.running)
+
+    def test_toggle_keeps_sampling(self):
+        self.config(profile_sampling=True)
+        list(self.middleware(self._environ(), None))
+        self.middleware.toggle()
+        self.assertTrue(self.middleware.sampler.running)
+        self.assertEqual({}, self.middleware.sampler.stacks)
+
+    def test_set_up_once_per_process(self):
+        self.config(profile_sampling=True)
+        with mock.patch.object(sampling_profiler.Sampler, 'start') as start:
+            self.middleware(self._environ(), None)
+            self.middleware(self._environ(), None)
+            self.assertEqual(1, start.call_count)
+
+
+class TestSampler(test_utils.BaseTestCase):
+
+    def test_back_off(self):
+        sampler = sampling_profiler.Sampler(0.01, 0.02)
+        sampler._adjust_interval(0.05, 1.0)
+        self.assertEqual(0.02, sampler.interval)
+        sampler._adjust_interval(0.03, 1.0)
+        self.assertEqual(0.04, sampler.interval)
+        sampler._adjust_interval(0.01, 1.0)
+        self.assertEqual(0.04, sampler.interval)
+        sampler._adjust_interval(0.001, 1.0)
+        self.assertEqual(0.02, sampler.interval)
+        for _ in range(3):
+            sampler._adjust_interval(0.001, 1.0)
+        self.assertEqual(0.01, sampler.interval)
+
+    def test_back_off_limit(self):
+        sampler = sampling_profiler.Sampler(0.6, 0.02)
+        sampler._adjust_interval(1.0, 1.0)
+        self.assertEqual(sampling_profiler.MAX_INTERVAL, sampler.interval)
+
+    def test_overhead(self):
+        sampler = sampling_profiler.Sampler(0.01, 0.02)
+        sampler.reset()
+        sampler.started -= 10
+        sampler.busy = 0.1
+        self.assertAlmostEqual(0.01, sampler.overhead, places=3)
@@ -13,9 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
 import mock
 import os
+import struct
 
 import glance_store
 from oslo_concurrency import processutils
@@ -78,37 +78,97 @@ class TestImportTask(test_utils.BaseTestCase):
                     group='taskflow_executor')
         glance_store.create_stores(CONF)
 
+    def _qcow2(self, virtual_size=10737418240):
+        return (b'QFI\xfb' + struct.pack('>IQIIQ', 2, 0, 0, 16, virtual_size) +
+                b'\0' * 40)
+
+    def _image_file(self, content):
+        image_path = os.path.join(self.work_dir, UUID1)
+        with open(image_path, 'wb') as image_file:
+            image_file.write(content)
+        return image_path
+
     def test_convert_success(self):
+        self.config(conversion_coroutines=4, group='taskflow_executor')
         image_convert = convert._Convert(self.task.task_id,
                                          self.task_type,
                                          self.img_repo)
+        image_path = self._image_file(b"TEST_IMAGE")
+        dest_path = "%s.converted" % image_path
 
-        self.task_repo.get.return_value = self.task
-        image_id = mock.sentinel.image_id
-        image = mock.MagicMock(image_id=image_id, virtual_size=None)
-        self.img_repo.get.return_value = image
+        def fake_execute(*args, **kwargs):
+            with open(args[-1], 'wb') as dest:
+                dest.write(self._qcow2())
+            return ("", None)
+
+        with mock.patch.object(processutils, 'execute') as exc_mock:
+            exc_mock.side_effect = fake_execute
+            conversion = image_convert.execute(UUID1, 'file://' + image_path)
+
+        exc_mock.assert_called_once_with(
+            'qemu-img', 'convert', '-f', 'raw', '-O', 'qcow2', '-m', '4',
+            '-S', '4096', '-W', image_path, dest_path,
+            log_errors=processutils.LOG_ALL_ERRORS)
+        with open(image_path, 'rb') as image_file:
+            self.assertEqual(self._qcow2(), image_file.read())
+        self.assertFalse(os.path.exists(dest_path))
+        self.assertEqual('raw', conversion['source_format'])
+        self.assertEqual('qcow2', conversion['format'])
+        self.assertEqual(10, conversion['size'])
+        self.assertIn('seconds', conversion)
+        self.assertIn('bytes_per_second', conversion)
+
+    def test_convert_options(self):
+        self.config(conversion_out_of_order=False, conversion_sparse_size=0,
+                    max_concurrent_tasks=4, group='taskflow_executor')
+        image_convert = convert._Convert(self.task.task_id,
+                                         self.task_type,
+                                         self.img_repo)
+        image_path = self._image_file(b"TEST_IMAGE")
 
         with mock.patch.object(processutils, 'execute') as exc_mock:
             exc_mock.return_value = ("", None)
-            with mock.patch.object(os, 'rename') as rm_mock:
-                rm_mock.return_value = None
-                image_convert.execute(image, 'file:///test/path.raw')
+            with mock.patch.object(processutils, 'get_worker_count',
+                                   return_value=8):
+                with mock.patch.object(os, 'rename'):
+                    image_convert.execute(UUID1, image_path)
 
-    def test_convert_revert_success(self):
+        exc_mock.assert_called_once_with(
+            'qemu-img', 'convert', '-f', 'raw', '-O', 'qcow2', '-m', '2',
+            '-S', '0', image_path, "%s.converted" % image_path,
+            log_errors=processutils.LOG_ALL_ERRORS)
+
+    def test_convert_same_format(self):
         image_convert = convert._Convert(self.task.task_id,
                                          self.task_type,
                                          self.img_repo)
+        image_path = self._image_file(self._qcow2())
 
-        self.task_repo.get.return_value = self.task
-        image_id = mock.sentinel.image_id
-        image = mock.MagicMock(image_id=image_id, virtual_size=None)
-        self.img_repo.get.return_value = image
+        with mock.patch.object(processutils, 'execute') as exc_mock:
+            self.assertIsNone(image_convert.execute(UUID1,
+                                                    'file://' + image_path))
+            self.assertFalse(exc_mock.called)
+
+    def test_convert_failure(self):
+        image_convert = convert._Convert(self.task.task_id,
+                                         self.task_type,
+                                         self.img_repo)
+        image_path = self._image_file(b"TEST_IMAGE")
 
         with mock.patch.object(processutils, 'execute') as exc_mock:
-            exc_mock.return_value = ("", None)
-            with mock.patch.object(os, 'remove') as rmtree_mock:
-                rmtree_mock.return_value = None
-                image_convert.revert(image, 'file:///tmp/test')
+            exc_mock.return_value = ("", "error")
+            self.assertRaises(RuntimeError, image_convert.execute, UUID1,
+                              image_path)
+
+    def test_convert_revert_success(self):
+        image_convert = convert._Convert(self.task.task_id,
+                                         self.task_type,
+                                         self.img_repo)
+        dest_path = "%s.converted" % self._image_file(b"TEST_IMAGE")
+        open(dest_path, 'a').close()
+
+        image_convert.revert(UUID1)
+        self.assertFalse(os.path.exists(dest_path))
 
     def test_import_flow_with_convert_and_introspect(self):
         self.config(engine_mode='serial',
@@ -138,28 +198,13 @@ class TestImportTask(test_utils.BaseTestCase):
         image_path = os.path.join(self.work_dir, image.image_id)
 
         def fake_execute(*args, **kwargs):
-            if 'info' in args:
-                # NOTE(flaper87): Make sure the file actually
-                # exists. Extra check to verify previous tasks did
-                # what they were supposed to do.
-                assert os.path.exists(args[3].split("file://")[-1])
-
-                return (json.dumps({
-                    "virtual-size": 10737418240,
-                    "filename": "/tmp/image.qcow2",
-                    "cluster-size": 65536,
-                    "format": "qcow2",
-                    "actual-size": 373030912,
-                    "format-specific": {
-                        "type": "qcow2",
-                        "data": {
-                            "compat": "0.10"
-                        }
-                    },
-                    "dirty-flag": False
-                }), None)
-
-            open("%s.converted" % image_path, 'a').close()
+            # NOTE(flaper87): Make sure the file actually
+            # exists. Extra check to verify previous tasks did
+            # what they were supposed to do.
+            assert os.path.exists(args[-2])
+
+            with open("%s.converted" % image_path, 'wb') as dest:
+                dest.write(self._qcow2())
             return ("", None)
 
         with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
@@ -178,3 +223,5 @@ class TestImportTask(test_utils.BaseTestCase):
                 self.assertEqual([], os.listdir(self.work_dir))
                 self.assertEqual('qcow2', image.disk_format)
                 self.assertEqual(10737418240, image.virtual_size)
+                self.assertEqual('qcow2',
+                                 self.task.result['conversion']['format'])
@@ -13,12 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
 import mock
 import os
+import struct
 
 import glance_store
-from oslo_concurrency import processutils as putils
 from oslo_config import cfg
 import six
 from six.moves import urllib
@@ -26,7 +25,9 @@ from taskflow import task
 from taskflow.types import failure
 
 import xmonitor.async.flows.base_import as import_flow
+from xmonitor.async.flows import ovf_process
 from xmonitor.async import taskflow_executor
+from xmonitor.common import format_inspector
 from xmonitor.common.scripts.image_import import main as image_import
 from xmonitor.common.scripts import utils as script_utils
 from xmonitor.common import utils
@@ -40,6 +41,35 @@ UUID1 = 'c80a1a6c-bd1f-41c5-90ee-81afedb1d58d'
 TENANT1 = '6838eb7b-6ded-434a-882c-b344c77fe8df'
 
 
+def _qcow2(virtual_size=1024, backing_file=None):
+    """The header of a qcow2 image."""
+    backing_file = backing_file or b''
+    backing_offset = 72 if backing_file else 0
+    return (b'QFI\xfb' + struct.pack('>IQIIQ', 2, backing_offset,
+                                      len(backing_file), 16, virtual_size) +
+            b'\0' * 40 + backing_file)
+
+
+def _qed(virtual_size=1024, backing_file=None):
+    """The header of a QED image."""
+    backing_file = backing_file or b''
+    return (b'QED\0' + struct.pack('<IIIQQQQQII', 65536, 4, 1,
+                                     1 if backing_file else 0, 0, 0, 4096,
+                                     virtual_size,
+                                     64 if backing_file else 0,
+                                     len(backing_file)) +
+            backing_file)
+
+
+def _vhd_footer(virtual_size=1024):
+    """The footer of a fixed VHD image."""
+    footer = b'conectix' + struct.pack('>IIQ', 2, 0x10000,
+                                       0xffffffffffffffff)
+    footer += b'\0' * (48 - len(footer))
+    footer += struct.pack('>QII', virtual_size, 0, 2)
+    return footer + b'\0' * (512 - len(footer))
+
+
 class _ErrorTask(task.Task):
 
     def execute(self):
@@ -108,24 +138,19 @@ class TestImportTask(test_utils.BaseTestCase):
         img_factory.new_image.side_effect = create_image
 
         with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
-            dmock.return_value = six.BytesIO(b"TEST_IMAGE")
+            dmock.return_value = six.BytesIO(_qcow2())
 
-            with mock.patch.object(putils, 'trycmd') as tmock:
-                tmock.return_value = (json.dumps({
-                    'format': 'qcow2',
-                }), None)
+            executor.begin_processing(self.task.task_id)
+            image_path = os.path.join(self.test_dir, self.image.image_id)
+            tmp_image_path = os.path.join(self.work_dir,
+                                          "%s.tasks_import" % image_path)
 
-                executor.begin_processing(self.task.task_id)
-                image_path = os.path.join(self.test_dir, self.image.image_id)
-                tmp_image_path = os.path.join(self.work_dir,
-                                              "%s.tasks_import" % image_path)
-
-                self.assertFalse(os.path.exists(tmp_image_path))
-                self.assertTrue(os.path.exists(image_path))
-                self.assertEqual(1, len(list(self.image.locations)))
-                self.assertEqual("file://%s/%s" % (self.test_dir,
-                                                   self.image.image_id),
-                                 self.image.locations[0]['url'])
+            self.assertFalse(os.path.exists(tmp_image_path))
+            self.assertTrue(os.path.exists(image_path))
+            self.assertEqual(1, len(list(self.image.locations)))
+            self.assertEqual("file://%s/%s" % (self.test_dir,
+                                               self.image.image_id),
+                             self.image.locations[0]['url'])
 
     def test_import_flow_missing_work_dir(self):
         self.config(engine_mode='serial', group='taskflow_executor')
@@ -220,32 +245,28 @@ class TestImportTask(test_utils.BaseTestCase):
         img_factory.new_image.side_effect = create_image
 
         with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
-            dmock.return_value = six.BytesIO(b"TEST_IMAGE")
-
-            with mock.patch.object(putils, 'trycmd') as tmock:
-                tmock.return_value = (json.dumps({
-                    'backing-filename': '/etc/password'
-                }), None)
+            dmock.return_value = six.BytesIO(
+                _qcow2(backing_file=b'/etc/password'))
 
-                with mock.patch.object(import_flow._ImportToFS,
-                                       'revert') as rmock:
-                    self.assertRaises(RuntimeError,
-                                      executor.begin_processing,
-                                      self.task.task_id)
-                    self.assertTrue(rmock.called)
-                    self.assertIsInstance(rmock.call_args[1]['result'],
-                                          failure.Failure)
+            with mock.patch.object(import_flow._ImportToFS,
+                                   'revert') as rmock:
+                self.assertRaises(RuntimeError,
+                                  executor.begin_processing,
+                                  self.task.task_id)
+                self.assertTrue(rmock.called)
+                self.assertIsInstance(rmock.call_args[1]['result'],
+                                      failure.Failure)
 
-                    image_path = os.path.join(self.test_dir,
-                                              self.image.image_id)
+                image_path = os.path.join(self.test_dir,
+                                          self.image.image_id)
 
-                    fname = "%s.tasks_import" % image_path
-                    tmp_image_path = os.path.join(self.work_dir, fname)
+                fname = "%s.tasks_import" % image_path
+                tmp_image_path = os.path.join(self.work_dir, fname)
 
-                    self.assertFalse(os.path.exists(tmp_image_path))
-                    # Note(sabari): The image should not have been uploaded to
-                    # the store as the flow failed before ImportToStore Task.
-                    self.assertFalse(os.path.exists(image_path))
+                self.assertFalse(os.path.exists(tmp_image_path))
+                # Note(sabari): The image should not have been uploaded to
+                # the store as the flow failed before ImportToStore Task.
+                self.assertFalse(os.path.exists(image_path))
 
     def test_import_flow_revert(self):
         self.config(engine_mode='serial',
@@ -269,33 +290,28 @@ class TestImportTask(test_utils.BaseTestCase):
         img_factory.new_image.side_effect = create_image
 
         with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
-            dmock.return_value = six.BytesIO(b"TEST_IMAGE")
+            dmock.return_value = six.BytesIO(_qcow2())
 
-            with mock.patch.object(putils, 'trycmd') as tmock:
-                tmock.return_value = (json.dumps({
-                    'format': 'qcow2',
-                }), None)
-
-                with mock.patch.object(import_flow,
-                                       "_get_import_flows") as imock:
-                    imock.return_value = (x for x in [_ErrorTask()])
-                    self.assertRaises(RuntimeError,
-                                      executor.begin_processing,
-                                      self.task.task_id)
-
-                    image_path = os.path.join(self.test_dir,
-                                              self.image.image_id)
-                    tmp_image_path = os.path.join(self.work_dir,
-                                                  ("%s.tasks_import" %
-                                                   image_path))
-                    self.assertFalse(os.path.exists(tmp_image_path))
-
-                    # NOTE(flaper87): Eventually, we want this to be assertTrue
-                    # The current issue is there's no way to tell taskflow to
-                    # continue on failures. That is, revert the subflow but
-                    # keep executing the parent flow. Under
-                    # discussion/development.
-                    self.assertFalse(os.path.exists(image_path))
+            with mock.patch.object(import_flow,
+                                   "_get_import_flows") as imock:
+                imock.return_value = (x for x in [_ErrorTask()])
+                self.assertRaises(RuntimeError,
+                                  executor.begin_processing,
+                                  self.task.task_id)
+
+                image_path = os.path.join(self.test_dir,
+                                          self.image.image_id)
+                tmp_image_path = os.path.join(self.work_dir,
+                                              ("%s.tasks_import" %
+                                               image_path))
+                self.assertFalse(os.path.exists(tmp_image_path))
+
+                # NOTE(flaper87): Eventually, we want this to be assertTrue
+                # The current issue is there's no way to tell taskflow to
+                # continue on failures. That is, revert the subflow but
+                # keep executing the parent flow. Under
+                # discussion/development.
+                self.assertFalse(os.path.exists(image_path))
 
     def test_import_flow_no_import_flows(self):
         self.config(engine_mode='serial',
@@ -335,6 +351,133 @@ class TestImportTask(test_utils.BaseTestCase):
                 with open(image_path, 'rb') as ifile:
                     self.assertEqual(content, ifile.read())
 
+    def test_import_flow_streaming(self):
+        self.config(engine_mode='serial', group='taskflow_executor')
+        self.config(stream_import=True, group='task')
+
+        img_factory = mock.MagicMock()
+
+        executor = taskflow_executor.TaskExecutor(
+            self.context,
+            self.task_repo,
+            self.img_repo,
+            img_factory)
+
+        self.task_repo.get.return_value = self.task
+
+        def create_image(*args, **kwargs):
+            kwargs['image_id'] = UUID1
+            return self.img_factory.new_image(*args, **kwargs)
+
+        self.img_repo.get.return_value = self.image
+        img_factory.new_image.side_effect = create_image
+
+        with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
+            content = _qcow2(virtual_size=1024)
+            dmock.return_value = six.BytesIO(content)
+
+            with mock.patch.object(import_flow._ImportToFS,
+                                   'execute') as emock:
+                executor.begin_processing(self.task.task_id)
+                self.assertFalse(emock.called)
+
+            self.assertEqual([], os.listdir(self.work_dir))
+            image_path = os.path.join(self.test_dir, self.image.image_id)
+            with open(image_path, 'rb') as ifile:
+                self.assertEqual(content, ifile.read())
+            self.assertEqual('qcow2', self.image.disk_format)
+            self.assertEqual(1024, self.image.virtual_size)
+            self.assertEqual(len(content), self.image.size)
+            self.assertIsNotNone(self.image.checksum)
+            self.assertEqual('active', self.image.status)
+
+    def test_import_flow_streaming_backing_file(self):
+        self._test_import_flow_streaming_backing_file(
+            _qcow2(backing_file=b'/etc/password'))
+
+    def test_import_flow_streaming_qed_backing_file(self):
+        self._test_import_flow_streaming_backing_file(
+            _qed(backing_file=b'/etc/password'))
+
+    def _test_import_flow_streaming_backing_file(self, content):
+        self.config(engine_mode='serial', group='taskflow_executor')
+        self.config(stream_import=True, group='task')
+
+        img_factory = mock.MagicMock()
+
+        executor = taskflow_executor.TaskExecutor(
+            self.context,
+            self.task_repo,
+            self.img_repo,
+            img_factory)
+
+        self.task_repo.get.return_value = self.task
+
+        def create_image(*args, **kwargs):
+            kwargs['image_id'] = UUID1
+            return self.img_factory.new_image(*args, **kwargs)
+
+        self.img_repo.get.return_value = self.image
+        img_factory.new_image.side_effect = create_image
+
+        with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
+            dmock.return_value = six.BytesIO(content)
+
+            self.assertRaises(RuntimeError,
+                              executor.begin_processing,
+                              self.task.task_id)
+
+            image_path = os.path.join(self.test_dir, self.image.image_id)
+            self.assertFalse(os.path.exists(image_path))
+            self.assertEqual([], os.listdir(self.work_dir))
+
+    def test_stream_import(self):
+        self.task_repo.get.return_value = self.task
+        self.assertFalse(import_flow._stream_import(self.task_repo,
+                                                    self.task.task_id))
+
+        self.config(stream_import=True, group='task')
+        self.assertTrue(import_flow._stream_import(self.task_repo,
+                                                   self.task.task_id))
+
+        self.config(conversion_format='raw', group='taskflow_executor')
+        self.assertFalse(import_flow._stream_import(self.task_repo,
+                                                    self.task.task_id))
+
+        self.config(conversion_format=None, group='taskflow_executor')
+        self.task.task_input['image_properties']['container_format'] = 'ova'
+        self.assertTrue(import_flow._stream_import(self.task_repo,
+                                                   self.task.task_id))
+
+        self.task_repo.get.return_value = None
+        self.assertFalse(import_flow._stream_import(self.task_repo,
+                                                    self.task.task_id))
+
+    def test_stream_to_store_inspects_head(self):
+        stream = import_flow._StreamToStore(self.task.task_id,
+                                            self.task_type,
+                                            self.img_repo,
+                                            'http://example.com/image.raw')
+        image = mock.MagicMock(size=12)
+        self.img_repo.get.return_value = image
+
+        with mock.patch.object(format_inspector, 'HEAD_SIZE', 6):
+            with mock.patch.object(script_utils,
+                                   'get_image_data_iter') as dmock:
+                dmock.return_value = [b"abcd", b"efgh", b"ijkl"]
+
+                inspect_head = mock.patch.object(
+                    format_inspector, 'inspect_head',
+                    wraps=format_inspector.inspect_head)
+                with inspect_head as imock:
+                    stream.execute(UUID1)
+
+        imock.assert_called_once_with(b"abcdefgh")
+        self.assertEqual(b"abcdefghijkl",
+                         b"".join(image.set_data.call_args[0][0]))
+        self.assertEqual('raw', image.disk_format)
+        self.assertEqual(12, image.virtual_size)
+
     def test_create_image(self):
         image_create = import_flow._CreateImage(self.task.task_id,
                                                 self.task_type,
@@ -379,20 +522,83 @@ class TestImportTask(test_utils.BaseTestCase):
             content = b"test"
             dmock.return_value = [content]
 
-            with mock.patch.object(putils, 'trycmd') as tmock:
-                tmock.return_value = (json.dumps({
-                    'format': 'qcow2',
-                }), None)
+            image_id = UUID1
+            path = import_fs.execute(image_id)
+            reader, size = glance_store.get_from_backend(path)
+            self.assertEqual(4, size)
+            self.assertEqual(content, b"".join(reader))
+
+            image_path = os.path.join(self.work_dir, image_id)
+            tmp_image_path = os.path.join(self.work_dir, image_path)
+            self.assertTrue(os.path.exists(tmp_image_path))
+
+    def test_import_to_fs_ova(self):
+        import_fs = import_flow._ImportToFS(self.task.task_id,
+                                            self.task_type,
+                                            self.task_repo,
+                                            'http://example.com/image.ova',
+                                            self.img_repo)
+        self.img_repo.get.return_value = mock.MagicMock(container_format='ova')
+
+        with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
+            dmock.return_value = [b"package"]
+            with mock.patch.object(ovf_process, 'extract_disk') as emock:
+                emock.return_value = six.BytesIO(b"disk")
+                path = import_fs.execute(UUID1)
+
+        emock.assert_called_once_with(self.img_repo, UUID1, [b"package"])
+        reader, size = glance_store.get_from_backend(path)
+        self.assertEqual(b"disk", b"".join(reader))
 
-                image_id = UUID1
-                path = import_fs.execute(image_id)
-                reader, size = glance_store.get_from_backend(path)
-                self.assertEqual(4, size)
-                self.assertEqual(content, b"".join(reader))
+    def _test_stream_to_store(self, content):
+        stream = import_flow._StreamToStore(self.task.task_id,
+                                            self.task_type,
+                                            self.img_repo,
+                                            'http://example.com/image')
+        self.img_repo.get.return_value = self.image
+
+        with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
+            dmock.return_value = six.BytesIO(content)
+            stream.execute(UUID1)
+
+        image_path = os.path.join(self.test_dir, self.image.image_id)
+        with open(image_path, 'rb') as ifile:
+            self.assertEqual(content, ifile.read())
+        self.assertEqual('active', self.image.status)
+        self.img_repo.save.assert_called_with(self.image)
+
+    def test_stream_to_store_sets_format(self):
+        self._test_stream_to_store(_qcow2(virtual_size=1024))
+        self.assertEqual('qcow2', self.image.disk_format)
+        self.assertEqual(1024, self.image.virtual_size)
+
+    def test_stream_to_store_raw(self):
+        self._test_stream_to_store(b'\x01' * 4096)
+        self.assertEqual('raw', self.image.disk_format)
+        self.assertEqual(4096, self.image.virtual_size)
+
+    def test_stream_to_store_fixed_vhd(self):
+        self._test_stream_to_store(b'\x01' * 1024 + _vhd_footer(1024))
+        self.assertEqual('vhd', self.image.disk_format)
+        self.assertEqual(1024, self.image.virtual_size)
+
+    def test_stream_to_store_ova(self):
+        stream = import_flow._StreamToStore(self.task.task_id,
+                                            self.task_type,
+                                            self.img_repo,
+                                            'http://example.com/image.ova')
+        image = mock.MagicMock(container_format='ova', size=4)
+        self.img_repo.get.return_value = image
 
-                image_path = os.path.join(self.work_dir, image_id)
-                tmp_image_path = os.path.join(self.work_dir, image_path)
-                self.assertTrue(os.path.exists(tmp_image_path))
+        with mock.patch.object(script_utils, 'get_image_data_iter') as dmock:
+            dmock.return_value = [b"package"]
+            with mock.patch.object(ovf_process, 'extract_disk') as emock:
+                emock.return_value = six.BytesIO(b"disk")
+                stream.execute(UUID1)
+
+        emock.assert_called_once_with(self.img_repo, UUID1, [b"package"])
+        self.assertEqual(b"disk", b"".join(image.set_data.call_args[0][0]))
+        self.assertEqual('raw', image.disk_format)
 
     def test_delete_from_fs(self):
         delete_fs = import_flow._DeleteFromFS(self.task.task_id,
@@ -13,11 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
 import mock
+import os
+import struct
 
 import glance_store
-from oslo_concurrency import processutils
 from oslo_config import cfg
 
 from xmonitor.async.flows import introspect
@@ -59,6 +59,12 @@ class TestImportTask(test_utils.BaseTestCase):
                     group="glance_store")
         glance_store.create_stores(CONF)
 
+    def _image_file(self, data):
+        path = os.path.join(self.test_dir, 'image')
+        with open(path, 'wb') as image_file:
+            image_file.write(data)
+        return 'file://' + path
+
     def test_introspect_success(self):
         image_create = introspect._Introspect(self.task.task_id,
                                               self.task_type,
@@ -69,25 +75,12 @@ class TestImportTask(test_utils.BaseTestCase):
         image = mock.MagicMock(image_id=image_id)
         self.img_repo.get.return_value = image
 
-        with mock.patch.object(processutils, 'execute') as exc_mock:
-            result = json.dumps({
-                "virtual-size": 10737418240,
-                "filename": "/tmp/image.qcow2",
-                "cluster-size": 65536,
-                "format": "qcow2",
-                "actual-size": 373030912,
-                "format-specific": {
-                    "type": "qcow2",
-                    "data": {
-                        "compat": "0.10"
-                    }
-                },
-                "dirty-flag": False
-            })
-
-            exc_mock.return_value = (result, None)
-            image_create.execute(image, '/test/path.qcow2')
-            self.assertEqual(10737418240, image.virtual_size)
+        path = self._image_file(b'QFI\xfb' +
+                                struct.pack('>IQIIQ', 2, 0, 0, 16,
+                                            10737418240))
+        image_create.execute(image, path)
+        self.assertEqual(10737418240, image.virtual_size)
+        self.assertEqual('qcow2', image.disk_format)
 
     def test_introspect_no_image(self):
         image_create = introspect._Introspect(self.task.task_id,
@@ -99,13 +92,11 @@ class TestImportTask(test_utils.BaseTestCase):
         image = mock.MagicMock(image_id=image_id, virtual_size=None)
         self.img_repo.get.return_value = image
 
-        # NOTE(flaper87): Don't mock, test the error.
-        with mock.patch.object(processutils, 'execute') as exc_mock:
-            exc_mock.return_value = (None, "some error")
-            # NOTE(flaper87): Pls, read the `OptionalTask._catch_all`
-            # docs to know why this is commented.
-            # self.assertRaises(RuntimeError,
-            #                  image_create.execute,
-            #                  image, '/test/path.qcow2')
-            image_create.execute(image, '/test/path.qcow2')
-            self.assertIsNone(image.virtual_size)
+        # NOTE(flaper87): Pls, read the `OptionalTask._catch_all`
+        # docs to know why this is commented.
+        # self.assertRaises(exception.InvalidImageFormat,
+        #                  image_create.execute,
+        #                  image, '/test/path.qcow2')
+        path = self._image_file(b'QFI\xfb')
+        image_create.execute(image, path)
+        self.assertIsNone(image.virtual_size)
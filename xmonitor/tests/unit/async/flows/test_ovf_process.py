@@ -135,6 +135,34 @@ class TestOvfProcessTask(test_utils.BaseTestCase):
         self.assertRaises(RuntimeError, oprocess.execute, 'test_image_id',
                           ova_uri)
 
+    @mock.patch.object(cfg.ConfigOpts, 'find_file')
+    def test_extract_ova_streamed(self, mock_find_file):
+        mock_find_file.return_value = self.config_file_name
+
+        ova_file_path = os.path.join(self.test_ova_dir, 'testserver.ova')
+        with open(ova_file_path, 'rb') as ova_file:
+            # Chunks of the package as they would be downloaded
+            chunks = iter(lambda: ova_file.read(1000), b'')
+
+            iextractor = ovf_process.OVAImageExtractor()
+            disk, properties = iextractor.extract(chunks)
+            self.assertEqual(b'ABCD', disk.read())
+        self.assertEqual(
+            {'cim_pasd_InstructionSetExtensionName': 'DMTF:x86:VT-d'},
+            properties)
+
+    @mock.patch.object(cfg.ConfigOpts, 'find_file')
+    def test_extract_disk(self, mock_find_file):
+        mock_find_file.return_value = self.config_file_name
+
+        ova_file_path = os.path.join(self.test_ova_dir, 'testserver.ova')
+        with open(ova_file_path, 'rb') as ova_file:
+            disk = ovf_process.extract_disk(self.img_repo, 'test_image_id',
+                                            ova_file)
+            self.assertEqual(b'ABCD', disk.read())
+        self.assertEqual('bare', self.image.container_format)
+        self.img_repo.save.assert_called_once_with(self.image)
+
     def test_extract_ova_not_tar(self):
         # testserver-not-tar.ova package is not in tar format
         ova_file_path = os.path.join(self.test_ova_dir,
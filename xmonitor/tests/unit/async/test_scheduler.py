@@ -0,0 +1,121 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+import mock
+
+from xmonitor.async import scheduler
+import xmonitor.tests.utils as test_utils
+
+
+class TestTaskScheduler(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestTaskScheduler, self).setUp()
+        self.scheduler = scheduler.TaskScheduler(1, 10)
+        self.started = []
+        self.threads = []
+
+    def _task(self, name, owner, priority=scheduler.NORMAL_PRIORITY):
+        def run():
+            self.scheduler.acquire(owner, priority)
+            self.started.append(name)
+            self.scheduler.release()
+
+        queued = self.scheduler.queued
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        # Queued in the order the tasks are created
+        while self.scheduler.queued == queued:
+            time.sleep(0.01)
+
+    def _run_queued(self):
+        self.scheduler.release()
+        for thread in self.threads:
+            thread.join()
+
+    def test_run_at_once(self):
+        self.assertEqual(0.0, self.scheduler.acquire('tenant1'))
+        self.assertEqual(1, self.scheduler.running)
+        self.scheduler.release()
+        self.assertEqual(0, self.scheduler.running)
+
+    def test_owners_take_turns(self):
+        self.scheduler.acquire('tenant1')
+        self._task('a1', 'tenant1')
+        self._task('a2', 'tenant1')
+        self._task('a3', 'tenant1')
+        self._task('b1', 'tenant2')
+        self._task('b2', 'tenant2')
+        self.assertEqual(5, self.scheduler.queued)
+
+        self._run_queued()
+        self.assertEqual(['a1', 'b1', 'a2', 'b2', 'a3'], self.started)
+        self.assertEqual(0, self.scheduler.queued)
+        self.assertEqual(0, self.scheduler.running)
+
+    def test_priority(self):
+        self.scheduler.acquire('tenant1')
+        self._task('a1', 'tenant1')
+        self._task('admin', 'admin', scheduler.HIGH_PRIORITY)
+        self._task('b1', 'tenant2')
+
+        self._run_queued()
+        self.assertEqual(['admin', 'a1', 'b1'], self.started)
+
+    def test_queue_full(self):
+        self.scheduler = scheduler.TaskScheduler(1, 0)
+        self.scheduler.acquire('tenant1')
+        self.assertRaises(scheduler.TaskQueueFull,
+                          self.scheduler.acquire, 'tenant2')
+        self.assertEqual(1, self.scheduler.running)
+        self.assertEqual(0, self.scheduler.queued)
+
+    def test_stats(self):
+        self.scheduler.record('ImportToFS', 2.0)
+        self.scheduler.record('ImportToFS', 4.0)
+        self.scheduler.record('SaveImage', 0.5)
+        self.assertEqual({'running': 0, 'queued': 0,
+                          'stages': {'ImportToFS': {'count': 2,
+                                                    'average': 3.0,
+                                                    'max': 4.0},
+                                     'SaveImage': {'count': 1,
+                                                   'average': 0.5,
+                                                   'max': 0.5}}},
+                         self.scheduler.stats())
+
+    @mock.patch.object(scheduler, '_scheduler', None)
+    def test_scheduler_per_process(self):
+        self.config(max_concurrent_tasks=2, group='taskflow_executor')
+        task_scheduler = scheduler.get_scheduler()
+        self.assertIs(task_scheduler, scheduler.get_scheduler())
+        self.assertEqual(2, task_scheduler.size)
+
+        with mock.patch.object(scheduler.os, 'getpid', return_value=-1):
+            self.assertIsNot(task_scheduler, scheduler.get_scheduler())
+
+    def test_healthcheck(self):
+        self.scheduler.acquire('tenant1')
+        self.scheduler.record('ImportToFS', 2.0)
+        healthcheck = scheduler.TaskSchedulerHealthcheck({})
+        with mock.patch.object(scheduler, 'get_scheduler',
+                               return_value=self.scheduler):
+            result = healthcheck.healthcheck(9292)
+        self.assertTrue(result.available)
+        self.assertEqual(self.scheduler.stats(), result.details)
+        self.assertEqual(1, result.details['running'])
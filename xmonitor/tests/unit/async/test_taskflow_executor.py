@@ -18,7 +18,10 @@ import mock
 import glance_store
 from oslo_config import cfg
 from taskflow import engines
+from taskflow.patterns import linear_flow
+from taskflow import task
 
+from xmonitor.async import scheduler
 from xmonitor.async import taskflow_executor
 from xmonitor import domain
 import xmonitor.tests.utils as test_utils
@@ -28,6 +31,12 @@ CONF = cfg.CONF
 TENANT1 = '6838eb7b-6ded-434a-882c-b344c77fe8df'
 
 
+class _Stage(task.Task):
+
+    def execute(self):
+        pass
+
+
 class TestTaskExecutor(test_utils.BaseTestCase):
 
     def setUp(self):
@@ -89,3 +98,69 @@ class TestTaskExecutor(test_utils.BaseTestCase):
                               self.task.task_id)
         self.assertEqual('failure', self.task.status)
         self.task_repo.save.assert_called_with(self.task)
+
+    def test_queue_full(self):
+        task_scheduler = scheduler.TaskScheduler(1, 0)
+        task_scheduler.acquire('tenant1')
+        with mock.patch.object(scheduler, 'get_scheduler',
+                               return_value=task_scheduler):
+            with mock.patch.object(engines, 'load') as load_mock:
+                self.task_repo.get.return_value = self.task
+                self.executor.begin_processing(self.task.task_id)
+
+        self.assertFalse(load_mock.called)
+        self.assertEqual('failure', self.task.status)
+        self.task_repo.save.assert_called_with(self.task)
+
+    def test_pending_until_run(self):
+        task_scheduler = scheduler.TaskScheduler(1, 0)
+        statuses = []
+
+        def acquire(owner, priority):
+            statuses.append(self.task.status)
+            return 0.0
+
+        with mock.patch.object(scheduler, 'get_scheduler',
+                               return_value=task_scheduler):
+            with mock.patch.object(task_scheduler, 'acquire',
+                                   side_effect=acquire):
+                with mock.patch.object(self.executor, '_get_flow'):
+                    with mock.patch.object(engines, 'load') as load_mock:
+                        engine = load_mock.return_value
+                        engine.run.side_effect = (
+                            lambda: statuses.append(self.task.status))
+                        self.task_repo.get.return_value = self.task
+                        self.executor.begin_processing(self.task.task_id)
+
+        self.assertEqual(['pending', 'processing'], statuses)
+        self.task_repo.save.assert_called_once_with(self.task)
+
+    def test_executor_fail(self):
+        task_scheduler = scheduler.TaskScheduler(1, 0)
+        with mock.patch.object(scheduler, 'get_scheduler',
+                               return_value=task_scheduler):
+            with mock.patch.object(self.executor, '_fetch_an_executor',
+                                   side_effect=RuntimeError):
+                self.task_repo.get.return_value = self.task
+                self.assertRaises(RuntimeError,
+                                  self.executor.begin_processing,
+                                  self.task.task_id)
+
+        self.assertEqual('failure', self.task.status)
+        self.assertEqual(0, task_scheduler.running)
+
+    def test_stage_timings(self):
+        task_scheduler = scheduler.TaskScheduler(1, 0)
+        with mock.patch.object(scheduler, 'get_scheduler',
+                               return_value=task_scheduler):
+            self.task_repo.get.return_value = self.task
+            with mock.patch.object(taskflow_executor.TaskExecutor,
+                                   '_get_flow') as flow_mock:
+                flow_mock.return_value = linear_flow.Flow('import').add(
+                    _Stage('import-Stage-%s' % self.task.task_id))
+                self.executor.begin_processing(self.task.task_id)
+
+        stages = task_scheduler.stats()['stages']
+        self.assertEqual(['Stage'], list(stages))
+        self.assertEqual(1, stages['Stage']['count'])
+        self.assertEqual(0, task_scheduler.running)
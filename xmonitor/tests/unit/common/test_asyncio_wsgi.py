@@ -0,0 +1,360 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import socket
+import tempfile
+import threading
+
+import mock
+from oslo_config import cfg
+import six
+from six.moves import http_client
+import testtools
+
+from xmonitor.tests import utils as test_utils
+
+if six.PY3:
+    import asyncio
+    import concurrent.futures
+
+    from xmonitor.common import asyncio_wsgi
+
+
+def application(environ, start_response):
+    path = environ['PATH_INFO']
+    if path == '/upload':
+        size = 0
+        while True:
+            data = environ['wsgi.input'].read(65536)
+            if not data:
+                break
+            size += len(data)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [str(size).encode('ascii')]
+    if path == '/stream':
+        start_response('200 OK', [('Content-Type',
+                                   'application/octet-stream')])
+        return (b'x' * 65536 for _ in range(16))
+    if path == '/file':
+        start_response('200 OK', [('Content-Type',
+                                   'application/octet-stream')])
+        return environ['wsgi.file_wrapper'](open(environ['QUERY_STRING'],
+                                                 'rb'))
+    if path == '/error':
+        raise ValueError()
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [b'{"images": []}']
+
+
+@testtools.skipIf(six.PY2, 'asyncio is not available on Python 2')
+class RequestBodyTest(test_utils.BaseTestCase):
+
+    def _body(self, *chunks, **kwargs):
+        body = asyncio_wsgi.RequestBody(mock.Mock(), mock.Mock(), **kwargs)
+        for chunk in chunks:
+            body.feed(chunk)
+        body.feed_eof()
+        return body
+
+    def test_read(self):
+        body = self._body(b'abc', b'def', b'gh')
+        self.assertEqual(b'ab', body.read(2))
+        self.assertEqual(b'cde', body.read(3))
+        self.assertEqual(b'fgh', body.read())
+        self.assertEqual(b'', body.read())
+
+    def test_readline(self):
+        body = self._body(b'first\nsec', b'ond\nthird')
+        self.assertEqual([b'first\n', b'second\n', b'third'], list(body))
+
+    def test_readline_size(self):
+        body = self._body(b'first\n')
+        self.assertEqual(b'fir', body.readline(3))
+        self.assertEqual(b'st\n', body.readline())
+
+    def test_pause_and_resume(self):
+        pause = mock.Mock()
+        resume = mock.Mock()
+        body = asyncio_wsgi.RequestBody(pause, resume)
+        body.feed(b'x' * asyncio_wsgi.READ_BUFFER_SIZE)
+        self.assertFalse(pause.called)
+        body.feed(b'x')
+        pause.assert_called_once_with()
+        body.read(asyncio_wsgi.READ_BUFFER_SIZE // 2 + 1)
+        resume.assert_called_once_with()
+
+    def test_expect_continue(self):
+        expect_continue = mock.Mock()
+        body = self._body(b'data', expect_continue=expect_continue)
+        body.read(2)
+        body.read()
+        expect_continue.assert_called_once_with()
+
+
+@testtools.skipIf(six.PY2, 'asyncio is not available on Python 2')
+class HttpProtocolTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(HttpProtocolTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(4)
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(16)
+        self.port = sock.getsockname()[1]
+        self.service = asyncio_wsgi.Service(
+            self.loop, executor, application, mock.Mock(), 'http',
+            '127.0.0.1', self.port)
+        self.service.server = self.loop.run_until_complete(
+            self.loop.create_server(
+                lambda: asyncio_wsgi.HttpProtocol(self.service), sock=sock))
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(self.loop.close)
+        self.addCleanup(self._stop)
+
+    def _stop(self):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.service.abort()
+
+    def _connection(self):
+        conn = http_client.HTTPConnection('127.0.0.1', self.port)
+        self.addCleanup(conn.close)
+        return conn
+
+    def _raw(self, data):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(sock.close)
+        sock.sendall(data)
+        received = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return received
+            received += chunk
+
+    def test_keep_alive(self):
+        conn = self._connection()
+        for path in ('/v2/images', '/stream', '/v2/images'):
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            self.assertEqual(200, response.status)
+        self.assertEqual(1, len(self.service.connections))
+
+    def test_content_length(self):
+        conn = self._connection()
+        conn.request('GET', '/v2/images')
+        response = conn.getresponse()
+        self.assertEqual('14', response.getheader('Content-Length'))
+        self.assertEqual(b'{"images": []}', response.read())
+
+    def test_chunked_response(self):
+        conn = self._connection()
+        conn.request('GET', '/stream')
+        response = conn.getresponse()
+        self.assertEqual('chunked', response.getheader('Transfer-Encoding'))
+        self.assertEqual(16 * 65536, len(response.read()))
+
+    def test_head(self):
+        conn = self._connection()
+        conn.request('HEAD', '/stream')
+        response = conn.getresponse()
+        self.assertEqual(200, response.status)
+        self.assertEqual(b'', response.read())
+
+    def test_file(self):
+        data = b'image data' * 1000
+        with tempfile.NamedTemporaryFile() as image:
+            image.write(data)
+            image.flush()
+            conn = self._connection()
+            conn.request('GET', '/file?' + image.name)
+            response = conn.getresponse()
+            self.assertEqual(str(len(data)),
+                             response.getheader('Content-Length'))
+            self.assertEqual(data, response.read())
+
+    def test_upload(self):
+        conn = self._connection()
+        conn.request('PUT', '/upload', body=b'x' * (3 * 1024 * 1024))
+        self.assertEqual(b'3145728', conn.getresponse().read())
+
+    def test_chunked_upload(self):
+        received = self._raw(b'PUT /upload HTTP/1.1\r\n'
+                             b'Transfer-Encoding: chunked\r\n'
+                             b'Connection: close\r\n\r\n'
+                             b'5\r\nhello\r\n6;ext=1\r\n world\r\n'
+                             b'0\r\n\r\n')
+        self.assertTrue(received.startswith(b'HTTP/1.1 200 OK'))
+        self.assertTrue(received.endswith(b'\r\n\r\n11'))
+
+    def test_expect_continue(self):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(sock.close)
+        sock.sendall(b'PUT /upload HTTP/1.1\r\nContent-Length: 4\r\n'
+                     b'Expect: 100-continue\r\n\r\n')
+        self.assertEqual(b'HTTP/1.1 100 Continue\r\n\r\n', sock.recv(25))
+        sock.sendall(b'data')
+        self.assertTrue(sock.recv(65536).startswith(b'HTTP/1.1 200 OK'))
+
+    def test_pipelined(self):
+        received = self._raw(b'GET /v2/images HTTP/1.1\r\n\r\n'
+                             b'GET /v2/images HTTP/1.1\r\n'
+                             b'Connection: close\r\n\r\n')
+        self.assertEqual(2, received.count(b'HTTP/1.1 200 OK'))
+
+    def test_error(self):
+        conn = self._connection()
+        conn.request('GET', '/error')
+        response = conn.getresponse()
+        self.assertEqual(500, response.status)
+        self.assertEqual('close', response.getheader('Connection'))
+
+    def test_bad_request(self):
+        received = self._raw(b'garbage\r\n\r\n')
+        self.assertTrue(received.startswith(b'HTTP/1.1 400 Bad Request'))
+
+    def test_headers_too_large(self):
+        self.config(max_header_line=100)
+        received = self._raw(b'GET / HTTP/1.1\r\nX-Auth-Token: ' +
+                             b'x' * 200 + b'\r\n\r\n')
+        self.assertTrue(received.startswith(b'HTTP/1.1 431'))
+
+    def test_environ(self):
+        environs = []
+
+        def app(environ, start_response):
+            environs.append(environ)
+            start_response('204 No Content', [])
+            return []
+
+        self.service.application = app
+        conn = self._connection()
+        conn.request('GET', '/v2/images%20x?limit=1',
+                     headers={'X-Auth-Token': 'token',
+                              'Content-Type': 'application/json'})
+        self.assertEqual(204, conn.getresponse().status)
+        environ = environs[0]
+        self.assertEqual('GET', environ['REQUEST_METHOD'])
+        self.assertEqual('/v2/images x', environ['PATH_INFO'])
+        self.assertEqual('limit=1', environ['QUERY_STRING'])
+        self.assertEqual('token', environ['HTTP_X_AUTH_TOKEN'])
+        self.assertEqual('application/json', environ['CONTENT_TYPE'])
+        self.assertEqual('http', environ['wsgi.url_scheme'])
+        self.assertTrue(environ['wsgi.multithread'])
+
+    def test_stop(self):
+        conn = self._connection()
+        conn.request('GET', '/v2/images')
+        conn.getresponse().read()
+        self.loop.call_soon_threadsafe(self.service.stop)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+
+@testtools.skipIf(six.PY2, 'asyncio is not available on Python 2')
+class ServerTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        cfg.CONF.import_opt('engine_mode', 'xmonitor.async.taskflow_executor',
+                            group='taskflow_executor')
+        self.config(engine_mode='serial', group='taskflow_executor')
+        self.config(enable_v1_api=False)
+
+    def test_admission_control(self):
+        self.config(max_data_transfers_per_worker=1, admission_queue_size=1,
+                    admission_queue_timeout=10)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        server = asyncio_wsgi.Server(threads=4)
+        control = server._admission_control(mock.Mock())
+        self.assertIsInstance(control.data, asyncio_wsgi.AdmissionQueue)
+        self.assertIsInstance(control.metadata, asyncio_wsgi.AdmissionQueue)
+
+        self.assertTrue(control.data.acquire())
+        waiter = concurrent.futures.ThreadPoolExecutor(1)
+        self.addCleanup(waiter.shutdown)
+        second = waiter.submit(control.data.acquire)
+        self.assertRaises(concurrent.futures.TimeoutError, second.result,
+                          0.05)
+        control.data.release()
+        self.assertTrue(second.result(5))
+        self.assertEqual(2, control.data.admitted)
+        self.assertEqual(1, control.data.max_waiting)
+
+    def test_admission_timeout(self):
+        queue = asyncio_wsgi.AdmissionQueue('Metadata', 1, 1, 0.01)
+        self.assertTrue(queue.acquire())
+        self.assertFalse(queue.acquire())
+        self.assertEqual(1, queue.rejected)
+        self.assertEqual(0, queue.waiting)
+
+    @mock.patch('xmonitor.common.wsgi.Server.start')
+    def test_start(self, mock_start):
+        server = asyncio_wsgi.Server()
+        server.start(mock.sentinel.application, 9292)
+        mock_start.assert_called_once_with(mock.sentinel.application, 9292)
+
+    @mock.patch('xmonitor.common.wsgi.Server.start')
+    def test_start_unsupported(self, mock_start):
+        for group, name, value in (('task', 'work_dir', '/tmp'),
+                                   ('taskflow_executor', 'engine_mode',
+                                    'parallel'),
+                                   (None, 'enable_v1_api', True)):
+            self.config(**{name: value, 'group': group})
+            server = asyncio_wsgi.Server()
+            self.assertRaises(RuntimeError, server.start, mock.Mock(), 9292)
+        self.assertFalse(mock_start.called)
+
+    def test_terminate(self):
+        loop = mock.Mock()
+        service = mock.Mock()
+        server = asyncio_wsgi.Server()
+        server._terminate(loop, service)
+        loop.remove_signal_handler.assert_called_once_with(
+            asyncio_wsgi.signal.SIGTERM)
+        service.stop.assert_called_once_with()
+        loop.run_in_executor.assert_called_once_with(
+            None, server._flush_and_exit)
+
+    @mock.patch('os.kill')
+    @mock.patch('xmonitor.notifier.flush_queue')
+    def test_flush_and_exit(self, mock_flush_queue, mock_kill):
+        asyncio_wsgi.Server._flush_and_exit()
+        mock_flush_queue.assert_called_once_with()
+        mock_kill.assert_called_once_with(os.getpid(),
+                                          asyncio_wsgi.signal.SIGTERM)
+
+    @mock.patch('xmonitor.common.asyncio_wsgi.Server._terminate_child')
+    def test_child_terminating(self, mock_terminate_child):
+        asyncio_wsgi.Server()._child_terminating()
+        mock_terminate_child.assert_called_once_with()
+
+    @mock.patch('xmonitor.common.asyncio_wsgi.Server.run_server')
+    def test_single_process(self, mock_run_server):
+        self.config(workers=0)
+        server = asyncio_wsgi.Server()
+        server.start_wsgi()
+        self.assertFalse(mock_run_server.called)
+        server.wait()
+        mock_run_server.assert_called_once_with()
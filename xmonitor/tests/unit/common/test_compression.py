@@ -0,0 +1,171 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gzip
+import os
+import struct
+import zlib
+
+import six
+
+from xmonitor.common import compression
+from xmonitor.common import format_inspector
+from xmonitor.tests import utils as test_utils
+
+
+def _gunzip(chunks):
+    return gzip.GzipFile(fileobj=six.BytesIO(b''.join(chunks))).read()
+
+
+class ClosingIter(object):
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    next = __next__
+
+    def close(self):
+        self.closed = True
+
+
+class TestGzipIter(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestGzipIter, self).setUp()
+        self.data = b''.join(b'%06d ' % i for i in range(40000))
+
+    def _chunks(self, size=4096):
+        return [self.data[i:i + size]
+                for i in range(0, len(self.data), size)]
+
+    def test_gzip_iter(self):
+        compressed = list(compression.gzip_iter(self._chunks(), workers=0,
+                                                block_size=64 * 1024))
+        self.assertEqual(self.data, _gunzip(compressed))
+        self.assertLess(len(b''.join(compressed)), len(self.data))
+
+    def test_gzip_iter_workers(self):
+        compressed = list(compression.gzip_iter(self._chunks(), workers=3,
+                                                block_size=64 * 1024))
+        self.assertEqual(self.data, _gunzip(compressed))
+
+    def test_gzip_iter_uneven_chunks(self):
+        for size in (1, 1000, 64 * 1024, 100 * 1024, len(self.data)):
+            compressed = compression.gzip_iter(self._chunks(size),
+                                               workers=2,
+                                               block_size=64 * 1024)
+            self.assertEqual(self.data, _gunzip(compressed))
+
+    def test_gzip_iter_empty(self):
+        self.assertEqual(b'', _gunzip(compression.gzip_iter([], workers=2)))
+
+    def test_gzip_iter_defaults(self):
+        self.config(gzip_workers=2, gzip_block_size=64 * 1024, gzip_level=1)
+        compressed = list(compression.gzip_iter(self._chunks()))
+        self.assertEqual(self.data, _gunzip(compressed))
+
+    def test_gzip_iter_trailer(self):
+        compressed = b''.join(compression.gzip_iter(self._chunks(),
+                                                    workers=2))
+        crc, size = struct.unpack('<II', compressed[-8:])
+        self.assertEqual(zlib.crc32(self.data) & 0xffffffff, crc)
+        self.assertEqual(len(self.data), size)
+
+    def test_gzip_iter_closes(self):
+        chunks = ClosingIter(self._chunks())
+        compressed = compression.gzip_iter(chunks, workers=2,
+                                           block_size=64 * 1024)
+        next(compressed)
+        next(compressed)
+        compressed.close()
+        self.assertTrue(chunks.closed)
+
+
+class TestIsCompressed(test_utils.BaseTestCase):
+
+    def test_compressible(self):
+        self.assertFalse(compression.is_compressed(b'\0' * 1024 * 1024))
+        self.assertFalse(compression.is_compressed(
+            b''.join(b'%06d ' % i for i in range(1000))))
+
+    def test_random(self):
+        self.assertTrue(compression.is_compressed(os.urandom(64 * 1024)))
+
+    def test_signatures(self):
+        for head in (b'\x1f\x8b\x08\x00', b'BZh91AY&SY', b'\xfd7zXZ\x00\x00',
+                     b'PK\x03\x04', b'\x28\xb5\x2f\xfd'):
+            self.assertTrue(compression.is_compressed(head + b'\0' * 4096))
+
+    def test_iso(self):
+        head = bytearray(64 * 1024)
+        offset = format_inspector.ISO_VOLUME_DESCRIPTOR + 1
+        head[offset:offset + 5] = format_inspector.ISO_SIGNATURE
+        self.assertTrue(compression.is_compressed(bytes(head)))
+
+    def _qcow2(self, l2_entry):
+        cluster_bits = 16
+        cluster_size = 1 << cluster_bits
+        head = bytearray(4 * cluster_size)
+        head[:4] = format_inspector.QCOW2_MAGIC
+        struct.pack_into('>I', head, 20, cluster_bits)
+        # NOTE: One L1 entry in the second cluster, pointing at an L2 table
+        # in the third
+        struct.pack_into('>IQ', head, 36, 1, cluster_size)
+        struct.pack_into('>Q', head, cluster_size,
+                         (1 << 63) | (2 * cluster_size))
+        struct.pack_into('>Q', head, 2 * cluster_size, l2_entry)
+        return bytes(head)
+
+    def test_qcow2(self):
+        self.assertFalse(compression.is_compressed(
+            self._qcow2((1 << 63) | (3 << 16))))
+
+    def test_qcow2_compressed(self):
+        self.assertTrue(compression.is_compressed(
+            self._qcow2((1 << 62) | (3 << 16))))
+
+    def test_qcow2_bad_header(self):
+        head = bytearray(self._qcow2((1 << 62) | (3 << 16)))
+        struct.pack_into('>IQ', head, 36, 1, len(head))
+        self.assertFalse(compression.is_compressed(bytes(head)))
+
+
+class TestPeek(test_utils.BaseTestCase):
+
+    def test_peek(self):
+        chunks = ClosingIter([b'ab', b'cd', b'ef'])
+        head, data = compression.peek(chunks, 3)
+        self.assertEqual(b'abc', head)
+        self.assertEqual([b'ab', b'cd', b'ef'], list(data))
+        self.assertTrue(chunks.closed)
+
+    def test_peek_short(self):
+        head, data = compression.peek([b'ab'], 3)
+        self.assertEqual(b'ab', head)
+        self.assertEqual([b'ab'], list(data))
+
+    def test_peek_close(self):
+        chunks = ClosingIter([b'ab', b'cd', b'ef'])
+        head, data = compression.peek(chunks, 3)
+        next(data)
+        data.close()
+        self.assertTrue(chunks.closed)
@@ -0,0 +1,235 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import struct
+
+from xmonitor.common import exception
+from xmonitor.common import format_inspector
+from xmonitor.tests import utils as test_utils
+
+GiB = 1024 * 1024 * 1024
+
+
+def _pad(data, size):
+    return data + b'\0' * (size - len(data))
+
+
+def qcow2(virtual_size=GiB, backing_file=b'', version=3):
+    backing_offset = 72 if backing_file else 0
+    header = b'QFI\xfb' + struct.pack('>IQIIQ', version, backing_offset,
+                                      len(backing_file), 16, virtual_size)
+    return _pad(header, 72) + backing_file
+
+
+def qed(virtual_size=GiB, backing_file=b''):
+    features = 1 if backing_file else 0
+    header = b'QED\0' + struct.pack('<IIIQQQQQII', 64 * 1024, 4, 1,
+                                     features, 0, 0, 4096, virtual_size,
+                                     64 if backing_file else 0,
+                                     len(backing_file))
+    return header + backing_file
+
+
+def vmdk(virtual_size=GiB, parent=None):
+    descriptor = b'# Disk DescriptorFile\nversion=1\n'
+    if parent:
+        descriptor += b'parentFileNameHint="' + parent + b'"\n'
+    header = b'KDMV' + struct.pack('<IIQQQQ', 1, 3, virtual_size // 512,
+                                   128, 1, 1)
+    return _pad(header, 512) + _pad(descriptor, 512)
+
+
+def vhd(virtual_size=GiB, parent=None):
+    footer = b'conectix' + struct.pack('>IIQ', 2, 0x10000, 512)
+    footer = _pad(footer, 48) + struct.pack(
+        '>QII', virtual_size, 0, 4 if parent else 3)
+    dynamic = _pad(b'cxsparse', 64)
+    if parent:
+        dynamic += parent.encode('utf-16-be')
+    return _pad(footer, 512) + _pad(dynamic, 1024)
+
+
+def vhdx(virtual_size=GiB, parent=None):
+    metadata_region = 1024 * 1024
+    region_table = _pad(b'regi' + struct.pack('<II', 0, 1), 16)
+    region_table += (format_inspector.VHDX_METADATA_REGION.bytes_le +
+                     struct.pack('<QII', metadata_region, 1024 * 1024, 1))
+
+    items = [(format_inspector.VHDX_VIRTUAL_DISK_SIZE,
+              struct.pack('<Q', virtual_size))]
+    if parent:
+        key = u'relative_path'.encode('utf-16-le')
+        value = parent.encode('utf-16-le')
+        locator = _pad(b'', 18) + struct.pack('<H', 1)
+        locator += struct.pack('<IIHH', 32, 32 + len(key), len(key),
+                               len(value))
+        items.append((format_inspector.VHDX_PARENT_LOCATOR,
+                      _pad(locator, 32) + key + value))
+
+    table = b'metadata' + struct.pack('<HH', 0, len(items))
+    table = _pad(table, 32)
+    data = b''
+    offset = 64 * 1024
+    for item, value in items:
+        table += item.bytes_le + struct.pack('<IIII', offset + len(data),
+                                             len(value), 0, 0)
+        data += value
+    metadata = _pad(table, 64 * 1024) + data
+
+    image = _pad(b'vhdxfile', format_inspector.VHDX_REGION_TABLE)
+    image = _pad(image + region_table, metadata_region)
+    return image + metadata
+
+
+def vdi(virtual_size=GiB, image_type=1):
+    header = _pad(b'<<< Oracle VM VirtualBox Disk Image >>>\n', 0x40)
+    header += struct.pack('<IIII', format_inspector.VDI_SIGNATURE,
+                          0x00010001, 0x190, image_type)
+    return _pad(header, 0x170) + struct.pack('<Q', virtual_size)
+
+
+def iso(blocks=1000):
+    descriptor = _pad(b'\x01CD001', 80) + struct.pack('<I', blocks)
+    descriptor = _pad(descriptor, 128) + struct.pack('<H', 2048)
+    return _pad(b'', format_inspector.ISO_VOLUME_DESCRIPTOR) + _pad(
+        descriptor, 2048)
+
+
+class TestFormatInspector(test_utils.BaseTestCase):
+
+    def _file(self, data):
+        path = os.path.join(self.test_dir, 'image')
+        with open(path, 'wb') as image_file:
+            image_file.write(data)
+        return path
+
+    def _assert_info(self, expected, data):
+        self.assertEqual(expected, format_inspector.inspect_head(data))
+        self.assertEqual(expected,
+                         format_inspector.inspect_file(self._file(data)))
+
+    def test_qcow2(self):
+        self._assert_info({'format': 'qcow2', 'virtual-size': GiB},
+                          qcow2())
+
+    def test_qcow2_backing_file(self):
+        self._assert_info({'format': 'qcow2', 'virtual-size': GiB,
+                           'backing-filename': '/etc/passwd'},
+                          qcow2(backing_file=b'/etc/passwd'))
+
+    def test_qcow2_truncated(self):
+        data = qcow2(backing_file=b'/etc/passwd')[:-4]
+        self.assertRaises(exception.InvalidImageFormat,
+                          format_inspector.inspect_head, data)
+
+    def test_qcow(self):
+        self._assert_info({'format': 'qcow', 'virtual-size': GiB},
+                          qcow2(version=1))
+
+    def test_qcow_backing_file(self):
+        self._assert_info({'format': 'qcow', 'virtual-size': GiB,
+                           'backing-filename': '/etc/passwd'},
+                          qcow2(backing_file=b'/etc/passwd', version=1))
+
+    def test_qed(self):
+        self._assert_info({'format': 'qed', 'virtual-size': GiB}, qed())
+
+    def test_qed_backing_file(self):
+        self._assert_info({'format': 'qed', 'virtual-size': GiB,
+                           'backing-filename': '/etc/passwd'},
+                          qed(backing_file=b'/etc/passwd'))
+
+    def test_qed_backing_file_too_long(self):
+        self.assertRaises(exception.InvalidImageFormat,
+                          format_inspector.inspect_head,
+                          qed(backing_file=b'/' * 2048))
+
+    def test_vmdk(self):
+        self._assert_info({'format': 'vmdk', 'virtual-size': GiB}, vmdk())
+
+    def test_vmdk_parent(self):
+        self._assert_info({'format': 'vmdk', 'virtual-size': GiB,
+                           'backing-filename': 'base.vmdk'},
+                          vmdk(parent=b'base.vmdk'))
+
+    def test_vmdk_descriptor(self):
+        descriptor = (b'# Disk DescriptorFile\n'
+                      b'createType="monolithicFlat"\n'
+                      b'RW 2048 FLAT "disk-flat.vmdk" 0\n'
+                      b'RW 2048 FLAT "disk-flat2.vmdk" 0\n')
+        self._assert_info({'format': 'vmdk', 'virtual-size': 2 * 2048 * 512},
+                          descriptor)
+
+    def test_vhd(self):
+        self._assert_info({'format': 'vhd', 'virtual-size': GiB}, vhd())
+
+    def test_vhd_parent(self):
+        self._assert_info({'format': 'vhd', 'virtual-size': GiB,
+                           'backing-filename': 'base.vhd'},
+                          vhd(parent=u'base.vhd'))
+
+    def test_vhd_fixed(self):
+        footer = vhd()[:512]
+        path = self._file(b'\x01' * 4096 + footer)
+        self.assertEqual({'format': 'vhd', 'virtual-size': GiB},
+                         format_inspector.inspect_file(path))
+
+    def test_vhd_fixed_tail(self):
+        footer = vhd()[:512]
+        self.assertEqual({'format': 'raw'},
+                         format_inspector.inspect_head(b'\x01' * 4096 +
+                                                       footer))
+        self.assertEqual({'format': 'vhd', 'virtual-size': GiB},
+                         format_inspector.inspect_tail(footer, 4096 + 512))
+        self.assertIsNone(format_inspector.inspect_tail(b'\x01' * 512,
+                                                        4096 + 512))
+        self.assertIsNone(format_inspector.inspect_tail(b'\x01' * 16, 16))
+
+    def test_vhdx(self):
+        self._assert_info({'format': 'vhdx', 'virtual-size': GiB}, vhdx())
+
+    def test_vhdx_parent(self):
+        self._assert_info({'format': 'vhdx', 'virtual-size': GiB,
+                           'backing-filename': 'base.vhdx'},
+                          vhdx(parent=u'base.vhdx'))
+
+    def test_vhdx_truncated(self):
+        data = vhdx()[:format_inspector.VHDX_REGION_TABLE + 64]
+        self.assertRaises(exception.InvalidImageFormat,
+                          format_inspector.inspect_head, data)
+
+    def test_vdi(self):
+        self._assert_info({'format': 'vdi', 'virtual-size': GiB}, vdi())
+
+    def test_vdi_differencing(self):
+        self.assertRaises(exception.InvalidImageFormat,
+                          format_inspector.inspect_head, vdi(image_type=4))
+
+    def test_iso(self):
+        self._assert_info({'format': 'iso', 'virtual-size': 1000 * 2048},
+                          iso())
+
+    def test_raw(self):
+        data = b'\x01' * 65536
+        self.assertEqual({'format': 'raw'},
+                         format_inspector.inspect_head(data))
+        self.assertEqual({'format': 'raw', 'virtual-size': 65536},
+                         format_inspector.inspect_file(self._file(data)))
+
+    def test_file_uri(self):
+        path = self._file(qcow2())
+        self.assertEqual({'format': 'qcow2', 'virtual-size': GiB},
+                         format_inspector.inspect_file('file://' + path))
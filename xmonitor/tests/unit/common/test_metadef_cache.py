@@ -0,0 +1,114 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import webob.exc
+
+from xmonitor.common import metadef_cache
+from xmonitor.common import wsgi
+from xmonitor.tests.unit import utils as unit_test_utils
+from xmonitor.tests import utils as test_utils
+
+
+class FakeController(object):
+    def __init__(self):
+        self.calls = 0
+        self.value = 'first'
+
+    def show(self, req, namespace):
+        self.calls += 1
+        if namespace == 'missing':
+            raise webob.exc.HTTPNotFound()
+        return {'namespace': namespace, 'value': self.value}
+
+
+class TestCachingResource(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestCachingResource, self).setUp()
+        self.db = unit_test_utils.FakeDB(initialize=False)
+        self.cache = metadef_cache.MetadefCache(10, db_api=self.db)
+        self.controller = FakeController()
+        self.resource = self._get_resource(self.cache)
+
+    def _get_resource(self, cache):
+        return metadef_cache.CachingResource(self.controller,
+                                             wsgi.JSONRequestDeserializer(),
+                                             wsgi.JSONResponseSerializer(),
+                                             cache=cache)
+
+    def _get_request(self, namespace='OS::Compute', **kwargs):
+        request = unit_test_utils.get_fake_request(
+            '/v2/metadefs/namespaces/%s' % namespace, method='GET', **kwargs)
+        request.environ['wsgiorg.routing_args'] = [
+            None, {'action': 'show', 'namespace': namespace}]
+        return request
+
+    def test_get_cached(self):
+        first = self.resource(self._get_request())
+        second = self.resource(self._get_request())
+        self.assertEqual(200, second.status_int)
+        self.assertEqual(first.body, second.body)
+        self.assertEqual(first.etag, second.etag)
+        self.assertEqual('application/json', second.content_type)
+        self.assertEqual(1, self.controller.calls)
+
+    def test_get_cached_per_identity(self):
+        self.resource(self._get_request())
+        self.resource(self._get_request(tenant=unit_test_utils.TENANT2))
+        self.resource(self._get_request(is_admin=True))
+        self.assertEqual(3, self.controller.calls)
+
+    def test_get_not_cached_when_disabled(self):
+        resource = self._get_resource(metadef_cache.MetadefCache(0))
+        resource(self._get_request())
+        resource(self._get_request())
+        self.assertEqual(2, self.controller.calls)
+
+    def test_errors_not_cached(self):
+        for _ in range(2):
+            response = self._get_request('missing').get_response(
+                self.resource)
+            self.assertEqual(404, response.status_int)
+        self.assertEqual(2, self.controller.calls)
+
+    def test_invalidate(self):
+        self.resource(self._get_request())
+        self.controller.value = 'second'
+        self.cache.invalidate(None)
+        response = self.resource(self._get_request())
+        self.assertIn(b'second', response.body)
+        self.assertEqual(2, self.controller.calls)
+
+    def test_stale_document_not_stored(self):
+        version = self.cache.version(None)
+        self.cache.invalidate(None)
+        self.cache.set(self._get_request().context, '/path', version,
+                       b'{}', 'application/json', 'UTF-8')
+        self.assertIsNone(self.cache.get(self._get_request().context,
+                                         '/path', self.cache.version(None)))
+
+    def test_shared_generation(self):
+        self.config(metadef_cache_shared_generation=True)
+        other_cache = metadef_cache.MetadefCache(10, db_api=self.db)
+        other_resource = self._get_resource(other_cache)
+        other_resource(self._get_request())
+
+        # A change made through another worker only shows up in the
+        # generation kept in the database.
+        self.controller.value = 'second'
+        self.cache.invalidate(None)
+        response = other_resource(self._get_request())
+        self.assertIn(b'second', response.body)
+        self.assertEqual(1, self.db.metadef_generation_get(None))
@@ -0,0 +1,195 @@
+# Copyright 2016 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import time
+
+import six
+
+from xmonitor.common import exception
+from xmonitor.common import multipart
+from xmonitor.tests.unit import utils as unit_test_utils
+from xmonitor.tests import utils as test_utils
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class TestMultipartUpload(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(TestMultipartUpload, self).setUp()
+        self.upload_dir = os.path.join(self.test_dir, 'uploads')
+        self.config(multipart_upload_dir=self.upload_dir)
+        self.upload = multipart.MultipartUpload.create(unit_test_utils.UUID1)
+
+    def test_get(self):
+        upload = multipart.MultipartUpload.get(unit_test_utils.UUID1,
+                                               self.upload.upload_id)
+        self.assertEqual(self.upload.path, upload.path)
+
+    def test_get_not_found(self):
+        self.assertRaises(exception.NotFound,
+                          multipart.MultipartUpload.get,
+                          unit_test_utils.UUID1, unit_test_utils.UUID2)
+        self.assertRaises(exception.NotFound,
+                          multipart.MultipartUpload.get,
+                          unit_test_utils.UUID1, '../../etc')
+
+    def test_add_part(self):
+        part = self.upload.add_part(2, six.BytesIO(b'WORLD'))
+        self.assertEqual({'part_number': 2, 'checksum': _md5(b'WORLD'),
+                          'size': 5}, part)
+        self.upload.add_part(1, [b'HEL', b'LO'], _md5(b'HELLO'))
+
+        self.assertEqual([{'part_number': 1, 'checksum': _md5(b'HELLO'),
+                           'size': 5},
+                          {'part_number': 2, 'checksum': _md5(b'WORLD'),
+                           'size': 5}],
+                         self.upload.parts())
+
+    def test_add_part_again(self):
+        self.upload.add_part(1, six.BytesIO(b'HELL'))
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        self.assertEqual([{'part_number': 1, 'checksum': _md5(b'HELLO'),
+                           'size': 5}],
+                         self.upload.parts())
+        self.assertEqual(1, len(os.listdir(self.upload.path)))
+
+    def test_add_part_bad_checksum(self):
+        self.assertRaises(exception.Invalid, self.upload.add_part,
+                          1, six.BytesIO(b'HELLO'), _md5(b'WORLD'))
+        self.assertEqual([], os.listdir(self.upload.path))
+
+    def test_add_part_bad_number(self):
+        self.config(multipart_upload_max_parts=2)
+        for number in (0, 3):
+            self.assertRaises(exception.Invalid, self.upload.add_part,
+                              number, six.BytesIO(b'HELLO'))
+
+    def test_add_part_too_large(self):
+        self.config(image_size_cap=4)
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          self.upload.add_part, 1, six.BytesIO(b'HELLO'))
+        self.assertEqual([], os.listdir(self.upload.path))
+
+    def test_add_part_uploads_too_large(self):
+        self.config(image_size_cap=8)
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        other = multipart.MultipartUpload.create(unit_test_utils.UUID1)
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          other.add_part, 1, six.BytesIO(b'WORLD'))
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          self.upload.add_part, 2, six.BytesIO(b'WORLD'))
+
+        # NOTE: A part uploaded again only counts once
+        self.upload.add_part(1, six.BytesIO(b'HELLO!!'))
+        other.add_part(1, six.BytesIO(b'!'))
+
+    def test_add_part_max_size(self):
+        self.upload.add_part(1, six.BytesIO(b'HELLO'), max_size=8)
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          self.upload.add_part, 2, six.BytesIO(b'WORLD'),
+                          max_size=8)
+        self.upload.add_part(2, six.BytesIO(b'WOR'), max_size=8)
+
+    def test_add_parts_at_once_too_large(self):
+        self.config(image_size_cap=8)
+
+        def data():
+            yield b'HELLO'
+            # NOTE: Part 2 is uploaded while part 1 is
+            self.upload.add_part(2, six.BytesIO(b'WORLD'))
+
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          self.upload.add_part, 1, data())
+        self.assertEqual([{'part_number': 2, 'checksum': _md5(b'WORLD'),
+                           'size': 5}],
+                         self.upload.parts())
+        self.assertEqual(1, len(os.listdir(self.upload.path)))
+
+    def test_read(self):
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        self.upload.add_part(2, six.BytesIO(b'WORLD'))
+        self.upload.add_part(4, six.BytesIO(b'!'))
+
+        size, data = self.upload.read([{'part_number': 1},
+                                       {'part_number': 2,
+                                        'checksum': _md5(b'WORLD')}])
+        self.assertEqual(10, size)
+        self.assertEqual(b'HELLOWORLD', b''.join(data))
+
+    def test_read_invalid(self):
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        self.upload.add_part(2, six.BytesIO(b'WORLD'))
+
+        for parts in ([],
+                      [{'part_number': 3}],
+                      [{'part_number': 2}, {'part_number': 1}],
+                      [{'part_number': '1'}],
+                      [{'part_number': 1, 'checksum': _md5(b'WORLD')}]):
+            self.assertRaises(exception.Invalid, self.upload.read, parts)
+
+    def test_delete(self):
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        self.upload.delete()
+        self.assertEqual([], os.listdir(self.upload_dir))
+        self.assertRaises(exception.NotFound,
+                          multipart.MultipartUpload.get,
+                          unit_test_utils.UUID1, self.upload.upload_id)
+
+    def test_delete_uploads(self):
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        multipart.MultipartUpload.create(unit_test_utils.UUID1)
+        other = multipart.MultipartUpload.create(unit_test_utils.UUID2)
+
+        multipart.delete_uploads(unit_test_utils.UUID1)
+
+        self.assertEqual([unit_test_utils.UUID2], os.listdir(self.upload_dir))
+        self.assertTrue(os.path.isdir(other.path))
+
+    def test_expire_uploads(self):
+        self.config(multipart_upload_expiry=3600)
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        other = multipart.MultipartUpload.create(unit_test_utils.UUID2)
+        old = time.time() - 7200
+        for path in (os.path.join(self.upload.path, name)
+                     for name in os.listdir(self.upload.path)):
+            os.utime(path, (old, old))
+        os.utime(self.upload.path, (old, old))
+
+        self.assertEqual(1, multipart.expire_uploads())
+
+        self.assertEqual([unit_test_utils.UUID2], os.listdir(self.upload_dir))
+        self.assertTrue(os.path.isdir(other.path))
+
+    def test_expire_uploads_recent_part(self):
+        self.config(multipart_upload_expiry=3600)
+        self.upload.add_part(1, six.BytesIO(b'HELLO'))
+        old = time.time() - 7200
+        os.utime(self.upload.path, (old, old))
+
+        self.assertEqual(0, multipart.expire_uploads())
+        self.assertTrue(os.path.isdir(self.upload.path))
+
+    def test_expire_uploads_disabled(self):
+        self.config(multipart_upload_expiry=0)
+        old = time.time() - 7200
+        os.utime(self.upload.path, (old, old))
+
+        self.assertEqual(0, multipart.expire_uploads())
+        self.assertTrue(os.path.isdir(self.upload.path))
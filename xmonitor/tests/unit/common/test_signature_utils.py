@@ -16,6 +16,7 @@
 import base64
 import datetime
 import mock
+import threading
 import unittest
 
 from cryptography import exceptions as crypto_exception
@@ -113,6 +114,12 @@ class BadPublicKey(object):
 class TestSignatureUtils(test_utils.BaseTestCase):
     """Test methods of signature_utils"""
 
+    def setUp(self):
+        super(TestSignatureUtils, self).setUp()
+        patcher = mock.patch.object(signature_utils, '_CACHE', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_should_create_verifier(self):
         image_props = {CERT_UUID: 'CERT_UUID',
                        HASH_METHOD: 'HASH_METHOD',
@@ -362,6 +369,116 @@ class TestSignatureUtils(test_utils.BaseTestCase):
                                signature_utils.get_public_key, None,
                                None, sig_key_type)
 
+    @mock.patch('xmonitor.common.signature_utils.get_certificate')
+    def test_get_public_key_cached(self, mock_get_cert):
+        mock_get_cert.return_value = FakeCryptoCertificate()
+        sig_key_type = signature_utils.SignatureKeyType.lookup('RSA-PSS')
+        context = mock.Mock(user='user1', tenant='tenant1')
+        for i in range(2):
+            signature_utils.get_public_key(context, 'cert', sig_key_type)
+        mock_get_cert.assert_called_once_with(context, 'cert')
+
+        other = mock.Mock(user='user2', tenant='tenant1')
+        signature_utils.get_public_key(other, 'cert', sig_key_type)
+        self.assertEqual(2, mock_get_cert.call_count)
+
+    @mock.patch('xmonitor.common.signature_utils.get_certificate')
+    def test_get_public_key_cache_disabled(self, mock_get_cert):
+        self.config(signature_certificate_cache_size=0)
+        mock_get_cert.return_value = FakeCryptoCertificate()
+        sig_key_type = signature_utils.SignatureKeyType.lookup('RSA-PSS')
+        for i in range(2):
+            signature_utils.get_public_key(None, 'cert', sig_key_type)
+        self.assertEqual(2, mock_get_cert.call_count)
+
+    def test_certificate_cache_expiry(self):
+        cache = signature_utils.CertificateCache(10, 300)
+        cert = FakeCryptoCertificate()
+        self.assertEqual(cert.public_key(),
+                         cache.set(None, 'cert', cert).public_key)
+        self.assertEqual(cert, cache.get(None, 'cert').certificate)
+        self.assertIsNone(cache.get(None, 'other'))
+
+        # Not used past the validity of the certificate
+        expired = FakeCryptoCertificate(
+            not_valid_after=datetime.datetime.utcnow())
+        cache.set(None, 'cert', expired)
+        self.assertIsNone(cache.get(None, 'cert'))
+
+        cache = signature_utils.CertificateCache(10, 0)
+        cache.set(None, 'cert', cert)
+        self.assertIsNone(cache.get(None, 'cert'))
+
+    def test_certificate_cache_size(self):
+        cache = signature_utils.CertificateCache(2, 300)
+        for cert_uuid in ('cert1', 'cert2', 'cert3'):
+            cache.set(None, cert_uuid, FakeCryptoCertificate())
+        self.assertIsNone(cache.get(None, 'cert1'))
+        self.assertIsNotNone(cache.get(None, 'cert2'))
+        self.assertIsNotNone(cache.get(None, 'cert3'))
+
+    @mock.patch('xmonitor.common.signature_utils.get_verifier')
+    def test_pending_verifier(self, mock_get_verifier):
+        created = mock.Mock()
+        key_manager_replied = threading.Event()
+
+        def get_verifier(context, image_properties):
+            key_manager_replied.wait()
+            return created
+
+        mock_get_verifier.side_effect = get_verifier
+        verifier = signature_utils.PendingVerifier(None, {}, max_pending=8)
+        verifier.update(b'HELLO')
+        verifier.update(bytearray(b'THE'))
+        self.assertFalse(created.update.called)
+
+        # Past max_pending, the verifier is waited for
+        key_manager_replied.set()
+        verifier.update(b'WORLD')
+        verifier.verify()
+        self.assertEqual([mock.call(b'HELLO'), mock.call(b'THE'),
+                          mock.call(b'WORLD')],
+                         created.update.call_args_list)
+        created.verify.assert_called_once_with()
+        mock_get_verifier.assert_called_once_with(None, {})
+
+    @mock.patch('xmonitor.common.signature_utils.get_verifier')
+    def test_pending_verifier_fail(self, mock_get_verifier):
+        key_manager_replied = threading.Event()
+
+        def get_verifier(context, image_properties):
+            key_manager_replied.wait()
+            raise exception.SignatureVerificationError(
+                'Unable to retrieve certificate')
+
+        mock_get_verifier.side_effect = get_verifier
+        verifier = signature_utils.PendingVerifier(None, {})
+        verifier.update(b'HELLO')
+        key_manager_replied.set()
+        self.assertRaises(exception.SignatureVerificationError,
+                          verifier.verify)
+        self.assertRaises(exception.SignatureVerificationError,
+                          verifier.update, b'WORLD')
+
+    @mock.patch('xmonitor.common.signature_utils.get_public_key')
+    def test_pending_verifier_PSS(self, mock_get_pub_key):
+        data = b'224626ae19824466f2a7f39ab7b80f7f'
+        mock_get_pub_key.return_value = TEST_RSA_PRIVATE_KEY.public_key()
+        hash_alg = signature_utils.HASH_METHODS['SHA-256']
+        signer = TEST_RSA_PRIVATE_KEY.signer(
+            padding.PSS(mgf=padding.MGF1(hash_alg),
+                        salt_length=padding.PSS.MAX_LENGTH),
+            hash_alg)
+        signer.update(data)
+        image_props = {CERT_UUID: 'fea14bc2-d75f-4ba5-bccc-b5c924ad0693',
+                       HASH_METHOD: 'SHA-256',
+                       KEY_TYPE: 'RSA-PSS',
+                       SIGNATURE: base64.b64encode(signer.finalize())}
+        verifier = signature_utils.PendingVerifier(None, image_props)
+        verifier.update(data[:16])
+        verifier.update(data[16:])
+        verifier.verify()
+
     @mock.patch('cryptography.x509.load_der_x509_certificate')
     @mock.patch('castellan.key_manager.API', return_value=FakeKeyManager())
     def test_get_certificate(self, mock_key_manager_API, mock_load_cert):
@@ -115,6 +115,40 @@ class TestUtils(test_utils.BaseTestCase):
         read_size = 8 * 1024           # 8k, as in httplib
         self._test_reader_chunked(chunk_size, read_size)
 
+    def test_cooperative_reader_hands_chunks_through(self):
+        chunks = [b'a' * 8, b'b' * 8, b'c' * 8]
+        reader = utils.CooperativeReader(iter(chunks))
+        for chunk in chunks:
+            self.assertIs(chunk, reader.read(8))
+        self.assertEqual(b'', reader.read(8))
+
+    def test_cooperative_reader_read_without_length(self):
+        reader = utils.CooperativeReader(iter([b'abc', b'def']))
+        self.assertEqual(b'a', reader.read(1))
+        self.assertEqual(b'bc', reader.read())
+        self.assertEqual(b'def', reader.read())
+        self.assertEqual(b'', reader.read())
+
+    def test_cooperative_reader_readinto(self):
+        chunks = [char * 43 for char in (b'a', b'b', b'c', b'a', b'b')]
+        reader = utils.CooperativeReader(iter(chunks))
+        buf = bytearray(101)
+        result = bytearray()
+        size = reader.readinto(buf)
+        while size:
+            result += buf[:size]
+            size = reader.readinto(buf)
+        self.assertEqual(b''.join(chunks), bytes(result))
+
+    def test_cooperative_reader_readinto_file(self):
+        reader = utils.CooperativeReader(six.BytesIO(b'abcdef'))
+        buf = bytearray(4)
+        self.assertEqual(4, reader.readinto(buf))
+        self.assertEqual(b'abcd', bytes(buf))
+        self.assertEqual(2, reader.readinto(buf))
+        self.assertEqual(b'ef', bytes(buf[:2]))
+        self.assertEqual(0, reader.readinto(buf))
+
     def test_limiting_reader(self):
         """Ensure limiting reader class accesses all bytes of file"""
         BYTES = 1024
@@ -158,6 +192,22 @@ class TestUtils(test_utils.BaseTestCase):
 
         self.assertRaises(exception.ImageSizeLimitExceeded, _consume_all_read)
 
+    def test_limiting_reader_readinto(self):
+        BYTES = 1024
+        reader = utils.LimitingReader(
+            utils.CooperativeReader([b'*' * 100] * 10 + [b'*' * 24]), BYTES)
+        buf = bytearray(64)
+        bytes_read = 0
+        size = reader.readinto(buf)
+        while size:
+            bytes_read += size
+            size = reader.readinto(buf)
+        self.assertEqual(BYTES, bytes_read)
+
+        reader = utils.LimitingReader(six.BytesIO(b'*' * BYTES), BYTES - 1)
+        self.assertRaises(exception.ImageSizeLimitExceeded,
+                          reader.readinto, bytearray(BYTES))
+
     def test_get_meta_from_headers(self):
         resp = webob.Response()
         resp.headers = {"x-image-meta-name": 'test',
@@ -35,6 +35,7 @@ from xmonitor.common import exception
 from xmonitor.common import utils
 from xmonitor.common import wsgi
 from xmonitor import i18n
+from xmonitor import notifier
 from xmonitor.tests import utils as test_utils
 
 
@@ -374,6 +375,78 @@ class ResourceTest(test_utils.BaseTestCase):
         e = wsgi.translate_exception(req, e)
         self.assertEqual('No Encontrado', e.explanation)
 
+    def _get_conditional_resource(self, tagged=True):
+        class FakeController(object):
+            def index(self, req):
+                return {'key': 'value'}
+
+        class TaggingSerializer(wsgi.JSONResponseSerializer):
+            def index(self, response, result):
+                self.default(response, result)
+                response.etag = wsgi.body_etag(response.body)
+
+        serializer = (TaggingSerializer() if tagged
+                      else wsgi.JSONResponseSerializer())
+        return wsgi.Resource(FakeController(),
+                             wsgi.JSONRequestDeserializer(),
+                             serializer)
+
+    def _get_conditional_request(self, method='GET', **headers):
+        env = {'wsgiorg.routing_args': [None, {'action': 'index'}]}
+        request = wsgi.Request.blank('/tests', environ=env)
+        request.method = method
+        for name, value in headers.items():
+            request.headers[name] = value
+        return request
+
+    def test_call_untagged(self):
+        resource = self._get_conditional_resource(tagged=False)
+        response = resource(self._get_conditional_request(
+            **{'If-None-Match': '*'}))
+        self.assertEqual(200, response.status_int)
+        self.assertIsNone(response.etag)
+
+    def test_call_if_none_match(self):
+        resource = self._get_conditional_resource()
+        etag = resource(self._get_conditional_request()).etag
+        request = self._get_conditional_request(
+            **{'If-None-Match': '"%s"' % etag})
+        response = resource(request)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(etag, response.etag)
+
+    def test_call_if_none_match_changed(self):
+        resource = self._get_conditional_resource()
+        request = self._get_conditional_request(
+            **{'If-None-Match': '"stale"'})
+        response = resource(request)
+        self.assertEqual(200, response.status_int)
+        self.assertEqual(b'{"key": "value"}', response.body)
+
+    def test_call_conditional_only_for_get(self):
+        resource = self._get_conditional_resource()
+        request = self._get_conditional_request(method='PUT',
+                                                **{'If-None-Match': '*'})
+        response = resource(request)
+        self.assertEqual(200, response.status_int)
+
+    def test_is_not_modified_since(self):
+        last_modified = datetime.datetime(2016, 1, 1,
+                                          tzinfo=webob.datetime_utils.UTC)
+        request = wsgi.Request.blank('/')
+        request.headers['If-Modified-Since'] = 'Fri, 01 Jan 2016 00:00:00 GMT'
+        self.assertTrue(wsgi.is_not_modified(request, 'tag', last_modified))
+        request.headers['If-Modified-Since'] = 'Thu, 31 Dec 2015 23:59:59 GMT'
+        self.assertFalse(wsgi.is_not_modified(request, 'tag', last_modified))
+
+    def test_is_not_modified_prefers_etag(self):
+        last_modified = datetime.datetime(2016, 1, 1,
+                                          tzinfo=webob.datetime_utils.UTC)
+        request = wsgi.Request.blank('/')
+        request.headers['If-Modified-Since'] = 'Fri, 01 Jan 2016 00:00:00 GMT'
+        request.headers['If-None-Match'] = '"other"'
+        self.assertFalse(wsgi.is_not_modified(request, 'tag', last_modified))
+
     def test_response_headers_encoded(self):
         # prepare environment
         for_openstack_comrades =  \
@@ -440,6 +513,34 @@ class JSONResponseSerializerTest(test_utils.BaseTestCase):
         self.assertEqual('application/json', response.content_type)
         self.assertEqual(b'{"key": "value"}', response.body)
 
+    def test_stream_collection(self):
+        formatted = []
+
+        def formatter(item):
+            formatted.append(item)
+            return {'id': item}
+
+        response = webob.Response()
+        wsgi.JSONResponseSerializer().stream_collection(
+            response, 'items', [1, 2, 3], formatter, {'first': '/items'})
+        self.assertEqual([], formatted)
+        self.assertEqual('application/json', response.content_type)
+        body = jsonutils.loads(b''.join(response.app_iter))
+        self.assertEqual({'first': '/items',
+                          'items': [{'id': 1}, {'id': 2}, {'id': 3}]}, body)
+        self.assertEqual([1, 2, 3], formatted)
+
+    def test_stream_collection_chunks(self):
+        serializer = wsgi.JSONResponseSerializer()
+        serializer.stream_chunk_size = 1
+        response = webob.Response()
+        serializer.stream_collection(response, 'items', ['a', 'b'],
+                                     lambda item: item, {})
+        chunks = list(response.app_iter)
+        self.assertEqual(3, len(chunks))
+        self.assertEqual({'items': ['a', 'b']},
+                         jsonutils.loads(b''.join(chunks)))
+
 
 class JSONRequestDeserializerTest(test_utils.BaseTestCase):
 
@@ -531,10 +632,25 @@ class JSONRequestDeserializerTest(test_utils.BaseTestCase):
 
 
 class ServerTest(test_utils.BaseTestCase):
+
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        self.useFixture(fixtures.MockPatchObject(notifier, '_queue_enabled',
+                                                 False))
+        self.useFixture(fixtures.MockPatchObject(wsgi.signal, 'signal'))
+
     def test_create_pool(self):
         """Ensure the wsgi thread pool is an eventlet.greenpool.GreenPool."""
         actual = wsgi.Server(threads=1).create_pool()
         self.assertIsInstance(actual, eventlet.greenpool.GreenPool)
+        self.assertEqual(1, actual.size)
+
+    def test_create_pool_admission_queues(self):
+        self.config(max_data_transfers_per_worker=2,
+                    max_metadata_requests_per_worker=50,
+                    admission_queue_size=4)
+        # Requests waiting for admission do not take up the threads
+        self.assertEqual(108, wsgi.Server(threads=100).create_pool().size)
 
     @mock.patch.object(wsgi.Server, 'configure_socket')
     def test_http_keepalive(self, mock_configure_socket):
@@ -558,6 +674,24 @@ class ServerTest(test_utils.BaseTestCase):
                                                 keepalive=False,
                                                 socket_timeout=900)
 
+    @mock.patch.object(wsgi.Server, 'configure_socket')
+    def test_single_process_sigterm(self, mock_configure_socket):
+        self.config(workers=0)
+        server = wsgi.Server(threads=1)
+        with mock.patch.object(server, 'create_pool'):
+            server.start('fake-application', 0)
+        self.assertTrue(notifier._queue_enabled)
+        wsgi.signal.signal.assert_called_once_with(wsgi.signal.SIGTERM,
+                                                   server._child_term)
+
+        server.sock = mock.Mock()
+        with mock.patch.object(server, '_child_terminating') as terminating, \
+                mock.patch.object(wsgi.eventlet.wsgi, 'is_accepting', True):
+            server._child_term(wsgi.signal.SIGTERM, None)
+            self.assertFalse(wsgi.eventlet.wsgi.is_accepting)
+        server.sock.close.assert_called_once_with()
+        terminating.assert_called_once_with()
+
     def test_number_of_workers(self):
         """Ensure the default number of workers matches num cpus."""
         def pid():
@@ -576,6 +710,261 @@ class ServerTest(test_utils.BaseTestCase):
                              len(server.children))
 
 
+    @mock.patch.object(wsgi.Server, 'configure_socket')
+    def test_reuse_port_no_shared_socket(self, mock_configure_socket):
+        self.config(reuse_port=True, workers=2)
+        server = wsgi.Server()
+        server.sock = mock.Mock()
+        server.configure()
+        self.assertIsNone(server.sock)
+        self.assertFalse(mock_configure_socket.called)
+
+    @mock.patch.object(wsgi.Server, 'configure_socket')
+    def test_reuse_port_single_process(self, mock_configure_socket):
+        self.config(reuse_port=True, workers=0)
+        server = wsgi.Server()
+        server.configure()
+        mock_configure_socket.assert_called_once_with(None, None)
+
+    @mock.patch.object(wsgi.Server, 'run_server')
+    @mock.patch.object(wsgi.Server, 'configure_socket')
+    @mock.patch.object(wsgi.sys, 'exit')
+    @mock.patch.object(wsgi.signal, 'signal')
+    @mock.patch.object(os, 'fork', return_value=0)
+    def test_reuse_port_child_binds(self, mock_fork, mock_signal, mock_exit,
+                                    mock_configure_socket, mock_run_server):
+        server = wsgi.Server()
+        server.reuse_port = True
+        server.run_child()
+        mock_configure_socket.assert_called_once_with()
+        mock_run_server.assert_called_once_with()
+
+    @mock.patch.object(wsgi.Server, 'run_server')
+    @mock.patch.object(wsgi.sys, 'exit')
+    @mock.patch.object(wsgi.signal, 'signal')
+    @mock.patch.object(os, 'fork', return_value=0)
+    def test_child_sigterm(self, mock_fork, mock_signal, mock_exit,
+                           mock_run_server):
+        server = wsgi.Server()
+        server.sock = mock.Mock()
+        server.run_child()
+        handlers = dict(call[0] for call in mock_signal.call_args_list)
+
+        with mock.patch.object(wsgi.eventlet, 'spawn_n') as mock_spawn_n, \
+                mock.patch.object(wsgi.eventlet.wsgi, 'is_accepting', True):
+            handlers[wsgi.signal.SIGTERM](wsgi.signal.SIGTERM, None)
+            self.assertFalse(wsgi.eventlet.wsgi.is_accepting)
+        server.sock.close.assert_called_once_with()
+        mock_spawn_n.assert_called_once_with(server._terminate_child)
+
+    @mock.patch.object(wsgi.Server, 'run_server')
+    @mock.patch.object(wsgi.sys, 'exit')
+    @mock.patch.object(wsgi.signal, 'signal')
+    @mock.patch.object(os, 'fork', return_value=0)
+    def test_child_sigterm_without_socket(self, mock_fork, mock_signal,
+                                          mock_exit, mock_run_server):
+        server = wsgi.Server()
+        server.run_child()
+        handlers = dict(call[0] for call in mock_signal.call_args_list)
+
+        with mock.patch.object(server, '_child_terminating') as terminating, \
+                mock.patch.object(wsgi.eventlet.wsgi, 'is_accepting', True):
+            handlers[wsgi.signal.SIGTERM](wsgi.signal.SIGTERM, None)
+            handlers[wsgi.signal.SIGHUP](wsgi.signal.SIGHUP, None)
+        terminating.assert_called_once_with()
+
+    @mock.patch.object(wsgi.signal, 'signal')
+    @mock.patch.object(os, 'kill')
+    def test_terminate_child(self, mock_kill, mock_signal):
+        with mock.patch('xmonitor.notifier.flush_queue') as mock_flush:
+            wsgi.Server._terminate_child()
+        mock_flush.assert_called_once_with()
+        mock_signal.assert_called_once_with(wsgi.signal.SIGTERM,
+                                            wsgi.signal.SIG_DFL)
+        mock_kill.assert_called_once_with(os.getpid(), wsgi.signal.SIGTERM)
+
+
+class AdmissionControlTest(test_utils.BaseTestCase):
+
+    def _environ(self, method, path, **kwargs):
+        environ = {'REQUEST_METHOD': method, 'PATH_INFO': path}
+        environ.update(kwargs)
+        return environ
+
+    def test_is_data_transfer(self):
+        image_id = 'c80a1a6c-bd1f-41c5-90ee-81afedb1d58d'
+        image = '/v2/images/%s' % image_id
+        upload = {'CONTENT_TYPE': 'application/octet-stream',
+                  'CONTENT_LENGTH': '10'}
+        self.assertTrue(wsgi.is_data_transfer(
+            self._environ('GET', image + '/file')))
+        self.assertTrue(wsgi.is_data_transfer(
+            self._environ('GET', '/v1/images/%s' % image_id)))
+        self.assertTrue(wsgi.is_data_transfer(
+            self._environ('PUT', image + '/file', **upload)))
+        self.assertTrue(wsgi.is_data_transfer(
+            self._environ('POST', '/v1/images', **upload)))
+
+        self.assertFalse(wsgi.is_data_transfer(self._environ('GET', image)))
+        self.assertFalse(wsgi.is_data_transfer(
+            self._environ('GET', '/v1/images/detail')))
+        self.assertFalse(wsgi.is_data_transfer(
+            self._environ('HEAD', '/v1/images/%s' % image_id)))
+        self.assertFalse(wsgi.is_data_transfer(
+            self._environ('PUT', '/v1/images/%s' % image_id,
+                          CONTENT_TYPE='application/octet-stream',
+                          CONTENT_LENGTH='0')))
+        self.assertFalse(wsgi.is_data_transfer(
+            self._environ('PATCH', image, CONTENT_LENGTH='10')))
+
+    def _admission_control(self, app, data=1, metadata=0, queue_size=1,
+                           timeout=0):
+        return wsgi.AdmissionControl(
+            app,
+            wsgi.AdmissionQueue('Data', data, queue_size, timeout),
+            wsgi.AdmissionQueue('Metadata', metadata, queue_size, timeout))
+
+    def test_limit(self):
+        app = mock.Mock(return_value=[b'data'])
+        control = self._admission_control(app)
+        download = self._environ('GET', '/v2/images/fake/file')
+
+        first = control(download, None)
+        self.assertTrue(control.data.semaphore.locked())
+        # Metadata requests do not wait for the transfer
+        self.assertEqual([b'data'], list(
+            control(self._environ('GET', '/v2/images'), None)))
+
+        waiter = eventlet.spawn(control, download, None)
+        eventlet.sleep(0)
+        self.assertEqual(2, app.call_count)
+        self.assertEqual(1, control.data.waiting)
+        self.assertEqual([b'data'], list(first))
+        first.close()
+        second = waiter.wait()
+        self.assertEqual(3, app.call_count)
+        second.close()
+        self.assertFalse(control.data.semaphore.locked())
+        self.assertEqual(2, control.data.admitted)
+        self.assertEqual(1, control.data.max_waiting)
+        self.assertEqual(0, control.data.running)
+
+    def test_shed_when_queue_full(self):
+        app = mock.Mock(return_value=[])
+        control = self._admission_control(app, queue_size=0, timeout=5)
+        download = self._environ('GET', '/v2/images/fake/file')
+        start_response = mock.Mock()
+
+        first = control(download, start_response)
+        control(download, start_response)
+        self.assertEqual(1, app.call_count)
+        status, headers = start_response.call_args[0][:2]
+        self.assertTrue(status.startswith('503'))
+        self.assertIn(('Retry-After', '5'), headers)
+        self.assertEqual(1, control.data.rejected)
+        first.close()
+
+    def test_shed_after_timeout(self):
+        app = mock.Mock(return_value=[])
+        control = self._admission_control(app, timeout=0.01)
+        download = self._environ('GET', '/v2/images/fake/file')
+        start_response = mock.Mock()
+
+        first = control(download, start_response)
+        control(download, start_response)
+        self.assertEqual(1, app.call_count)
+        status, headers = start_response.call_args[0][:2]
+        self.assertTrue(status.startswith('503'))
+        self.assertIn(('Retry-After', '1'), headers)
+        self.assertEqual(0, control.data.waiting)
+        self.assertLess(0, control.data.max_wait)
+        first.close()
+        self.assertFalse(control.data.semaphore.locked())
+
+    def test_metadata_limit(self):
+        app = mock.Mock(return_value=[])
+        control = self._admission_control(app, data=0, metadata=1,
+                                          queue_size=0)
+        metadata = self._environ('GET', '/v2/images')
+        start_response = mock.Mock()
+
+        first = control(metadata, start_response)
+        # Transfers are not limited and do not take a metadata slot
+        control(self._environ('GET', '/v2/images/fake/file'), None).close()
+        self.assertEqual(2, app.call_count)
+        control(metadata, start_response)
+        self.assertEqual(2, app.call_count)
+        self.assertEqual(1, control.metadata.rejected)
+        first.close()
+
+    def test_release_on_error(self):
+        app = mock.Mock(side_effect=ValueError())
+        control = self._admission_control(app)
+        self.assertRaises(ValueError, control,
+                          self._environ('GET', '/v2/images/fake/file'), None)
+        self.assertFalse(control.data.semaphore.locked())
+        self.assertEqual(0, control.data.running)
+
+    def test_release_once(self):
+        control = self._admission_control(mock.Mock(return_value=[]))
+        app_iter = control(self._environ('GET', '/v2/images/fake/file'), None)
+        app_iter.close()
+        app_iter.close()
+        self.assertEqual(1, control.data.semaphore.balance)
+
+    @mock.patch.object(wsgi.LOG, 'info')
+    def test_report(self, mock_info):
+        queue = wsgi.AdmissionQueue('Data', 1, 1, 0)
+        queue.report()
+        self.assertFalse(mock_info.called)
+
+        self.assertTrue(queue.acquire())
+        queue.release()
+        queue.report()
+        self.assertEqual(1, mock_info.call_count)
+        self.assertEqual(1, mock_info.call_args[0][1]['admitted'])
+        self.assertEqual(0, queue.admitted)
+
+    def test_admission_control_disabled(self):
+        app = mock.Mock()
+        server = wsgi.Server()
+        self.assertIs(app, server._admission_control(app))
+
+    @mock.patch.object(wsgi, '_admission', None)
+    @mock.patch.object(eventlet, 'spawn_n')
+    def test_admission_control(self, mock_spawn_n):
+        self.config(max_data_transfers_per_worker=2,
+                    admission_queue_size=4, admission_queue_timeout=10)
+        server = wsgi.Server(threads=100)
+        control = server._admission_control(mock.Mock())
+        self.assertIsInstance(control, wsgi.AdmissionControl)
+        self.assertEqual(2, control.data.semaphore.balance)
+        self.assertEqual(4, control.data.queue_size)
+        # Transfers wait as long as it takes
+        self.assertIsNone(control.data.timeout)
+        self.assertIsNone(control.metadata.semaphore)
+        self.assertEqual(10, control.metadata.timeout)
+        mock_spawn_n.assert_called_once_with(control.report,
+                                             wsgi.ADMISSION_REPORT_INTERVAL)
+        self.assertIs(control, wsgi._admission)
+
+    def test_healthcheck(self):
+        healthcheck = wsgi.AdmissionHealthcheck({})
+        with mock.patch.object(wsgi, '_admission', None):
+            result = healthcheck.healthcheck(9292)
+        self.assertTrue(result.available)
+        self.assertIsNone(result.details)
+
+        control = self._admission_control(mock.Mock(return_value=[]))
+        control(self._environ('GET', '/v2/images/fake/file'), None)
+        with mock.patch.object(wsgi, '_admission', control):
+            result = healthcheck.healthcheck(9292)
+        self.assertTrue(result.available)
+        self.assertEqual(1, result.details['data']['running'])
+        self.assertEqual(1, result.details['data']['admitted'])
+        self.assertEqual(0, result.details['metadata']['admitted'])
+
+
 class TestHelpers(test_utils.BaseTestCase):
 
     def test_headers_are_unicode(self):
@@ -671,6 +1060,18 @@ class GetSocketTestCase(test_utils.BaseTestCase):
                 socket.TCP_KEEPIDLE,
                 wsgi.CONF.tcp_keepidle), mock_socket.mock_calls)
 
+    def test_get_socket_reuse_port(self):
+        mock_socket = mock.Mock()
+        self.useFixture(fixtures.MonkeyPatch(
+            'xmonitor.common.wsgi.socket.socket',
+            mock.Mock(return_value=mock_socket)))
+        self.useFixture(fixtures.MonkeyPatch(
+            'xmonitor.common.wsgi.socket.SO_REUSEPORT', 15))
+        self.assertEqual(mock_socket, wsgi.get_socket(1234, reuse_port=True))
+        mock_socket.setsockopt.assert_any_call(socket.SOL_SOCKET, 15, 1)
+        mock_socket.bind.assert_called_once_with(('192.168.0.13', 1234))
+        mock_socket.listen.assert_called_once_with(wsgi.CONF.backlog)
+
     def test_get_socket_without_all_ssl_reqs(self):
         wsgi.CONF.key_file = None
         self.assertRaises(RuntimeError, wsgi.get_socket, 1234)
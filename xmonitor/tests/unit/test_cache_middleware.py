@@ -378,6 +378,25 @@ class TestCacheMiddlewareProcessRequest(base.IsolatedUnitTest):
                          response.headers['Content-Type'])
         self.assertEqual('c1234', response.headers['Content-MD5'])
         self.assertEqual('123456789', response.headers['Content-Length'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_v2_process_request_gzip_variant(self):
+        image_id = 'test1'
+        request = webob.Request.blank('/v2/images/test1/file')
+        request.headers['Accept-Encoding'] = 'deflate, gzip'
+        request.context = context.RequestContext()
+        request.environ['api.cache.image'] = ImageStub(image_id)
+        image_meta = {'id': image_id, 'status': 'active', 'deleted': False,
+                      'size': 123456789}
+
+        cache_filter = ProcessRequestTestCacheFilter()
+        cache_filter.cache.open_gzip_variant = lambda image_id: (
+            7, iter([b'gzipped']))
+        response = cache_filter._process_v2_request(
+            request, image_id, iter([b'image']), image_meta)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual('7', response.headers['Content-Length'])
+        self.assertEqual('c1234', response.headers['Content-MD5'])
 
     def test_process_request_without_download_image_policy(self):
         """
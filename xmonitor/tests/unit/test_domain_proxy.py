@@ -302,3 +302,83 @@ class TestTaskFactory(test_utils.BaseTestCase):
         )
         self.assertIsInstance(task, FakeProxy)
         self.assertEqual('fake_task', task.base)
+
+
+class FakeDomainImage(object):
+    def __init__(self):
+        self.name = 'arya'
+        self.visibility = 'private'
+
+    def get_data(self):
+        return 'data'
+
+
+class FakeGuardedImageProxy(proxy.Image):
+    def __init__(self, image):
+        self.image = image
+        super(FakeGuardedImageProxy, self).__init__(image)
+
+    @property
+    def visibility(self):
+        return self.image.visibility
+
+    @visibility.setter
+    def visibility(self, value):
+        self.image.visibility = 'guarded-%s' % value
+
+    def get_data(self):
+        return 'guarded-%s' % self.image.get_data()
+
+
+class TestComposedProxy(test_utils.BaseTestCase):
+    def setUp(self):
+        super(TestComposedProxy, self).setUp()
+        self.domain_image = FakeDomainImage()
+        self.chain = proxy.Image(FakeGuardedImageProxy(
+            proxy.Image(self.domain_image)))
+        self.image = proxy.compose(self.chain)
+
+    def test_compose_none(self):
+        self.assertIsNone(proxy.compose(None))
+
+    def test_compose_unproxied(self):
+        self.assertIs(self.domain_image, proxy.compose(self.domain_image))
+
+    def test_compose_idempotent(self):
+        self.assertIs(self.image, proxy.compose(self.image))
+
+    def test_class_cached_per_configuration(self):
+        other = proxy.compose(proxy.Image(FakeGuardedImageProxy(
+            proxy.Image(FakeDomainImage()))))
+        self.assertIs(type(self.image), type(other))
+        self.assertIsNot(type(self.image),
+                         type(proxy.compose(proxy.Image(FakeDomainImage()))))
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, object.__getattribute__,
+                          self.image, '__dict__')
+
+    def test_passthrough_attribute(self):
+        self.assertEqual('arya', self.image.name)
+        self.image.name = 'sansa'
+        self.assertEqual('sansa', self.domain_image.name)
+
+    def test_overridden_attribute(self):
+        self.image.visibility = 'public'
+        self.assertEqual('guarded-public', self.image.visibility)
+        self.assertEqual('guarded-public', self.domain_image.visibility)
+
+    def test_methods_use_chain(self):
+        self.assertEqual('guarded-data', self.image.get_data())
+
+    def test_decompose(self):
+        self.assertIs(self.chain, proxy.decompose(self.image))
+        self.assertIs(self.chain.base, self.image.base)
+
+    def test_repo(self):
+        repo = FakeRepo(self.chain)
+        composed_repo = proxy.ComposedRepo(repo)
+        self.assertIsInstance(composed_repo.get('abcd'), proxy.ComposedProxy)
+        composed_repo.save(self.image, from_state='queued')
+        self.assertEqual((self.chain,), repo.args)
+        self.assertEqual({'from_state': 'queued'}, repo.kwargs)
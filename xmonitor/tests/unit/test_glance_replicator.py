@@ -277,7 +277,7 @@ class FakeImageService(object):
     def __init__(self, http_conn, authtoken):
         self.authtoken = authtoken
 
-    def get_images(self):
+    def get_images(self, changes_since=None):
         if self.authtoken == 'livemastertoken':
             return FAKEIMAGES_LIVEMASTER
         return FAKEIMAGES
@@ -297,6 +297,9 @@ class FakeImageService(object):
     def add_image(self, meta, data):
         return {'status': 200}, None
 
+    def delete_image(self, id):
+        pass
+
 
 def get_image_service():
     return FakeImageService
@@ -376,43 +379,64 @@ class ReplicationCommandsTestCase(test_utils.BaseTestCase):
         command = glance_replicator.replication_size
         self.assertTrue(check_bad_args(command, args))
 
-    def test_replication_dump(self):
-        tempdir = self.useFixture(fixtures.TempDir()).path
-
+    def _dump(self, tempdir, image_service=get_image_service):
         options = moves.UserDict()
         options.chunksize = 4096
         options.mastertoken = 'mastertoken'
         options.metaonly = False
+        options.image_workers = 2
+        options.retries = 0
         args = ['localhost:9292', tempdir]
 
         orig_img_service = glance_replicator.get_image_service
         self.addCleanup(setattr, glance_replicator,
                         'get_image_service', orig_img_service)
-        glance_replicator.get_image_service = get_image_service
-        glance_replicator.replication_dump(options, args)
+        glance_replicator.get_image_service = image_service
+        return glance_replicator.replication_dump(options, args)
+
+    def test_replication_dump(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self._dump(tempdir)
+
+        manifest = glance_replicator.Manifest(
+            os.path.join(tempdir, glance_replicator.MANIFEST_NAME))
+        self.assertEqual(sorted(img['id'] for img in FAKEIMAGES),
+                         sorted(img['id'] for img in manifest))
+        for d in manifest:
+            self.assertIn('status', d)
+            self.assertIn('id', d)
+            self.assertIn('size', d)
 
         for active in ['5dcddce0-cba5-4f18-9cf4-9853c7b207a6',
                        '37ff82db-afca-48c7-ae0b-ddc7cf83e3db']:
             imgfile = os.path.join(tempdir, active)
-            self.assertTrue(os.path.exists(imgfile))
-            self.assertTrue(os.path.exists('%s.img' % imgfile))
-
-            with open(imgfile) as f:
-                d = jsonutils.loads(f.read())
-                self.assertIn('status', d)
-                self.assertIn('id', d)
-                self.assertIn('size', d)
+            with open('%s.img' % imgfile, 'rb') as f:
+                self.assertEqual(b'data', f.read())
 
         for inactive in ['f4da1d2a-40e8-4710-b3aa-0222a4cc887b']:
             imgfile = os.path.join(tempdir, inactive)
-            self.assertTrue(os.path.exists(imgfile))
             self.assertFalse(os.path.exists('%s.img' % imgfile))
 
-            with open(imgfile) as f:
-                d = jsonutils.loads(f.read())
-                self.assertIn('status', d)
-                self.assertIn('id', d)
-                self.assertIn('size', d)
+    def test_replication_dump_resumes(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.assertEqual(3, len(self._dump(tempdir)))
+        with mock.patch.object(FakeImageService, 'get_image') as get_image:
+            self.assertEqual([], self._dump(tempdir))
+        self.assertFalse(get_image.called)
+
+    def test_replication_dump_failure_not_recorded(self):
+        class BrokenImageService(FakeImageService):
+            def get_image(self, id):
+                if id == '37ff82db-afca-48c7-ae0b-ddc7cf83e3db':
+                    raise IOError()
+                return super(BrokenImageService, self).get_image(id)
+
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self._dump(tempdir, image_service=lambda: BrokenImageService)
+        manifest = glance_replicator.Manifest(
+            os.path.join(tempdir, glance_replicator.MANIFEST_NAME))
+        self.assertNotIn('37ff82db-afca-48c7-ae0b-ddc7cf83e3db', manifest)
+        self.assertIn('5dcddce0-cba5-4f18-9cf4-9853c7b207a6', manifest)
 
     def test_replication_dump_with_no_args(self):
         args = []
@@ -469,6 +493,9 @@ class ReplicationCommandsTestCase(test_utils.BaseTestCase):
         options = moves.UserDict()
         options.dontreplicate = 'dontrepl dontreplabsent'
         options.slavetoken = 'slavetoken'
+        options.image_workers = 2
+        options.retries = 0
+        options.journal = None
         args = ['localhost:9292', tempdir]
 
         orig_img_service = glance_replicator.get_image_service
@@ -483,6 +510,40 @@ class ReplicationCommandsTestCase(test_utils.BaseTestCase):
         self.assertIn(new_id, updated)
         self.assertNotIn(new_id_missing_data, updated)
 
+    def test_replication_load_from_manifest(self):
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        manifest = glance_replicator.Manifest(
+            os.path.join(tempdir, glance_replicator.MANIFEST_NAME))
+        new_id = str(uuid.uuid4())
+        manifest.add(dict(FAKEIMAGES[0], extra='thisissomeextra'))
+        manifest.add(dict(FAKEIMAGES[2], id=new_id))
+        manifest.close()
+        with open(os.path.join(tempdir, new_id + '.img'), 'wb') as f:
+            f.write(b'dskjfhskjhfkfdhksjdhf')
+
+        options = moves.UserDict()
+        options.dontreplicate = 'dontrepl dontreplabsent'
+        options.slavetoken = 'slavetoken'
+        options.image_workers = 2
+        options.retries = 0
+        options.journal = os.path.join(tempdir, 'journal')
+        args = ['localhost:9292', tempdir]
+
+        orig_img_service = glance_replicator.get_image_service
+        self.addCleanup(setattr, glance_replicator,
+                        'get_image_service', orig_img_service)
+        glance_replicator.get_image_service = get_image_service
+
+        with mock.patch.object(FakeImageService, 'add_image',
+                               side_effect=IOError()):
+            updated = glance_replicator.replication_load(options, list(args))
+        self.assertEqual(['5dcddce0-cba5-4f18-9cf4-9853c7b207a6'], updated)
+
+        # The second load only retries the image that failed
+        updated = glance_replicator.replication_load(options, list(args))
+        self.assertEqual([new_id], updated)
+        self.assertFalse(os.path.exists(options.journal))
+
     def test_replication_load_with_no_args(self):
         args = []
         command = glance_replicator.replication_load
@@ -493,23 +554,121 @@ class ReplicationCommandsTestCase(test_utils.BaseTestCase):
         command = glance_replicator.replication_load
         self.assertTrue(check_bad_args(command, args))
 
-    def test_replication_livecopy(self):
+    def _get_livecopy_options(self, journal=None, retries=0,
+                              sync_state=None):
         options = moves.UserDict()
         options.chunksize = 4096
         options.dontreplicate = 'dontrepl dontreplabsent'
         options.mastertoken = 'livemastertoken'
         options.slavetoken = 'liveslavetoken'
         options.metaonly = False
-        args = ['localhost:9292', 'localhost:9393']
+        options.image_workers = 2
+        options.journal = journal
+        options.retries = retries
+        options.sync_state = sync_state
+        return options
 
+    def _livecopy(self, options, image_service=get_image_service):
+        args = ['localhost:9292', 'localhost:9393']
         orig_img_service = glance_replicator.get_image_service
         try:
-            glance_replicator.get_image_service = get_image_service
-            updated = glance_replicator.replication_livecopy(options, args)
+            glance_replicator.get_image_service = image_service
+            return glance_replicator.replication_livecopy(options, args)
         finally:
             glance_replicator.get_image_service = orig_img_service
 
-        self.assertEqual(2, len(updated))
+    def test_replication_livecopy(self):
+        updated = self._livecopy(self._get_livecopy_options())
+        self.assertEqual(sorted(['37ff82db-afca-48c7-ae0b-ddc7cf83e3db',
+                                 '15648dd7-8dd0-401c-bd51-550e1ba9a088']),
+                         sorted(updated))
+
+    @mock.patch.object(FakeImageService, 'delete_image')
+    def test_replication_livecopy_deletes(self, mock_delete):
+        updated = self._livecopy(self._get_livecopy_options())
+        self.assertIn('37ff82db-afca-48c7-ae0b-ddc7cf83e3db', updated)
+        mock_delete.assert_called_once_with(
+            '37ff82db-afca-48c7-ae0b-ddc7cf83e3db')
+
+    def test_replication_livecopy_changes_since(self):
+        class ChangedImageService(FakeImageService):
+            changes_since = []
+
+            def get_images(self, changes_since=None):
+                if self.authtoken != 'livemastertoken':
+                    raise AssertionError('The slave must not be listed')
+                self.changes_since.append(changes_since)
+                image = dict(FAKEIMAGES_LIVEMASTER[2],
+                             updated_at='2016-06-01T10:00:05')
+                return [image]
+
+        sync_state = os.path.join(self.test_dir, 'sync_state')
+        with open(sync_state, 'w') as f:
+            f.write(jsonutils.dumps({'changes_since': '2016-06-01T09:00:00Z'}))
+
+        with mock.patch.object(FakeImageService, 'delete_image') as delete:
+            updated = self._livecopy(
+                self._get_livecopy_options(sync_state=sync_state),
+                image_service=lambda: ChangedImageService)
+
+        self.assertEqual(['2016-06-01T09:00:00Z'],
+                         ChangedImageService.changes_since)
+        self.assertEqual(['37ff82db-afca-48c7-ae0b-ddc7cf83e3db'], updated)
+        delete.assert_called_once_with('37ff82db-afca-48c7-ae0b-ddc7cf83e3db')
+        with open(sync_state) as f:
+            self.assertEqual({'changes_since': '2016-06-01T10:00:04Z'},
+                             jsonutils.loads(f.read()))
+
+    def test_replication_livecopy_first_sync_saves_state(self):
+        sync_state = os.path.join(self.test_dir, 'sync_state')
+        self._livecopy(self._get_livecopy_options(sync_state=sync_state))
+        # None of the fake images has an updated_at to start from
+        self.assertFalse(os.path.exists(sync_state))
+
+    def test_replication_livecopy_lists_slave_once(self):
+        with mock.patch.object(FakeImageService, 'get_image_meta') as meta:
+            self._livecopy(self._get_livecopy_options())
+        self.assertFalse(meta.called)
+
+    def test_replication_livecopy_resumes_from_journal(self):
+        journal = os.path.join(self.test_dir, 'journal')
+        with open(journal, 'w') as f:
+            f.write('15648dd7-8dd0-401c-bd51-550e1ba9a088\n')
+
+        updated = self._livecopy(self._get_livecopy_options(journal))
+        self.assertEqual(['37ff82db-afca-48c7-ae0b-ddc7cf83e3db'], updated)
+        # Everything got replicated, the journal is no longer needed
+        self.assertFalse(os.path.exists(journal))
+
+    @mock.patch.object(glance_replicator.time, 'sleep')
+    def test_replication_livecopy_retries(self, mock_sleep):
+        class FlakyImageService(FakeImageService):
+            failures = [IOError(), moves.http_client.HTTPException()]
+
+            def add_image(self, meta, data):
+                if self.failures:
+                    raise self.failures.pop(0)
+                return super(FlakyImageService, self).add_image(meta, data)
+
+        updated = self._livecopy(self._get_livecopy_options(retries=2),
+                                 image_service=lambda: FlakyImageService)
+        self.assertIn('15648dd7-8dd0-401c-bd51-550e1ba9a088', updated)
+        self.assertEqual([mock.call(1), mock.call(2)],
+                         mock_sleep.call_args_list)
+
+    def test_replication_livecopy_keeps_journal_on_failure(self):
+        class BrokenImageService(FakeImageService):
+            def add_image(self, meta, data):
+                raise IOError()
+
+        journal = os.path.join(self.test_dir, 'journal')
+        updated = self._livecopy(self._get_livecopy_options(journal),
+                                 image_service=lambda: BrokenImageService)
+        self.assertEqual(['37ff82db-afca-48c7-ae0b-ddc7cf83e3db'], updated)
+        with open(journal) as f:
+            done = f.read().split()
+        self.assertNotIn('15648dd7-8dd0-401c-bd51-550e1ba9a088', done)
+        self.assertIn('37ff82db-afca-48c7-ae0b-ddc7cf83e3db', done)
 
     def test_replication_livecopy_with_no_args(self):
         args = []
@@ -555,6 +714,41 @@ class ReplicationCommandsTestCase(test_utils.BaseTestCase):
         self.assertTrue(check_bad_args(command, args))
 
 
+class ManifestTestCase(test_utils.BaseTestCase):
+    def setUp(self):
+        super(ManifestTestCase, self).setUp()
+        self.path = os.path.join(self.test_dir, 'manifest.gz')
+
+    def test_append(self):
+        manifest = glance_replicator.Manifest(self.path)
+        manifest.add({'id': 'a', 'size': 1})
+        manifest.close()
+        manifest = glance_replicator.Manifest(self.path)
+        manifest.add({'id': 'b', 'size': 2})
+        manifest.add({'id': 'a', 'size': 3})
+        manifest.close()
+
+        manifest = glance_replicator.Manifest(self.path)
+        self.assertIn('a', manifest)
+        self.assertEqual([{'id': 'a', 'size': 3}, {'id': 'b', 'size': 2}],
+                         list(manifest))
+
+    def test_truncated(self):
+        manifest = glance_replicator.Manifest(self.path)
+        manifest.add({'id': 'a'})
+        manifest.add({'id': 'b'})
+        # Leave the last entry unfinished, as an interrupted dump would
+        manifest._file.fileobj.truncate(manifest._file.fileobj.tell() - 3)
+        manifest._file.fileobj.close()
+        manifest._file = None
+
+        manifest = glance_replicator.Manifest(self.path)
+        self.assertIn('a', manifest)
+        manifest.add({'id': 'c'})
+        manifest.close()
+        self.assertIn('c', glance_replicator.Manifest(self.path))
+
+
 class ReplicationUtilitiesTestCase(test_utils.BaseTestCase):
     def test_check_upload_response_headers(self):
         glance_replicator._check_upload_response_headers({'status': 'active'},
@@ -568,13 +762,6 @@ class ReplicationUtilitiesTestCase(test_utils.BaseTestCase):
             exception.UploadException,
             glance_replicator._check_upload_response_headers, {}, None)
 
-    def test_image_present(self):
-        client = FakeImageService(None, 'noauth')
-        self.assertTrue(glance_replicator._image_present(
-            client, '5dcddce0-cba5-4f18-9cf4-9853c7b207a6'))
-        self.assertFalse(glance_replicator._image_present(
-            client, uuid.uuid4()))
-
     def test_dict_diff(self):
         a = {'a': 1, 'b': 2, 'c': 3}
         b = {'a': 1, 'b': 2}
@@ -587,3 +774,33 @@ class ReplicationUtilitiesTestCase(test_utils.BaseTestCase):
         self.assertTrue(glance_replicator._dict_diff(a, b))
         self.assertTrue(glance_replicator._dict_diff(a, c))
         self.assertFalse(glance_replicator._dict_diff(a, d))
+
+    def test_normalize_meta(self):
+        meta = {'id': 'fake', 'size': 1024, 'is_public': True,
+                'checksum': None, 'properties': {'Distro': 'fedora',
+                                                 'kernel_id': None}}
+        self.assertEqual({'id': 'fake', 'size': '1024', 'is_public': 'True',
+                          'properties': {'distro': 'fedora'}},
+                         glance_replicator._normalize_meta(meta))
+        self.assertEqual({'id': 'fake'}, glance_replicator._normalize_meta(
+            {'id': 'fake', 'properties': {}}))
+
+    def test_livecopy_image_head_metadata(self):
+        # The slave image as get_image_meta returns it after a retry
+        image = {'id': 'fake', 'status': 'active', 'size': 1024,
+                 'is_public': False, 'checksum': None,
+                 'properties': {'Distro': 'fedora'}}
+        headers = {'id': 'fake', 'status': 'active', 'size': '1024',
+                   'is_public': 'False', 'properties': {'distro': 'fedora'}}
+        options = moves.UserDict()
+        options.dontreplicate = ''
+        slave_client = mock.Mock()
+        self.assertFalse(glance_replicator._livecopy_image(
+            options, None, slave_client, image, headers))
+        self.assertFalse(slave_client.add_image_meta.called)
+
+        headers['size'] = '2048'
+        slave_client.add_image_meta.return_value = {'status': 'active'}, None
+        self.assertTrue(glance_replicator._livecopy_image(
+            options, None, slave_client, image, headers))
+        slave_client.add_image_meta.assert_called_once_with(image)
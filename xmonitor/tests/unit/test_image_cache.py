@@ -431,6 +431,77 @@ class ImageCacheTestCase(object):
         # checksum is invalid, caching will fail:
         self.assertFalse(cache.is_cached(image_id))
 
+    def _setup_gzip_variant(self):
+        self._setup_fixture_file()
+        self.config(image_cache_gzip_variants=True)
+        compressed = [b'gzip', b'ped']
+        variant_iter = self.cache.get_gzip_variant_iter(1, compressed)
+        self.assertEqual(compressed, list(variant_iter))
+
+    @skip_if_disabled
+    def test_gzip_variant(self):
+        self._setup_gzip_variant()
+
+        size, variant_iter = self.cache.open_gzip_variant(1)
+        self.assertEqual(7, size)
+        self.assertEqual(b'gzipped', b''.join(variant_iter))
+        self.assertEqual([], [name for name in os.listdir(self.cache.gzip_dir)
+                              if name.startswith('.')])
+
+    @skip_if_disabled
+    def test_gzip_variant_disabled(self):
+        self._setup_fixture_file()
+        compressed = [b'gzipped']
+
+        self.assertIs(compressed,
+                      self.cache.get_gzip_variant_iter(1, compressed))
+        self.assertIsNone(self.cache.open_gzip_variant(1))
+
+    @skip_if_disabled
+    def test_gzip_variant_not_cached(self):
+        self.config(image_cache_gzip_variants=True)
+        compressed = [b'gzipped']
+
+        self.assertIs(compressed,
+                      self.cache.get_gzip_variant_iter(1, compressed))
+        self.assertIsNone(self.cache.open_gzip_variant(1))
+
+    @skip_if_disabled
+    def test_gzip_variant_interrupted(self):
+        self._setup_fixture_file()
+        self.config(image_cache_gzip_variants=True)
+
+        def compressed():
+            yield b'gzip'
+            raise IOError()
+
+        variant_iter = self.cache.get_gzip_variant_iter(1, compressed())
+        self.assertRaises(IOError, list, variant_iter)
+        self.assertIsNone(self.cache.open_gzip_variant(1))
+        self.assertEqual([], os.listdir(self.cache.gzip_dir))
+
+    @skip_if_disabled
+    def test_gzip_variant_deleted(self):
+        self._setup_gzip_variant()
+
+        self.cache.delete_cached_image(1)
+
+        self.assertEqual([], os.listdir(self.cache.gzip_dir))
+
+    @skip_if_disabled
+    def test_gzip_variant_clean(self):
+        self._setup_gzip_variant()
+        self.cache.driver.delete_cached_image(1)
+        stalled_path = os.path.join(self.cache.gzip_dir, '.2.stalled')
+        with open(stalled_path, 'wb') as stalled:
+            stalled.write(b'gzip')
+        old = time.time() - 3600
+        os.utime(stalled_path, (old, old))
+
+        self.cache.clean(stall_time=60)
+
+        self.assertEqual([], os.listdir(self.cache.gzip_dir))
+
 
 class TestImageCacheXattr(test_utils.BaseTestCase,
                           ImageCacheTestCase):
@@ -1821,6 +1821,27 @@ class MigrationsMixin(test_migrations.WalkVersionsMixin):
                           metadef_resource_types.name, engine)
                          )
 
+    def _pre_upgrade_045(self, engine):
+        self.assertRaises(sqlalchemy.exc.NoSuchTableError,
+                          db_utils.get_table, engine, 'metadef_generation')
+
+    def _check_045(self, engine, data):
+        table = db_utils.get_table(engine, 'metadef_generation')
+        expected_cols = [u'id',
+                         u'generation',
+                         u'created_at',
+                         u'updated_at']
+        col_data = [col.name for col in table.columns]
+        self.assertEqual(expected_cols, col_data)
+
+    def _check_046(self, engine, data):
+        meta = sqlalchemy.MetaData()
+        meta.bind = engine
+        image_locations = sqlalchemy.Table('image_locations', meta,
+                                           autoload=True)
+        self.assertTrue(index_exist('ix_image_locations_status_deleted_at',
+                                    image_locations.name, engine))
+
     def assert_table(self, engine, table_name, indices, columns):
         table = db_utils.get_table(engine, table_name)
         index_data = [(index.name, index.columns.keys()) for index in
@@ -24,8 +24,10 @@ import webob
 
 import xmonitor.async
 from xmonitor.common import exception
+from xmonitor.common import metadef_cache
 from xmonitor.common import timeutils
 import xmonitor.context
+import xmonitor.gateway
 from xmonitor import notifier
 import xmonitor.tests.unit.utils as unit_test_utils
 from xmonitor.tests import utils
@@ -113,6 +115,14 @@ class TaskRepoStub(object):
         return ['tasks_from_list']
 
 
+class MetadefNamespaceRepoStub(object):
+    def save(self, *args, **kwargs):
+        return 'namespace_from_save'
+
+    def get(self, *args, **kwargs):
+        return 'namespace_from_get'
+
+
 class TestNotifier(utils.BaseTestCase):
 
     @mock.patch.object(oslo_messaging, 'Notifier')
@@ -131,6 +141,110 @@ class TestNotifier(utils.BaseTestCase):
     def test_notifier_load(self):
         self._test_load_strategy(url=None, driver=None)
 
+    @mock.patch.object(notifier, '_queue_enabled', True)
+    @mock.patch.object(notifier, '_queue', None)
+    @mock.patch.object(oslo_messaging, 'Notifier')
+    @mock.patch.object(oslo_messaging, 'get_notification_transport')
+    def test_notifications_queued(self, mock_get_transport, mock_notifier):
+        nfier = notifier.Notifier()
+        nfier.info('image.upload', {'id': UUID1})
+        nfier.error('image.upload', 'Image storage media is full')
+
+        queue = notifier.get_queue()
+        self.assertTrue(queue.flush(10))
+        self.assertEqual([mock.call({}, 'image.upload', {'id': UUID1})],
+                         mock_notifier.return_value.info.call_args_list)
+        self.assertEqual([mock.call({}, 'image.upload',
+                                    'Image storage media is full')],
+                         mock_notifier.return_value.error.call_args_list)
+        self.assertEqual(0, queue.stats()['queued'])
+        self.assertEqual(2, queue.stats()['sent'])
+
+    @mock.patch.object(oslo_messaging, 'Notifier')
+    @mock.patch.object(oslo_messaging, 'get_notification_transport')
+    def test_notifications_not_queued(self, mock_get_transport,
+                                      mock_notifier):
+        self.config(notification_queue_size=0)
+        nfier = notifier.Notifier()
+        nfier.warn('image.upload', {'id': UUID1})
+        mock_notifier.return_value.warn.assert_called_once_with(
+            {}, 'image.upload', {'id': UUID1})
+        self.assertIsNone(notifier.get_queue())
+
+    @mock.patch.object(notifier, '_queue_enabled', False)
+    @mock.patch.object(notifier, '_queue', None)
+    @mock.patch.object(oslo_messaging, 'Notifier')
+    @mock.patch.object(oslo_messaging, 'get_notification_transport')
+    def test_notifications_not_queued_outside_api(self, mock_get_transport,
+                                                  mock_notifier):
+        nfier = notifier.Notifier()
+        nfier.info('image.upload', {'id': UUID1})
+        mock_notifier.return_value.info.assert_called_once_with(
+            {}, 'image.upload', {'id': UUID1})
+        self.assertIsNone(notifier.get_queue())
+
+    def test_queue_full(self):
+        queue = notifier.NotificationQueue(1, 64)
+        oslo_notifier = mock.Mock()
+
+        def image_send(image_id, bytes_sent):
+            return {'bytes_sent': bytes_sent, 'image_id': image_id,
+                    'owner_id': TENANT1, 'receiver_tenant_id': TENANT2,
+                    'receiver_user_id': USER1}
+
+        with mock.patch.object(queue, '_start'):
+            queue.put(oslo_notifier, 'info', 'image.send',
+                      image_send(UUID1, 10))
+            # Merged with the one waiting for the same download
+            queue.put(oslo_notifier, 'info', 'image.send',
+                      image_send(UUID1, 5))
+            queue.put(oslo_notifier, 'info', 'image.send',
+                      image_send('other', 5))
+            # Sent right away
+            queue.put(oslo_notifier, 'info', 'image.activate', {})
+            oslo_notifier.info.assert_called_once_with({}, 'image.activate',
+                                                       {})
+
+        queue._run()
+        oslo_notifier.info.assert_called_with({}, 'image.send',
+                                              image_send(UUID1, 15))
+        stats = queue.stats()
+        self.assertEqual({'queued': 0, 'sent': 2, 'merged': 1,
+                          'dropped': 1, 'overflowed': 1},
+                         dict((key, stats[key]) for key in
+                              ('queued', 'sent', 'merged', 'dropped',
+                               'overflowed')))
+        self.assertTrue(queue.flush(0))
+
+    def test_queue_report(self):
+        queue = notifier.NotificationQueue(10, 64)
+        with mock.patch.object(notifier, 'LOG') as mock_log:
+            queue.report()
+            self.assertFalse(mock_log.info.called)
+
+            queue._send(notifier._Notification(mock.Mock(), 'info',
+                                               'image.upload', {}))
+            queue.report()
+            self.assertEqual(1, mock_log.info.call_count)
+            self.assertEqual(1, mock_log.info.call_args[0][1]['sent'])
+
+            queue.report()
+            self.assertEqual(1, mock_log.info.call_count)
+
+    @mock.patch.object(notifier, '_queue', None)
+    def test_flush_queue_none(self):
+        self.assertTrue(notifier.flush_queue())
+
+    @mock.patch.object(notifier, '_queue_enabled', True)
+    @mock.patch.object(notifier, '_queue', None)
+    def test_flush_queue(self):
+        self.config(notification_flush_timeout=5)
+        queue = notifier.get_queue()
+        with mock.patch.object(queue, 'flush',
+                               return_value=False) as mock_flush:
+            self.assertFalse(notifier.flush_queue())
+        mock_flush.assert_called_once_with(5)
+
     @mock.patch.object(oslo_messaging, 'set_transport_defaults')
     def test_set_defaults(self, mock_set_trans_defaults):
         notifier.set_defaults(control_exchange='foo')
@@ -635,3 +749,82 @@ class TestTaskNotifications(utils.BaseTestCase):
         self.assertEqual('INFO', output_log['notification_type'])
         self.assertEqual('task.failure', output_log['event_type'])
         self.assertEqual(self.task.task_id, output_log['payload']['id'])
+
+
+class TestMetadefNotifications(utils.BaseTestCase):
+    """Test Metadef Notifications work"""
+
+    def setUp(self):
+        super(TestMetadefNotifications, self).setUp()
+        namespace = xmonitor.domain.MetadefNamespace(
+            namespace_id=1, namespace='OS::Compute', display_name='Compute',
+            description=None, owner=TENANT2, visibility='public',
+            protected=False, created_at=DATETIME, updated_at=DATETIME)
+        self.context = xmonitor.context.RequestContext(tenant=TENANT2,
+                                                       user=USER1)
+        self.notifier = unit_test_utils.FakeNotifier()
+        self.namespace = notifier.MetadefNamespaceProxy(
+            namespace, self.context, self.notifier)
+        self.namespace_repo_proxy = notifier.MetadefNamespaceRepoProxy(
+            MetadefNamespaceRepoStub(), self.context, self.notifier)
+        self.cache = metadef_cache.MetadefCache(10)
+        patcher = mock.patch.object(metadef_cache, '_CACHE', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_namespace_save_invalidates_cache(self):
+        self.namespace_repo_proxy.save(self.namespace)
+        self.assertEqual(1, self.cache.generation)
+        output_logs = self.notifier.get_logs()
+        self.assertEqual(1, len(output_logs))
+        self.assertEqual('metadef_namespace.update',
+                         output_logs[0]['event_type'])
+
+    def test_namespace_get_keeps_cache(self):
+        self.namespace_repo_proxy.get('OS::Compute')
+        self.assertEqual(0, self.cache.generation)
+
+    def test_disabled_notification_invalidates_cache(self):
+        self.config(disabled_notifications=['metadef_namespace'])
+        self.namespace_repo_proxy.save(self.namespace)
+        self.assertEqual(1, self.cache.generation)
+        self.assertEqual(0, len(self.notifier.get_logs()))
+
+
+class TestGatewayProxies(utils.BaseTestCase):
+    """Test the gateway builds the notifier proxies"""
+
+    def setUp(self):
+        super(TestGatewayProxies, self).setUp()
+        self.context = xmonitor.context.RequestContext(tenant=TENANT2,
+                                                       user=USER1)
+        self.gateway = xmonitor.gateway.Gateway(
+            unit_test_utils.FakeDB(initialize=False),
+            unit_test_utils.FakeStoreAPI(),
+            unit_test_utils.FakeNotifier(),
+            unit_test_utils.FakePolicyEnforcer())
+
+    def test_factories_and_repos(self):
+        for name in ('image_factory', 'image_member_factory', 'repo',
+                     'task_factory', 'task_repo', 'task_stub_repo',
+                     'metadef_namespace_factory', 'metadef_namespace_repo',
+                     'metadef_object_factory', 'metadef_object_repo',
+                     'metadef_resource_type_factory',
+                     'metadef_resource_type_repo',
+                     'metadef_property_factory', 'metadef_property_repo',
+                     'metadef_tag_factory', 'metadef_tag_repo'):
+            self.assertIsNotNone(
+                getattr(self.gateway, 'get_%s' % name)(self.context))
+
+    def test_metadef_repo_proxies(self):
+        for proxy in (notifier.MetadefNamespaceRepoProxy,
+                      notifier.MetadefObjectRepoProxy,
+                      notifier.MetadefPropertyRepoProxy,
+                      notifier.MetadefResourceTypeRepoProxy,
+                      notifier.MetadefTagRepoProxy):
+            self.assertTrue(issubclass(proxy,
+                                       notifier.MetadefNotificationRepoProxy))
+        for proxy in (notifier.MetadefNamespaceFactoryProxy,
+                      notifier.MetadefTagFactoryProxy):
+            self.assertTrue(issubclass(proxy,
+                                       notifier.NotificationFactoryProxy))
@@ -22,6 +22,7 @@ import oslo_config.cfg
 import xmonitor.api.policy
 from xmonitor.common import exception
 import xmonitor.context
+import xmonitor.domain
 from xmonitor.tests.unit import base
 import xmonitor.tests.unit.utils as unit_test_utils
 from xmonitor.tests import utils as test_utils
@@ -337,6 +338,21 @@ class TestImagePolicy(test_utils.BaseTestCase):
         self.policy.enforce.assert_called_once_with({}, "download_image",
                                                     target)
 
+    def test_image_target_snapshot(self):
+        image = xmonitor.domain.ImageFactory().new_image(
+            image_id=UUID1, owner='tenant1', disk_format='raw',
+            extra_properties={'test_key': 'test_4321'})
+        target = xmonitor.api.policy.ImageTarget(image)
+
+        snapshot = xmonitor.api.policy.ImageTarget.snapshot(image)
+
+        self.assertEqual(UUID1, snapshot['id'])
+        self.assertEqual('test_4321', snapshot['test_key'])
+        self.assertNotIn('locations', snapshot)
+        self.assertNotIn('extra_properties', snapshot)
+        for key, value in snapshot.items():
+            self.assertEqual(target[key], value)
+
     def test_image_set_data(self):
         self.policy.enforce.side_effect = exception.Forbidden
         image = xmonitor.api.policy.ImageProxy(self.image_stub, {}, self.policy)
@@ -64,6 +64,23 @@ class TestBasicSchema(test_utils.BaseTestCase):
         actual = set(self.schema.raw()['properties'].keys())
         self.assertEqual(expected, actual)
 
+    def test_validator_cached(self):
+        validator = self.schema._get_validator()
+        self.schema.validate({'ham': 'no'})
+        self.assertIs(validator, self.schema._get_validator())
+
+    def test_validator_invalidated_by_merge(self):
+        self.schema.validate({'ham': 'no'})
+        self.schema.merge_properties({'bacon': {'type': 'string'}})
+        self.schema.validate({'bacon': 'crispy'})  # No exception raised
+
+    def test_validator_invalidated_by_new_definition(self):
+        validator = self.schema._get_validator()
+        self.schema.required = ['ham']
+        self.assertIsNot(validator, self.schema._get_validator())
+        self.assertRaises(exception.InvalidObject, self.schema.validate,
+                          {'eggs': 'scrambled'})
+
     def test_raw_json_schema(self):
         expected = {
             'name': 'basic',
@@ -12,16 +12,21 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import base64
+import hashlib
+import os
 import uuid
 
 import glance_store
 import mock
+from oslo_serialization import jsonutils
 import six
 import webob
 
 import xmonitor.api.policy
 import xmonitor.api.v2.image_data
 from xmonitor.common import exception
+from xmonitor.common import multipart
 from xmonitor.common import wsgi
 from xmonitor.tests.unit import base
 import xmonitor.tests.unit.utils as unit_test_utils
@@ -85,8 +90,9 @@ class FakeImageRepo(object):
 
 
 class FakeGateway(object):
-    def __init__(self, repo):
+    def __init__(self, repo, db_api=None):
         self.repo = repo
+        self.db_api = db_api
 
     def get_repo(self, context):
         return self.repo
@@ -457,6 +463,173 @@ class TestImagesController(base.StoreClearingUnitTest):
         self.assertEqual('queued', self.image_repo.saved_image.status)
 
 
+class TestMultipartUploads(base.StoreClearingUnitTest):
+
+    def setUp(self):
+        super(TestMultipartUploads, self).setUp()
+        self.config(multipart_upload_dir=os.path.join(self.test_dir,
+                                                      'uploads'))
+        self.image = FakeImage(unit_test_utils.UUID1, status='queued')
+        self.image.owner = unit_test_utils.TENANT1
+        self.image.set_data = self._set_data
+        self.image_repo = FakeImageRepo(self.image)
+        self.policy = unit_test_utils.FakePolicyEnforcer()
+        self.db_api = mock.Mock()
+        self.db_api.user_get_storage_usage.return_value = 0
+        self.controller = xmonitor.api.v2.image_data.ImageDataController(
+            gateway=FakeGateway(self.image_repo, self.db_api),
+            policy_enforcer=self.policy)
+        self.request = unit_test_utils.get_fake_request()
+
+    def _set_data(self, data, size=None):
+        self.image.data = b''.join(data)
+        self.image.size = size
+        self.image.status = 'active'
+
+    def _create_upload(self):
+        return self.controller.create_upload(self.request,
+                                             unit_test_utils.UUID1)
+
+    def test_upload_in_parts(self):
+        upload_id = self._create_upload()['upload_id']
+        part = self.controller.upload_part(
+            self.request, unit_test_utils.UUID1, upload_id, '2',
+            six.BytesIO(b'WORLD'))
+        self.assertEqual(2, part['part_number'])
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'),
+                                    hashlib.md5(b'HELLO').hexdigest())
+
+        upload = self.controller.show_upload(self.request,
+                                             unit_test_utils.UUID1,
+                                             upload_id)
+        self.assertEqual([1, 2], [uploaded['part_number']
+                                  for uploaded in upload['parts']])
+
+        self.controller.complete_upload(self.request, unit_test_utils.UUID1,
+                                        upload_id,
+                                        [{'part_number': 1},
+                                         {'part_number': 2,
+                                          'checksum': part['checksum']}])
+        self.assertEqual(b'HELLOWORLD', self.image.data)
+        self.assertEqual(10, self.image.size)
+        self.assertEqual('active', self.image_repo.saved_image.status)
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.show_upload, self.request,
+                          unit_test_utils.UUID1, upload_id)
+
+    def test_complete_missing_part(self):
+        upload_id = self._create_upload()['upload_id']
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'))
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.controller.complete_upload, self.request,
+                          unit_test_utils.UUID1, upload_id,
+                          [{'part_number': 1}, {'part_number': 2}])
+        self.assertEqual('queued', self.image.status)
+
+        # NOTE: Resumed by uploading the missing part only
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '2', six.BytesIO(b'WORLD'))
+        self.controller.complete_upload(self.request, unit_test_utils.UUID1,
+                                        upload_id,
+                                        [{'part_number': 1},
+                                         {'part_number': 2}])
+        self.assertEqual(b'HELLOWORLD', self.image.data)
+
+    def test_complete_failure_keeps_parts(self):
+        upload_id = self._create_upload()['upload_id']
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'))
+        self.image.set_data = Raise(glance_store.StorageFull)
+        self.assertRaises(webob.exc.HTTPRequestEntityTooLarge,
+                          self.controller.complete_upload, self.request,
+                          unit_test_utils.UUID1, upload_id,
+                          [{'part_number': 1}])
+        self.assertEqual('queued', self.image.status)
+        upload = self.controller.show_upload(self.request,
+                                             unit_test_utils.UUID1,
+                                             upload_id)
+        self.assertEqual(1, len(upload['parts']))
+
+    def test_upload_part_bad_checksum(self):
+        upload_id = self._create_upload()['upload_id']
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.controller.upload_part, self.request,
+                          unit_test_utils.UUID1, upload_id, '1',
+                          six.BytesIO(b'HELLO'),
+                          hashlib.md5(b'WORLD').hexdigest())
+
+    def test_upload_part_bad_number(self):
+        upload_id = self._create_upload()['upload_id']
+        for number in ('one', '0'):
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.controller.upload_part, self.request,
+                              unit_test_utils.UUID1, upload_id, number,
+                              six.BytesIO(b'HELLO'))
+
+    def test_upload_unknown(self):
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.upload_part, self.request,
+                          unit_test_utils.UUID1, unit_test_utils.UUID2, '1',
+                          six.BytesIO(b'HELLO'))
+
+    def test_delete_upload(self):
+        upload_id = self._create_upload()['upload_id']
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'))
+        self.controller.delete_upload(self.request, unit_test_utils.UUID1,
+                                      upload_id)
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.show_upload, self.request,
+                          unit_test_utils.UUID1, upload_id)
+
+    def test_upload_part_over_quota(self):
+        self.config(user_storage_quota='8B')
+        self.db_api.user_get_storage_usage.return_value = 2
+        upload_id = self._create_upload()['upload_id']
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'))
+        self.assertRaises(webob.exc.HTTPRequestEntityTooLarge,
+                          self.controller.upload_part, self.request,
+                          unit_test_utils.UUID1, upload_id, '2',
+                          six.BytesIO(b'WORLD'))
+        self.db_api.user_get_storage_usage.assert_called_with(
+            self.request.context, self.request.context.owner,
+            image_id=unit_test_utils.UUID1)
+
+    def test_create_upload_expires_uploads(self):
+        with mock.patch.object(multipart, 'expire_uploads') as mock_expire:
+            self._create_upload()
+        mock_expire.assert_called_once_with()
+
+    def test_killed_image_deletes_uploads(self):
+        upload_id = self._create_upload()['upload_id']
+        self.controller.upload_part(self.request, unit_test_utils.UUID1,
+                                    upload_id, '1', six.BytesIO(b'HELLO'))
+        self.controller._delete(self.image_repo, self.image)
+        self.assertEqual('killed', self.image.status)
+        self.assertRaises(webob.exc.HTTPNotFound,
+                          self.controller.show_upload, self.request,
+                          unit_test_utils.UUID1, upload_id)
+
+    def test_create_upload_disabled(self):
+        self.config(multipart_upload_dir=None)
+        self.assertRaises(webob.exc.HTTPNotImplemented, self._create_upload)
+
+    def test_create_upload_not_queued(self):
+        self.image.status = 'active'
+        self.assertRaises(webob.exc.HTTPConflict, self._create_upload)
+
+    def test_create_upload_forbidden(self):
+        self.policy.set_rules({'upload_image': False})
+        self.assertRaises(webob.exc.HTTPForbidden, self._create_upload)
+
+    def test_create_upload_not_owner(self):
+        self.image.owner = unit_test_utils.TENANT2
+        self.assertRaises(webob.exc.HTTPForbidden, self._create_upload)
+
+
 class TestImageDataDeserializer(test_utils.BaseTestCase):
 
     def setUp(self):
@@ -527,6 +700,41 @@ class TestImageDataDeserializer(test_utils.BaseTestCase):
                           self.deserializer.upload, request)
 
 
+    def test_upload_part(self):
+        request = unit_test_utils.get_fake_request()
+        request.headers['Content-Type'] = 'application/octet-stream'
+        request.headers['Content-MD5'] = base64.b64encode(
+            hashlib.md5(b'YYY').digest()).decode('ascii')
+        request.body = b'YYY'
+        output = self.deserializer.upload_part(request)
+        self.assertEqual(b'YYY', output['data'].read())
+        self.assertEqual(hashlib.md5(b'YYY').hexdigest(), output['checksum'])
+
+    def test_upload_part_bad_content_md5(self):
+        request = unit_test_utils.get_fake_request()
+        request.headers['Content-Type'] = 'application/octet-stream'
+        request.headers['Content-MD5'] = 'not base64!'
+        request.body = b'YYY'
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.upload_part, request)
+
+    def test_complete_upload(self):
+        request = unit_test_utils.get_fake_request()
+        request.body = jsonutils.dump_as_bytes(
+            {'parts': [{'part_number': 1, 'checksum': 'abc'}]})
+        output = self.deserializer.complete_upload(request)
+        self.assertEqual({'parts': [{'part_number': 1, 'checksum': 'abc'}]},
+                         output)
+
+    def test_complete_upload_invalid(self):
+        for body in ({}, {'parts': {}}, {'parts': [1]},
+                     {'parts': [{'part_number': 1, 'checksum': 1}]}):
+            request = unit_test_utils.get_fake_request()
+            request.body = jsonutils.dump_as_bytes(body)
+            self.assertRaises(webob.exc.HTTPBadRequest,
+                              self.deserializer.complete_upload, request)
+
+
 class TestImageDataSerializer(test_utils.BaseTestCase):
 
     def setUp(self):
@@ -26,9 +26,11 @@ from six.moves import range
 import testtools
 import webob
 
+import xmonitor.api.common
 import xmonitor.api.v2.image_actions
 import xmonitor.api.v2.images
 from xmonitor.common import exception
+from xmonitor.common import multipart
 from xmonitor import domain
 import xmonitor.schema
 from xmonitor.tests.unit import base
@@ -551,6 +553,47 @@ class TestImagesController(base.IsolatedUnitTest):
         self.assertEqual(UUID2, output.image_id)
         self.assertEqual('2', output.name)
 
+    def _get_conditional_request(self, etag):
+        request = unit_test_utils.get_fake_request(method='GET')
+        request.headers['If-None-Match'] = '"%s"' % etag
+        cache = xmonitor.api.common.ValidatorCache(10)
+        self.controller.validator_cache = cache
+        updated_at = self.db.image_get(request.context, UUID2)['updated_at']
+        cache.set(request.context, UUID2, 'fake-etag', None, updated_at,
+                  {'id': UUID2, 'owner': TENANT1})
+        return request
+
+    def test_show_not_modified(self):
+        request = self._get_conditional_request('fake-etag')
+        with mock.patch.object(self.controller.gateway,
+                               'get_repo') as mock_get_repo:
+            response = self.assertRaises(webob.exc.HTTPNotModified,
+                                         self.controller.show,
+                                         request, image_id=UUID2)
+        self.assertEqual('fake-etag', response.etag)
+        self.assertFalse(mock_get_repo.called)
+
+    def test_show_not_modified_policy(self):
+        request = self._get_conditional_request('fake-etag')
+        self.policy.rules = {'get_image': False}
+        with mock.patch.object(self.policy, 'enforce',
+                               wraps=self.policy.enforce) as mock_enforce:
+            self.assertRaises(webob.exc.HTTPForbidden, self.controller.show,
+                              request, image_id=UUID2)
+        mock_enforce.assert_any_call(request.context, 'get_image',
+                                     {'id': UUID2, 'owner': TENANT1})
+
+    def test_show_modified_etag(self):
+        request = self._get_conditional_request('other-etag')
+        output = self.controller.show(request, image_id=UUID2)
+        self.assertEqual(UUID2, output.image_id)
+
+    def test_show_modified_image(self):
+        request = self._get_conditional_request('fake-etag')
+        self.db.image_update(None, UUID2, {'name': 'changed'})
+        output = self.controller.show(request, image_id=UUID2)
+        self.assertEqual('changed', output.name)
+
     def test_show_deleted_properties(self):
         """Ensure that the api filters out deleted image properties."""
 
@@ -1909,6 +1952,12 @@ class TestImagesController(base.IsolatedUnitTest):
         self.assertEqual('deleted', deleted_img['status'])
         self.assertNotIn('%s/%s' % (BASE_URI, UUID1), self.store.data)
 
+    def test_delete_multipart_uploads(self):
+        request = unit_test_utils.get_fake_request()
+        with mock.patch.object(multipart, 'delete_uploads') as mock_delete:
+            self.controller.delete(request, UUID1)
+        mock_delete.assert_called_once_with(UUID1)
+
     def test_delete_with_tags(self):
         request = unit_test_utils.get_fake_request()
         changes = [
@@ -2446,6 +2495,26 @@ class TestImagesDeserializer(test_utils.BaseTestCase):
         ]}
         self.assertEqual(expected, output)
 
+    def test_update_invalid_intermediate_value(self):
+        request = self._get_fake_patch_request()
+        body = [
+            {'op': 'replace', 'path': '/name', 'value': 1},
+            {'op': 'replace', 'path': '/name', 'value': 'fedora'},
+        ]
+        request.body = jsonutils.dump_as_bytes(body)
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.update, request)
+
+    def test_update_invalid_final_value(self):
+        request = self._get_fake_patch_request()
+        body = [
+            {'op': 'replace', 'path': '/name', 'value': 'fedora'},
+            {'op': 'replace', 'path': '/min_ram', 'value': 'lots'},
+        ]
+        request.body = jsonutils.dump_as_bytes(body)
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                          self.deserializer.update, request)
+
     def test_update_disallowed_attributes(self):
         samples = {
             'direct_url': '/a/b/c/d',
@@ -3158,6 +3227,21 @@ class TestImagesSerializer(test_utils.BaseTestCase):
                          expect_next % UUID2),
                          unit_test_utils.sort_url_by_qs_keys(output['next']))
 
+    def test_index_streamed(self):
+        request = webob.Request.blank('/v2/images?limit=10')
+        response = webob.Response(request=request)
+        result = {'images': self.fixtures, 'next_marker': UUID2}
+        self.serializer.index(response, result)
+        expected = jsonutils.loads(response.body)
+
+        self.config(stream_list_responses=True)
+        response = webob.Response(request=request)
+        self.serializer.index(response, result)
+        self.assertIsNone(response.content_length)
+        self.assertEqual('application/json', response.content_type)
+        actual = jsonutils.loads(b''.join(response.app_iter))
+        self.assertEqual(expected, actual)
+
     def test_index_forbidden_get_image_location(self):
         """Make sure the serializer works fine.
 
@@ -3211,6 +3295,19 @@ class TestImagesSerializer(test_utils.BaseTestCase):
         self.assertEqual(expected, actual)
         self.assertEqual('application/json', response.content_type)
 
+    def test_show_remembers_validators(self):
+        cache = xmonitor.api.common.ValidatorCache(10)
+        self.serializer.validator_cache = cache
+        request = unit_test_utils.get_fake_request(method='GET')
+        response = webob.Response(request=request)
+        self.serializer.show(response, self.fixtures[0])
+        validators = cache.get(request.context, UUID1)
+        self.assertEqual(response.etag, validators.etag)
+        self.assertEqual(self.fixtures[0].updated_at, validators.updated_at)
+        self.assertEqual(response.last_modified, validators.last_modified)
+        self.assertEqual(UUID1, validators.target['id'])
+        self.assertEqual(self.fixtures[0].owner, validators.target['owner'])
+
     def test_show_minimal_fixture(self):
         expected = {
             'id': UUID2,
@@ -744,6 +744,19 @@ class TestTasksSerializer(test_utils.BaseTestCase):
                          expect_next % UUID2),
                          unit_test_utils.sort_url_by_qs_keys(output['next']))
 
+    def test_index_streamed(self):
+        request = webob.Request.blank('/v2/tasks')
+        response = webob.Response(request=request)
+        result = {'tasks': list(self.fixtures), 'next_marker': UUID2}
+        self.serializer.index(response, result)
+        expected = jsonutils.loads(response.body)
+
+        self.config(stream_list_responses=True)
+        response = webob.Response(request=request)
+        self.serializer.index(response, result)
+        actual = jsonutils.loads(b''.join(response.app_iter))
+        self.assertEqual(expected, actual)
+
     def test_get(self):
         expected = {
             'id': UUID4,